@@ -11,15 +11,14 @@ from opendm.utils import double_quote
 from opendm import log
 from opendm import io
 from opendm import system
+from opendm import pcinfo
 from opendm.concurrency import get_max_memory
 
 def get_point_cloud_crs(file):
-    pipeline = pdal.Pipeline(json.dumps([ file ]))
-    metadata = pipeline.quickinfo
-
-    reader_metadata = [val for key, val in metadata.items() if "readers" in key]
-    crs = CRS.from_string(reader_metadata[0]["srs"]["horizontal"])
-    return str(crs)
+    srs = pcinfo.get_srs(file)
+    if srs is None:
+        raise Exception("Cannot find the SRS of %s" % file)
+    return str(CRS.from_string(srs))
 
 def get_raster_crs(file):
     with rasterio.open(file, 'r') as f:
@@ -120,18 +119,6 @@ def compute_alignment_matrix(input_laz, align_file, stats_dir):
             if os.path.isfile(f):
                 os.unlink(f)
 
-def transform_point_cloud(input_laz, a_matrix, output_laz):
-    pipe = [
-        input_laz,
-        {
-            'type': 'filters.transformation',
-            'matrix': " ".join(list(map(str, a_matrix.flatten()))),
-        },
-        output_laz,
-    ]
-    p = pdal.Pipeline(json.dumps(pipe))
-    p.execute()
-
 def transform_obj(input_obj, a_matrix, geo_offset, output_obj):
     g_off = np.array([geo_offset[0], geo_offset[1], 0, 0])
 
@@ -1,66 +1,153 @@
 import os
-import shutil
-from opendm import system
+from contextlib import contextmanager
 from opendm.concurrency import get_max_memory
-from opendm import io
 from opendm import log
 
-def convert_to_cogeo(src_path, blocksize=256, max_workers=1, compression="DEFLATE"):
+def finalize_raster(raster, cutline=None, tags={}, metadata={}, pseudo_georeference=False,
+                    cog=False, overviews=False, creation_options={}, warp_options=[],
+                    blocksize=256, max_workers=1, compression="DEFLATE", keep_original=True):
     """
-    Guarantee that the .tif passed as an argument is a Cloud Optimized GeoTIFF (cogeo)
-    The file is destructively converted into a cogeo.
-    If the file cannot be converted, the function does not change the file
-    :param src_path: path to GeoTIFF
-    :return: True on success
+    Crop a raster to a cutline, add metadata and write it as a (Cloud Optimized) GeoTIFF,
+    in a single write. The source is wrapped in an in-memory VRT (warped with the cutline, if any)
+    carrying the metadata, which is then copied to the final GeoTIFF by the GTiff or COG driver
+    (the COG driver also generates the overviews).
+    If nothing needs to be rewritten, the metadata is added in place.
+    :param raster path to GeoTIFF, replaced by the finalized raster
+    :param cutline path to a vector file to crop the raster with (e.g. bounds GeoPackage), or None
+    :param tags dictionary of TIFFTAGs
+    :param metadata dictionary of metadata domains (e.g. xml:GROUND_CONTROL_POINTS)
+    :param pseudo_georeference whether to assign a pseudo georeferencing (after cropping)
+    :param cog whether to write a Cloud Optimized GeoTIFF
+    :param overviews whether to add overviews to a regular GeoTIFF
+    :param creation_options GTiff creation options (when not writing a COG)
+    :param warp_options additional gdalwarp options (e.g. -dstalpha)
+    :param keep_original keep the uncropped raster (as <name>.original.tif)
+    :return True on success
     """
+    from osgeo import gdal
 
-    if not os.path.isfile(src_path):
-        log.ODM_WARNING("Cannot convert to cogeo: %s (file does not exist)" % src_path)
+    if not os.path.isfile(raster):
+        log.ODM_WARNING("Cannot finalize %s (file does not exist)" % raster)
         return False
 
-    log.ODM_INFO("Optimizing %s as Cloud Optimized GeoTIFF" % src_path)
+    if cutline is not None and not os.path.isfile(cutline):
+        log.ODM_WARNING("%s does not exist, will skip cropping." % cutline)
+        cutline = None
 
-    
-    tmpfile = io.related_file_path(src_path, postfix='_cogeo')
-    swapfile = io.related_file_path(src_path, postfix='_cogeo_swap')
+    with gdal_config({'GDAL_CACHEMAX': '%s%%' % get_max_memory(),
+                      'GDAL_NUM_THREADS': max_workers if max_workers else 'ALL_CPUS'}):
+        if cutline is None and not cog and not pseudo_georeference:
+            log.ODM_INFO("Adding TIFFTAGs to %s" % raster)
+            try:
+                ds = gdal_checked(gdal.Open(raster, gdal.GA_Update))
+                set_raster_metadata(ds, tags, metadata)
+                ds = None
+                if overviews:
+                    build_overviews(raster)
+                return True
+            except Exception as e:
+                log.ODM_WARNING("Cannot finalize %s: %s" % (raster, str(e)))
+                return False
 
-    kwargs = {
-        'threads': max_workers if max_workers else 'ALL_CPUS',
-        'blocksize': blocksize,
-        'max_memory': get_max_memory(),
-        'src_path': src_path,
-        'tmpfile': tmpfile,
-        'compress': compression,
-        'predictor': '2' if compression in ['LZW', 'DEFLATE'] else '1',
-    }
+        log.ODM_INFO("Finalizing %s (%s)" % (raster, ", ".join(
+                        (["crop"] if cutline is not None else []) + ["tags"] + (["COG"] if cog else []))))
 
-    try:
-        system.run("gdal_translate "
-                "-of COG "
-                "-co NUM_THREADS={threads} "
-                "-co BLOCKSIZE={blocksize} "
-                "-co COMPRESS={compress} "
-                "-co PREDICTOR={predictor} "
-                "-co BIGTIFF=IF_SAFER "
-                "-co RESAMPLING=NEAREST "
-                "--config GDAL_CACHEMAX {max_memory}% "
-                "--config GDAL_NUM_THREADS {threads} "
-                "\"{src_path}\" \"{tmpfile}\" ".format(**kwargs))
-    except Exception as e:
-        log.ODM_WARNING("Cannot create Cloud Optimized GeoTIFF: %s" % str(e))
-
-    if os.path.isfile(tmpfile):
-        shutil.move(src_path, swapfile) # Move to swap location
+        # path/to/odm_orthophoto.tif --> path/to/odm_orthophoto.original.tif
+        basename, ext = os.path.splitext(raster)
+        original = "{}.original{}".format(basename, ext)
+        os.replace(raster, original)
 
         try:
-            shutil.move(tmpfile, src_path)
-        except IOError as e:
-            log.ODM_WARNING("Cannot move %s to %s: %s" % (tmpfile, src_path, str(e)))
-            shutil.move(swapfile, src_path) # Attempt to restore
+            src = gdal_checked(gdal.Open(original))
+            if cutline is not None:
+                vrt = gdal_checked(gdal.Warp('', src, options=gdal.WarpOptions(options=list(warp_options), format='VRT',
+                                cutlineDSName=cutline, cropToCutline=True,
+                                multithread=True, warpOptions=['NUM_THREADS=%s' % (max_workers if max_workers else 'ALL_CPUS')])))
+            else:
+                vrt = gdal_checked(gdal.Translate('', src, format='VRT'))
 
-        if os.path.isfile(swapfile):
-            os.remove(swapfile)
+            if pseudo_georeference:
+                from opendm.pseudogeo import set_pseudo_georeferencing
+                set_pseudo_georeferencing(vrt)
 
-        return True
-    else:
-        return False
+            set_raster_metadata(vrt, tags, metadata)
+
+            if cog:
+                options = [
+                    'NUM_THREADS=%s' % (max_workers if max_workers else 'ALL_CPUS'),
+                    'BLOCKSIZE=%s' % blocksize,
+                    'COMPRESS=%s' % compression,
+                    'PREDICTOR=%s' % ('2' if compression in ['LZW', 'DEFLATE'] else '1'),
+                    'BIGTIFF=IF_SAFER',
+                    'RESAMPLING=NEAREST'
+                ]
+                dst = gdal_checked(gdal.Translate(raster, vrt, format='COG', creationOptions=options))
+            else:
+                options = ['{}={}'.format(k, creation_options[k]) for k in creation_options]
+                dst = gdal_checked(gdal.Translate(raster, vrt, format='GTiff', creationOptions=options))
+
+            dst = vrt = src = None
+
+            if overviews and not cog:
+                build_overviews(raster)
+        except Exception as e:
+            log.ODM_WARNING("Cannot finalize %s: %s" % (raster, str(e)))
+            dst = vrt = src = None
+            if os.path.isfile(raster):
+                os.remove(raster)
+            os.replace(original, raster) # Revert rename
+            return False
+
+        if not keep_original or cutline is None:
+            os.remove(original)
+
+    return True
+
+def set_raster_metadata(ds, tags={}, metadata={}):
+    """
+    :param ds GDAL dataset
+    :param tags dictionary of TIFFTAGs
+    :param metadata dictionary of metadata domains
+    """
+    for k in tags:
+        ds.SetMetadataItem(k, str(tags[k]))
+    for domain in metadata:
+        ds.SetMetadata([metadata[domain]] if domain.startswith('xml:') else metadata[domain], domain)
+
+def build_overviews(raster):
+    """
+    Add JPEG compressed overviews (2 4 8 16) to a GeoTIFF, in place
+    """
+    from osgeo import gdal
+
+    log.ODM_INFO("Building Overviews")
+    with gdal_config({'BIGTIFF_OVERVIEW': 'IF_SAFER', 'COMPRESS_OVERVIEW': 'JPEG'}):
+        ds = gdal_checked(gdal.Open(raster, gdal.GA_Update))
+        ds.BuildOverviews('AVERAGE', [2, 4, 8, 16])
+        ds = None
+
+def gdal_checked(ds):
+    """
+    :return ds, if it's a valid GDAL dataset
+    :raise Exception with the last GDAL error otherwise
+    """
+    if ds is None:
+        from osgeo import gdal
+        raise Exception(gdal.GetLastErrorMsg())
+    return ds
+
+@contextmanager
+def gdal_config(options):
+    """
+    Set GDAL configuration options for the duration of a block
+    """
+    from osgeo import gdal
+
+    previous = {k: gdal.GetConfigOption(k) for k in options}
+    for k in options:
+        gdal.SetConfigOption(k, str(options[k]))
+    try:
+        yield
+    finally:
+        for k in previous:
+            gdal.SetConfigOption(k, previous[k])
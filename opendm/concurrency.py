@@ -100,4 +100,56 @@ def parallel_map(func, items, max_workers=1, single_thread_fallback=True):
     if use_single_thread:
         # Boring, single thread processing
         for q in items:
-            process_one(q)
\ No newline at end of file
+            process_one(q)
+
+
+def run_with_memory_budget(jobs, max_memory_mb, max_workers=1):
+    """
+    Run jobs concurrently, starting a job only when its estimated
+    memory usage fits within what is left of the memory budget.
+    A job is always started if nothing else is running, so that
+    jobs larger than the budget still get to run (alone).
+    :param jobs list of (func, estimated_memory_mb) tuples
+    :param max_memory_mb total memory budget in megabytes
+    :param max_workers maximum number of jobs running at the same time
+    """
+    pending = list(jobs)
+    running = []
+    errors = []
+    cv = threading.Condition()
+    used_memory = [0]
+
+    def worker(func, mem):
+        try:
+            func()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            with cv:
+                used_memory[0] -= mem
+                running.remove(threading.current_thread())
+                cv.notify_all()
+
+    with cv:
+        while len(pending) > 0 and len(errors) == 0:
+            # Pick the first job that fits
+            idx = None
+            for i, (func, mem) in enumerate(pending):
+                if len(running) == 0 or (len(running) < max_workers and used_memory[0] + mem <= max_memory_mb):
+                    idx = i
+                    break
+
+            if idx is not None:
+                func, mem = pending.pop(idx)
+                used_memory[0] += mem
+                t = threading.Thread(target=worker, args=(func, mem))
+                running.append(t)
+                t.start()
+            else:
+                cv.wait()
+
+        while len(running) > 0:
+            cv.wait()
+
+    if len(errors) > 0:
+        raise errors[0]
@@ -4,7 +4,6 @@ from opendm import context
 from opendm import io
 from opendm import log
 from appsettings import SettingsParser
-from pyodm import Node, exceptions
 import os
 import sys
 
@@ -26,6 +25,7 @@ rerun_stages = {
     'cog': 'odm_dem',
     'copy_to': 'odm_postprocess',
     'crop': 'odm_georeferencing',
+    'dem_blend_distance': 'odm_dem',
     'dem_decimation': 'odm_dem',
     'dem_euclidean_map': 'odm_dem',
     'dem_gapfill_steps': 'odm_dem',
@@ -48,6 +48,7 @@ rerun_stages = {
     'matcher_order': 'opensfm',
     'matcher_type': 'opensfm',
     'max_concurrency': None,
+    'max_concurrent_stages': None,
     'merge': 'Merge',
     'mesh_octree_depth': 'odm_meshing',
     'mesh_size': 'odm_meshing',
@@ -92,6 +93,7 @@ rerun_stages = {
     'smrf_slope': 'odm_dem',
     'smrf_threshold': 'odm_dem',
     'smrf_window': 'odm_dem',
+    'smrf_tiled': 'odm_georeferencing',
     'split': 'split',
     'split_image_groups': 'split',
     'split_overlap': 'split',
@@ -104,6 +106,7 @@ rerun_stages = {
     'use_fixed_camera_params': 'opensfm',
     'use_hybrid_bundle_adjustment': 'opensfm',
     'version': None,
+    'video_frame_step': 'dataset',
     'video_limit': 'dataset',
     'video_resolution': 'dataset',
 }
@@ -133,6 +136,36 @@ def url_string(string):
         raise argparse.ArgumentTypeError("%s is not a valid URL. The URL must be in the format: http(s)://host[:port]/[?token=]" % string)
     return string
 
+def split_node_urls(string):
+    """
+    :param string comma separated list of node URLs, each optionally followed by #weight
+        (e.g. http://node1:3000#4,http://node2:3000)
+    :return list of (url, weight) tuples (weight is None if not set)
+    """
+    if not string:
+        return []
+
+    result = []
+    for url in string.split(","):
+        url = url.strip()
+        weight = None
+        if "#" in url:
+            url, weight = url.rsplit("#", 1)
+            weight = float(weight)
+        result.append((url, weight))
+    return result
+
+def url_list_string(string):
+    try:
+        urls = split_node_urls(string)
+    except ValueError:
+        raise argparse.ArgumentTypeError("%s is not a valid list of URLs. The format is: http(s)://host[:port]/[?token=][#weight],..." % string)
+    for url, weight in urls:
+        url_string(url)
+        if weight is not None and weight <= 0:
+            raise argparse.ArgumentTypeError("The weight of %s must be positive" % url)
+    return string
+
 class RerunFrom(argparse.Action):
     def __call__(self, parser, namespace, values, option_string=None):
         setattr(namespace, self.dest, processopts[processopts.index(values):])
@@ -305,6 +338,15 @@ def config(argv=None, parser=None):
                               'processes. Peak memory requirement is ~1GB per '
                               'thread and 2 megapixel image resolution. Default: %(default)s'))
 
+    parser.add_argument('--max-concurrent-stages',
+                        metavar='<positive integer>',
+                        action=StoreValue,
+                        default=1,
+                        type=int,
+                        help=('The maximum number of independent stages (for example the DEM and the orthophoto) '
+                              'to run at the same time. Additional stages are started only while at least half '
+                              'of the system memory is available. Default: %(default)s'))
+
     parser.add_argument('--use-hybrid-bundle-adjustment',
                         action=StoreTrue,
                         nargs=0,
@@ -537,6 +579,14 @@ def config(argv=None, parser=None):
         help='Simple Morphological Filter window radius parameter (meters). '
                 'Default: %(default)s')
 
+    parser.add_argument('--smrf-tiled',
+        action=StoreTrue,
+        nargs=0,
+        default=False,
+        help='Run the Simple Morphological Filter on overlapping tiles in parallel (up to --max-concurrency). '
+                'Faster on large point clouds, but the classification can differ slightly from a single run near tile edges. '
+                'Default: %(default)s')
+
     parser.add_argument('--texturing-skip-global-seam-leveling',
                         action=StoreTrue,
                         nargs=0,
@@ -648,6 +698,15 @@ def config(argv=None, parser=None):
             'Default: '
             '%(default)s')
 
+    parser.add_argument('--dem-blend-distance',
+                        metavar='<positive integer>',
+                        action=StoreValue,
+                        default=256,
+                        type=int,
+                        help='Maximum distance (in pixels) from NODATA cells over which euclidean distances are measured. '
+                             'Overlapping DEMs are blended over this distance when merging split datasets, and --dem-euclidean-map '
+                             'values are capped to it. Set to 0 to not cap distances (slower, uses more memory). Default: %(default)s')
+
     parser.add_argument('--orthophoto-resolution',
                         metavar='<float > 0.0>',
                         action=StoreValue,
@@ -763,6 +822,14 @@ def config(argv=None, parser=None):
                         metavar='<positive integer>',
                         help='The maximum output resolution of extracted video frames in pixels. Default: %(default)s')
 
+    parser.add_argument('--video-frame-step',
+                        type=int,
+                        action=StoreValue,
+                        default=1,
+                        metavar='<positive integer>',
+                        help='Only evaluate one frame every N frames when extracting frames from video files. '
+                            'Skipped frames are not decoded, which speeds up the extraction of high frame rate videos. Default: %(default)s')
+
     parser.add_argument('--split',
                         type=int,
                         action=StoreValue,
@@ -804,11 +871,13 @@ def config(argv=None, parser=None):
     parser.add_argument('--sm-cluster',
                         metavar='<string>',
                         action=StoreValue,
-                        type=url_string,
+                        type=url_list_string,
                         default=None,
                         help='URL to a ClusterODM instance '
                             'for distributing a split-merge workflow on '
-                            'multiple nodes in parallel. '
+                            'multiple nodes in parallel. A comma separated list of NodeODM '
+                            'URLs can also be used, optionally followed by #weight to set the relative '
+                            'capacity of each node (by default, nodes are weighted by their CPU cores). '
                             'Default: %(default)s')
 
     parser.add_argument('--merge',
@@ -926,10 +995,20 @@ def config(argv=None, parser=None):
       args.crop = 0.01
 
     if args.sm_cluster:
-        try:
-            Node.from_url(args.sm_cluster).info()
-        except exceptions.NodeConnectionError as e:
-            log.ODM_ERROR("Cluster node seems to be offline: %s"  % str(e))
+        from pyodm import Node, exceptions
+
+        errors = []
+        urls = split_node_urls(args.sm_cluster)
+        for url, weight in urls:
+            try:
+                Node.from_url(url).info()
+            except exceptions.NodeConnectionError as e:
+                errors.append(str(e))
+
+        if len(errors) == len(urls):
+            log.ODM_ERROR("Cluster node seems to be offline: %s"  % ", ".join(errors))
             sys.exit(1)
+        for e in errors:
+            log.ODM_WARNING("Cluster node seems to be offline: %s" % e)
 
     return args
@@ -1,8 +1,8 @@
 from opendm import context
 from opendm.system import run
 from opendm import log
-from opendm.point_cloud import export_summary_json
-from osgeo import ogr
+from osgeo import ogr, osr
+import numpy as np
 import json, os
 from opendm.concurrency import get_max_memory
 from opendm.utils import double_quote
@@ -121,68 +121,69 @@ class Cropper:
         # Save and close output data source
         out_ds = None
 
-    def create_bounds_geojson(self, pointcloud_path, buffer_distance = 0, decimation_step=40):
+    @staticmethod
+    def compute_bounds(pointcloud_path, decimation_step=40, chunk_size=1000000):
         """
-        Compute a buffered polygon around the data extents (not just a bounding box)
-        of the given point cloud.
+        Stream the point cloud once (in chunks) and compute the convex hull
+        of the decimated points together with the point cloud SRS.
 
-        @return filename to GeoJSON containing the polygon
+        @return (hull, srs) with hull an Nx2 array of hull vertices (counter-clockwise)
+            and srs a proj4 (or WKT) string, or None if the point cloud has no SRS
         """
-        if not os.path.exists(pointcloud_path):
-            log.ODM_WARNING('Point cloud does not exist, cannot generate bounds {}'.format(pointcloud_path))
-            return ''
-
-        # Do decimation prior to extracting boundary information
-        decimated_pointcloud_path = self.path('decimated.las')
-
-        run("pdal translate -i \"{}\" "
-            "-o \"{}\" "
-            "decimation "
-            "--filters.decimation.step={} ".format(pointcloud_path, decimated_pointcloud_path, decimation_step))
-
-        if not os.path.exists(decimated_pointcloud_path):
-            log.ODM_WARNING('Could not decimate point cloud, thus cannot generate GPKG bounds {}'.format(decimated_pointcloud_path))
-            return ''
+        import pdal
+
+        pipeline = pdal.Pipeline(json.dumps([
+            {
+                "type": "readers.las",
+                "filename": pointcloud_path
+            },
+            {
+                "type": "filters.decimation",
+                "step": decimation_step
+            }
+        ]))
 
-        # Use PDAL to dump boundary information
-        # then read the information back
+        srs = None
+        reader_metadata = [val for key, val in pipeline.quickinfo.items() if "readers" in key]
+        if len(reader_metadata) > 0:
+            srs = reader_metadata[0].get("srs", {})
+            srs = srs.get("proj4") or srs.get("wkt") or None
+
+        if hasattr(pipeline, "iterator"):
+            chunks = pipeline.iterator(chunk_size=chunk_size)
+        else:
+            # Older PDAL bindings do not support streaming
+            pipeline.execute()
+            chunks = pipeline.arrays
+
+        hull = np.empty((0, 2), dtype=np.float64)
+        for arr in chunks:
+            if len(arr) == 0:
+                continue
+            xy = np.column_stack((arr["X"], arr["Y"])).astype(np.float64)
+            hull = convex_hull(np.vstack((hull, convex_hull(xy))))
+
+        if len(hull) < 3:
+            raise RuntimeError("Could not determine point cloud boundaries")
+
+        return hull, srs
+
+    def create_bounds_geometry(self, pointcloud_path, buffer_distance = 0, decimation_step=40):
+        """
+        Compute a buffered polygon around the data extents (not just a bounding box)
+        of the given point cloud.
 
-        boundary_file_path = self.path('boundary.json')
+        @return (ogr.Geometry, srs) tuple
+        """
+        hull, srs = Cropper.compute_bounds(pointcloud_path, decimation_step)
 
-        run('pdal info --boundary --filters.hexbin.edge_size=1 --filters.hexbin.threshold=0 "{0}" > "{1}"'.format(decimated_pointcloud_path,  boundary_file_path))
-        
-        pc_geojson_boundary_feature = None
-
-        with open(boundary_file_path, 'r') as f:
-            json_f = json.loads(f.read())
-            pc_geojson_boundary_feature = json_f['boundary']['boundary_json']
-
-        if pc_geojson_boundary_feature is None: raise RuntimeError("Could not determine point cloud boundaries")
-
-        # Write bounds to GeoJSON
-        tmp_bounds_geojson_path = self.path('tmp-bounds.geojson')
-        with open(tmp_bounds_geojson_path, "w") as f:
-            f.write(json.dumps({
-                "type": "FeatureCollection",
-                "features": [{
-                    "type": "Feature",
-                    "geometry": pc_geojson_boundary_feature
-                }]
-            }))
-
-        # Create a convex hull around the boundary
-        # as to encompass the entire area (no holes)    
-        driver = ogr.GetDriverByName('GeoJSON')
-        ds = driver.Open(tmp_bounds_geojson_path, 0) # ready-only
-        layer = ds.GetLayer()
-
-        # Collect all Geometry
-        geomcol = ogr.Geometry(ogr.wkbGeometryCollection)
-        for feature in layer:
-            geomcol.AddGeometry(feature.GetGeometryRef())
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        for x, y in hull:
+            ring.AddPoint_2D(float(x), float(y))
+        ring.AddPoint_2D(float(hull[0][0]), float(hull[0][1]))
 
-        # Calculate convex hull
-        convexhull = geomcol.ConvexHull()
+        convexhull = ogr.Geometry(ogr.wkbPolygon)
+        convexhull.AddGeometry(ring)
 
         # If buffer distance is specified
         # Create two buffers, one shrunk by
@@ -200,30 +201,47 @@ class Cropper:
             else:
                 log.ODM_WARNING("Very small crop area detected, we will not smooth it.")
 
-        # Save to a new file
-        bounds_geojson_path = self.path('bounds.geojson')
-        if os.path.exists(bounds_geojson_path):
-            os.remove(bounds_geojson_path)
+        return convexhull, srs
 
-        out_ds = driver.CreateDataSource(bounds_geojson_path)
-        layer = out_ds.CreateLayer("convexhull", geom_type=ogr.wkbPolygon)
+    @staticmethod
+    def write_bounds(geometry, output_path, driver_name, srs=None):
+        driver = ogr.GetDriverByName(driver_name)
+
+        if os.path.exists(output_path):
+            driver.DeleteDataSource(output_path)
+
+        spatial_ref = None
+        if srs is not None:
+            spatial_ref = osr.SpatialReference()
+            spatial_ref.SetFromUserInput(srs)
+
+        out_ds = driver.CreateDataSource(output_path)
+        layer = out_ds.CreateLayer("convexhull", srs=spatial_ref, geom_type=ogr.wkbPolygon)
 
         feature_def = layer.GetLayerDefn()
         feature = ogr.Feature(feature_def)
-        feature.SetGeometry(convexhull)
+        feature.SetGeometry(geometry)
         layer.CreateFeature(feature)
         feature = None
 
-        # Save and close data sources
-        out_ds = ds = None
+        # Save and close data source
+        out_ds = None
+
+    def create_bounds_geojson(self, pointcloud_path, buffer_distance = 0, decimation_step=40):
+        """
+        Compute a buffered polygon around the data extents (not just a bounding box)
+        of the given point cloud.
 
-        # Remove decimated point cloud
-        if os.path.exists(decimated_pointcloud_path):
-            os.remove(decimated_pointcloud_path)
-        
-        # Remove tmp bounds
-        if os.path.exists(tmp_bounds_geojson_path):
-            os.remove(tmp_bounds_geojson_path)
+        @return filename to GeoJSON containing the polygon
+        """
+        if not os.path.exists(pointcloud_path):
+            log.ODM_WARNING('Point cloud does not exist, cannot generate bounds {}'.format(pointcloud_path))
+            return ''
+
+        convexhull, _ = self.create_bounds_geometry(pointcloud_path, buffer_distance, decimation_step)
+
+        bounds_geojson_path = self.path('bounds.geojson')
+        Cropper.write_bounds(convexhull, bounds_geojson_path, 'GeoJSON')
 
         return bounds_geojson_path
 
@@ -239,31 +257,30 @@ class Cropper:
             log.ODM_WARNING('Point cloud does not exist, cannot generate GPKG bounds {}'.format(pointcloud_path))
             return ''
 
-        bounds_geojson_path = self.create_bounds_geojson(pointcloud_path, buffer_distance, decimation_step)
-
-        summary_file_path = os.path.join(self.storage_dir, '{}.summary.json'.format(self.files_prefix))
-        export_summary_json(pointcloud_path, summary_file_path)
-        
-        pc_proj4 = None
-        with open(summary_file_path, 'r') as f:
-            json_f = json.loads(f.read())
-            pc_proj4 = json_f['summary']['srs']['proj4']
+        convexhull, pc_srs = self.create_bounds_geometry(pointcloud_path, buffer_distance, decimation_step)
 
-        if pc_proj4 is None: raise RuntimeError("Could not determine point cloud proj4 declaration")
+        if pc_srs is None: raise RuntimeError("Could not determine point cloud proj4 declaration")
 
         bounds_gpkg_path = os.path.join(self.storage_dir, '{}.bounds.gpkg'.format(self.files_prefix))
+        Cropper.write_bounds(convexhull, bounds_gpkg_path, 'GPKG', pc_srs)
 
-        if os.path.isfile(bounds_gpkg_path):
-            os.remove(bounds_gpkg_path)
+        return bounds_gpkg_path
 
-        # Convert bounds to GPKG
-        kwargs = {
-            'input': double_quote(bounds_geojson_path),
-            'output': double_quote(bounds_gpkg_path),
-            'proj4': pc_proj4
-        }
 
-        run('ogr2ogr -overwrite -f GPKG -a_srs "{proj4}" {output} {input}'.format(**kwargs))
+def convex_hull(points):
+    """
+    Convex hull of a set of 2D points
+    @param points Nx2 array
+    @return array of hull vertices in counter-clockwise order
+    """
+    from scipy.spatial import ConvexHull
 
-        return bounds_gpkg_path
+    points = np.unique(points, axis=0)
+    if len(points) <= 2:
+        return points
 
+    try:
+        return points[ConvexHull(points).vertices]
+    except Exception:
+        # Degenerate (collinear) input, keep the two extremes
+        return points[[0, -1]]
@@ -1,11 +1,9 @@
 import os
-import subprocess
 import sys
 import rasterio
 import numpy
 import math
 import time
-import shutil
 import glob
 import re
 from joblib import delayed, Parallel
@@ -15,41 +13,37 @@ from opendm import io
 from opendm import system
 from opendm.concurrency import get_max_memory, parallel_map, get_total_memory
 from datetime import datetime
-from opendm.vendor.gdal_fillnodata import main as gdal_fillnodata
 from opendm import log
 
 from .ground_rectification.rectify import run_rectification
 from . import pdal
-
-gdal_proximity = None
-
-try:
-    # GDAL >= 3.3
-    from osgeo_utils.gdal_proximity import main as gdal_proximity
-except ModuleNotFoundError:
-    # GDAL <= 3.2
-    try:
-        from osgeo.utils.gdal_proximity import main as gdal_proximity
-    except ModuleNotFoundError:
-        # GDAL <= 3.0
-        gdal_proximity_script = shutil.which("gdal_proximity.py")
-        if gdal_proximity_script is not None:
-            def gdal_proximity(args):
-                subprocess.run([gdal_proximity_script] + args[1:], check=True)
-
-
-def classify(lasFile, scalar, slope, threshold, window):
+from .gapfill import fill_and_smooth as gapfill_and_smooth
+from .euclidean import compute_distance_map, MAX_BLEND_DISTANCE
+
+def classify(lasFile, scalar, slope, threshold, window, max_workers=1, output=None, tiled=False):
+    """
+    :param output path to the classified point cloud (lasFile is classified in place if None).
+        If classification fails, lasFile is copied to it unclassified.
+    :param tiled whether to run SMRF on overlapping tiles in parallel (with max_workers > 1)
+    """
     start = datetime.now()
+    if output is None:
+        output = lasFile
 
     try:
-        pdal.run_pdaltranslate_smrf(lasFile, lasFile, scalar, slope, threshold, window)
+        if tiled and max_workers > 1:
+            pdal.run_tiled_smrf(lasFile, output, point_cloud.get_extent(lasFile), scalar, slope, threshold, window, max_workers)
+        else:
+            pdal.run_pdaltranslate_smrf(lasFile, output, scalar, slope, threshold, window)
     except:
-        log.ODM_WARNING("Error creating classified file %s" % lasFile)
+        log.ODM_WARNING("Error creating classified file %s" % output)
+        if output != lasFile:
+            pdal.translate(lasFile, output)
 
-    log.ODM_INFO('Created %s in %s' % (lasFile, datetime.now() - start))
-    return lasFile
+    log.ODM_INFO('Created %s in %s' % (output, datetime.now() - start))
+    return output
 
-def rectify(lasFile, reclassify_threshold=5, min_area=750, min_points=500):
+def rectify(lasFile, reclassify_threshold=5, min_area=750, min_points=500, max_workers=1):
     start = datetime.now()
 
     try:
@@ -59,7 +53,7 @@ def rectify(lasFile, reclassify_threshold=5, min_area=750, min_points=500):
             input=lasFile, output=lasFile, \
             reclassify_plan='median', reclassify_threshold=reclassify_threshold, \
             extend_plan='surrounding', extend_grid_distance=5, \
-            min_area=min_area, min_points=min_points)
+            min_area=min_area, min_points=min_points, max_workers=max_workers)
 
         log.ODM_INFO('Created %s in %s' % (lasFile, datetime.now() - start))
     except Exception as e:
@@ -72,7 +66,7 @@ error = None
 def create_dem(input_point_cloud, dem_type, output_type='max', radiuses=['0.56'], gapfill=True,
                 outdir='', resolution=0.1, max_workers=1, max_tile_size=4096,
                 decimation=None, with_euclidean_map=False,
-                apply_smoothing=True, max_tiles=None):
+                apply_smoothing=True, max_tiles=None, max_blend_distance=MAX_BLEND_DISTANCE):
     """ Create DEM from multiple radii, and optionally gapfill """
     
     start = datetime.now()
@@ -126,76 +120,41 @@ def create_dem(input_point_cloud, dem_type, output_type='max', radiuses=['0.56']
 
     run('gdalbuildvrt -input_file_list "%s" "%s" ' % (tiles_file_list, tiles_vrt_path))
 
-    merged_vrt_path = os.path.abspath(os.path.join(outdir, "merged.vrt"))
-    geotiff_small_path = os.path.abspath(os.path.join(outdir, 'tiles.small.tif'))
-    geotiff_small_filled_path = os.path.abspath(os.path.join(outdir, 'tiles.small_filled.tif'))
-    geotiff_path = os.path.abspath(os.path.join(outdir, 'tiles.tif'))
-
-    # Build GeoTIFF
-    kwargs = {
-        'max_memory': get_max_memory(),
-        'threads': max_workers if max_workers else 'ALL_CPUS',
-        'tiles_vrt': tiles_vrt_path,
-        'merged_vrt': merged_vrt_path,
-        'geotiff_small': geotiff_small_path,
-        'geotiff_small_filled': geotiff_small_filled_path,
-        'gapfill_scale': '10%',
-        'output': output_path
-    }
-
-    if gapfill:
-        # Sometimes, for some reason gdal_fillnodata.py
-        # behaves strangely when reading data directly from a .VRT
-        # so we need to convert to GeoTIFF first.
-        # Scale to 10% size
+    if gapfill or apply_smoothing:
+        gapfill_scale = 0.1
 
         with rasterio.open(tiles_vrt_path) as src:
             min_dimension = min(src.width, src.height)
-        
+
         # Handle edge case when VRT size < 10 pixels
         if min_dimension < 10:
-            kwargs['gapfill_scale'] = '50%'
-
-        run('gdal_translate '
-                '-co NUM_THREADS={threads} '
-                '-co BIGTIFF=IF_SAFER '
-                '-co COMPRESS=DEFLATE '
-                '--config GDAL_CACHEMAX {max_memory}% '
-                '-outsize {gapfill_scale} 0 '
-                '"{tiles_vrt}" "{geotiff_small}"'.format(**kwargs))
-
-        # Fill scaled
-        gdal_fillnodata(['.', 
-                        '-co', 'NUM_THREADS=%s' % kwargs['threads'], 
-                        '-co', 'BIGTIFF=IF_SAFER',
-                        '-co', 'COMPRESS=DEFLATE',
-                        '--config', 'GDAL_CACHE_MAX', str(kwargs['max_memory']) + '%',
-                        '-b', '1',
-                        '-of', 'GTiff',
-                        kwargs['geotiff_small'], kwargs['geotiff_small_filled']])
-        
-        # Merge filled scaled DEM with unfilled DEM using bilinear interpolation
-        run('gdalbuildvrt -resolution highest -r bilinear "%s" "%s" "%s"' % (merged_vrt_path, geotiff_small_filled_path, tiles_vrt_path))
-    else:
-        merged_vrt_path = tiles_vrt_path
+            gapfill_scale = 0.5
 
-    if apply_smoothing:
-        median_smoothing(merged_vrt_path, output_path, num_workers=max_workers)
+        # Fill gaps, merge with the tiles and smooth in one pass
+        gapfill_and_smooth(tiles_vrt_path, output_path, gapfill=gapfill,
+                            smoothing_radius=4 if apply_smoothing else None,
+                            gapfill_scale=gapfill_scale, max_workers=max_workers)
     else:
+        kwargs = {
+            'max_memory': get_max_memory(),
+            'threads': max_workers if max_workers else 'ALL_CPUS',
+            'tiles_vrt': tiles_vrt_path,
+            'output': output_path
+        }
         run('gdal_translate '
             '-co NUM_THREADS={threads} '
             '-co TILED=YES '
             '-co BIGTIFF=IF_SAFER '
             '-co COMPRESS=DEFLATE '
             '--config GDAL_CACHEMAX {max_memory}% '
-            '"{merged_vrt}" "{output}"'.format(**kwargs))
+            '"{tiles_vrt}" "{output}"'.format(**kwargs))
 
     if os.path.exists(tiles_vrt_path):
         if with_euclidean_map:
             emap_path = io.related_file_path(output_path, postfix=".euclideand")
-            compute_euclidean_map(tiles_vrt_path, emap_path, overwrite=True)
+            compute_euclidean_map(tiles_vrt_path, emap_path, overwrite=True, max_workers=max_workers, max_distance=max_blend_distance)
     
-    for cleanup_file in [tiles_vrt_path, tiles_file_list, merged_vrt_path, geotiff_small_path, geotiff_small_filled_path]:
+    for cleanup_file in [tiles_vrt_path, tiles_file_list]:
         if os.path.exists(cleanup_file): os.remove(cleanup_file)
 
     for t in tiles:
@@ -204,69 +163,32 @@ def create_dem(input_point_cloud, dem_type, output_type='max', radiuses=['0.56']
     log.ODM_INFO('Completed %s in %s' % (output_file, datetime.now() - start))
 
 
-def compute_euclidean_map(geotiff_path, output_path, overwrite=False):
+def compute_euclidean_map(geotiff_path, output_path, overwrite=False, max_workers=1, max_distance=MAX_BLEND_DISTANCE):
     if not os.path.exists(geotiff_path):
         log.ODM_WARNING("Cannot compute euclidean map (file does not exist: %s)" % geotiff_path)
         return
 
-    nodata = -9999
-    with rasterio.open(geotiff_path) as f:
-        nodata = f.nodatavals[0]
-
     if not os.path.isfile(output_path) or overwrite:
         if os.path.isfile(output_path):
             os.remove(output_path)
 
         log.ODM_INFO("Computing euclidean distance: %s" % output_path)
 
-        if gdal_proximity is not None:
-            try:
-                gdal_proximity(['gdal_proximity.py', 
-                                geotiff_path, output_path, '-values', str(nodata),
-                                '-co', 'TILED=YES',
-                                '-co', 'BIGTIFF=IF_SAFER',
-                                '-co', 'COMPRESS=DEFLATE',
-                            ])
-            except Exception as e:
-                log.ODM_WARNING("Cannot compute euclidean distance: %s" % str(e))
-
-            if os.path.exists(output_path):
-                return output_path
-            else:
-                log.ODM_WARNING("Cannot compute euclidean distance file: %s" % output_path)
+        try:
+            compute_distance_map(geotiff_path, output_path, max_distance=max_distance, max_workers=max_workers)
+        except Exception as e:
+            log.ODM_WARNING("Cannot compute euclidean distance: %s" % str(e))
+
+        if os.path.exists(output_path):
+            return output_path
         else:
-            log.ODM_WARNING("Cannot compute euclidean map, gdal_proximity is missing")
-            
+            log.ODM_WARNING("Cannot compute euclidean distance file: %s" % output_path)
+
     else:
         log.ODM_INFO("Found a euclidean distance map: %s" % output_path)
         return output_path
 
 
-def median_smoothing(geotiff_path, output_path, window_size=512, num_workers=1, radius=4):
-    """ Apply median smoothing """
-    start = datetime.now()
-
-    if not os.path.exists(geotiff_path):
-        raise Exception('File %s does not exist!' % geotiff_path)
-
-    kwargs = {
-        'input': geotiff_path,
-        'output': output_path,
-        'window': window_size,
-        'radius': radius,
-    }
-    system.run('fastrasterfilter "{input}" '
-                '--output "{output}" '
-                '--window-size {window} '
-                '--radius {radius} '
-                '--co TILED=YES '
-                '--co BIGTIFF=IF_SAFER '
-                '--co COMPRESS=DEFLATE '.format(**kwargs), env_vars={'OMP_NUM_THREADS': num_workers})
-
-    log.ODM_INFO('Completed smoothing to create %s in %s' % (output_path, datetime.now() - start))
-    return output_path
-
-
 def get_dem_radius_steps(stats_file, steps, resolution, multiplier = 1.0):
     radius_steps = [point_cloud.get_spacing(stats_file, resolution) * multiplier]
     for _ in range(steps - 1):
@@ -0,0 +1,65 @@
+import numpy as np
+import rasterio
+from scipy import ndimage
+from opendm.dem.utils import process_blocks
+
+# Default cap of euclidean distances (in pixels). This is
+# the distance over which DEMs are blended when they are merged.
+MAX_BLEND_DISTANCE = 256
+
+def distance_to_nodata(arr, nodata, max_distance=None):
+    """
+    :param arr array of DEM values
+    :param nodata nodata value (None if there's no nodata)
+    :param max_distance cap distances to this value (None or 0 to not cap them)
+    :return float32 array with the distance (in pixels) of each cell to the
+        nearest nodata cell of arr
+    """
+    if nodata is None:
+        mask = np.ones(arr.shape, dtype=bool)
+    elif np.isnan(nodata):
+        mask = ~np.isnan(arr)
+    else:
+        mask = arr != nodata
+
+    if mask.all():
+        return np.full(arr.shape, max_distance if max_distance else np.hypot(*arr.shape), dtype=np.float32)
+
+    distance = ndimage.distance_transform_edt(mask)
+    if max_distance:
+        np.minimum(distance, max_distance, out=distance)
+    return distance.astype(np.float32)
+
+def compute_distance_map(input_path, output_path, max_distance=MAX_BLEND_DISTANCE, max_workers=1, block_size=1024):
+    """
+    Compute a map of the euclidean distance (in pixels) of each cell
+    to the nearest nodata cell of a DEM, up to max_distance.
+    Blocks are processed in parallel: each block is read with a halo of max_distance
+    cells, so the (capped) distances are exact. Without max_distance, the distances
+    are computed over the whole raster at once.
+    :param input_path path to DEM
+    :param output_path path to output GeoTIFF (tiled, compressed)
+    :param max_distance cap distances to this value (None or 0 to not cap them)
+    """
+    with rasterio.open(input_path) as src:
+        profile = src.profile.copy()
+        width, height = src.width, src.height
+        nodata = src.nodatavals[0]
+
+    profile.update(driver='GTiff', dtype='float32', count=1, nodata=None,
+                   tiled=True, blockxsize=512, blockysize=512,
+                   compress='deflate', bigtiff='IF_SAFER', num_threads=max_workers)
+
+    if max_distance:
+        halo = int(np.ceil(max_distance))
+    else:
+        halo = 0
+        block_size = max(width, height)
+
+    def process(src, read_window):
+        return distance_to_nodata(src.read(1, window=read_window), nodata, max_distance)
+
+    with rasterio.open(output_path, 'w', **profile) as dst:
+        process_blocks(input_path, dst, process, halo=halo, block_size=block_size, max_workers=max_workers)
+
+    return output_path
@@ -0,0 +1,162 @@
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from scipy import ndimage
+from opendm import log
+from opendm.dem.utils import process_blocks
+
+def coarse_fill(src, scale=0.1, max_distance=100):
+    """
+    Read a DEM at a reduced resolution and fill its gaps in memory
+    :param src rasterio dataset
+    :param scale size of the coarse DEM relative to src
+    :param max_distance maximum distance (in coarse pixels) to fill gaps from valid pixels
+    :return float32 array of the coarse DEM (NaN where it could not be filled)
+    """
+    height = max(1, int(round(src.height * scale)))
+    width = max(1, int(round(src.width * scale)))
+
+    data = src.read(1, out_shape=(height, width), resampling=Resampling.average, masked=True)
+    return fill_pyramid(data.astype(np.float32).filled(np.nan), max_distance)
+
+def fill_pyramid(arr, max_distance=100):
+    """
+    Fill NaN gaps with a push-pull interpolation: the image is halved (averaging valid pixels)
+    until there are no gaps or gaps are farther than max_distance from valid pixels,
+    then the gaps of each level are filled with the upsampled level above it.
+    :param arr float array (NaN = gap), modified in place
+    :return arr
+    """
+    levels = [arr]
+    while np.isnan(levels[-1]).any() and min(levels[-1].shape) > 1 and 2 ** len(levels) <= max_distance:
+        levels.append(downsample(levels[-1]))
+
+    for i in range(len(levels) - 2, -1, -1):
+        fine = levels[i]
+        holes = np.isnan(fine)
+        if holes.any():
+            fine[holes] = upsample(levels[i + 1], fine.shape)[holes]
+
+    return arr
+
+def downsample(arr):
+    """Halve the size of arr, averaging the valid (not NaN) values of each 2x2 block"""
+    h, w = arr.shape
+    padded = np.full((h + h % 2, w + w % 2), np.nan, dtype=arr.dtype)
+    padded[:h, :w] = arr
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+
+    valid = ~np.isnan(blocks)
+    count = valid.sum(axis=(1, 3))
+    total = np.where(valid, blocks, 0).sum(axis=(1, 3))
+
+    result = np.full(count.shape, np.nan, dtype=arr.dtype)
+    np.divide(total, count, out=result, where=count > 0)
+    return result
+
+def upsample(arr, shape):
+    """Bilinear upsampling of arr to shape"""
+    rows = (np.arange(shape[0]) + 0.5) * arr.shape[0] / shape[0] - 0.5
+    cols = (np.arange(shape[1]) + 0.5) * arr.shape[1] / shape[1] - 0.5
+    return bilinear(arr, rows, cols)
+
+def bilinear(arr, rows, cols):
+    """
+    Sample arr at the (fractional) pixel coordinates rows x cols with bilinear interpolation.
+    NaN values are ignored (the weights of valid neighbors are normalized)
+    :return array of shape (len(rows), len(cols))
+    """
+    def axis_weights(coords, size):
+        coords = np.clip(coords, 0, size - 1)
+        lo = np.floor(coords).astype(np.int64)
+        hi = np.minimum(lo + 1, size - 1)
+        f = (coords - lo).astype(np.float32)
+        return lo, hi, f
+
+    r0, r1, fr = axis_weights(rows, arr.shape[0])
+    c0, c1, fc = axis_weights(cols, arr.shape[1])
+    fr = fr[:, np.newaxis]
+    fc = fc[np.newaxis, :]
+
+    valid = ~np.isnan(arr)
+    values = np.where(valid, arr, 0)
+
+    total = np.zeros((len(rows), len(cols)), dtype=np.float32)
+    weights = np.zeros((len(rows), len(cols)), dtype=np.float32)
+    for r, wr in ((r0, 1 - fr), (r1, fr)):
+        for c, wc in ((c0, 1 - fc), (c1, fc)):
+            w = wr * wc * valid[np.ix_(r, c)]
+            total += w * values[np.ix_(r, c)]
+            weights += w
+
+    result = np.full(total.shape, np.nan, dtype=np.float32)
+    np.divide(total, weights, out=result, where=weights > 0)
+    return result
+
+def median_filter(arr, radius):
+    """
+    Median filter with a circular window of the given radius. NaN pixels
+    are left as NaN and do not contribute to the median of their neighbors
+    (they are replaced by their nearest valid value before filtering)
+    """
+    nodata = np.isnan(arr)
+    if nodata.all():
+        return arr
+
+    data = arr
+    if nodata.any():
+        nearest = ndimage.distance_transform_edt(nodata, return_distances=False, return_indices=True)
+        data = arr[tuple(nearest)]
+
+    y, x = np.ogrid[-radius:radius + 1, -radius:radius + 1]
+    result = ndimage.median_filter(data, footprint=(x ** 2 + y ** 2) <= radius ** 2, mode='nearest')
+    result[nodata] = np.nan
+    return result
+
+def fill_and_smooth(input_path, output_path, gapfill=True, smoothing_radius=4, gapfill_scale=0.1,
+                    max_workers=1, block_size=512):
+    """
+    Write a DEM with its gaps filled and/or median smoothing applied, in a single pass over blocks.
+    The gaps are filled by compositing the DEM over a bilinear upsample of a coarse, gap-filled copy of it.
+    :param input_path path to input DEM (e.g. VRT of DEM tiles)
+    :param output_path path to output GeoTIFF
+    :param gapfill whether to fill gaps
+    :param smoothing_radius radius (in pixels) of the median filter, None to disable smoothing
+    :param gapfill_scale size of the coarse DEM used to fill gaps, relative to the input
+    """
+    with rasterio.open(input_path) as src:
+        profile = src.profile.copy()
+        width, height = src.width, src.height
+        nodata = src.nodata if src.nodata is not None else -9999
+
+        if gapfill:
+            coarse = coarse_fill(src, gapfill_scale)
+            scale_y, scale_x = coarse.shape[0] / height, coarse.shape[1] / width
+            log.ODM_INFO("Computed coarse gap fill (%sx%s)" % (coarse.shape[1], coarse.shape[0]))
+
+    profile.update(driver='GTiff', dtype='float32', count=1, nodata=nodata,
+                   tiled=True, blockxsize=block_size, blockysize=block_size,
+                   compress='deflate', bigtiff='IF_SAFER', num_threads=max_workers)
+    # Gaps within the median window take the value of their nearest valid pixel,
+    # which for pixels that affect the block is at most 2 * radius away from it
+    halo = 2 * smoothing_radius if smoothing_radius else 0
+
+    def process(src, read_window):
+        arr = src.read(1, window=read_window, masked=True).astype(np.float32).filled(np.nan)
+
+        if gapfill and np.isnan(arr).any():
+            rows = (np.arange(read_window.row_off, read_window.row_off + read_window.height) + 0.5) * scale_y - 0.5
+            cols = (np.arange(read_window.col_off, read_window.col_off + read_window.width) + 0.5) * scale_x - 0.5
+            holes = np.isnan(arr)
+            arr[holes] = bilinear(coarse, rows, cols)[holes]
+
+        if smoothing_radius:
+            arr = median_filter(arr, smoothing_radius)
+
+        arr[np.isnan(arr)] = nodata
+        return arr
+
+    with rasterio.open(output_path, 'w', **profile) as dst:
+        process_blocks(input_path, dst, process, halo=halo, block_size=block_size, max_workers=max_workers)
+
+    return output_path
@@ -1,6 +1,5 @@
 import numpy as np
 from scipy.spatial import Delaunay
-from ..point_cloud import PointCloud
 
 EPSILON = 0.00001
 
@@ -18,14 +17,15 @@ class PolyBounds(object):
         return point_cloud[mask]
 
     def percentage_of_points_inside(self, points):
-        if isinstance(points, PointCloud):
+        if hasattr(points, 'get_xy'):
             points = points.get_xy()
         mask = self.calculate_mask(points)
         return np.count_nonzero(mask) * 100 / points.shape[0]
 
     def calculate_mask(self, points):
-        """Calculate the mask that would filter out the points outside the bounds"""
-        if isinstance(points, PointCloud):
+        """Calculate the mask that would filter out the points outside the bounds
+           :param points xy coordinates, or a PointCloud (or PointCloudView)"""
+        if hasattr(points, 'get_xy'):
             points = points.get_xy()
         return self.__delaunay.find_simplex(points) >= 0
 
@@ -46,14 +46,15 @@ class BoxBounds(object):
         return point_cloud[mask]
 
     def percentage_of_points_inside(self, points):
-        if isinstance(points, PointCloud):
+        if hasattr(points, 'get_xy'):
             points = points.get_xy()
         mask = self.calculate_mask(points)
         return np.count_nonzero(mask) * 100 / points.shape[0]
 
     def calculate_mask(self, points):
-        """Calculate the mask that would filter out the points outside the bounds"""
-        if isinstance(points, PointCloud):
+        """Calculate the mask that would filter out the points outside the bounds
+           :param points xy coordinates, or a PointCloud (or PointCloudView)"""
+        if hasattr(points, 'get_xy'):
             points = points.get_xy()
         (x_min, x_max, y_min, y_max) = self._corners
         min = np.array([x_min, y_min])
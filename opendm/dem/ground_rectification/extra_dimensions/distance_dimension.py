@@ -13,22 +13,15 @@ class DistanceDimension(Dimension):
         super(DistanceDimension, self)._set_values(point_cloud, default)
 
     def assign(self, *point_clouds, **kwargs):
-        for point_cloud in point_clouds:
-            xy = point_cloud.get_xy()
+        """If 'distances' is given (one array per point cloud), those values are assigned instead of being calculated"""
+        distances = kwargs.get('distances')
+        random_state = kwargs.get('random_state')
 
-            # Calculate RANSCAC model
-            model = RANSACRegressor().fit(xy, point_cloud.get_z())
-
-            # Calculate angle between estimated plane and XY plane
-            angle = self.__calculate_angle(model)
-            if angle >= 45:
-                # If the angle is higher than 45 degrees, then don't calculate the difference, since it will probably be way off
-                diff = np.full(point_cloud.len(), 0)
+        for i, point_cloud in enumerate(point_clouds):
+            if distances is not None:
+                diff = distances[i]
             else:
-                predicted = model.predict(xy)
-                diff = point_cloud.get_z() - predicted
-                # Ignore the diff when the diff is below the ground
-                diff[diff < 0] = 0
+                diff = calculate_distance_to_ground(point_cloud.get_xy(), point_cloud.get_z(), random_state)
             super(DistanceDimension, self)._set_values(point_cloud, diff)
 
     def get_name(self):
@@ -37,9 +30,25 @@ class DistanceDimension(Dimension):
     def get_las_type(self):
         return 'float64'
 
-    def __calculate_angle(self, model):
-        "Calculate the angle between the estimated plane and the XY plane"
-        a = model.estimator_.coef_[0]
-        b = model.estimator_.coef_[1]
-        angle = np.arccos(1 / np.sqrt(a ** 2 + b ** 2 + 1))
-        return np.degrees(angle)
+def calculate_distance_to_ground(xy, z, random_state=None):
+    """Calculate the distance of each point to the ground plane estimated with RANSAC"""
+    # Calculate RANSCAC model
+    model = RANSACRegressor(random_state=random_state).fit(xy, z)
+
+    # Calculate angle between estimated plane and XY plane
+    angle = calculate_angle(model)
+    if angle >= 45:
+        # If the angle is higher than 45 degrees, then don't calculate the difference, since it will probably be way off
+        return np.full(len(z), 0)
+
+    diff = z - model.predict(xy)
+    # Ignore the diff when the diff is below the ground
+    diff[diff < 0] = 0
+    return diff
+
+def calculate_angle(model):
+    "Calculate the angle between the estimated plane and the XY plane"
+    a = model.estimator_.coef_[0]
+    b = model.estimator_.coef_[1]
+    angle = np.arccos(1 / np.sqrt(a ** 2 + b ** 2 + 1))
+    return np.degrees(angle)
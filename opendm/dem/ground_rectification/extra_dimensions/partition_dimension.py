@@ -10,12 +10,12 @@ class PartitionDimension(Dimension):
         self.name = name
 
     def assign_default(self, point_cloud):
-        default = np.full(point_cloud.len(), 0)
+        default = np.full(point_cloud.len(), 0, dtype=np.uint32)
         super(PartitionDimension, self)._set_values(point_cloud, default)
 
     def assign(self, *point_clouds, **kwargs):
         for point_cloud in point_clouds:
-            super(PartitionDimension, self)._set_values(point_cloud, np.full(point_cloud.len(), self.counter))
+            super(PartitionDimension, self)._set_values(point_cloud, np.full(point_cloud.len(), self.counter, dtype=np.uint32))
         self.counter += 1
 
     def get_name(self):
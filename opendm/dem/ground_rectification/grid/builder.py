@@ -1,32 +1,78 @@
 import numpy as np
-from sklearn.neighbors import BallTree
 
 EPSILON = 0.00001
+CHUNK_SIZE = 10000000
 
 def build_grid(bounds, point_cloud, distance):
     """First, a 2D grid is built with a distance of 'distance' between points, inside the given bounds.
        Then, only points that don't have a point cloud neighbour closer than 'distance' are left. The rest are filtered out."""
 
-    # Generate a grid of 2D points inside the bounds, with a distance of 'distance' between them
-    grid = __build_grid(bounds, distance)
+    # Generate the axes of a grid of 2D points inside the bounds, with a distance of 'distance' between them
+    xs, ys = __grid_axes(bounds, distance)
+
+    # Find the grid points that don't have a neighbor closer than 'distance' from the given point cloud
+    lonely = ~__calculate_occupancy(xs, ys, point_cloud.get_xy(), distance)
+    i, j = np.nonzero(lonely)
+    grid = np.column_stack((xs[i], ys[j]))
 
     # Filter out grid points outside the bounds (makes sense if bounds are not squared)
-    grid_inside = bounds.keep_points_inside(grid)
+    return bounds.keep_points_inside(grid)
+
+def label_grid_points(grid, grid_bounds, distance, partitions_bounds):
+    """Assign each grid point (as returned by build_grid) the index of the last partition whose bounds contain it, or -1.
+       A label raster is painted one partition at a time, testing only the grid cells within the partition's corners."""
+    xs, ys = __grid_axes(grid_bounds, distance)
+    labels = np.full((len(xs), len(ys)), -1, dtype=np.int32)
+
+    for n, bounds in enumerate(partitions_bounds):
+        x_min, x_max, y_min, y_max = bounds.corners()
+        i_from, i_to = __cell_range(xs, x_min, x_max, distance)
+        j_from, j_to = __cell_range(ys, y_min, y_max, distance)
+        if i_from >= i_to or j_from >= j_to:
+            continue
+
+        i, j = np.meshgrid(np.arange(i_from, i_to), np.arange(j_from, j_to), indexing='ij')
+        cells = np.column_stack((xs[i.ravel()], ys[j.ravel()]))
+        mask = bounds.calculate_mask(cells).reshape(i.shape)
+        labels[i_from:i_to, j_from:j_to][mask] = n
 
-    # Filter out the grid points that have a neighbor  closer than 'distance' from the given point cloud
-    return __calculate_lonely_points(grid_inside, point_cloud, distance)
+    if len(grid) == 0:
+        return np.empty(0, dtype=np.int32)
 
-def __build_grid(bounds, distance):
+    x_min, _, y_min, _ = grid_bounds.corners()
+    i = np.rint((grid[:, 0] - x_min) / distance).astype(np.int64)
+    j = np.rint((grid[:, 1] - y_min) / distance).astype(np.int64)
+    return labels[i, j]
+
+def __grid_axes(bounds, distance):
     x_min, x_max, y_min, y_max = bounds.corners()
-    grid = [[x, y] for x in np.arange(x_min, x_max + distance, distance) for y in np.arange(y_min, y_max + distance, distance)]
-    return np.array(grid)
+    return np.arange(x_min, x_max + distance, distance), np.arange(y_min, y_max + distance, distance)
+
+def __cell_range(axis, v_min, v_max, distance):
+    # One extra cell on each side, the bounds will decide about the points at the border
+    start = max(0, int(np.floor((v_min - axis[0]) / distance)) - 1)
+    end = min(len(axis), int(np.ceil((v_max - axis[0]) / distance)) + 2)
+    return start, end
+
+def __calculate_occupancy(xs, ys, xy, distance):
+    """Rasterize the point cloud on the grid: a grid point is occupied if a point is closer than 'distance' (manhattan) to it.
+       Such a point can only be in one of the four grid cells around the grid point, so each point is
+       checked against the corners of the cell it falls in."""
+    occupied = np.zeros((len(xs), len(ys)), dtype=bool)
+    radius = distance - EPSILON
 
-def __calculate_lonely_points(grid, point_cloud, distance):
-    # Generate BallTree for point cloud
-    ball_tree = BallTree(point_cloud.get_xy(), metric='manhattan')
+    for start in range(0, len(xy), CHUNK_SIZE):
+        chunk = xy[start:start + CHUNK_SIZE]
+        i = np.floor((chunk[:, 0] - xs[0]) / distance).astype(np.int64)
+        j = np.floor((chunk[:, 1] - ys[0]) / distance).astype(np.int64)
 
-    # Calculate for each of the points in the grid, the amount of neighbors in the original ground cloud
-    count = ball_tree.query_radius(grid, distance - EPSILON, count_only=True)
+        for di in (0, 1):
+            for dj in (0, 1):
+                ci = i + di
+                cj = j + dj
+                valid = (ci >= 0) & (ci < len(xs)) & (cj >= 0) & (cj < len(ys))
+                ci, cj = ci[valid], cj[valid]
+                near = np.abs(chunk[valid, 0] - xs[ci]) + np.abs(chunk[valid, 1] - ys[cj]) <= radius
+                occupied[ci[near], cj[near]] = True
 
-    # Return only the points in the grid that don't have a neighbor
-    return grid[count == 0]
+    return occupied
@@ -25,7 +25,8 @@ def read_cloud(point_cloud_path):
     cloud = PointCloud.with_dimensions(x, y, z, classification, red, green, blue)
 
     if "UserData" in arrays.dtype.names:
-        cloud.add_dimension(UserDataDimension(), arrays["UserData"])
+        # Copy, so that the array of all LAS dimensions can be released
+        cloud.add_dimension(UserDataDimension(), arrays["UserData"].copy())
 
     return pipeline.metadata["metadata"]["readers.las"], cloud
 
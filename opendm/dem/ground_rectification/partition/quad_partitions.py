@@ -14,39 +14,58 @@ class QuadPartitions(PartitionPlan):
         self.point_cloud = point_cloud
 
     @abstractmethod
-    def choose_divide_point(self, point_cloud, bounding_box):
-        """Given a point cloud and a bounding box, calculate the point that will be used to divide the partition by four"""
+    def choose_divide_point(self, xy, bounding_box):
+        """Given the coordinates of the points and a bounding box, calculate the point that will be used to divide the partition by four"""
 
     def execute(self, **kwargs):
         initial_bounding_box = box_from_cloud(self.point_cloud)
-        return self._divide_until(self.point_cloud, initial_bounding_box, kwargs['min_points'], kwargs['min_area'])
 
-    def _divide_until(self, point_cloud, bounding_box, min_points, min_area):
-        dividing_point = self.choose_divide_point(point_cloud, bounding_box)
+        # Rows and coordinates are reordered as the partitions are divided, so that
+        # each partition ends up as a contiguous range of them
+        rows = np.arange(self.point_cloud.len())
+        xy = self.point_cloud.get_xy(copy=True)
+        return self._divide_until(rows, xy, 0, len(rows), initial_bounding_box, kwargs['min_points'], kwargs['min_area'])
+
+    def _divide_until(self, rows, xy, start, end, bounding_box, min_points, min_area):
+        node_xy = xy[start:end]
+        dividing_point = self.choose_divide_point(node_xy, bounding_box)
         new_boxes = bounding_box.divide_by_point(dividing_point)
 
         for new_box in new_boxes:
             if new_box.area() < min_area:
-                return [Partition(point_cloud, bounds=bounding_box)] # If by dividing, I break the minimum area threshold, don't do it
+                return [self._partition(rows, xy, start, end, bounding_box)] # If by dividing, I break the minimum area threshold, don't do it
+
+        positions = [np.flatnonzero(new_box.calculate_mask(node_xy)) for new_box in new_boxes]
+        for p in positions:
+            if len(p) < min_points:
+                return [self._partition(rows, xy, start, end, bounding_box)] # If by dividing, I break the minimum amount of points in a zone, don't do it
+
+        # Move the points of each new box next to each other (keeping their relative order),
+        # points that fall in between the boxes go last
+        inside = np.zeros(end - start, dtype=bool)
+        for p in positions:
+            inside[p] = True
+        order = np.concatenate(positions + [np.flatnonzero(~inside)])
+        rows[start:end] = rows[start:end][order]
+        xy[start:end] = node_xy[order]
 
         subdivisions = []
-
-        for new_box in new_boxes:
-            mask = new_box.calculate_mask(point_cloud)
-            if np.count_nonzero(mask) < min_points:
-                return [Partition(point_cloud, bounds=bounding_box)] # If by dividing, I break the minimum amount of points in a zone, don't do it
-
-            subdivisions += self._divide_until(point_cloud[mask], new_box, min_points, min_area)
+        for new_box, p in zip(new_boxes, positions):
+            subdivisions += self._divide_until(rows, xy, start, start + len(p), new_box, min_points, min_area)
+            start += len(p)
 
         return subdivisions
 
+    def _partition(self, rows, xy, start, end, bounding_box):
+        return Partition(self.point_cloud.view(rows[start:end], xy[start:end]), bounds=bounding_box)
+
 class UniformPartitions(QuadPartitions):
     """This kind of partitioner takes the current bounding box, and divides it by four uniform partitions"""
 
     def __init__(self, point_cloud):
         super(UniformPartitions, self).__init__(point_cloud)
 
-    def choose_divide_point(self, point_cloud, bounding_box):
+    def choose_divide_point(self, xy, bounding_box):
         return bounding_box.center()
 
 class MedianPartitions(QuadPartitions):
@@ -55,5 +74,5 @@ class MedianPartitions(QuadPartitions):
     def __init__(self, point_cloud):
         super(MedianPartitions, self).__init__(point_cloud)
 
-    def choose_divide_point(self, point_cloud, bounding_box):
-        return np.median(point_cloud.get_xy(), axis=0)
+    def choose_divide_point(self, xy, bounding_box):
+        return np.median(xy, axis=0)
@@ -105,6 +105,8 @@ class ExecutionResult:
 
     def build_result(self, whole_point_cloud):
         remaining_cloud = whole_point_cloud[~self.marked_as_neighbors]
-        new_bounds = box_from_cloud(remaining_cloud)
-        self.partitions.insert(0, Partition(remaining_cloud, bounds=new_bounds))
+        # In sparse clouds, all of the points can be neighbors of some cluster
+        if remaining_cloud.len() > 0:
+            new_bounds = box_from_cloud(remaining_cloud)
+            self.partitions.insert(0, Partition(remaining_cloud, bounds=new_bounds))
         return self.partitions
@@ -1,8 +1,8 @@
 import numpy as np
-from numpy.lib.recfunctions import append_fields
 
 class PointCloud:
-    """Representation of a 3D point cloud"""
+    """Representation of a 3D point cloud. Columns are stored once: subsets of the cloud
+       (see __getitem__) are PointCloudView instances that reference rows of this cloud."""
     def __init__(self, xy, z, classification, rgb, indices, extra_dimensions, extra_dimensions_metadata):
         self.xy = xy
         self.z = z
@@ -22,12 +22,21 @@ class PointCloud:
     @staticmethod
     def with_xy(xy):
         [x, y] = np.hsplit(xy, 2)
-        empty = np.empty(xy.shape[0])
-        return PointCloud.with_dimensions(x.ravel(), y.ravel(), empty, np.empty(xy.shape[0], dtype=np.uint8), empty, empty, empty)
-
-    def __getitem__(self, mask):
-        masked_dimensions = { name: values[mask] for name, values in self.extra_dimensions.items() }
-        return PointCloud(self.xy[mask], self.z[mask], self.classification[mask], self.rgb[mask], self.indices[mask], masked_dimensions, self.extra_dimensions_metadata)
+        # Points that are never given an altitude are outside any bounding box
+        z = np.full(xy.shape[0], np.nan)
+        color = np.zeros(xy.shape[0], dtype=np.uint16)
+        return PointCloud.with_dimensions(x.ravel(), y.ravel(), z, np.empty(xy.shape[0], dtype=np.uint8), color, color, color)
+
+    def __getitem__(self, rows):
+        """:param rows boolean mask, array of row numbers or slice
+           :return PointCloudView of the selected rows (no point data is copied)"""
+        return self.view(rows)
+
+    def view(self, rows, xy=None):
+        """:param xy coordinates of the selected rows, if they are already available"""
+        if isinstance(rows, np.ndarray) and rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return PointCloudView(self, rows, xy)
 
     def concatenate(self, other_cloud):
         for name, dimension in self.extra_dimensions_metadata.items():
@@ -36,7 +45,7 @@ class PointCloud:
         for name, dimension in other_cloud.extra_dimensions_metadata.items():
             if name not in self.extra_dimensions:
                 dimension.assign_default(self)
-        new_indices = np.arange(len(self.indices), len(self.indices) + len(other_cloud.indices))
+        new_indices = np.arange(len(self.indices), len(self.indices) + other_cloud.len())
         self.xy = np.concatenate((self.xy, other_cloud.xy))
         self.z = np.concatenate((self.z, other_cloud.z))
         self.classification = np.concatenate((self.classification, other_cloud.classification))
@@ -45,25 +54,37 @@ class PointCloud:
         self.extra_dimensions = { name: np.concatenate((values, other_cloud.extra_dimensions[name])) for name, values in self.extra_dimensions.items() }
 
     def update(self, other_cloud):
+        # Views of this cloud write their values in place, there's nothing to copy back
+        if isinstance(other_cloud, PointCloudView) and other_cloud.base is self:
+            return
+
         for name, dimension in self.extra_dimensions_metadata.items():
             if name not in other_cloud.extra_dimensions:
                 dimension.assign_default(other_cloud)
         for name, dimension in other_cloud.extra_dimensions_metadata.items():
             if name not in self.extra_dimensions:
                 dimension.assign_default(self)
-        self.xy[other_cloud.indices] = other_cloud.xy
-        self.z[other_cloud.indices] = other_cloud.z
-        self.classification[other_cloud.indices] = other_cloud.classification
-        self.rgb[other_cloud.indices] = other_cloud.rgb
+        indices = other_cloud.indices
+        self.xy[indices] = other_cloud.xy
+        self.z[indices] = other_cloud.z
+        self.classification[indices] = other_cloud.classification
+        self.rgb[indices] = other_cloud.rgb
+        other_dimensions = other_cloud.extra_dimensions
         for name, values in self.extra_dimensions.items():
-            values[other_cloud.indices] = other_cloud.extra_dimensions[name]
+            values[indices] = other_dimensions[name]
 
     def add_dimension(self, dimension, values):
         self.extra_dimensions[dimension.get_name()] = values
         self.extra_dimensions_metadata[dimension.get_name()] = dimension
 
-    def get_xy(self):
-        return self.xy
+    def set_dimension_rows(self, dimension, rows, values):
+        """Set the values of a dimension for some rows, the other rows get the default value if the dimension is new"""
+        if dimension.get_name() not in self.extra_dimensions:
+            dimension.assign_default(self)
+        self.extra_dimensions[dimension.get_name()][rows] = values
+
+    def get_xy(self, copy=False):
+        return self.xy.copy() if copy else self.xy
 
     def get_z(self):
         return self.z
@@ -81,6 +102,76 @@ class PointCloud:
         z_max = max(self.z)
         return BoundingBox3D(x_min, x_max, y_min, y_max, z_min, z_max)
 
+class PointCloudView:
+    """A subset of the rows of a PointCloud. Reading a column gathers the selected rows
+       (or slices them, if rows is a slice), while new dimension values are written directly to the base cloud."""
+    def __init__(self, base, rows, xy=None):
+        self.base = base
+        self.rows = rows
+        self._xy = xy
+
+    @property
+    def xy(self):
+        return self._xy if self._xy is not None else self.base.xy[self.rows]
+
+    @property
+    def z(self):
+        return self.base.z[self.rows]
+
+    @property
+    def classification(self):
+        return self.base.classification[self.rows]
+
+    @property
+    def rgb(self):
+        return self.base.rgb[self.rows]
+
+    @property
+    def indices(self):
+        return self.base.indices[self.rows]
+
+    @property
+    def extra_dimensions(self):
+        return { name: values[self.rows] for name, values in self.base.extra_dimensions.items() }
+
+    @property
+    def extra_dimensions_metadata(self):
+        return self.base.extra_dimensions_metadata
+
+    def __getitem__(self, rows):
+        return self.view(rows)
+
+    def view(self, rows, xy=None):
+        if isinstance(rows, np.ndarray) and rows.dtype == bool:
+            if xy is None and self._xy is not None:
+                xy = self._xy[rows]
+            rows = np.flatnonzero(rows)
+        return PointCloudView(self.base, self.__base_rows()[rows], xy)
+
+    def add_dimension(self, dimension, values):
+        self.base.set_dimension_rows(dimension, self.rows, values)
+
+    def get_xy(self, copy=False):
+        xy = self.xy
+        if copy and (self._xy is not None or isinstance(self.rows, slice)):
+            xy = xy.copy()
+        return xy
+
+    def get_z(self):
+        return self.z
+
+    def len(self):
+        if isinstance(self.rows, slice):
+            return len(range(*self.rows.indices(self.base.len())))
+        return len(self.rows)
+
+    def get_extra_dimension_values(self, name):
+        return self.base.extra_dimensions[name][self.rows]
+
+    def __base_rows(self):
+        if isinstance(self.rows, slice):
+            return np.arange(self.base.len())[self.rows]
+        return self.rows
 
 class BoundingBox3D:
     def __init__(self, x_min, x_max, y_min, y_max, z_min, z_max):
@@ -1,33 +1,71 @@
 import argparse
+import shutil
+import tempfile
 import numpy as np
 from os import path
-from sklearn.neighbors import BallTree
+from joblib import delayed, Parallel
 from sklearn.linear_model import RANSACRegressor
-from .extra_dimensions.distance_dimension import DistanceDimension
+from .extra_dimensions.distance_dimension import DistanceDimension, calculate_distance_to_ground
 from .extra_dimensions.partition_dimension import PartitionDimension
 from .extra_dimensions.extended_dimension import ExtendedDimension
-from .grid.builder import build_grid
+from .grid.builder import build_grid, label_grid_points
 from .bounds.utils import calculate_convex_hull_bounds
-from .io.las_io import read_cloud, write_cloud
 from .partition.selector import select_partition_plan
 from .point_cloud import PointCloud
 
 EPSILON = 0.00001
 
 def run_rectification(**kwargs):
+    from .io.las_io import read_cloud, write_cloud
+
+    # The whole cloud is read and written at once: the median split and the
+    # clustering of the surrounding plan depend on all of the ground points
     header, point_cloud = read_cloud(kwargs['input'])
+    max_workers = kwargs.get('max_workers', 1)
 
     if 'reclassify_plan' in kwargs and kwargs['reclassify_plan'] is not None:
-        point_cloud = reclassify_cloud(point_cloud, kwargs['reclassify_plan'], kwargs['reclassify_threshold'], kwargs['min_points'], kwargs['min_area'])
+        point_cloud = reclassify_cloud(point_cloud, kwargs['reclassify_plan'], kwargs['reclassify_threshold'], kwargs['min_points'], kwargs['min_area'], max_workers)
 
     if 'extend_plan' in kwargs and kwargs['extend_plan'] is not None:
-        point_cloud = extend_cloud(point_cloud, kwargs['extend_plan'], kwargs['extend_grid_distance'], kwargs['min_points'], kwargs['min_area'])
+        point_cloud = extend_cloud(point_cloud, kwargs['extend_plan'], kwargs['extend_grid_distance'], kwargs['min_points'], kwargs['min_area'], max_workers)
 
     write_cloud(header, point_cloud, kwargs['output'])
 
-def reclassify_cloud(point_cloud, plan, threshold, min_points, min_area):
+def fit_partitions(func, columns, tasks, max_workers=1):
+    """Run func(*[column[rows] for column in columns], *args) for each (rows, args) task, in parallel worker processes if max_workers > 1.
+       The columns are written once to memory mapped files that the workers read, so only the row numbers
+       of each partition are sent to them. Results are returned in the same order as the tasks, so that they
+       can be applied to the point cloud in the same order regardless of the number of workers."""
+    if max_workers > 1 and len(tasks) > 1:
+        temp_folder = tempfile.mkdtemp(prefix='rectify_')
+        try:
+            shared = []
+            for i, column in enumerate(columns):
+                filename = path.join(temp_folder, 'column_%s.npy' % i)
+                np.save(filename, column)
+                shared.append(np.load(filename, mmap_mode='r'))
+
+            # Memory mapped arrays are passed to the workers by file name
+            return Parallel(n_jobs=max_workers, mmap_mode='r', temp_folder=temp_folder)(delayed(__fit_rows)(func, shared, rows, args) for rows, args in tasks)
+        finally:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+    else:
+        return [__fit_rows(func, columns, rows, args) for rows, args in tasks]
+
+def __fit_rows(func, columns, rows, args):
+    return func(*[column[rows] for column in columns], *args)
+
+def __ground_rows(partition_cloud, ground_rows):
+    """:return rows of the ground cloud (whose rows in the original cloud are ground_rows) that are in a partition"""
+    rows = partition_cloud.rows
+    if isinstance(rows, slice):
+        rows = np.arange(partition_cloud.base.len())[rows]
+    return np.searchsorted(ground_rows, rows)
+
+def reclassify_cloud(point_cloud, plan, threshold, min_points, min_area, max_workers=1):
     # Get only ground
-    ground_cloud = point_cloud[point_cloud.classification == 2]
+    ground_rows = np.flatnonzero(point_cloud.classification == 2)
+    ground_cloud = point_cloud[ground_rows]
 
     # Get the partition plan, according to the specified criteria
     partition_plan = select_partition_plan(plan, ground_cloud)
@@ -35,15 +73,22 @@ def reclassify_cloud(point_cloud, plan, threshold, min_points, min_area):
     # Execute the partition plan, and get all the partitions
     partitions = [result for result in partition_plan.execute(min_points=min_points, min_area=min_area)]
 
+    # Partitions are independent: fit the ground of each of them in parallel.
+    # Each partition has its own random state so that results don't depend on scheduling.
+    tasks = [(__ground_rows(p.point_cloud, ground_rows), (i,)) for i, p in enumerate(partitions)]
+    distances = fit_partitions(calculate_distance_to_ground, [ground_cloud.get_xy(), ground_cloud.get_z()], tasks, max_workers)
+
     # Add 'distance to ground' and 'partition number' dimensions to the cloud
-    for dimension in [DistanceDimension(), PartitionDimension('reclassify_partition')]:
+    distance_dimension = DistanceDimension()
+    partition_dimension = PartitionDimension('reclassify_partition')
 
-        # Calculate new dimension for partition
-        for partition in partitions:
-            dimension.assign(partition.point_cloud)
+    for partition, distance in zip(partitions, distances):
+        distance_dimension.assign(partition.point_cloud, distances=[distance])
+        point_cloud.update(partition.point_cloud)
 
-            # Update new data to the original point cloud
-            point_cloud.update(partition.point_cloud)
+    for partition in partitions:
+        partition_dimension.assign(partition.point_cloud)
+        point_cloud.update(partition.point_cloud)
 
     # Calculate the points that need to be reclassified
     mask = point_cloud.get_extra_dimension_values('distance_to_ground') > threshold
@@ -53,9 +98,10 @@ def reclassify_cloud(point_cloud, plan, threshold, min_points, min_area):
 
     return point_cloud
 
-def extend_cloud(point_cloud, plan, distance, min_points, min_area):
+def extend_cloud(point_cloud, plan, distance, min_points, min_area, max_workers=1):
     # Get only ground
-    ground_cloud = point_cloud[point_cloud.classification == 2]
+    ground_rows = np.flatnonzero(point_cloud.classification == 2)
+    ground_cloud = point_cloud[ground_rows]
 
     # Read the bounds file
     bounds = calculate_convex_hull_bounds(ground_cloud.get_xy())
@@ -72,17 +118,22 @@ def extend_cloud(point_cloud, plan, distance, min_points, min_area):
     # Execute the partition plan, and get all the partitions
     partitions = partition_plan.execute(distance=distance, min_points=min_points, min_area=min_area, bounds=bounds)
 
+    # Keep the grid points that are inside each partition. When partitions overlap, the
+    # last one is the one that sets the point, so the point is only given to that one
+    grids_inside = __split_grid(grid_3d, label_grid_points(grid_2d, bounds, distance, [partition.bounds for partition in partitions]), len(partitions))
+
+    # In each partition, calculate the altitude of the grid points (in parallel)
+    tasks = [(__ground_rows(partition.point_cloud, ground_rows), (grid_inside.get_xy(), i))
+             for i, (partition, grid_inside) in enumerate(zip(partitions, grids_inside)) if __can_extend(partition, grid_inside)]
+    altitudes = iter(fit_partitions(__predict_altitude, [ground_cloud.get_xy(), ground_cloud.get_z()], tasks, max_workers))
+
     # Create dimensions
     partition_dimension = PartitionDimension('extend_partition')
     extended_dimension = ExtendedDimension()
 
-    for partition in partitions:
-        # Keep the grid point that are inside the partition
-        grid_inside = partition.bounds.keep_points_inside(grid_3d)
-
-        if grid_inside.len() > 0:
-            # In each partition, calculate the altitude of the grid points
-            new_points = __calculate_new_points(grid_inside, partition.point_cloud)
+    for partition, grid_inside in zip(partitions, grids_inside):
+        if __can_extend(partition, grid_inside):
+            new_points = __calculate_new_points(grid_inside, partition.point_cloud, next(altitudes))
 
             # Assign the dimension values
             partition_dimension.assign(new_points, partition.point_cloud)
@@ -111,18 +162,33 @@ def extend_cloud(point_cloud, plan, distance, min_points, min_area):
     # Add the new points to the original point cloud
     return point_cloud
 
-def __calculate_new_points(grid_points_inside, partition_point_cloud):
+def __split_grid(grid_3d, labels, count):
+    # Stable sort, so that points keep their order within each partition
+    order = np.argsort(labels, kind='stable')
+    limits = np.searchsorted(labels[order], np.arange(count + 1))
+    return [grid_3d[order[limits[i]:limits[i + 1]]] for i in range(count)]
+
+def __can_extend(partition, grid_inside):
+    return grid_inside.len() > 0 and partition.point_cloud.len() > 0
+
+def __predict_altitude(xy, z, grid_xy, random_state=None):
+    if len(z) < 3:
+        # Not enough points to fit a plane (sparse clouds), use their average altitude
+        return np.full(len(grid_xy), np.mean(z))
+
     # Calculate RANSCAC model
-    model = RANSACRegressor().fit(partition_point_cloud.get_xy(), partition_point_cloud.get_z())
+    model = RANSACRegressor(random_state=random_state).fit(xy, z)
 
     # With the ransac model, calculate the altitude for each grid point
-    grid_points_altitude = model.predict(grid_points_inside.get_xy())
+    return model.predict(grid_xy)
 
+def __calculate_new_points(grid_points_inside, partition_point_cloud, grid_points_altitude):
     # Calculate color for new points
-    [avg_red, avg_green, avg_blue] = np.mean(partition_point_cloud.rgb, axis=0)
-    red = np.full(grid_points_inside.len(), avg_red)
-    green = np.full(grid_points_inside.len(), avg_green)
-    blue = np.full(grid_points_inside.len(), avg_blue)
+    rgb = partition_point_cloud.rgb
+    [avg_red, avg_green, avg_blue] = np.mean(rgb, axis=0)
+    red = np.full(grid_points_inside.len(), avg_red, dtype=rgb.dtype)
+    green = np.full(grid_points_inside.len(), avg_green, dtype=rgb.dtype)
+    blue = np.full(grid_points_inside.len(), avg_blue, dtype=rgb.dtype)
 
     # Classify all new points as ground
     classification = np.full(grid_points_inside.len(), 2, dtype=np.uint8)
@@ -143,6 +209,7 @@ if __name__ == '__main__':
     parser.add_argument('--extend_grid_distance', type=float, help='The distance between points on the grid that will be added to the point cloud.', default=5)
     parser.add_argument('--min_area', type=int, help='Some partition plans need a minimum area as a stopping criteria.', default=750)
     parser.add_argument('--min_points', type=int, help='Some partition plans need a minimum number of points as a stopping criteria.', default=500)
+    parser.add_argument('--max_workers', type=int, help='The number of worker processes used to fit the partitions.', default=1)
 
     args = parser.parse_args()
 
@@ -151,4 +218,4 @@ if __name__ == '__main__':
 
     run(input=args.input, reclassify_plan=args.reclassify_plan, reclassify_threshold=args.reclassify_threshold, \
         extend_plan=args.extend_plan, extend_grid_distance=args.extend_grid_distance, \
-        output=args.output, min_points=args.min_points, min_area=args.min_area, debug=False)
+        output=args.output, min_points=args.min_points, min_area=args.min_area, max_workers=args.max_workers, debug=False)
@@ -5,11 +5,12 @@ import rasterio
 from rasterio.transform import Affine, rowcol
 from opendm import system
 from opendm.dem.commands import compute_euclidean_map
+from opendm.dem.euclidean import MAX_BLEND_DISTANCE
 from opendm import log
 from opendm import io
 import os
 
-def euclidean_merge_dems(input_dems, output_dem, creation_options={}, euclidean_map_source=None):
+def euclidean_merge_dems(input_dems, output_dem, creation_options={}, euclidean_map_source=None, max_blend_distance=MAX_BLEND_DISTANCE):
     """
     Based on https://github.com/mapbox/rio-merge-rgba
     and ideas from Anna Petrasova
@@ -41,11 +42,13 @@ def euclidean_merge_dems(input_dems, output_dem, creation_options={}, euclidean_
         profile = first.profile
 
     for dem in existing_dems:
-        eumap = compute_euclidean_map(dem, io.related_file_path(dem, postfix=".euclideand", replace_base=euclidean_map_source), overwrite=False)
+        eumap = compute_euclidean_map(dem, io.related_file_path(dem, postfix=".euclideand", replace_base=euclidean_map_source), overwrite=False, max_distance=max_blend_distance)
         if eumap and io.file_exists(eumap):
             inputs.append((dem, eumap))
 
     log.ODM_INFO("%s valid DEM rasters to merge" % len(inputs))
+    if max_blend_distance:
+        log.ODM_INFO("Blending DEMs over up to %s pixels" % max_blend_distance)
 
     sources = [(rasterio.open(d), rasterio.open(e)) for d,e in inputs]
 
@@ -154,6 +157,11 @@ def euclidean_merge_dems(input_dems, output_dem, creation_options={}, euclidean_
                 temp_e[temp_e==0] = small_distance
                 temp_e[temp_d==nodata] = 0
 
+                # Blend up to the maximum blend distance (the distance maps
+                # are only computed up to it)
+                if max_blend_distance:
+                    np.minimum(temp_e, max_blend_distance, out=temp_e)
+
                 np.multiply(temp_d, temp_e, out=temp_d)
                 np.add(dstarr, temp_d, out=dstarr)
                 np.add(distsum, temp_e, out=distsum)
@@ -32,10 +32,14 @@
 
 import os
 import sys
+import math
+import shutil
 import json as jsonlib
 import tempfile
 from opendm import system
 from opendm import log
+from opendm import pcinfo
+from opendm.concurrency import parallel_map
 from opendm.utils import double_quote
 
 from datetime import datetime
@@ -135,7 +139,7 @@ def json_add_readers(json, filenames):
 
 """ Run PDAL commands """
 
-def run_pipeline(json):
+def run_pipeline(json, stream=False):
     """ Run PDAL Pipeline with provided JSON """
 
     # write to temp file
@@ -148,6 +152,8 @@ def run_pipeline(json):
         'pipeline',
         '-i %s' % double_quote(jsonfile)
     ]
+    if stream:
+        cmd.append('--stream')
     system.run(' '.join(cmd))
     os.remove(jsonfile)
 
@@ -170,6 +176,125 @@ def run_pdaltranslate_smrf(fin, fout, scalar, slope, threshold, window):
     system.run(' '.join(cmd))
 
 
+def smrf_tile_plan(bounds, window, max_workers):
+    """
+    Plan the tiles of a tiled SMRF classification
+    :param bounds dictionary with minx, maxx, miny, maxy of the point cloud
+    :param window SMRF maximum window size (in point cloud units)
+    :param max_workers number of tiles that will be classified at the same time
+    :return (length, buffer) of the tiles, or None if the point cloud is too small to be split
+    """
+    # SMRF looks for the ground up to "window" away, the margins should be wider than that
+    buffer = window * 2.0
+
+    # Tiles should be large compared to their margins (so that few points are
+    # classified twice) and there should be a few of them per worker
+    width = bounds['maxx'] - bounds['minx']
+    height = bounds['maxy'] - bounds['miny']
+    length = max(buffer * 8.0, math.sqrt(width * height / (max_workers * 2.0)))
+
+    if max_workers <= 1 or (length >= width and length >= height):
+        return None
+
+    return length, buffer
+
+def smrf_tile_core(bounds, length, x, y):
+    """
+    :param x,y tile indices (with origin at minx, miny)
+    :return (minx, maxx, miny, maxy) core bounds of the tile; the lower bound is inclusive, the upper is not
+    """
+    minx = bounds['minx'] + x * length
+    miny = bounds['miny'] + y * length
+    return (minx, minx + length, miny, miny + length)
+
+def run_tiled_smrf(fin, fout, bounds, scalar, slope, threshold, window, max_workers=1):
+    """
+    Run SMRF on overlapping tiles in parallel. Each tile is classified together with
+    its margins, which are then discarded. Tiles are merged into fout.
+    Falls back to run_pdaltranslate_smrf if the point cloud is too small to be split.
+    :param bounds dictionary with minx, maxx, miny, maxy of the point cloud
+    """
+    plan = smrf_tile_plan(bounds, window, max_workers)
+    if plan is None:
+        run_pdaltranslate_smrf(fin, fout, scalar, slope, threshold, window)
+        return
+
+    length, buffer = plan
+    tmpdir = tempfile.mkdtemp(prefix='smrf_', dir=os.path.dirname(os.path.abspath(fout)))
+
+    try:
+        # Split in a single pass. Tiles keep the scale, offset and
+        # extra dimensions of the input (pdal tile does not forward them)
+        tiles = []
+        pipeline = [{'filename': fin, 'tag': 'input'}]
+        for x in range(int((bounds['maxx'] - bounds['minx']) // length) + 1):
+            for y in range(int((bounds['maxy'] - bounds['miny']) // length) + 1):
+                minx, maxx, miny, maxy = smrf_tile_core(bounds, length, x, y)
+                tile_file = os.path.join(tmpdir, 'tile_%s_%s.laz' % (x, y))
+                pipeline += [{
+                    'type': 'filters.crop',
+                    'inputs': ['input'],
+                    'bounds': '([{},{}],[{},{}])'.format(minx - buffer, maxx + buffer, miny - buffer, maxy + buffer),
+                    'tag': 'crop_%s_%s' % (x, y)
+                }, {
+                    'type': 'writers.las',
+                    'inputs': ['crop_%s_%s' % (x, y)],
+                    'filename': tile_file,
+                    'forward': 'all',
+                    'extra_dims': 'all',
+                    'compression': 'lazperf'
+                }]
+                tiles.append((tile_file, x, y))
+        run_pipeline({'pipeline': pipeline})
+
+        tiles = [t for t in tiles if os.path.isfile(t[0]) and pcinfo.get_count(t[0]) > 0]
+
+        log.ODM_INFO("Classifying %s tiles (%sx%s, %s margins)" % (len(tiles), length, length, buffer))
+
+        def classified_file(tile_file):
+            return tile_file[:-4] + '_classified.laz'
+
+        def classify_tile(tile):
+            tile_file, x, y = tile
+            minx, maxx, miny, maxy = smrf_tile_core(bounds, length, x, y)
+            run_pipeline({'pipeline': [
+                tile_file,
+                {
+                    'type': 'filters.smrf',
+                    'scalar': scalar,
+                    'slope': slope,
+                    'threshold': threshold,
+                    'window': window
+                },
+                {
+                    # Discard the margins
+                    'type': 'filters.range',
+                    'limits': 'X[{}:{}),Y[{}:{})'.format(minx, maxx, miny, maxy)
+                },
+                {
+                    'type': 'writers.las',
+                    'filename': classified_file(tile_file),
+                    'forward': 'all',
+                    'extra_dims': 'all',
+                    'compression': 'lazperf'
+                }
+            ]})
+            os.remove(tile_file)
+
+        parallel_map(classify_tile, tiles, max_workers)
+
+        # Merge (single streaming pass)
+        run_pipeline({'pipeline': [classified_file(t[0]) for t in tiles] + [{
+            'type': 'writers.las',
+            'filename': fout,
+            'forward': 'all',
+            'extra_dims': 'all',
+            'compression': 'lazperf' if fout.lower().endswith('.laz') else 'none'
+        }]}, stream=True)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
 def merge_point_clouds(input_files, output_file):
     if len(input_files) == 0:
         log.ODM_WARNING("Cannot merge point clouds, no point clouds to merge.")
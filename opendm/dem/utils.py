@@ -1,3 +1,8 @@
+import threading
+import rasterio
+from rasterio.windows import Window
+from opendm.concurrency import parallel_map
+
 
 def get_dem_vars(args):
     return {
@@ -8,3 +13,46 @@ def get_dem_vars(args):
         'BIGTIFF': 'IF_SAFER',
         'NUM_THREADS': args.max_concurrency,
     }
+
+def process_blocks(input_path, dst, process, halo=0, block_size=512, max_workers=1):
+    """
+    Compute a single band raster from another raster block by block, in parallel
+    :param input_path path to the input raster
+    :param dst rasterio dataset to write to (same size as the input)
+    :param process function(src, read_window) returning the output for read_window, where
+        src is a rasterio dataset of input_path (one per thread) and read_window is
+        a block extended by halo cells on each side (clipped to the raster)
+    :param halo number of cells to read around each block
+    """
+    width, height = dst.width, dst.height
+    windows = [Window(col, row, min(block_size, width - col), min(block_size, height - row))
+                for row in range(0, height, block_size) for col in range(0, width, block_size)]
+
+    local = threading.local()
+    sources = []
+    lock = threading.Lock()
+
+    def process_block(window):
+        # Each thread reads from its own dataset
+        if not hasattr(local, 'src'):
+            local.src = rasterio.open(input_path)
+            with lock:
+                sources.append(local.src)
+
+        row_off = max(0, window.row_off - halo)
+        col_off = max(0, window.col_off - halo)
+        row_end = min(height, window.row_off + window.height + halo)
+        col_end = min(width, window.col_off + window.width + halo)
+
+        arr = process(local.src, Window(col_off, row_off, col_end - col_off, row_end - row_off))
+
+        r = window.row_off - row_off
+        c = window.col_off - col_off
+        with lock:
+            dst.write(arr[r:r + window.height, c:c + window.width], 1, window=window)
+
+    try:
+        parallel_map(process_block, windows, max_workers)
+    finally:
+        for s in sources:
+            s.close()
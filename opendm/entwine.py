@@ -1,10 +1,12 @@
 import os
 import sys
 import shutil
+import time
 from opendm.utils import double_quote
 from opendm import io
 from opendm import log
 from opendm import system
+from opendm import pcinfo
 from opendm import concurrency
 
 
@@ -62,9 +64,57 @@ def build_untwine(input_point_cloud_files, tmpdir, output_path, max_concurrency=
     # Run untwine
     system.run('untwine --temp_dir "{tmpdir}" {files} --output_dir "{outputdir}"'.format(**kwargs))
 
+def has_8bit_color(point_cloud_file):
+    """
+    :return True if the point cloud has RGB colors and none of them
+        exceed the 8-bit range (0-255)
+    """
+    if not all([d in pcinfo.get_dimensions(point_cloud_file) for d in ["Red", "Green", "Blue"]]):
+        return False
+
+    maximums = [pcinfo.get_dimension_stats(point_cloud_file, d)["maximum"] for d in ["Red", "Green", "Blue"]]
+    return max(maximums) <= 255 and max(maximums) > 0
+
+def get_point_count(point_cloud_file):
+    return pcinfo.get_count(point_cloud_file)
+
+def convert_rgb_8_to_16_files(input_point_cloud_files, outdir):
+    """
+    Convert the 8-bit RGB values of point cloud files to 16-bit (per COPC spec).
+    Files already in 16-bit are skipped.
+    :return list of converted file paths (same order as the input, files that
+        did not need conversion are returned as-is)
+    """
+    results = []
+
+    for f in input_point_cloud_files:
+        if not has_8bit_color(f):
+            log.ODM_INFO("%s does not have 8-bit colors, skipping conversion" % f)
+            results.append(f)
+            continue
+
+        base = os.path.basename(f)
+        filename, ext = os.path.splitext(base)
+        out_16 = os.path.join(outdir, "%s_16%s" % (filename, ext))
+
+        start = time.time()
+        system.run('pdal translate -i "{input}" -o "{output}" assign '
+        '--filters.assign.value="Red = Red / 255 * 65535" '
+        '--filters.assign.value="Green = Green / 255 * 65535" '
+        '--filters.assign.value="Blue = Blue / 255 * 65535" '.format(input=f, output=out_16))
+        elapsed = time.time() - start
+
+        points = get_point_count(f)
+        if elapsed > 0 and points > 0:
+            log.ODM_INFO("Converted %s to 16-bit RGB (%s points, %.0f points/sec)" % (base, points, points / elapsed))
+
+        results.append(out_16)
+
+    return results
+
 def build_copc(input_point_cloud_files, output_file, convert_rgb_8_to_16=False):
     if len(input_point_cloud_files) == 0:
-        logger.ODM_WARNING("Cannot build COPC, no input files")
+        log.ODM_WARNING("Cannot build COPC, no input files")
         return
 
     base_path, ext = os.path.splitext(output_file)
@@ -76,6 +126,7 @@ def build_copc(input_point_cloud_files, output_file, convert_rgb_8_to_16=False):
     cleanup = [tmpdir]
 
     if convert_rgb_8_to_16:
+        # Keep converted files on the same filesystem as the output
         tmpdir16 = io.related_file_path(base_path, postfix="-tmp16")
         if os.path.exists(tmpdir16):
             log.ODM_WARNING("Removing previous directory %s" % tmpdir16)
@@ -83,26 +134,10 @@ def build_copc(input_point_cloud_files, output_file, convert_rgb_8_to_16=False):
         os.makedirs(tmpdir16, exist_ok=True)
         cleanup.append(tmpdir16)
 
-        converted = []
-        ok = True
-        for f in input_point_cloud_files:
-            # Convert 8bit RGB to 16bit RGB (per COPC spec)
-            base = os.path.basename(f)
-            filename, ext = os.path.splitext(base)
-            out_16 = os.path.join(tmpdir16, "%s_16%s" % (filename, ext))
-            try:
-                system.run('pdal translate -i "{input}" -o "{output}" assign '
-                '--filters.assign.value="Red = Red / 255 * 65535" '
-                '--filters.assign.value="Green = Green / 255 * 65535" '
-                '--filters.assign.value="Blue = Blue / 255 * 65535" '.format(input=f, output=out_16))
-                
-                converted.append(out_16)
-            except Exception as e:
-                log.ODM_WARNING("Cannot convert point cloud to 16bit RGB, COPC is not going to follow the official spec: %s" % str(e))
-                ok = False
-                break
-        if ok:
-            input_point_cloud_files = converted
+        try:
+            input_point_cloud_files = convert_rgb_8_to_16_files(input_point_cloud_files, tmpdir16)
+        except Exception as e:
+            log.ODM_WARNING("Cannot convert point cloud to 16bit RGB, COPC is not going to follow the official spec: %s" % str(e))
         
     kwargs = {
         'tmpdir': tmpdir,
@@ -115,4 +150,4 @@ def build_copc(input_point_cloud_files, output_file, convert_rgb_8_to_16=False):
 
     for d in cleanup:
         if os.path.exists(d):
-            shutil.rmtree(d)
\ No newline at end of file
+            shutil.rmtree(d)
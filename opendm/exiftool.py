@@ -1,56 +1,190 @@
 import json
 import os
-import tempfile
 import base64
+import threading
+import subprocess
+import atexit
+import cv2
+import numpy as np
 from rasterio.io import MemoryFile
-from opendm.system import run
+from opendm import context
 from opendm import log
-from opendm.utils import double_quote
+
+class ExifToolProcess:
+    """
+    A persistent exiftool process (-stay_open) that can be queried
+    repeatedly without paying the startup cost of a new process
+    for every image.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.process = None
+        self.counter = 0
+
+    def start(self):
+        env = os.environ.copy()
+        env["PATH"] = env["PATH"] + os.pathsep + context.superbuild_bin_path
+
+        self.process = subprocess.Popen(["exiftool", "-stay_open", "True", "-@", "-"],
+                                        env=env,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def execute(self, *args):
+        """
+        Run a single exiftool command
+        :param args exiftool arguments (one per item)
+        :return raw stdout bytes of the command
+        """
+        with self.lock:
+            if not self.is_running():
+                self.start()
+
+            self.counter += 1
+            ready = ("{ready%s}" % self.counter).encode("utf-8")
+            cmd = "\n".join(list(args) + ["-execute%s" % self.counter]) + "\n"
+
+            self.process.stdin.write(cmd.encode("utf-8"))
+            self.process.stdin.flush()
+
+            output = b""
+            fd = self.process.stdout.fileno()
+            while not output.rstrip().endswith(ready):
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise IOError("exiftool terminated unexpectedly")
+                output += chunk
+
+            return output.rstrip()[:-len(ready)]
+
+    def get_json(self, image_paths, tags=[], binary=False):
+        """
+        :param image_paths list of image paths
+        :param tags list of tag names to extract (all if empty)
+        :param binary whether to extract binary tag values (base64 encoded)
+        :return list of tag dictionaries, one per image (in the same order as image_paths)
+        """
+        args = ["-j"]
+        if binary:
+            args.append("-b")
+        args += ["-%s" % t for t in tags]
+        args += image_paths
+
+        output = self.execute(*args).strip()
+        if not output:
+            raise Exception("exiftool returned no output")
+
+        entries = {}
+        for e in json.loads(output.decode("utf-8")):
+            entries[os.path.normpath(e.get("SourceFile", ""))] = e
+
+        return [entries.get(os.path.normpath(p)) for p in image_paths]
+
+    def close(self):
+        with self.lock:
+            if self.is_running():
+                try:
+                    self.process.stdin.write(b"-stay_open\nFalse\n")
+                    self.process.stdin.flush()
+                    self.process.wait(timeout=5)
+                except Exception:
+                    self.process.kill()
+            self.process = None
+
+_exiftool = None
+_exiftool_pid = None
+_exiftool_lock = threading.Lock()
+
+def get_exiftool():
+    """
+    :return the ExifToolProcess for the current process (a new one
+        is created after a fork)
+    """
+    global _exiftool, _exiftool_pid
+
+    with _exiftool_lock:
+        if _exiftool is None or _exiftool_pid != os.getpid():
+            _exiftool = ExifToolProcess()
+            _exiftool_pid = os.getpid()
+            atexit.register(_exiftool.close)
+
+        return _exiftool
+
+# Planck constants don't change for a given camera,
+# so we only need to read them once per camera
+camera_constants = {}
+camera_constants_lock = threading.Lock()
+
+PLANCK_TAGS = ["PlanckR1", "PlanckB", "PlanckF", "PlanckO", "PlanckR2"]
+CAMERA_KEY_TAGS = ["Make", "Model", "SerialNumber"]
 
 def extract_raw_thermal_image_data(image_path):
+    """
+    Extract the radiometric parameters and raw sensor values of a thermal image
+    :param image_path path to the image
+    :return (params, image) tuple (({}, None) if the image could not be read)
+    """
+    params_tags = [t for t in temperature_params if t not in PLANCK_TAGS]
+
     try:
-        f, tmp_file_path = tempfile.mkstemp(suffix='.json')
-        os.close(f)
-
-        try:
-            output = run("exiftool -b -x ThumbnailImage -x PreviewImage -j \"%s\" > \"%s\"" % (image_path, tmp_file_path), quiet=True)
-
-            with open(tmp_file_path) as f:
-                j = json.loads(f.read())
-
-                if isinstance(j, list):
-                    j = j[0] # single file
-                    
-                    if "RawThermalImage" in j:
-                        imageBytes = base64.b64decode(j["RawThermalImage"][len("base64:"):])
-
-                        with MemoryFile(imageBytes) as memfile:
-                            with memfile.open() as dataset:
-                                img = dataset.read()
-                                bands, h, w = img.shape
-
-                                if bands != 1:
-                                    raise Exception("Raw thermal image has more than one band? This is not supported")
-
-                                # (1, 512, 640) --> (512, 640, 1)
-                                img = img[0][:,:,None]
-
-                        del j["RawThermalImage"]
-                    
-                    return extract_temperature_params_from(j), img
-                else:
-                    raise Exception("Invalid JSON (not a list)")
-
-        except Exception as e:
-            log.ODM_WARNING("Cannot extract tags using exiftool: %s" % str(e))
-            return {}, None
-        finally:
-            if os.path.isfile(tmp_file_path):
-                os.remove(tmp_file_path)
+        exiftool = get_exiftool()
+        j = exiftool.get_json([image_path], CAMERA_KEY_TAGS + ["RawThermalImage"] + params_tags, binary=True)[0]
+        if j is None:
+            raise Exception("No tags found for %s" % image_path)
+        if not "RawThermalImage" in j:
+            raise Exception("Cannot find RawThermalImage in %s" % image_path)
+
+        # Only read the Planck constants of cameras we haven't seen yet
+        key = camera_key(j)
+        with camera_constants_lock:
+            constants = camera_constants.get(key)
+
+        if constants is None:
+            c = exiftool.get_json([image_path], PLANCK_TAGS)[0]
+            if c is not None and all([t in c for t in PLANCK_TAGS]):
+                constants = {t: c[t] for t in PLANCK_TAGS}
+                with camera_constants_lock:
+                    camera_constants[key] = constants
+
+        j.update(constants or {})
+
+        img = decode_raw_thermal_image(base64.b64decode(j["RawThermalImage"][len("base64:"):]))
+        del j["RawThermalImage"]
+
+        return extract_temperature_params_from(j), img
     except Exception as e:
-        log.ODM_WARNING("Cannot create temporary file: %s" % str(e))
+        log.ODM_WARNING("Cannot extract tags using exiftool: %s" % str(e))
         return {}, None
 
+def camera_key(tags):
+    return tuple([str(tags.get(t, "")) for t in CAMERA_KEY_TAGS])
+
+def decode_raw_thermal_image(image_bytes):
+    img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+    if img is None:
+        # Fallback to GDAL for formats OpenCV doesn't understand
+        with MemoryFile(image_bytes) as memfile:
+            with memfile.open() as dataset:
+                img = dataset.read()
+                bands, h, w = img.shape
+
+                if bands != 1:
+                    raise Exception("Raw thermal image has more than one band? This is not supported")
+
+                # (1, 512, 640) --> (512, 640, 1)
+                return img[0][:,:,None]
+
+    if len(img.shape) != 2:
+        raise Exception("Raw thermal image has more than one band? This is not supported")
+
+    # (512, 640) --> (512, 640, 1)
+    return img[:,:,None]
+
 def unit(unit):
     def _convert(v):
         if isinstance(v, float):
@@ -66,29 +200,28 @@ def unit(unit):
             return float(v)
     return _convert
 
-def extract_temperature_params_from(tags):
-    # Defaults
-    meta = {
-        "Emissivity": float,
-        "ObjectDistance": unit("m"),
-        "AtmosphericTemperature": unit("C"),
-        "ReflectedApparentTemperature": unit("C"),
-        "IRWindowTemperature": unit("C"),
-        "IRWindowTransmission": float,
-        "RelativeHumidity": unit("%"),
-        "PlanckR1": float,
-        "PlanckB": float,
-        "PlanckF": float,
-        "PlanckO": float,
-        "PlanckR2": float,
-    }
+temperature_params = {
+    "Emissivity": float,
+    "ObjectDistance": unit("m"),
+    "AtmosphericTemperature": unit("C"),
+    "ReflectedApparentTemperature": unit("C"),
+    "IRWindowTemperature": unit("C"),
+    "IRWindowTransmission": float,
+    "RelativeHumidity": unit("%"),
+    "PlanckR1": float,
+    "PlanckB": float,
+    "PlanckF": float,
+    "PlanckO": float,
+    "PlanckR2": float,
+}
 
+def extract_temperature_params_from(tags):
     params = {}
 
-    for m in meta:
+    for m in temperature_params:
         if m not in tags:
             # All or nothing
             raise Exception("Cannot find %s in tags" % m)
-        params[m] = (meta[m])(tags[m])
-    
-    return params
\ No newline at end of file
+        params[m] = (temperature_params[m])(tags[m])
+
+    return params
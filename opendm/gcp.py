@@ -1,7 +1,7 @@
-import glob
 import os
 from opendm import log
 from opendm import location
+from opendm.geoindex import CoordinateIndex, transform_arrays
 from pyproj import CRS
 
 class GCPFile:
@@ -10,6 +10,7 @@ class GCPFile:
         self.entries = []
         self.raw_srs = ""
         self.srs = None
+        self._index = None
         self.read()
     
     def read(self):
@@ -36,6 +37,20 @@ class GCPFile:
     def iter_entries(self):
         for entry in self.entries:
             yield self.parse_entry(entry)
+
+    def index(self):
+        """
+        :return CoordinateIndex of the entries (parsed once)
+        """
+        if self._index is None:
+            x, y, z, filenames = [], [], [], []
+            for entry in self.iter_entries():
+                x.append(entry.x)
+                y.append(entry.y)
+                z.append(entry.z)
+                filenames.append(entry.filename)
+            self._index = CoordinateIndex(x, y, z, filenames)
+        return self._index
     
     def check_entries(self):
         coords = {}
@@ -108,9 +123,10 @@ class GCPFile:
         :return utm zone string valid for a coordinates header
         """
         if self.entries_count() > 0:
-            entry = self.get_entry(0)
+            index = self.index()
             longlat = CRS.from_epsg("4326")
-            lon, lat = location.transform2(self.srs, longlat, entry.x, entry.y)
+            lon, lat, _ = transform_arrays(self.srs, longlat, index.x[:1], index.y[:1])
+            lon, lat = float(lon[0]), float(lat[0])
             utm_zone, hemisphere = location.get_utm_zone_and_hemisphere_from(lon, lat)
             return "WGS84 UTM %s%s" % (utm_zone, hemisphere)
 
@@ -126,16 +142,26 @@ class GCPFile:
 
         output = [self.wgs84_utm_zone()]
         target_srs = location.parse_srs_header(output[0])
-        transformer = location.transformer(self.srs, target_srs)
 
-        for entry in self.iter_entries():
-            if filenames is None or entry.filename in filenames:
-                entry.x, entry.y, entry.z = transformer.TransformPoint(entry.x, entry.y, entry.z)
-                if not include_extras:
-                    entry.extras = ''
-                output.append(str(entry))
-            elif isinstance(rejected_entries, list):
-                rejected_entries.append(entry)
+        index = self.index()
+        if filenames is None:
+            rows = list(range(len(index)))
+        else:
+            rows = index.rows_for(set(filenames)).tolist()
+
+        # Reproject all points at once
+        x, y, z = index.reproject(self.srs, target_srs, rows)
+
+        if isinstance(rejected_entries, list):
+            selected = set(rows)
+            rejected_entries += [self.get_entry(i) for i in range(self.entries_count()) if i not in selected]
+
+        for j, i in enumerate(rows):
+            entry = self.get_entry(i)
+            entry.x, entry.y, entry.z = float(x[j]), float(y[j]), float(z[j])
+            if not include_extras:
+                entry.extras = ''
+            output.append(str(entry))
 
         with open(gcp_file_output, 'w') as f:
             f.write('\n'.join(output) + '\n')
@@ -155,15 +181,14 @@ class GCPFile:
         if os.path.exists(gcp_file_output):
             os.remove(gcp_file_output)
 
-        files = list(map(os.path.basename, glob.glob(os.path.join(images_dir, "*"))))
+        files = set([f for f in os.listdir(images_dir) if not f.startswith(".")])
 
         output = [self.raw_srs]
-        files_found = 0
-        
-        for entry in self.iter_entries():
-            if entry.filename in files:
-                output.append(str(entry))
-                files_found += 1
+        rows = self.index().rows_for(files)
+        files_found = len(rows)
+
+        for i in rows:
+            output.append(str(self.get_entry(i)))
 
         if files_found >= min_images:
             with open(gcp_file_output, 'w') as f:
@@ -199,12 +224,11 @@ class GCPFile:
             utm_zone = self.wgs84_utm_zone()
 
         target_srs = location.parse_srs_header(utm_zone)
-        transformer = location.transformer(self.srs, target_srs)
+        utm_x, utm_y, utm_z = self.index().reproject(self.srs, target_srs)
 
         gcps = {}
-        for entry in self.iter_entries():
-            utm_x, utm_y, utm_z = transformer.TransformPoint(entry.x, entry.y, entry.z)
-            k = "{} {} {}".format(utm_x, utm_y, utm_z)
+        for i, entry in enumerate(self.iter_entries()):
+            k = "{} {} {}".format(float(utm_x[i]), float(utm_y[i]), float(utm_z[i]))
             if not k in gcps:
                 gcps[k] = [entry]
             else:
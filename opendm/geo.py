@@ -2,13 +2,16 @@ import os
 import math
 from opendm import log
 from opendm import location
+from opendm.geoindex import CoordinateIndex
 from pyproj import CRS
 
 class GeoFile:
     def __init__(self, geo_path):
         self.geo_path = geo_path
         self.entries = {}
+        self.lines = {}
         self.srs = None
+        self.index = None
 
         with open(self.geo_path, 'r') as f:
             contents = f.read().strip()
@@ -22,6 +25,7 @@ class GeoFile:
             self.srs = location.parse_srs_header(self.raw_srs)
             longlat = CRS.from_epsg("4326")
 
+            rows = []
             for line in lines[1:]:
                 if line != "" and line[0] != "#":
                     parts = line.split()
@@ -31,12 +35,6 @@ class GeoFile:
                         x, y = [float(p) for p in parts[1:3]]
                         z = float(parts[3]) if len(parts) >= 4 else None
 
-                        # Always convert coordinates to WGS84
-                        if z is not None:
-                            x, y, z = location.transform3(self.srs, longlat, x, y, z)
-                        else:
-                            x, y = location.transform2(self.srs, longlat, x, y)
-
                         yaw = pitch = roll = None
 
                         if len(parts) >= 7:
@@ -51,16 +49,48 @@ class GeoFile:
                             i = 9
 
                         extras = " ".join(parts[i:])
-                        self.entries[filename] = GeoEntry(filename, x, y, z,
-                                                        yaw, pitch, roll,
-                                                        horizontal_accuracy, vertical_accuracy, 
-                                                        extras)
+                        rows.append(GeoEntry(filename, x, y, z,
+                                            yaw, pitch, roll,
+                                            horizontal_accuracy, vertical_accuracy, 
+                                            extras))
+                        self.lines[filename] = line
                     else:
                         log.ODM_WARNING("Malformed geo line: %s" % line)
+
+            # Always convert coordinates to WGS84 (all at once)
+            index = CoordinateIndex([e.x for e in rows], [e.y for e in rows],
+                                    [e.z if e.z is not None else 0 for e in rows],
+                                    [e.filename for e in rows])
+            x, y, z = index.reproject(self.srs, longlat)
+
+            for i, e in enumerate(rows):
+                e.x, e.y = float(x[i]), float(y[i])
+                if e.z is not None:
+                    e.z = float(z[i])
+                self.entries[e.filename] = e
+
+            self.index = CoordinateIndex(x, y, z, index.filenames)
     
     def get_entry(self, filename):
         return self.entries.get(filename)
 
+    def make_filtered_copy(self, geo_file_output, filenames):
+        """
+        Creates a new geo file that includes only the entries of filenames
+        :param filenames set of image filenames
+        :return geo_file_output if at least one entry was written, None otherwise
+        """
+        if os.path.exists(geo_file_output):
+            os.remove(geo_file_output)
+
+        output = [self.raw_srs] + [self.lines[f] for f in self.lines if f in filenames]
+
+        if len(output) > 1:
+            with open(geo_file_output, 'w') as f:
+                f.write('\n'.join(output) + '\n')
+
+            return geo_file_output
+
 
 class GeoEntry:
     def __init__(self, filename, x, y, z, yaw=None, pitch=None, roll=None, horizontal_accuracy=None, vertical_accuracy=None, extras=None):
@@ -0,0 +1,97 @@
+import threading
+import numpy as np
+from pyproj import Transformer
+
+_transformers = {}
+_transformers_lock = threading.Lock()
+
+def get_transformer(from_srs, to_srs):
+    """
+    :param from_srs pyproj CRS
+    :param to_srs pyproj CRS
+    :return (cached) pyproj Transformer with x/y (lon/lat) axis order
+    """
+    key = (from_srs.to_wkt(), to_srs.to_wkt())
+    with _transformers_lock:
+        t = _transformers.get(key)
+        if t is None:
+            t = Transformer.from_crs(from_srs, to_srs, always_xy=True)
+            _transformers[key] = t
+        return t
+
+def transform_arrays(from_srs, to_srs, x, y, z=None):
+    """
+    Reproject many coordinates with a single call
+    :param x array of x (longitude) values
+    :param y array of y (latitude) values
+    :param z array of z values (optional)
+    :return (x, y, z) arrays (z is None if it was not specified)
+    """
+    t = get_transformer(from_srs, to_srs)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    if len(x) == 0:
+        return x, y, (np.asarray(z, dtype=np.float64) if z is not None else None)
+
+    if z is not None:
+        return t.transform(x, y, np.asarray(z, dtype=np.float64))
+    else:
+        x, y = t.transform(x, y)
+        return x, y, None
+
+class CoordinateIndex:
+    """
+    Columnar view of the entries of a GCP or geo file:
+    coordinates are stored in arrays (one row per entry) and
+    rows are indexed by image filename.
+    """
+    def __init__(self, x, y, z, filenames):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.z = np.asarray(z, dtype=np.float64)
+        self.filenames = filenames
+
+        self.rows = {}
+        for i, f in enumerate(filenames):
+            self.rows.setdefault(f, []).append(i)
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def __contains__(self, filename):
+        return filename in self.rows
+
+    def rows_for(self, filenames):
+        """
+        :param filenames set of image filenames
+        :return sorted array of the rows that reference one of filenames
+        """
+        if len(filenames) < len(self.rows):
+            rows = [r for f in filenames for r in self.rows.get(f, [])]
+        else:
+            rows = [r for f in self.rows if f in filenames for r in self.rows[f]]
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def rows_within(self, minx, miny, maxx, maxy):
+        """
+        :return sorted array of the rows with coordinates within the bounds
+        """
+        return np.flatnonzero((self.x >= minx) & (self.x <= maxx) & (self.y >= miny) & (self.y <= maxy))
+
+    def bounds(self):
+        """
+        :return (minx, miny, maxx, maxy) or None if there are no entries
+        """
+        if len(self) == 0:
+            return None
+        return (float(self.x.min()), float(self.y.min()), float(self.x.max()), float(self.y.max()))
+
+    def reproject(self, from_srs, to_srs, rows=None):
+        """
+        :param rows rows to reproject (all if None)
+        :return (x, y, z) arrays of reprojected coordinates
+        """
+        if rows is None:
+            rows = slice(None)
+        return transform_arrays(from_srs, to_srs, self.x[rows], self.y[rows], self.z[rows])
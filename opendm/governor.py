@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import time
+import threading
+from opendm import log
+from opendm import system
+from opendm.concurrency import get_max_memory_mb
+
+# Error codes of processes killed for running out of memory
+# (SIGKILL, SIGTERM and STATUS_NO_MEMORY on Windows)
+OOM_ERROR_CODES = [137, 143, 3221226505]
+
+# Number of observations kept per tool
+HISTORY_SIZE = 20
+
+def is_oom_error(error_code):
+    return error_code in OOM_ERROR_CODES
+
+class ToolModel:
+    """
+    Default memory model of a tool:
+    base_mb + unit_mb * units + thread_mb * thread_units * threads
+    """
+    def __init__(self, base_mb, unit_mb, thread_mb):
+        self.base_mb = base_mb
+        self.unit_mb = unit_mb
+        self.thread_mb = thread_mb
+
+    def estimate(self, units, threads, thread_units=1):
+        return self.base_mb + self.unit_mb * units + self.thread_mb * thread_units * threads
+
+tool_models = {
+    # units: points + octree nodes
+    'PoissonRecon': ToolModel(200, 0.0005, 50),
+    # units: DSM pixels, thread_units: 1 (each thread processes a 2000x2000 tile)
+    'dem2mesh': ToolModel(100, 0.00002, 160),
+    # units: megapixels of all depthmaps, thread_units: megapixels of one depthmap
+    'DensifyPointCloud': ToolModel(500, 12, 150),
+}
+
+class MemoryPlan:
+    def __init__(self, threads, estimated_mb, budget_mb):
+        self.threads = threads
+        self.estimated_mb = estimated_mb
+        self.budget_mb = budget_mb
+
+    @property
+    def fits(self):
+        return self.estimated_mb <= self.budget_mb
+
+def process_tree_rss_mb(pid):
+    """
+    :return resident memory of a process and all of its descendants in megabytes
+        (Linux only, None elsewhere or if the process has ended)
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+
+    total_kb = 0
+    pids = [pid]
+    found = False
+    while pids:
+        p = pids.pop()
+        try:
+            with open("/proc/%s/status" % p, 'r') as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        found = True
+                        break
+            task_dir = "/proc/%s/task" % p
+            for tid in os.listdir(task_dir):
+                with open(os.path.join(task_dir, tid, "children"), 'r') as f:
+                    pids += [int(c) for c in f.read().split()]
+        except (OSError, ValueError):
+            pass
+
+    return total_kb / 1024 if found else None
+
+class RSSMonitor:
+    """
+    Samples the resident memory of a process tree from a background thread
+    and keeps track of its peak. Unlike ru_maxrss, which reports the
+    largest single process, this accounts for all of the descendants
+    running at the same time.
+    """
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            rss = process_tree_rss_mb(self.pid)
+            if rss is not None:
+                self.peak_mb = max(self.peak_mb, rss)
+            if self.stop_event.wait(self.interval):
+                break
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        return self.peak_mb
+
+def default_history_file():
+    return os.environ.get('ODM_MEMORY_HISTORY', os.path.join(os.path.expanduser("~"), ".odm", "memory_history.json"))
+
+class MemoryGovernor:
+    """
+    Chooses the number of threads (and whether to tile) for memory hungry
+    tools before launching them, based on an estimate of the memory they
+    need for a given input size and on the memory that is currently available.
+    The peak memory of every run is recorded in a per-machine history, which
+    is used to correct the default estimates of each tool.
+    """
+    def __init__(self, history_file=None, models=tool_models, safety_factor=1.2, use_at_most=0.9):
+        self.history_file = history_file if history_file is not None else default_history_file()
+        self.models = models
+        self.safety_factor = safety_factor
+        self.use_at_most = use_at_most
+        self.lock = threading.Lock()
+        self.history = self.load()
+
+    def load(self):
+        if os.path.isfile(self.history_file):
+            try:
+                with open(self.history_file, 'r', encoding='utf-8') as f:
+                    return json.loads(f.read())
+            except Exception as e:
+                log.ODM_WARNING("Cannot read %s: %s" % (self.history_file, str(e)))
+        return {}
+
+    def save(self):
+        tmp_file = self.history_file + ".tmp"
+        try:
+            d = os.path.dirname(self.history_file)
+            if d and not os.path.isdir(d):
+                os.makedirs(d, exist_ok=True)
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(self.history, indent=4))
+            os.replace(tmp_file, self.history_file)
+        except Exception as e:
+            log.ODM_WARNING("Cannot save %s: %s" % (self.history_file, str(e)))
+
+    def budget_mb(self):
+        return get_max_memory_mb(minimum=0, use_at_most=self.use_at_most)
+
+    def correction(self, tool):
+        """
+        :return ratio between the observed and the estimated peak memory
+            of the most pessimistic recent run of tool (1 if tool has no history)
+        """
+        with self.lock:
+            entries = list(self.history.get(tool, []))
+
+        model = self.models[tool]
+        ratios = []
+        for e in entries:
+            estimate = model.estimate(e['units'], e['threads'], e.get('threadUnits', 1))
+            if estimate > 0:
+                ratios.append(e['peakMb'] / estimate)
+
+        if not ratios:
+            return 1.0
+        return max(0.25, max(ratios))
+
+    def estimate(self, tool, units, threads, thread_units=1):
+        """
+        :return estimated peak memory in megabytes of running tool
+        """
+        return self.models[tool].estimate(units, threads, thread_units) * self.correction(tool) * self.safety_factor
+
+    def plan(self, tool, units, max_threads, thread_units=1):
+        """
+        :param tool tool name (a key of tool_models)
+        :param units size of the input, in the units of the tool's model
+        :param max_threads maximum number of threads to use
+        :param thread_units size of the input processed by each thread
+        :return MemoryPlan with the largest number of threads whose estimated
+            memory fits in the available memory (at least 1 thread; check MemoryPlan.fits
+            to know whether the input should be split)
+        """
+        budget = self.budget_mb()
+        max_threads = max(1, int(max_threads))
+
+        threads = 1
+        for t in range(max_threads, 0, -1):
+            if self.estimate(tool, units, t, thread_units) <= budget:
+                threads = t
+                break
+
+        plan = MemoryPlan(threads, self.estimate(tool, units, threads, thread_units), budget)
+        if threads < max_threads or not plan.fits:
+            log.ODM_INFO("%s is estimated to need %.0f MB with %s threads (%.0f MB available)" % (tool, plan.estimated_mb, threads, budget))
+        return plan
+
+    def record(self, tool, units, threads, peak_mb, thread_units=1, oom=False):
+        entry = {
+            'units': units,
+            'threads': threads,
+            'threadUnits': thread_units,
+            'peakMb': round(peak_mb, 1),
+            'oom': oom,
+            'time': int(time.time()),
+        }
+        with self.lock:
+            entries = self.history.setdefault(tool, [])
+            entries.append(entry)
+            del entries[:-HISTORY_SIZE]
+            self.save()
+
+    def run(self, tool, cmd, units, threads, thread_units=1, **run_kwargs):
+        """
+        Run a command with system.start, record its peak memory and return its ProcessResult.
+        If the process runs out of memory, the memory that was available when it
+        started is recorded as a lower bound of its peak memory.
+        """
+        available = self.budget_mb() / self.use_at_most
+        p = system.start(cmd, **run_kwargs)
+        monitor = RSSMonitor(p.pid)
+        try:
+            result = p.wait(raise_on_error=False)
+        finally:
+            peak = monitor.stop()
+
+        if result.max_rss_mb is not None:
+            peak = max(peak, result.max_rss_mb)
+
+        oom = is_oom_error(result.error_code)
+        if oom:
+            peak = max(peak, available)
+        if result.retcode == 0 or oom:
+            self.record(tool, units, threads, peak, thread_units=thread_units, oom=oom)
+
+        result.check()
+        return result
+
+_governor = None
+_governor_lock = threading.Lock()
+
+def get_governor():
+    global _governor
+
+    with _governor_lock:
+        if _governor is None:
+            _governor = MemoryGovernor()
+        return _governor
@@ -1,8 +1,54 @@
 import math
+import numpy as np
+from functools import lru_cache
 from opendm import log
-from pyproj import Proj, Transformer, CRS
+from opendm.geoindex import get_transformer
+from pyproj import CRS
 from osgeo import osr
 
+def photo_coords(photos):
+    """
+    Gather the GPS positions of photos into arrays
+    :param photos ([ODM_Photo]) list of photos
+    :return (lon, lat, alt, valid) where lon, lat, alt are arrays of the photos
+        that have a GPS position (missing altitudes are set to 0) and valid is
+        a boolean mask over photos
+    """
+    n = len(photos)
+    lon = np.empty(n, dtype=np.float64)
+    lat = np.empty(n, dtype=np.float64)
+    alt = np.zeros(n, dtype=np.float64)
+    valid = np.zeros(n, dtype=bool)
+
+    for i, photo in enumerate(photos):
+        if photo.latitude is None or photo.longitude is None:
+            continue
+
+        lon[i] = photo.longitude
+        lat[i] = photo.latitude
+        if photo.altitude is not None:
+            alt[i] = photo.altitude
+        valid[i] = True
+
+    return lon[valid], lat[valid], alt[valid], valid
+
+def write_coords_file(output_coords_file, header, offset, x, y, z):
+    """
+    Write a coordinates file
+    :param header (str) SRS line (e.g. "WGS84 UTM 16N")
+    :param offset (dx, dy) integer offsets
+    :param x,y,z arrays of coordinates (before subtracting the offset)
+    """
+    dx, dy = offset
+    x = (np.asarray(x) - dx).tolist()
+    y = (np.asarray(y) - dy).tolist()
+    z = np.asarray(z).tolist()
+
+    with open(output_coords_file, "w") as f:
+        f.write("%s\n" % header)
+        f.write("%s %s\n" % (dx, dy))
+        f.write("".join(["%s %s %s\n" % c for c in zip(x, y, z)]))
+
 def extract_utm_coords(photos, images_path, output_coords_file):
     """
     Create a coordinate file containing the GPS positions of all cameras 
@@ -15,46 +61,32 @@ def extract_utm_coords(photos, images_path, output_coords_file):
     if len(photos) == 0:
         raise Exception("No input images, cannot create coordinates file of GPS positions")
     
-    utm_zone = None
-    hemisphere = None
-    coords = []
-    reference_photo = None
-    for photo in photos:
-        if photo.latitude is None or photo.longitude is None:
+    lon, lat, alt, valid = photo_coords(photos)
+    located = []
+    for photo, v in zip(photos, valid):
+        if v:
+            located.append(photo)
+        else:
             log.ODM_WARNING("GPS position not available for %s" % photo.filename)
-            continue
-        
-        if utm_zone is None:
-            utm_zone, hemisphere = get_utm_zone_and_hemisphere_from(photo.longitude, photo.latitude)
-
-        try:
-            alt = photo.altitude if photo.altitude is not None else 0
-            coord = convert_to_utm(photo.longitude, photo.latitude, alt, utm_zone, hemisphere)
-        except:
-            raise Exception("Failed to convert GPS position to UTM for %s" % photo.filename)
-        
-        coords.append(coord)
-
-    if utm_zone is None:
+
+    if len(lon) == 0:
         raise Exception("No images seem to have GPS information")
-        
-    # Calculate average
-    dx = 0.0
-    dy = 0.0
-    num = float(len(coords))
-    for coord in coords:
-        dx += coord[0] / num
-        dy += coord[1] / num
-
-    dx = int(math.floor(dx))
-    dy = int(math.floor(dy))
-
-    # Open output file
-    with open(output_coords_file, "w") as f:
-        f.write("WGS84 UTM %s%s\n" % (utm_zone, hemisphere))
-        f.write("%s %s\n" % (dx, dy))
-        for coord in coords:
-            f.write("%s %s %s\n" % (coord[0] - dx, coord[1] - dy, coord[2]))
+
+    utm_zone, hemisphere = get_utm_zone_and_hemisphere_from(lon[0], lat[0])
+
+    try:
+        x, y = utm_transformer(utm_zone, hemisphere).transform(lon, lat)
+    except Exception as e:
+        raise Exception("Failed to convert GPS positions to UTM: %s" % str(e))
+
+    invalid = np.flatnonzero(~(np.isfinite(x) & np.isfinite(y)))
+    if len(invalid) > 0:
+        raise Exception("Failed to convert GPS position to UTM for %s" % located[invalid[0]].filename)
+
+    dx = int(math.floor(np.mean(x)))
+    dy = int(math.floor(np.mean(y)))
+
+    write_coords_file(output_coords_file, "WGS84 UTM %s%s" % (utm_zone, hemisphere), (dx, dy), x, y, alt)
     
 def transform2(from_srs, to_srs, x, y):
     return transformer(from_srs, to_srs).TransformPoint(x, y, 0)[:2]
@@ -95,6 +127,15 @@ def get_utm_zone_and_hemisphere_from(lon, lat):
     hemisphere = 'S' if lat < 0 else 'N'
     return [utm_zone, hemisphere]
 
+@lru_cache(maxsize=None)
+def utm_transformer(utm_zone, hemisphere):
+    """
+    :param utm_zone UTM zone number
+    :param hemisphere one of 'N' or 'S'
+    :return (cached) pyproj Transformer from WGS84 longitude/latitude to UTM
+    """
+    return get_transformer(CRS.from_epsg(4326), parse_srs_header("WGS84 UTM %s%s" % (utm_zone, hemisphere)))
+
 def convert_to_utm(lon, lat, alt, utm_zone, hemisphere):
     """
     Convert longitude, latitude and elevation values to UTM
@@ -105,12 +146,7 @@ def convert_to_utm(lon, lat, alt, utm_zone, hemisphere):
     :param hemisphere one of 'N' or 'S'
     :return [x,y,z] UTM coordinates
     """
-    if hemisphere == 'N':
-        p = Proj(proj='utm',zone=utm_zone,ellps='WGS84', preserve_units=True)
-    else:
-        p = Proj(proj='utm',zone=utm_zone,ellps='WGS84', preserve_units=True, south=True)
-    
-    x,y = p(lon, lat)
+    x, y = utm_transformer(utm_zone, hemisphere).transform(lon, lat)
     return [x, y, alt]
 
 def parse_srs_header(header):
@@ -6,6 +6,10 @@ import datetime
 import dateutil.parser
 import shutil
 import multiprocessing
+import queue
+import atexit
+import time
+from collections import deque
 from repoze.lru import lru_cache
 
 from opendm.arghelpers import double_quote, args_to_dict
@@ -31,6 +35,14 @@ else:
 
 lock = threading.Lock()
 
+# Number of messages per stage that are kept in memory
+# (and written to log.json). All messages are written to log.jsonl
+MAX_STAGE_MESSAGES = 1000
+
+# Number of (most recent) processes that are kept in memory
+# (and written to log.json). All processes are written to log.jsonl
+MAX_PROCESSES = 1000
+
 @lru_cache(maxsize=None)
 def odm_version():
     with open(os.path.join(os.path.dirname(__file__), "..", "VERSION")) as f:
@@ -43,22 +55,135 @@ def memory():
         'available': round(mem.available / 1024 / 1024)
     }
 
+# Maximum number of pending writes of an AsyncWriter
+MAX_PENDING_WRITES = 10000
+
+class AsyncWriter:
+    """
+    Writes text to a stream from a background thread, so that callers
+    don't block on I/O. Pending writes are batched and the stream
+    is flushed once per batch. If the stream cannot keep up and
+    max_pending writes are queued, callers wait (as they would with
+    synchronous writes).
+    """
+    def __init__(self, get_stream, max_pending=MAX_PENDING_WRITES):
+        self.get_stream = get_stream
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.pid = os.getpid()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            data = [i for i in items if i is not None]
+            if data:
+                try:
+                    stream = self.get_stream()
+                    stream.write("".join(data))
+                    stream.flush()
+                except Exception:
+                    pass
+
+            for _ in items:
+                self.queue.task_done()
+
+            if None in items:
+                break
+
+    def write(self, data):
+        if os.getpid() != self.pid or not self.thread.is_alive():
+            # Forked child (the writer thread only exists in the parent)
+            # or writer closed: write synchronously
+            stream = self.get_stream()
+            stream.write(data)
+            stream.flush()
+        else:
+            self.queue.put(data)
+
+    def flush(self, timeout=None):
+        """
+        Wait for all pending writes to complete
+        :param timeout maximum number of seconds to wait (None to wait indefinitely)
+        :return True if all pending writes completed
+        """
+        if os.getpid() != self.pid or not self.thread.is_alive():
+            return True
+
+        if timeout is None:
+            self.queue.join()
+            return True
+
+        end = time.time() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks > 0:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self):
+        if os.getpid() == self.pid and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
 class ODMLogger:
     def __init__(self):
         self.json = None
         self.json_output_file = None
+        self.json_thread_stages = {}
+        self.jsonl = None
         self.start_time = datetime.datetime.now()
+        self.stdout = AsyncWriter(lambda: sys.stdout)
+        atexit.register(self.flush)
 
     def log(self, startc, msg, level_name):
         level = "[" + level_name + "]"
-        with lock:
-            print("%s%s %s%s" % (startc, level, msg, ENDC))
-            sys.stdout.flush()
-            if self.json is not None:
-                self.json['stages'][-1]['messages'].append({
-                    'message': msg,
-                    'type': level_name.lower()
-                })
+        self.write_output("%s%s %s%s\n" % (startc, level, msg, ENDC))
+
+        if level_name in ["ERROR", "EXCEPTION"]:
+            # Make sure errors are visible before anything
+            # else is printed (e.g. stack traces)
+            self.stdout.flush()
+
+        if self.json is not None:
+            with lock:
+                if self.json['stages']:
+                    stage = self.json_thread_stages.get(threading.get_ident(), self.json['stages'][-1])
+                    stage['messages'].append({
+                        'message': msg,
+                        'type': level_name.lower()
+                    })
+                    self._log_jsonl_event('message', stage=stage['name'], message=msg, type=level_name.lower())
+
+    def write_output(self, text):
+        """
+        Write text to stdout (asynchronously)
+        """
+        self.stdout.write(text)
+
+    def flush(self, timeout=None):
+        """
+        Wait for pending output (stdout and log.jsonl) to be written
+        :param timeout maximum number of seconds to wait for each stream
+        """
+        self.stdout.flush(timeout)
+        jsonl = self.jsonl
+        if jsonl is not None:
+            jsonl.flush(timeout)
+
+    def _log_jsonl_event(self, event, **data):
+        if self.jsonl is not None:
+            data['event'] = event
+            data['time'] = datetime.datetime.now().isoformat()
+            self.jsonl.write(json.dumps(data, default=str) + "\n")
     
     def init_json_output(self, output_files, args):
         self.json_output_files = output_files
@@ -71,20 +196,54 @@ class ODMLogger:
         self.json['options'] = args_to_dict(args)
         self.json['startTime'] = self.start_time.isoformat()
         self.json['stages'] = []
-        self.json['processes'] = []
+        self.json_thread_stages = {}
+        self.json['processes'] = deque(maxlen=MAX_PROCESSES)
         self.json['success'] = False
 
+        # Events are streamed to log.jsonl as they happen, so that
+        # they are not lost if the process is killed before close()
+        jsonl_file = os.path.splitext(self.json_output_file)[0] + ".jsonl"
+        try:
+            f = open(jsonl_file, 'w', encoding='utf-8')
+            self.jsonl = AsyncWriter(lambda: f)
+            self.jsonl_file = f
+            self._log_jsonl_event('start', **{k: self.json[k] for k in ['odmVersion', 'memory', 'cpus', 'options', 'startTime']})
+        except Exception as e:
+            print("Cannot write %s: %s" % (jsonl_file, str(e)))
+
     def log_json_stage_run(self, name, start_time):
         if self.json is not None:
-            self.json['stages'].append({
+            stage = {
                 'name': name,
                 'startTime': start_time.isoformat(),
-                'messages': [],
-            })
+                'messages': deque(maxlen=MAX_STAGE_MESSAGES),
+            }
+            with lock:
+                self.json['stages'].append(stage)
+                # Stages can run concurrently, messages are
+                # attributed to the stage running in the current thread
+                self.json_thread_stages[threading.get_ident()] = stage
+                self._log_jsonl_event('stageStart', stage=name)
+
+    def log_json_stage_end(self, name, end_time):
+        if self.json is not None:
+            for stage in reversed(self.json['stages']):
+                if stage['name'] == name:
+                    stage['endTime'] = end_time.isoformat()
+                    start_time = dateutil.parser.isoparse(stage['startTime'])
+                    stage['totalTime'] = round((end_time - start_time).total_seconds(), 2)
+                    self._log_jsonl_event('stageEnd', stage=name, totalTime=stage['totalTime'])
+                    break
+
+    def log_json_timeline(self, timeline):
+        if self.json is not None:
+            self.json['timeline'] = timeline
+            self._log_jsonl_event('timeline', **timeline)
     
     def log_json_images(self, count):
         if self.json is not None:
             self.json['images'] = count
+            self._log_jsonl_event('images', count=count)
     
     def log_json_stage_error(self, error, exit_code, stack_trace = ""):
         if self.json is not None:
@@ -93,14 +252,16 @@ class ODMLogger:
                 'message': error
             }
             self.json['stackTrace'] = list(map(str.strip, stack_trace.split("\n")))
+            self._log_jsonl_event('error', code=exit_code, message=error, stackTrace=self.json['stackTrace'])
             self._log_json_end_time()
 
     def log_json_success(self):
         if self.json is not None:
             self.json['success'] = True
+            self._log_jsonl_event('success')
             self._log_json_end_time()
     
-    def log_json_process(self, cmd, exit_code, output = []):
+    def log_json_process(self, cmd, exit_code, output = [], stats = None):
         if self.json is not None:
             d = {
                 'command': cmd,
@@ -108,8 +269,11 @@ class ODMLogger:
             }
             if output:
                 d['output'] = output
+            if stats:
+                d.update(stats)
 
             self.json['processes'].append(d)
+            self._log_jsonl_event('process', **d)
 
     def _log_json_end_time(self):
         if self.json is not None:
@@ -117,7 +281,7 @@ class ODMLogger:
             self.json['endTime'] = end_time.isoformat()
             self.json['totalTime'] = round((end_time - self.start_time).total_seconds(), 2)
 
-            if self.json['stages']:
+            if self.json['stages'] and not 'endTime' in self.json['stages'][-1]:
                 last_stage = self.json['stages'][-1]
                 last_stage['endTime'] = end_time.isoformat()
                 start_time = dateutil.parser.isoparse(last_stage['startTime'])
@@ -136,10 +300,18 @@ class ODMLogger:
         self.log(FAIL, msg, "EXCEPTION")
 
     def close(self):
+        self.stdout.flush()
+
         if self.json is not None and self.json_output_file is not None:
+            if self.jsonl is not None:
+                self._log_jsonl_event('end', totalTime=self.json.get('totalTime'))
+                self.jsonl.close()
+                self.jsonl_file.close()
+                self.jsonl = None
+
             try:
                 with open(self.json_output_file, 'w') as f:
-                    f.write(json.dumps(self.json, indent=4))
+                    f.write(json.dumps(self.json, indent=4, default=list))
                 for f in self.json_output_files[1:]:
                     shutil.copy(self.json_output_file, f)
             except Exception as e:
@@ -0,0 +1,273 @@
+import os
+import json
+import hashlib
+import threading
+from opendm import log
+from opendm.arghelpers import args_to_dict
+
+MANIFEST_VERSION = 1
+
+# Files larger than this are tracked by size and modification
+# time instead of their content (hashing multi-GB outputs after every
+# stage takes longer than rerunning the stages that depend on them)
+MAX_CONTENT_HASH_SIZE = 64 * 1024 * 1024
+
+# Stages that don't produce files of their own: the stages that
+# depend on them consume the outputs of the stages before them
+PASS_THROUGH_STAGES = ['split', 'merge']
+
+def stage_output_files(name, tree):
+    """
+    :param name stage name
+    :param tree ODM_Tree
+    :return list of files produced by a stage that are consumed by the stages that depend on it
+    """
+    if name == 'dataset':
+        return [tree.path('images.json'), tree.dataset_list,
+                tree.odm_georeferencing_coords, tree.odm_georeferencing_model_txt_geo,
+                tree.odm_georeferencing_gcp_utm, os.path.join(tree.odm_georeferencing, tree.odm_georeferencing_proj)]
+    elif name == 'opensfm':
+        return [tree.opensfm_reconstruction, os.path.join(tree.opensfm, 'undistorted', 'reconstruction.json')]
+    elif name == 'openmvs':
+        return [tree.openmvs_model]
+    elif name == 'odm_filterpoints':
+        return [tree.filtered_point_cloud]
+    elif name == 'odm_meshing':
+        return [tree.odm_mesh, tree.odm_25dmesh]
+    elif name == 'mvs_texturing':
+        # Whole directories: models, materials (.mtl) and textures (.png)
+        return [tree.odm_texturing, tree.odm_25dtexturing]
+    elif name == 'odm_georeferencing':
+        bounds_base, _ = os.path.splitext(tree.odm_georeferencing_model_laz)
+        return [tree.odm_georeferencing_model_laz, bounds_base + ".bounds.geojson", bounds_base + ".bounds.gpkg"]
+    elif name == 'odm_dem':
+        return [tree.path('odm_dem', 'dsm.tif'), tree.path('odm_dem', 'dtm.tif')]
+    elif name == 'odm_orthophoto':
+        return [tree.odm_orthophoto_tif]
+    elif name == 'odm_report':
+        return [os.path.join(tree.odm_report, 'report.pdf')]
+    else:
+        return []
+
+def stage_input_files(name, tree):
+    """
+    :param name stage name
+    :param tree ODM_Tree
+    :return list of files (or directories) read by a stage that are not produced by other stages
+    """
+    if name == 'dataset':
+        return [tree.input_images, tree.odm_georeferencing_gcp, tree.odm_geo_file]
+    elif name == 'odm_georeferencing':
+        return [tree.odm_georeferencing_gcp, tree.odm_align_file]
+    else:
+        return []
+
+def file_hash(path, chunk_size=1024 * 1024):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class OptionRecorder:
+    """
+    Wraps the parsed arguments and records which options are read
+    """
+    __slots__ = ('__dict__', 'read_options')
+
+    def __init__(self, args):
+        # Attributes are shared with args (vars() and assignments keep working)
+        self.__dict__ = args.__dict__
+        self.read_options = set()
+
+    def __getattribute__(self, name):
+        d = object.__getattribute__(self, '__dict__')
+        if name in d:
+            object.__getattribute__(self, 'read_options').add(name)
+        elif name == '__dict__':
+            # vars(args), args_to_dict(args), ... can read any option
+            object.__getattribute__(self, 'read_options').update(d.keys())
+        return object.__getattribute__(self, name)
+
+class StageManifest:
+    """
+    Keeps track of the inputs, outputs and options of every stage
+    that has run in a project, so that a stage is rerun only when
+    something it actually consumes has changed (a file produced by another
+    stage, an input file or one of its options). The options of a stage are
+    the ones mapped to it in config.rerun_stages plus the ones it read
+    while running. Content hashes are cached by file size and modification
+    time, so unchanged files are read only once. Large files and files in
+    input directories (e.g. the images) are tracked by size and modification time only.
+    """
+    def __init__(self, manifest_file, tree, args, rerun_stages):
+        self.manifest_file = manifest_file
+        self.tree = tree
+        self.args = args
+        self.rerun_stages = rerun_stages
+        self.lock = threading.RLock()
+        self.recorders = {}
+        self.data = self.load()
+
+    def load(self):
+        if os.path.isfile(self.manifest_file):
+            try:
+                with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                    data = json.loads(f.read())
+                if data.get('version') == MANIFEST_VERSION:
+                    return data
+                log.ODM_WARNING("Ignoring %s (unsupported version)" % self.manifest_file)
+            except Exception as e:
+                log.ODM_WARNING("Cannot read %s: %s" % (self.manifest_file, str(e)))
+
+        return {'version': MANIFEST_VERSION, 'files': {}, 'stages': {}}
+
+    def save(self):
+        with self.lock:
+            tmp_file = self.manifest_file + ".tmp"
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    f.write(json.dumps(self.data, indent=4))
+                os.replace(tmp_file, self.manifest_file)
+            except Exception as e:
+                log.ODM_WARNING("Cannot save %s: %s" % (self.manifest_file, str(e)))
+
+    def key(self, path):
+        path = os.path.abspath(path)
+        if path.startswith(self.tree.root_path + os.sep):
+            return os.path.relpath(path, self.tree.root_path).replace(os.sep, '/')
+        return path
+
+    def hash_file(self, path, content=True):
+        """
+        :param content whether to hash the contents of the file or just its size and modification time
+        :return hash of path, or None if path does not exist
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        if not content or st.st_size > MAX_CONTENT_HASH_SIZE:
+            return "%s:%s" % (st.st_size, st.st_mtime_ns)
+
+        k = self.key(path)
+        with self.lock:
+            cached = self.data['files'].get(k)
+        if cached is not None and cached['size'] == st.st_size and cached['mtime'] == st.st_mtime_ns:
+            return cached['hash']
+
+        h = file_hash(path)
+        with self.lock:
+            self.data['files'][k] = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'hash': h}
+        return h
+
+    def hash_paths(self, paths):
+        """
+        :param paths list of files or directories (directories are expanded recursively, None entries are ignored)
+        :return dictionary of file keys --> content hashes
+        """
+        result = {}
+        for p in paths:
+            if p is None:
+                continue
+            if os.path.isdir(p):
+                for root, dirs, files in os.walk(p):
+                    dirs.sort()
+                    for f in sorted(files):
+                        fp = os.path.join(root, f)
+                        result[self.key(fp)] = self.hash_file(fp, content=False)
+            else:
+                result[self.key(p)] = self.hash_file(p)
+        return result
+
+    def track_options(self, stage):
+        """
+        :return arguments to pass to stage, recording which options it reads
+        """
+        recorder = OptionRecorder(stage.args)
+        with self.lock:
+            self.recorders[stage.name] = recorder
+        return recorder
+
+    def stage_options(self, name, read_options=()):
+        """
+        :param read_options names of the options that the stage read when it last ran
+        :return dictionary of options --> values that affect the outputs of a stage
+        """
+        args_dict = args_to_dict(self.args)
+        opts = {opt: args_dict.get(opt) for opt in sorted(self.rerun_stages) \
+                    if self.rerun_stages[opt] is not None and (self.rerun_stages[opt] == name or opt in read_options)}
+
+        # Normalize values so that they compare equal to the ones loaded from JSON
+        return json.loads(json.dumps(opts, default=str))
+
+    def dependency_outputs(self, stage):
+        """
+        :return list of files produced by the stages that stage depends on
+        """
+        paths = []
+        for d in stage.get_dependencies():
+            if d.name in PASS_THROUGH_STAGES:
+                paths += self.dependency_outputs(d)
+            else:
+                paths += stage_output_files(d.name, self.tree)
+        return paths
+
+    def stage_inputs(self, stage):
+        paths = stage_input_files(stage.name, self.tree) + self.dependency_outputs(stage)
+        return self.hash_paths(paths)
+
+    def is_stale(self, stage):
+        """
+        :return a reason (string) why stage needs to be rerun, or None if
+            nothing it depends on has changed since it was last run (or
+            if the stage has never been recorded)
+        """
+        with self.lock:
+            entry = self.data['stages'].get(stage.name)
+        if entry is None:
+            return None
+
+        options = self.stage_options(stage.name, entry['options'].keys())
+        changed = [opt for opt in options if entry['options'].get(opt) != options[opt]]
+        if changed:
+            return "changed options: %s" % ", ".join(changed)
+
+        # Inputs that have been removed (e.g. by --optimize-disk-space)
+        # don't count as changes
+        inputs = self.stage_inputs(stage)
+        changed = [k for k in sorted(inputs.keys()) if inputs[k] is not None and inputs[k] != entry['inputs'].get(k)]
+        if changed:
+            if len(changed) > 5:
+                return "changed inputs: %s and %s more" % (", ".join(changed[:5]), len(changed) - 5)
+            return "changed inputs: %s" % ", ".join(changed)
+
+        return None
+
+    def record(self, stage):
+        """
+        Record a stage that has finished running
+        """
+        with self.lock:
+            recorder = self.recorders.pop(stage.name, None)
+        read_options = set(recorder.read_options) if recorder is not None else set()
+
+        # Keep the options read on previous runs (a stage can take a
+        # different code path on a rerun, e.g. skip work whose outputs exist)
+        with self.lock:
+            previous = self.data['stages'].get(stage.name)
+        if previous is not None:
+            read_options.update(previous['options'].keys())
+
+        entry = {
+            'options': self.stage_options(stage.name, read_options),
+            'inputs': self.stage_inputs(stage),
+            'outputs': self.hash_paths(stage_output_files(stage.name, self.tree)),
+        }
+        with self.lock:
+            self.data['stages'][stage.name] = entry
+            self.save()
+
+def manifest_path(project_path):
+    return os.path.join(project_path, "manifest.json")
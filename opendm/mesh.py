@@ -5,9 +5,11 @@ from opendm import system
 from opendm import log
 from opendm import context
 from opendm import concurrency
+from opendm.governor import get_governor
 from opendm import point_cloud
 from scipy import signal
 import numpy as np
+import rasterio
 
 def create_25dmesh(inPointCloud, outMesh, radius_steps=["0.05"], dsm_resolution=0.05, depth=8, samples=1, maxVertexCount=100000, available_cores=None, method='gridded', smooth_dsm=True, max_tiles=None, trim=True):
     # Create DSM from point cloud
@@ -73,6 +75,10 @@ def dem_to_points(inGeotiff, outPointCloud):
     return outPointCloud
 
 
+def raster_pixel_count(raster_path):
+    with rasterio.open(raster_path) as r:
+        return r.width * r.height
+
 def dem_to_mesh_gridded(inGeotiff, outMesh, maxVertexCount, maxConcurrency=1):
     log.ODM_INFO('Creating mesh from DSM: %s' % inGeotiff)
 
@@ -86,6 +92,10 @@ def dem_to_mesh_gridded(inGeotiff, outMesh, maxVertexCount, maxConcurrency=1):
 
     outMeshDirty = os.path.join(mesh_path, "{}.dirty{}".format(basename, ext))
 
+    governor = get_governor()
+    dsm_pixels = raster_pixel_count(inGeotiff)
+    maxConcurrency = governor.plan('dem2mesh', dsm_pixels, maxConcurrency).threads
+
     # This should work without issues most of the times, 
     # but just in case we lower maxConcurrency if it fails.
     while True:
@@ -97,13 +107,13 @@ def dem_to_mesh_gridded(inGeotiff, outMesh, maxVertexCount, maxConcurrency=1):
                 'maxVertexCount': maxVertexCount,
                 'maxConcurrency': maxConcurrency
             }
-            system.run('"{bin}" -inputFile "{infile}" '
+            governor.run('dem2mesh', '"{bin}" -inputFile "{infile}" '
                 '-outputFile "{outfile}" '
                 '-maxTileLength 2000 '
                 '-maxVertexCount {maxVertexCount} '
                 '-maxConcurrency {maxConcurrency} '
                 '-edgeSwapThreshold 0.15 '
-                '-verbose '.format(**kwargs))
+                '-verbose '.format(**kwargs), dsm_pixels, maxConcurrency)
             break
         except Exception as e:
             maxConcurrency = math.floor(maxConcurrency / 2)
@@ -166,16 +176,21 @@ def screened_poisson_reconstruction(inPointCloud, outMesh, depth = 8, samples =
         'pointWeight': pointWeight,
     }
 
+    # Points + (roughly) the number of octree nodes on the surface
+    governor = get_governor()
+    units = point_cloud.ply_info(inPointCloud)['vertex_count'] + 4 ** depth
+    threads = governor.plan('PoissonRecon', units, threads).threads
+
     # Run PoissonRecon
     while True:
         try:
-            system.run('"{bin}" --in "{infile}" '
+            governor.run('PoissonRecon', '"{bin}" --in "{infile}" '
                     '--out "{outfile}" '
                     '--depth {depth} '
                     '--pointWeight {pointWeight} '
                     '--samplesPerNode {samples} '
                     '--density '
-                    '--confidence'.format(**poissonReconArgs), env_vars={'OMP_NUM_THREADS': int(threads)})
+                    '--confidence'.format(**poissonReconArgs), units, threads, env_vars={'OMP_NUM_THREADS': int(threads)})
         except Exception as e:
             log.ODM_WARNING(str(e))
             
@@ -1,7 +1,6 @@
 import os
 from opendm import log
 from opendm import system
-from opendm.cropper import Cropper
 from opendm.concurrency import get_max_memory
 import math
 import numpy as np
@@ -12,8 +11,8 @@ from rasterio.transform import Affine, rowcol
 from rasterio.mask import mask
 from opendm import io
 from opendm.tiles.tiler import generate_orthophoto_tiles
-from opendm.cogeo import convert_to_cogeo
-from opendm.utils import add_raster_meta_tags
+from opendm.cogeo import finalize_raster
+from opendm.utils import get_raster_meta_tags
 from osgeo import gdal
 from osgeo import ogr
 
@@ -29,16 +28,6 @@ def get_orthophoto_vars(args):
         'NUM_THREADS': args.max_concurrency
     }
 
-def build_overviews(orthophoto_file):
-    log.ODM_INFO("Building Overviews")
-    kwargs = {'orthophoto': orthophoto_file}
-    
-    # Run gdaladdo
-    system.run('gdaladdo -r average '
-                '--config BIGTIFF_OVERVIEW IF_SAFER '
-                '--config COMPRESS_OVERVIEW JPEG '
-                '{orthophoto} 2 4 8 16'.format(**kwargs))
-
 def generate_png(orthophoto_file, output_file=None, outsize=None):
     if output_file is None:
         base, ext = os.path.splitext(orthophoto_file)
@@ -168,11 +157,15 @@ def generate_tfw(orthophoto_file):
 
 
 def post_orthophoto_steps(args, bounds_file_path, orthophoto_file, orthophoto_tiles_dir, resolution, reconstruction, tree, embed_gcp_meta=False):
-    if args.crop > 0 or args.boundary:
-        Cropper.crop(bounds_file_path, orthophoto_file, get_orthophoto_vars(args), keep_original=not args.optimize_disk_space, warp_options=['-dstalpha'])
-
-    if args.build_overviews and not args.cog:
-        build_overviews(orthophoto_file)
+    # Crop, add meta tags and overviews / convert to COG in a single write
+    tags, metadata = get_raster_meta_tags(reconstruction, tree, embed_gcp_meta=embed_gcp_meta)
+    finalize_raster(orthophoto_file,
+                    cutline=bounds_file_path if args.crop > 0 or args.boundary else None,
+                    tags=tags, metadata=metadata,
+                    cog=args.cog, overviews=args.build_overviews,
+                    creation_options=get_orthophoto_vars(args), warp_options=['-dstalpha'],
+                    max_workers=args.max_concurrency, compression=args.orthophoto_compression,
+                    keep_original=not args.optimize_disk_space)
 
     if args.orthophoto_png:
         generate_png(orthophoto_file)
@@ -180,14 +173,9 @@ def post_orthophoto_steps(args, bounds_file_path, orthophoto_file, orthophoto_ti
     if args.orthophoto_kmz:
         generate_kmz(orthophoto_file)
 
-    add_raster_meta_tags(orthophoto_file, reconstruction, tree, embed_gcp_meta=embed_gcp_meta)
-
     if args.tiles:
         generate_orthophoto_tiles(orthophoto_file, orthophoto_tiles_dir, args.max_concurrency, resolution)
 
-    if args.cog:
-        convert_to_cogeo(orthophoto_file, max_workers=args.max_concurrency, compression=args.orthophoto_compression)
-
     generate_extent_polygon(orthophoto_file)
     generate_tfw(orthophoto_file)
 
@@ -0,0 +1,327 @@
+import os
+import json
+import hashlib
+import struct
+import threading
+import numpy as np
+from opendm import log
+
+# Point cloud metadata (extent, SRS, count, dimensions and statistics).
+# Headers are read in-process, statistics are computed (with a full scan)
+# at most once per version of a file: results are cached in memory, keyed by
+# file size, modification/change times, inode and a hash of the first and last
+# bytes of the file (so that same-size rewrites are detected even on file
+# systems with coarse timestamps).
+
+CHUNK_SIZE = 1000000
+FINGERPRINT_SIZE = 65536
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+LAS_BASE_DIMENSIONS = ['X', 'Y', 'Z', 'Intensity', 'ReturnNumber', 'NumberOfReturns', 'ScanDirectionFlag',
+                       'EdgeOfFlightLine', 'Classification', 'Synthetic', 'KeyPoint', 'Withheld']
+LAS_RECORD_LENGTHS = {0: 20, 1: 28, 2: 26, 3: 34, 4: 57, 5: 63, 6: 30, 7: 36, 8: 38, 9: 59, 10: 67}
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8'
+}
+PLY_DIMENSIONS = {'x': 'X', 'y': 'Y', 'z': 'Z', 'red': 'Red', 'green': 'Green', 'blue': 'Blue'}
+
+def get_header(path):
+    """
+    :return dictionary with the header-level metadata of a LAS/LAZ/PLY file:
+        count, dimensions, srs (None if unknown) and bounds (None for PLY files)
+    """
+    return _load(path)['header']
+
+def get_count(path):
+    return get_header(path)['count']
+
+def get_dimensions(path):
+    return get_header(path)['dimensions']
+
+def get_srs(path):
+    """
+    :return SRS of the point cloud (WKT or EPSG:<code>), None if unknown
+    """
+    return get_header(path)['srs']
+
+def get_extent(path):
+    """
+    :return dictionary with minx, maxx, miny, maxy, minz, maxz
+        (from the header, if available, or from the point cloud statistics)
+    """
+    bounds = get_header(path)['bounds']
+    if bounds is None:
+        bounds = get_stats(path)['bounds']
+    return bounds
+
+def get_stats(path):
+    """
+    :return dictionary with count, bounds and statistic (list of per-dimension
+        name, position, count, minimum, maximum, average, variance, stddev,
+        as in the output of pdal info)
+    """
+    entry = _load(path)
+    if entry.get('stats') is None:
+        log.ODM_INFO("Computing point cloud statistics for %s" % path)
+        entry['stats'] = compute_stats(path, entry['header'])
+    return entry['stats']
+
+def get_dimension_stats(path, name):
+    """
+    :return statistics of the given dimension, None if the point cloud does not have it
+    """
+    for s in get_stats(path)['statistic']:
+        if s['name'] == name:
+            return s
+
+def _version(path):
+    st = os.stat(path)
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read(FINGERPRINT_SIZE))
+        if st.st_size > FINGERPRINT_SIZE:
+            f.seek(max(FINGERPRINT_SIZE, st.st_size - FINGERPRINT_SIZE))
+            h.update(f.read(FINGERPRINT_SIZE))
+    return (st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino, h.hexdigest())
+
+def _load(path):
+    path = os.path.abspath(path)
+    version = _version(path)
+
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry is not None and entry['version'] == version:
+            return entry
+
+    entry = {'version': version, 'header': read_header(path), 'stats': None}
+    with _cache_lock:
+        _cache[path] = entry
+    return entry
+
+def read_header(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ['.las', '.laz']:
+        return read_las_header(path)
+    elif ext == '.ply':
+        return read_ply_header(path)
+    else:
+        raise IOError("Unsupported point cloud format: %s" % path)
+
+def read_las_header(path):
+    with open(path, 'rb') as f:
+        data = f.read(375)
+        if len(data) < 227 or data[0:4] != b'LASF':
+            raise IOError("%s is not a valid LAS/LAZ file" % path)
+
+        version_minor = data[25]
+        header_size, point_offset, vlr_count = struct.unpack_from('<HII', data, 94)
+        point_format, record_length, count = struct.unpack_from('<BHI', data, 104)
+        max_x, min_x, max_y, min_y, max_z, min_z = struct.unpack_from('<6d', data, 179)
+
+        # LAZ files set the upper bits of the point format
+        point_format &= 0x3F
+        evlr_offset, evlr_count = 0, 0
+        if version_minor >= 4 and len(data) >= 255:
+            evlr_offset, evlr_count, count_14 = struct.unpack_from('<QIQ', data, 235)
+            if count_14 > 0:
+                count = count_14
+
+        vlrs = []
+        f.seek(header_size)
+        for i in range(vlr_count):
+            vlr = f.read(54)
+            if len(vlr) < 54:
+                break
+            user_id = vlr[2:18].split(b'\0')[0].decode('ascii', errors='ignore')
+            record_id, length = struct.unpack_from('<HH', vlr, 18)
+            vlrs.append((user_id, record_id, f.read(length)))
+
+        if evlr_count > 0:
+            f.seek(evlr_offset)
+            for i in range(evlr_count):
+                evlr = f.read(60)
+                if len(evlr) < 60:
+                    break
+                user_id = evlr[2:18].split(b'\0')[0].decode('ascii', errors='ignore')
+                record_id, length = struct.unpack_from('<HQ', evlr, 18)
+                vlrs.append((user_id, record_id, f.read(length)))
+
+    dimensions = list(LAS_BASE_DIMENSIONS)
+    if point_format >= 6:
+        dimensions += ['ScanChannel', 'Overlap']
+    dimensions += ['ScanAngleRank', 'UserData', 'PointSourceId']
+    if point_format in [1, 3, 4, 5] or point_format >= 6:
+        dimensions.append('GpsTime')
+    if point_format in [2, 3, 5, 7, 8, 10]:
+        dimensions += ['Red', 'Green', 'Blue']
+    if point_format in [8, 10]:
+        dimensions.append('Infrared')
+
+    srs = None
+    for user_id, record_id, payload in vlrs:
+        if user_id == 'LASF_Spec' and record_id == 4:
+            # Extra bytes
+            for i in range(0, len(payload) - 191, 192):
+                dimensions.append(payload[i + 4:i + 36].split(b'\0')[0].decode('ascii', errors='ignore'))
+        elif user_id == 'LASF_Projection' and record_id == 2112:
+            srs = payload.split(b'\0')[0].decode('utf-8', errors='ignore').strip() or srs
+        elif user_id == 'LASF_Projection' and record_id == 34735 and srs is None:
+            srs = _geokeys_srs(payload)
+
+    return {
+        'count': int(count),
+        'dimensions': dimensions,
+        'srs': srs,
+        'bounds': {'minx': min_x, 'maxx': max_x, 'miny': min_y, 'maxy': max_y, 'minz': min_z, 'maxz': max_z},
+        'point_format': point_format,
+        'record_length': record_length,
+        'point_offset': point_offset,
+        'compressed': path.lower().endswith('.laz')
+    }
+
+def _geokeys_srs(payload):
+    """
+    :return EPSG:<code> from a GeoTIFF GeoKeyDirectory, None if not found
+    """
+    keys = struct.unpack_from('<%sH' % (len(payload) // 2), payload)
+    for i in range(4, min(len(keys), 4 + keys[3] * 4), 4):
+        key_id, location, _, value = keys[i:i + 4]
+        # ProjectedCSTypeGeoKey, GeographicTypeGeoKey
+        if key_id in [3072, 2048] and location == 0 and value not in [0, 32767]:
+            return 'EPSG:%s' % value
+
+def read_ply_header(path):
+    with open(path, 'rb') as f:
+        line = f.readline().strip()
+        if line != b'ply':
+            raise IOError("%s is not a valid PLY file" % path)
+
+        storage = None
+        count = 0
+        properties = []
+        vertex_first = None
+        element = None
+
+        while True:
+            line = f.readline()
+            if not line:
+                raise IOError("Cannot find end_header field. Invalid PLY?")
+            props = line.strip().decode('ascii', errors='ignore').split()
+            if len(props) == 0:
+                continue
+            if props[0] == 'end_header':
+                break
+            elif props[0] == 'format':
+                storage = props[1]
+            elif props[0] == 'element':
+                element = props[1]
+                if element == 'vertex':
+                    count = int(props[2])
+                    vertex_first = vertex_first is None
+                elif vertex_first is None:
+                    vertex_first = False
+            elif props[0] == 'property' and element == 'vertex' and len(props) == 3:
+                properties.append((props[2], props[1]))
+
+        data_offset = f.tell()
+
+    return {
+        'count': count,
+        'dimensions': [PLY_DIMENSIONS.get(name, name) for name, _ in properties],
+        'srs': None,
+        'bounds': None,
+        'storage': storage,
+        'properties': properties,
+        'data_offset': data_offset,
+        'vertex_first': bool(vertex_first)
+    }
+
+def read_chunks(path, header):
+    """
+    Read the points of a point cloud in chunks
+    :return generator of numpy structured arrays
+    """
+    ply_byte_order = {'binary_little_endian': '<', 'binary_big_endian': '>'}
+    if header.get('storage') in ply_byte_order and header['vertex_first'] and \
+            all([t in PLY_TYPES for _, t in header['properties']]):
+        # Binary PLY vertices can be mapped directly
+        order = ply_byte_order[header['storage']]
+        dtype = np.dtype([(PLY_DIMENSIONS.get(name, name), order + PLY_TYPES[t]) for name, t in header['properties']])
+        points = np.memmap(path, dtype=dtype, mode='r', offset=header['data_offset'], shape=(header['count'],))
+        for start in range(0, len(points), CHUNK_SIZE):
+            yield points[start:start + CHUNK_SIZE]
+    else:
+        import pdal
+
+        pipeline = pdal.Pipeline(json.dumps([path]))
+        if hasattr(pipeline, 'iterator'):
+            for arr in pipeline.iterator(chunk_size=CHUNK_SIZE):
+                yield arr
+        else:
+            # Older PDAL bindings do not support streaming
+            pipeline.execute()
+            for arr in pipeline.arrays:
+                yield arr
+
+def compute_stats(path, header):
+    """
+    Compute per-dimension statistics with a single pass over the points
+    (chunk statistics are combined with Chan's parallel algorithm)
+    """
+    names = None
+    stats = {}
+
+    for arr in read_chunks(path, header):
+        if len(arr) == 0:
+            continue
+        if names is None:
+            names = list(arr.dtype.names)
+            stats = {n: [0, 0.0, 0.0, np.inf, -np.inf] for n in names}
+
+        for n in names:
+            values = np.asarray(arr[n], dtype=np.float64)
+            count, mean, m2, minimum, maximum = stats[n]
+            c_count = len(values)
+            c_mean = values.mean()
+            c_m2 = np.square(values - c_mean).sum()
+
+            total = count + c_count
+            delta = c_mean - mean
+            stats[n] = [total,
+                        mean + delta * c_count / total,
+                        m2 + c_m2 + delta * delta * count * c_count / total,
+                        min(minimum, values.min()),
+                        max(maximum, values.max())]
+
+    statistic = []
+    for position, n in enumerate(names or []):
+        count, mean, m2, minimum, maximum = stats[n]
+        variance = m2 / (count - 1) if count > 1 else 0.0
+        statistic.append({
+            'name': n,
+            'position': position,
+            'count': int(count),
+            'minimum': float(minimum),
+            'maximum': float(maximum),
+            'average': float(mean),
+            'variance': float(variance),
+            'stddev': float(np.sqrt(variance))
+        })
+
+    bounds = None
+    if names is not None and all([d in stats for d in ['X', 'Y', 'Z']]):
+        bounds = {}
+        for d in ['X', 'Y', 'Z']:
+            bounds['min' + d.lower()] = float(stats[d][3])
+            bounds['max' + d.lower()] = float(stats[d][4])
+
+    return {
+        'count': int(stats[names[0]][0]) if names else 0,
+        'bounds': bounds,
+        'statistic': statistic
+    }
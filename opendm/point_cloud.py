@@ -5,7 +5,8 @@ from opendm import context
 from opendm.system import run
 from opendm import entwine
 from opendm import io
-from opendm.concurrency import parallel_map
+from opendm import pcinfo
+from opendm.concurrency import parallel_map, run_with_memory_budget, get_max_memory_mb
 from opendm.utils import double_quote
 from opendm.boundary import as_polygon, as_geojson
 from opendm.dem.pdal import run_pipeline
@@ -131,60 +132,38 @@ def get_spacing(stats_file, resolution_fallback=5.0):
             return fallback()
 
 def export_info_json(pointcloud_path, info_file_path):
-    system.run('pdal info --dimensions "X,Y,Z" "{0}" > "{1}"'.format(pointcloud_path, info_file_path))
+    """
+    Write the X,Y,Z statistics of a point cloud (in the format of pdal info --dimensions "X,Y,Z")
+    """
+    stats = pcinfo.get_stats(pointcloud_path)
+    with open(info_file_path, 'w') as f:
+        f.write(json.dumps({
+            'filename': pointcloud_path,
+            'stats': {
+                'bbox': {'native': {'bbox': stats['bounds']}},
+                'statistic': [s for s in stats['statistic'] if s['name'] in ['X', 'Y', 'Z']]
+            }
+        }, indent=2))
 
 
 def export_summary_json(pointcloud_path, summary_file_path):
-    system.run('pdal info --summary "{0}" > "{1}"'.format(pointcloud_path, summary_file_path))
+    """
+    Write a summary of a point cloud (in the format of pdal info --summary)
+    """
+    header = pcinfo.get_header(pointcloud_path)
+    with open(summary_file_path, 'w') as f:
+        f.write(json.dumps({
+            'filename': pointcloud_path,
+            'summary': {
+                'bounds': pcinfo.get_extent(pointcloud_path),
+                'dimensions': ', '.join(header['dimensions']),
+                'num_points': header['count'],
+                'srs': {'wkt': header['srs'] or ''}
+            }
+        }, indent=2))
 
 def get_extent(input_point_cloud):
-    fd, json_file = tempfile.mkstemp(suffix='.json')
-    os.close(fd)
-    
-    # Get point cloud extent
-    fallback = False
-
-    # We know PLY files do not have --summary support
-    if input_point_cloud.lower().endswith(".ply"):
-        fallback = True
-        run('pdal info "{0}" > "{1}"'.format(input_point_cloud, json_file))
-
-    try:
-        if not fallback:
-            run('pdal info --summary "{0}" > "{1}"'.format(input_point_cloud, json_file))
-    except:
-        fallback = True
-        run('pdal info "{0}" > "{1}"'.format(input_point_cloud, json_file))
-
-    bounds = {}
-    with open(json_file, 'r') as f:
-        result = json.loads(f.read())
-        
-        if not fallback:
-            summary = result.get('summary')
-            if summary is None: raise Exception("Cannot compute summary for %s (summary key missing)" % input_point_cloud)
-            bounds = summary.get('bounds')
-        else:
-            stats = result.get('stats')
-            if stats is None: raise Exception("Cannot compute bounds for %s (stats key missing)" % input_point_cloud)
-            bbox = stats.get('bbox')
-            if bbox is None: raise Exception("Cannot compute bounds for %s (bbox key missing)" % input_point_cloud)
-            native = bbox.get('native')
-            if native is None: raise Exception("Cannot compute bounds for %s (native key missing)" % input_point_cloud)
-            bounds = native.get('bbox')
-
-        if bounds is None: raise Exception("Cannot compute bounds for %s (bounds key missing)" % input_point_cloud)
-        
-        if bounds.get('maxx', None) is None or \
-            bounds.get('minx', None) is None or \
-            bounds.get('maxy', None) is None or \
-            bounds.get('miny', None) is None or \
-            bounds.get('maxz', None) is None or \
-            bounds.get('minz', None) is None:
-            raise Exception("Cannot compute bounds for %s (invalid keys) %s" % (input_point_cloud, str(bounds)))
-            
-    os.remove(json_file)
-    return bounds
+    return pcinfo.get_extent(input_point_cloud)
 
 
 def merge(input_point_cloud_files, output_file, rerun=False):
@@ -275,19 +254,101 @@ def merge_ply(input_point_cloud_files, output_file, dims=None):
 
     system.run(' '.join(cmd))
 
-def post_point_cloud_steps(args, tree, rerun=False):
+def georeference(input_point_cloud, output_point_cloud, scale=0.001, offset=None, srs=None, a_matrix=None, vlrs=[]):
+    """
+    Convert the filtered point cloud to LAS/LAZ in a single streaming pass:
+    views are ferried to UserData and the UTM offset and the alignment matrix (if any)
+    are applied as a single transformation.
+    :param scale LAS scale
+    :param offset (x, y) offset of the reconstruction (also used as LAS offset), None if not georeferenced
+    :param srs SRS of the output, None if not georeferenced
+    :param a_matrix 4x4 alignment matrix, applied after the offset, None for no alignment
+    :param vlrs list of VLRs to embed (writers.las format)
+    """
+    import numpy as np
+
+    matrix = np.identity(4)
+    if offset is not None:
+        matrix[0][3] = offset[0]
+        matrix[1][3] = offset[1]
+    if a_matrix is not None:
+        matrix = np.dot(a_matrix, matrix)
+
+    pipeline = [
+        {
+            'type': 'readers.ply',
+            'filename': input_point_cloud
+        },
+        {
+            'type': 'filters.ferry',
+            'dimensions': 'views => UserData'
+        }
+    ]
+
+    if not np.array_equal(matrix, np.identity(4)):
+        pipeline.append({
+            'type': 'filters.transformation',
+            'matrix': ' '.join(map(str, matrix.flatten()))
+        })
+
+    writer = {
+        'type': 'writers.las',
+        'filename': output_point_cloud,
+        'scale_x': scale,
+        'scale_y': scale,
+        'scale_z': scale,
+        'compression': 'lazperf' if output_point_cloud.lower().endswith('.laz') else 'none'
+    }
+    if offset is not None:
+        writer.update({
+            'offset_x': offset[0],
+            'offset_y': offset[1],
+            'offset_z': 0
+        })
+    if srs is not None:
+        writer['a_srs'] = srs
+    if len(vlrs) > 0:
+        writer['vlrs'] = vlrs
+    pipeline.append(writer)
+
+    run_pipeline({'pipeline': pipeline}, stream=True)
+
+def post_point_cloud_steps(args, tree, rerun=False, input_point_cloud=None):
+    """
+    :param input_point_cloud unclassified point cloud to classify into tree.odm_georeferencing_model_laz
+        (e.g. written by the georeferencing), None to classify tree.odm_georeferencing_model_laz in place.
+        The input point cloud is removed.
+    """
+    if input_point_cloud is not None:
+        pc_classify_marker = os.path.join(tree.odm_georeferencing, 'pc_classify_done.txt')
+        if not args.pc_classify or (io.file_exists(pc_classify_marker) and not rerun):
+            run_pipeline({'pipeline': [input_point_cloud, {
+                'type': 'writers.las',
+                'filename': tree.odm_georeferencing_model_laz,
+                'compression': 'lazperf',
+                'forward': 'all'
+            }]}, stream=True)
+            os.remove(input_point_cloud)
+            input_point_cloud = None
+
+
     # Classify and rectify before generating derivate files
     if args.pc_classify:
         pc_classify_marker = os.path.join(tree.odm_georeferencing, 'pc_classify_done.txt')
 
         if not io.file_exists(pc_classify_marker) or rerun:
             log.ODM_INFO("Classifying {} using Simple Morphological Filter (1/2)".format(tree.odm_georeferencing_model_laz))
-            commands.classify(tree.odm_georeferencing_model_laz,
+            commands.classify(input_point_cloud or tree.odm_georeferencing_model_laz,
                                 args.smrf_scalar, 
                                 args.smrf_slope, 
                                 args.smrf_threshold, 
-                                args.smrf_window
+                                args.smrf_window,
+                                args.max_concurrency,
+                                output=tree.odm_georeferencing_model_laz,
+                                tiled=args.smrf_tiled
                             )
+            if input_point_cloud is not None and os.path.isfile(input_point_cloud):
+                os.remove(input_point_cloud)
 
             log.ODM_INFO("Classifying {} using OpenPointClass (2/2)".format(tree.odm_georeferencing_model_laz))
             classify(tree.odm_georeferencing_model_laz, args.max_concurrency)
@@ -298,22 +359,37 @@ def post_point_cloud_steps(args, tree, rerun=False):
                 f.write('Slope: {}\n'.format(args.smrf_slope))
                 f.write('Threshold: {}\n'.format(args.smrf_threshold))
                 f.write('Window: {}\n'.format(args.smrf_window))
+                f.write('Tiled: {}\n'.format(args.smrf_tiled))
     
     if args.pc_rectify:
-        commands.rectify(tree.odm_georeferencing_model_laz)
+        commands.rectify(tree.odm_georeferencing_model_laz, max_workers=args.max_concurrency)
+
+    export_point_cloud(args, tree, rerun)
+
+def export_point_cloud(args, tree, rerun=False):
+    """
+    Generate the CSV, LAS, EPT and COPC outputs. CSV and LAS outputs are
+    written by a single streaming PDAL pipeline, so the source point cloud
+    is decompressed only once for both. EPT and COPC are built by external
+    tools reading the point cloud themselves, so they run concurrently with
+    the PDAL pipeline when they fit within the memory budget, sharing
+    max_concurrency threads.
+    """
+    source = tree.odm_georeferencing_model_laz
+    writers = []
 
     # XYZ point cloud output
     if args.pc_csv:
         log.ODM_INFO("Creating CSV file (XYZ format)")
         
         if not io.file_exists(tree.odm_georeferencing_xyz_file) or rerun:
-            system.run("pdal translate -i \"{}\" "
-                "-o \"{}\" "
-                "--writers.text.format=csv "
-                "--writers.text.order=\"X,Y,Z\" "
-                "--writers.text.keep_unspecified=false ".format(
-                    tree.odm_georeferencing_model_laz,
-                    tree.odm_georeferencing_xyz_file))
+            writers.append({
+                'type': 'writers.text',
+                'filename': tree.odm_georeferencing_xyz_file,
+                'format': 'csv',
+                'order': 'X,Y,Z',
+                'keep_unspecified': False
+            })
         else:
             log.ODM_WARNING("Found existing CSV file %s" % tree.odm_georeferencing_xyz_file)
 
@@ -322,21 +398,57 @@ def post_point_cloud_steps(args, tree, rerun=False):
         log.ODM_INFO("Creating LAS file")
         
         if not io.file_exists(tree.odm_georeferencing_model_las) or rerun:
-            system.run("pdal translate -i \"{}\" "
-                "-o \"{}\" ".format(
-                    tree.odm_georeferencing_model_laz,
-                    tree.odm_georeferencing_model_las))
+            writers.append({
+                'type': 'writers.las',
+                'filename': tree.odm_georeferencing_model_las
+            })
         else:
             log.ODM_WARNING("Found existing LAS file %s" % tree.odm_georeferencing_model_las)
 
+    # EPT and COPC builders are assumed to need up to the whole decompressed
+    # point cloud in memory (each dimension takes 8 bytes at most)
+    try:
+        source_mb = pcinfo.get_count(source) * len(pcinfo.get_dimensions(source)) * 8 / 1024 / 1024
+    except Exception as e:
+        log.ODM_WARNING("Cannot read %s: %s" % (source, str(e)))
+        source_mb = 0
+    jobs = []
+
+    if len(writers) > 0:
+        def write_outputs():
+            run_pipeline({'pipeline': [{'type': 'readers.las', 'filename': source}] + writers}, stream=True)
+
+        # Streaming keeps a single chunk of points in memory
+        jobs.append((write_outputs, 0))
+
     # EPT point cloud output
     if args.pc_ept:
         log.ODM_INFO("Creating Entwine Point Tile output")
-        entwine.build([tree.odm_georeferencing_model_laz], tree.entwine_pointcloud, max_concurrency=args.max_concurrency, rerun=rerun)
+
+        def build_ept():
+            entwine.build([source], tree.entwine_pointcloud, max_concurrency=ept_threads, rerun=rerun)
+
+        jobs.append((build_ept, source_mb))
 
     # COPC point clouds
     if args.pc_copc:
         log.ODM_INFO("Creating Cloud Optimized Point Cloud (COPC)")
 
-        copc_output = io.related_file_path(tree.odm_georeferencing_model_laz, postfix=".copc")
-        entwine.build_copc([tree.odm_georeferencing_model_laz], copc_output, convert_rgb_8_to_16=True)
\ No newline at end of file
+        def build_copc():
+            copc_output = io.related_file_path(source, postfix=".copc")
+            entwine.build_copc([source], copc_output, convert_rgb_8_to_16=True)
+
+        jobs.append((build_copc, source_mb))
+
+    if len(jobs) > 0:
+        max_memory_mb = get_max_memory_mb()
+        max_workers = len(jobs) if args.max_concurrency > 1 else 1
+
+        # Untwine (COPC) picks its own number of threads, leave half of the threads
+        # to it when both builders run at the same time, which is when
+        # both fit in the memory budget (the streaming writer takes none)
+        ept_threads = args.max_concurrency
+        if args.pc_ept and args.pc_copc and max_workers > 1 and source_mb * 2 <= max_memory_mb:
+            ept_threads = max(1, args.max_concurrency // 2)
+
+        run_with_memory_budget(jobs, max_memory_mb, max_workers=max_workers)
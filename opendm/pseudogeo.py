@@ -10,6 +10,16 @@ def get_pseudogeo_utm():
 def get_pseudogeo_scale():
     return 0.1 # Arbitrarily chosen
 
+def set_pseudo_georeferencing(ds):
+    """
+    :param ds GDAL dataset (opened for update, or a VRT)
+    """
+    srs = osr.SpatialReference()
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    srs.ImportFromProj4(get_pseudogeo_utm())
+    ds.SetProjection( srs.ExportToWkt() )
+    ds.SetGeoTransform( [ 0.0, get_pseudogeo_scale(), 0.0, 0.0, 0.0, -get_pseudogeo_scale() ] )
+
 def add_pseudo_georeferencing(geotiff):
     if not io.file_exists(geotiff):
         log.ODM_WARNING("Cannot add pseudo georeferencing, %s does not exist" % geotiff)
@@ -19,11 +29,7 @@ def add_pseudo_georeferencing(geotiff):
         log.ODM_INFO("Adding pseudo georeferencing (raster should show up at the equator) to %s" % geotiff)
 
         dst_ds = gdal.Open(geotiff, GA_Update)
-        srs = osr.SpatialReference()
-        srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
-        srs.ImportFromProj4(get_pseudogeo_utm())
-        dst_ds.SetProjection( srs.ExportToWkt() )
-        dst_ds.SetGeoTransform( [ 0.0, get_pseudogeo_scale(), 0.0, 0.0, 0.0, -get_pseudogeo_scale() ] )
+        set_pseudo_georeferencing(dst_ds)
         dst_ds = None
 
     except Exception as e:
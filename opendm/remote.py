@@ -1,16 +1,21 @@
 import time
 import datetime
+import json
 import os
 import sys
 import threading
 import signal
 import zipfile
 import glob
+import mimetypes
+from requests_toolbelt.multipart import encoder
 from opendm import log
+from opendm import context
+from opendm import get_image_size
 from opendm import system
 from opendm import config
 from pyodm import Node, exceptions
-from pyodm.utils import AtomicCounter
+from pyodm.utils import AtomicCounter, options_to_json
 from pyodm.types import TaskStatus
 from opendm.osfm import OSFMContext, get_submodel_args_dict, get_submodel_argv
 from opendm.utils import double_quote
@@ -20,33 +25,85 @@ try:
 except ImportError:
     import Queue as queue
 
+class PoolNode:
+    """
+    A processing node that submodels can be assigned to. The local
+    machine is also part of the pool (with url set to None).
+    """
+    def __init__(self, url=None, weight=None):
+        self.url = url
+        self.node = Node.from_url(url) if url is not None else None
+        self.weight = weight
+        self.max_running = None # Set if the node refuses tasks
+        self.online = True
+        self.running = 0
+        self.queue = []
+        self.load = 0.0
+
+    def is_local(self):
+        return self.node is None
+
+    def can_run_more(self):
+        """
+        Tasks are sent freely (the node queues them) until
+        the node reports that its task limit has been reached
+        """
+        return self.max_running is None or self.running < self.max_running
+
+    def queued_load(self):
+        return self.load / max(self.weight, 1e-6)
+
+    def __str__(self):
+        if self.is_local():
+            return "local"
+        return "%s:%s" % (self.node.host, self.node.port)
+
+
 class LocalRemoteExecutor:
     """
     A class for performing OpenSfM reconstructions and full ODM pipeline executions
-    using a mix of local and remote processing. Tasks are executed locally one at a time
-    and remotely until a node runs out of available slots for processing. This allows us
-    to use the processing power of the current machine as well as offloading tasks to a 
-    network node.
+    using a mix of local and remote processing. Tasks are assigned to a pool made of the
+    current machine and one or more network nodes, in proportion to their capacity
+    (remote nodes are weighted by their CPU cores, unless a weight is set in the URL
+    using url#weight) and to the estimated cost of each task (image count x resolution).
+    Idle nodes take queued tasks from busier ones, and the tasks of a node that goes
+    offline are redistributed to the remaining nodes.
     """
-    def __init__(self, nodeUrl, rolling_shutter = False, rerun = False):
-        self.node = Node.from_url(nodeUrl)
+    def __init__(self, nodeUrls, rolling_shutter = False, rerun = False, parallel_uploads = 1):
         self.params = {
             'tasks': [],
             'threads': [],
             'rolling_shutter': rolling_shutter,
             'rerun': rerun
         }
-        self.node_online = True
+        self.parallel_uploads = max(1, parallel_uploads)
+        self.local_node = PoolNode(weight=float(context.num_cores))
+        self.nodes = []
 
-        log.ODM_INFO("LRE: Initializing using cluster node %s:%s" % (self.node.host, self.node.port))
-        try:
-            info = self.node.info()
-            log.ODM_INFO("LRE: Node is online and running %s version %s"  % (info.engine, info.engine_version))
-        except exceptions.NodeConnectionError:
-            log.ODM_WARNING("LRE: The node seems to be offline! We'll still process the dataset, but it's going to run entirely locally.")
-            self.node_online = False
-        except Exception as e:
-            raise system.ExitException("LRE: An unexpected problem happened while opening the node connection: %s" % str(e))
+        for url, weight in config.split_node_urls(nodeUrls):
+            pn = PoolNode(url, weight)
+            log.ODM_INFO("LRE: Initializing using cluster node %s" % pn)
+            try:
+                info = pn.node.info()
+                log.ODM_INFO("LRE: Node is online and running %s version %s"  % (info.engine, info.engine_version))
+                if pn.weight is None:
+                    pn.weight = float(info.cpu_cores or 1)
+            except exceptions.NodeConnectionError:
+                log.ODM_WARNING("LRE: Node %s seems to be offline! We'll process its share of the dataset on the other nodes." % pn)
+                pn.online = False
+            except Exception as e:
+                raise system.ExitException("LRE: An unexpected problem happened while opening the node connection: %s" % str(e))
+
+            if pn.weight is None:
+                pn.weight = 1.0
+            self.nodes.append(pn)
+
+        if self.nodes and not self.node_online:
+            log.ODM_WARNING("LRE: No nodes are online! We'll still process the dataset, but it's going to run entirely locally.")
+
+    @property
+    def node_online(self):
+        return any([pn.online for pn in self.nodes])
 
     def set_projects(self, paths):
         self.project_paths = paths
@@ -64,18 +121,36 @@ class LocalRemoteExecutor:
         # Shared variables across threads
         class nonloc:
             error = None
-            local_processing = False
-            max_remote_tasks = None
-        
-        calculate_task_limit_lock = threading.Lock()
-        finished_tasks = AtomicCounter(0)
-        remote_running_tasks = AtomicCounter(0)
-
-        # Create queue
-        q = queue.Queue()
+            finished_tasks = 0
+            stop = False
+
+        cv = threading.Condition()
+        pool = [self.local_node] + [pn for pn in self.nodes if pn.online]
+        for pn in pool:
+            pn.queue = []
+            pn.load = 0.0
+            pn.running = 0
+
+        def assign(tasks):
+            # Largest tasks first, each to the node that would finish it the earliest
+            for task in sorted(tasks, key=lambda t: t.cost, reverse=True):
+                pn = min([pn for pn in pool if pn.online], key=lambda pn: (pn.load + task.cost) / pn.weight)
+                pn.queue.append(task)
+                pn.load += task.cost
+            cv.notify_all()
+
+        tasks = []
         for pp in self.project_paths:
-            log.ODM_INFO("LRE: Adding to queue %s" % pp)
-            q.put(taskClass(pp, self.node, self.params))
+            task = taskClass(pp, None, self.params)
+            task.cost = task.estimated_cost()
+            tasks.append(task)
+
+        with cv:
+            assign(tasks)
+
+        for pn in pool:
+            if pn.queue:
+                log.ODM_INFO("LRE: Assigned to %s: %s" % (pn, ", ".join([str(t) for t in pn.queue])))
 
         def remove_task_safe(task):
             try:
@@ -93,7 +168,26 @@ class LocalRemoteExecutor:
             for task in self.params['tasks']:
                 log.ODM_INFO("LRE: Removing remote task %s... %s" % (task.uuid, 'OK' if remove_task_safe(task) else 'NO'))
 
-        def handle_result(task, local, error = None, partial=False):
+        def requeue(task, pn):
+            if pn.online:
+                # Back to the front of the same node's queue
+                pn.queue.insert(0, task)
+                pn.load += task.cost
+                cv.notify_all()
+            else:
+                assign([task])
+
+        def set_offline(pn):
+            log.ODM_WARNING("LRE: Node %s is not reachable, moving its tasks to other nodes" % pn)
+            pn.online = False
+            queued = pn.queue
+            pn.queue = []
+            pn.load = 0.0
+            assign(queued)
+
+        def handle_result(task, pn, error = None, partial=False):
+            local = pn.is_local()
+
             def cleanup_remote():
                 if not partial and task.remote_task:
                     log.ODM_INFO("LRE: Cleaning up remote task (%s)... %s" % (task.remote_task.uuid, 'OK' if remove_task_safe(task.remote_task) else 'NO'))
@@ -110,132 +204,126 @@ class LocalRemoteExecutor:
                     system.exit_gracefully()
 
                 task_limit_reached = isinstance(error, NodeTaskLimitReachedException)
-                if task_limit_reached:
-                    # Estimate the maximum number of tasks based on how many tasks
-                    # are currently running
-                    with calculate_task_limit_lock:
-                        if nonloc.max_remote_tasks is None:
-                            node_task_limit = 0
-                            for t in self.params['tasks']:
-                                try:
-                                    info = t.info(with_output=-3)
-                                    if info.status == TaskStatus.RUNNING and info.processing_time >= 0 and len(info.output) >= 3:
-                                        node_task_limit += 1
-                                except exceptions.OdmError:
-                                    pass
-
-                            nonloc.max_remote_tasks = max(1, node_task_limit)
-                            log.ODM_INFO("LRE: Node task limit reached. Setting max remote tasks to %s" % node_task_limit)
-                                
 
                 # Retry, but only if the error is not related to a task failure
                 if task.retries < task.max_retries and not isinstance(error, exceptions.TaskFailedError):
-                    # Put task back in queue
                     # Don't increment the retry counter if this task simply reached the task
                     # limit count.
                     if not task_limit_reached:
                         task.retries += 1
                     task.wait_until = datetime.datetime.now() + datetime.timedelta(seconds=task.retries * task.retry_timeout)
                     cleanup_remote()
-                    q.task_done()
 
-                    log.ODM_INFO("LRE: Re-queueing %s (retries: %s)" % (task, task.retries))
-                    q.put(task)
-                    if not local: remote_running_tasks.increment(-1)
+                    with cv:
+                        if not local: pn.running -= 1
+
+                        if task_limit_reached:
+                            # Don't run more tasks on this node than it's currently running
+                            if pn.max_running is None or pn.running < pn.max_running:
+                                pn.max_running = max(1, pn.running)
+                                log.ODM_INFO("LRE: Node %s task limit reached. Setting max remote tasks to %s" % (pn, pn.max_running))
+                        elif isinstance(error, exceptions.NodeConnectionError) and not local and pn.online:
+                            set_offline(pn)
+
+                        log.ODM_INFO("LRE: Re-queueing %s (retries: %s)" % (task, task.retries))
+                        requeue(task, pn)
                     return
                 else:
-                    nonloc.error = error
-                    finished_tasks.increment()
-                    if not local: remote_running_tasks.increment(-1)
+                    with cv:
+                        nonloc.error = error
+                        nonloc.finished_tasks += 1
+                        if not local: pn.running -= 1
+                        cv.notify_all()
             else:
                 if not partial:
                     log.ODM_INFO("LRE: %s finished successfully" % task)
-                    finished_tasks.increment()
-                    if not local: remote_running_tasks.increment(-1)
+                    with cv:
+                        nonloc.finished_tasks += 1
+                        if not local: pn.running -= 1
+                        cv.notify_all()
 
             cleanup_remote()
-            if not partial: q.task_done()
-            
-        def local_worker():
-            while True:
-                # Block until a new queue item is available
-                task = q.get()
 
-                if task is None or nonloc.error is not None:
-                    q.task_done()
-                    break
+        def next_task(pn):
+            """
+            Pick the next task for a node, either from its own queue or from
+            the node with the most work left (must be called with cv held)
+            :return task or None, seconds to wait before a task might be available
+            """
+            now = datetime.datetime.now()
+            wait = None
 
-                # Process local
-                try:
-                    nonloc.local_processing = True
-                    task.process(True, handle_result)
-                except Exception as e:
-                    handle_result(task, True, e)
-                finally:
-                    nonloc.local_processing = False
+            candidates = [pn] + sorted([o for o in pool if o is not pn and o.queue], key=lambda o: o.queued_load(), reverse=True)
+            for source in candidates:
+                # Take our own largest task, or the smallest task of a busier node
+                for task in (source.queue if source is pn else reversed(source.queue)):
+                    if task.wait_until > now:
+                        w = (task.wait_until - now).total_seconds()
+                        wait = w if wait is None else min(wait, w)
+                        continue
 
+                    source.queue.remove(task)
+                    source.load -= task.cost
+                    if source is not pn:
+                        log.ODM_INFO("LRE: %s takes %s from %s" % (pn, task, source))
+                    return task, None
 
-        def remote_worker():
-            while True:
-                # Block until a new queue item is available
-                task = q.get()
+            return None, wait
 
-                if task is None or nonloc.error is not None:
-                    q.task_done()
-                    break
-                
-                # Yield to local processing
-                if not nonloc.local_processing:
-                    log.ODM_INFO("LRE: Yielding to local processing, sending %s back to the queue" % task)
-                    q.put(task)
-                    q.task_done()
-                    time.sleep(0.05)
-                    continue
-
-                # If we've found an estimate of the limit on the maximum number of tasks
-                # a node can process, we block until some tasks have completed
-                if nonloc.max_remote_tasks is not None and remote_running_tasks.value >= nonloc.max_remote_tasks:
-                    q.put(task)
-                    q.task_done()
-                    time.sleep(2)
-                    continue
-
-                # Process remote
+        def worker(pn):
+            local = pn.is_local()
+
+            while True:
+                with cv:
+                    task = None
+                    while nonloc.error is None and not nonloc.stop and pn.online:
+                        if local or pn.can_run_more():
+                            task, wait = next_task(pn)
+                            if task is not None:
+                                break
+                        else:
+                            wait = None
+                        cv.wait(timeout=wait)
+
+                    if task is None:
+                        break
+                    if not local:
+                        pn.running += 1
+
+                task.node = pn.node
                 try:
-                    remote_running_tasks.increment()
-                    task.process(False, handle_result)
+                    task.process(local, lambda t, l, error=None, partial=False: handle_result(t, pn, error, partial))
                 except Exception as e:
-                    handle_result(task, False, e)
-        
-        # Create queue thread
-        local_thread = threading.Thread(target=local_worker)
-        if self.node_online:
-            remote_thread = threading.Thread(target=remote_worker)
+                    handle_result(task, pn, e)
+
+        # Local processing runs one task at a time, remote nodes
+        # can upload multiple tasks at the same time
+        threads = [threading.Thread(target=worker, args=(self.local_node, ))]
+        for pn in pool[1:]:
+            threads += [threading.Thread(target=worker, args=(pn, )) for i in range(self.parallel_uploads)]
 
         system.add_cleanup_callback(cleanup_remote_tasks)
 
         # Start workers
-        local_thread.start()
-        if self.node_online:
-            remote_thread.start()
+        for t in threads:
+            t.start()
 
         # block until all tasks are done (or CTRL+C)
         try:
-            while finished_tasks.value < len(self.project_paths) and nonloc.error is None:
-                time.sleep(0.5)
+            with cv:
+                while nonloc.finished_tasks < len(self.project_paths) and nonloc.error is None:
+                    cv.wait()
         except KeyboardInterrupt:
             log.ODM_WARNING("LRE: CTRL+C")
             system.exit_gracefully()
         
         # stop workers
-        q.put(None)
-        if self.node_online:
-            q.put(None)
+        with cv:
+            nonloc.stop = True
+            cv.notify_all()
 
-        # Wait for queue thread
-        local_thread.join()
-        if self.node_online:
-            remote_thread.join()
+        for t in threads:
+            t.join()
 
         # Wait for all remains threads
         for thrds in self.params['threads']:
@@ -255,6 +343,157 @@ class LocalRemoteExecutor:
 class NodeTaskLimitReachedException(Exception):
     pass
 
+# Formats that are already compressed and don't
+# benefit from being deflated again
+STORED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.webp', '.npz', '.npy.gz',
+                     '.gz', '.zip', '.laz', '.glb', '.mp4', '.mov')
+
+def zip_compress_type(filename):
+    if filename.lower().endswith(STORED_EXTENSIONS):
+        return zipfile.ZIP_STORED
+    else:
+        return zipfile.ZIP_DEFLATED
+
+def log_transfer_rate(action, task, node, num_bytes, elapsed):
+    mb = num_bytes / 1024.0 / 1024.0
+    log.ODM_INFO("LRE: %s %.1f MB for %s (%s:%s) in %.1fs (%.2f MB/s)" % (action, mb, task, node.host, node.port, elapsed, mb / max(elapsed, 1e-3)))
+
+def upload_task(node, files, seed_builder=None, options={}, outputs=[], progress_callback=None, parallel_uploads=10, max_retries=5, retry_timeout=5):
+    """
+    Create a new task on a node, uploading files in parallel.
+    :param node pyodm Node
+    :param files list of file paths to upload
+    :param seed_builder optional function returning the path of an additional file to upload.
+        It's called while the other files are being uploaded, so that the seed archive
+        is built at the same time and uploaded as soon as it's ready.
+    :return (pyodm Task, number of bytes uploaded)
+    """
+    if not node.version_greater_or_equal_than("1.4.0"):
+        # Older nodes don't support chunked uploads
+        if seed_builder is not None:
+            files = files + [seed_builder()]
+        task = node.create_task(files, options, progress_callback=progress_callback, skip_post_processing=True, outputs=outputs)
+        return task, sum([os.path.getsize(f) for f in files])
+
+    fields = {
+        'options': options_to_json(options),
+        'skipPostProcessing': 'true',
+    }
+    if outputs:
+        fields['outputs'] = json.dumps(outputs)
+
+    e = encoder.MultipartEncoder(fields=fields)
+    result = node.post('/task/new/init', data=e, headers={'Content-Type': e.content_type})
+    if not isinstance(result, dict) or not 'uuid' in result:
+        raise exceptions.NodeServerError("Invalid response from /task/new/init: %s" % result)
+    uuid = result['uuid']
+
+    class nonloc:
+        error = None
+        uploaded_bytes = AtomicCounter(0)
+        uploaded_files = AtomicCounter(0)
+        total_files = len(files) + (1 if seed_builder is not None else 0)
+        last_progress = -1
+
+    progress_lock = threading.Lock()
+
+    def report_progress():
+        if progress_callback is not None:
+            with progress_lock:
+                progress = 100.0 * nonloc.uploaded_files.value / nonloc.total_files
+                if progress != nonloc.last_progress:
+                    nonloc.last_progress = progress
+                    try:
+                        progress_callback(progress)
+                    except Exception as e:
+                        nonloc.error = e
+
+    def worker():
+        while True:
+            item = q.get()
+            if item is None:
+                q.task_done()
+                break
+
+            if nonloc.error is not None:
+                # Skip the remaining files, but mark them
+                # as done so that q.join() returns
+                q.task_done()
+                continue
+
+            if item['wait_until'] > datetime.datetime.now():
+                time.sleep((item['wait_until'] - datetime.datetime.now()).total_seconds())
+
+            result = None
+            try:
+                f = item['file']
+                with open(f, 'rb') as fin:
+                    # Streamed from disk, files are not loaded in memory
+                    e = encoder.MultipartEncoder(fields={
+                        'images': (os.path.basename(f), fin, mimetypes.guess_type(f)[0] or "image/jpg")
+                    })
+                    result = node.post('/task/new/upload/%s' % uuid, data=e, headers={'Content-Type': e.content_type})
+
+                if isinstance(result, dict) and result.get('success'):
+                    nonloc.uploaded_bytes.increment(os.path.getsize(f))
+                    nonloc.uploaded_files.increment()
+                    report_progress()
+                elif isinstance(result, dict) and 'error' in result:
+                    raise exceptions.NodeResponseError(result['error'])
+                else:
+                    raise exceptions.NodeServerError("Failed upload with unexpected result: %s" % str(result))
+            except exceptions.OdmError as e:
+                if item['retries'] < max_retries and not (isinstance(result, dict) and result.get('noRetry')):
+                    item['retries'] += 1
+                    item['wait_until'] = datetime.datetime.now() + datetime.timedelta(seconds=item['retries'] * retry_timeout)
+                    q.put(item)
+                else:
+                    nonloc.error = e
+            except Exception as e:
+                nonloc.error = e
+            finally:
+                q.task_done()
+
+    def queue_file(f):
+        q.put({'file': f, 'wait_until': datetime.datetime.now(), 'retries': 0})
+
+    q = queue.Queue()
+    threads = []
+    for i in range(parallel_uploads):
+        t = threading.Thread(target=worker)
+        t.start()
+        threads.append(t)
+
+    for f in files:
+        queue_file(f)
+
+    if seed_builder is not None:
+        try:
+            queue_file(seed_builder())
+        except Exception as e:
+            nonloc.error = e
+
+    if nonloc.error is None:
+        q.join()
+
+    for t in threads:
+        q.put(None)
+    for t in threads:
+        t.join()
+
+    if nonloc.error is not None:
+        # Don't leave the partially uploaded task on the node
+        try:
+            result = node.post('/task/remove', data={'uuid': uuid})
+            removed = isinstance(result, dict) and result.get('success')
+        except Exception:
+            removed = False
+        log.ODM_INFO("LRE: Removing partially uploaded task %s... %s" % (uuid, 'OK' if removed else 'NO'))
+        raise nonloc.error
+
+    result = node.post('/task/new/commit/%s' % uuid)
+    return node.handle_task_new_response(result), nonloc.uploaded_bytes.value
+
 class Task:
     def __init__(self, project_path, node, params, max_retries=5, retry_timeout=10):
         self.project_path = project_path
@@ -265,6 +504,24 @@ class Task:
         self.retries = 0
         self.retry_timeout = retry_timeout
         self.remote_task = None
+        self.cost = 1.0
+
+    def estimated_cost(self):
+        """
+        :return an estimate of the processing cost of this task
+            (number of images x megapixels)
+        """
+        images = [f for f in glob.glob(self.path("images", "*")) if os.path.isfile(f)]
+        if not images:
+            return 1.0
+
+        try:
+            width, height = get_image_size.get_image_size(images[0], fallback_on_error=False)
+            megapixels = max(width * height / 1e6, 0.01)
+        except Exception:
+            megapixels = 1.0
+
+        return len(images) * megapixels
 
     def process(self, local, done):
         def handle_result(error = None, partial=False):
@@ -281,9 +538,6 @@ class Task:
                 log.ODM_INFO("LRE: Waiting %s seconds before processing %s" % (wait_for, self))
                 time.sleep(wait_for)
 
-            # TODO: we could consider uploading multiple tasks
-            # in parallel. But since we are using the same node
-            # perhaps this wouldn't be a big speedup.
             self._process_remote(handle_result) # Block until upload is complete
 
     def path(self, *paths):
@@ -304,9 +558,9 @@ class Task:
                         for filename in filenames:
                             filename = os.path.join(root, filename)
                             filename = os.path.normpath(filename)
-                            zf.write(filename, os.path.relpath(filename, self.project_path))
+                            zf.write(filename, os.path.relpath(filename, self.project_path), compress_type=zip_compress_type(filename))
                 else:
-                    zf.write(p, os.path.relpath(p, self.project_path))
+                    zf.write(p, os.path.relpath(p, self.project_path), compress_type=zip_compress_type(p))
 
             for tf in touch_files:
                 zf.writestr(tf, "")
@@ -333,8 +587,6 @@ class Task:
         creating empty files (for flag checks) specified in seed_touch_files
         and returning the results specified in outputs. Yeah it's pretty cool!
         """
-        seed_file = self.create_seed_payload(seed_files, touch_files=seed_touch_files)
-        
         # Find all images
         images = glob.glob(self.path("images/**"))
 
@@ -346,9 +598,6 @@ class Task:
         if os.path.exists(self.path("geo.txt")):
             images.append(self.path("geo.txt"))
         
-        # Add seed file
-        images.append(seed_file)
-
         class nonloc:
             last_update = 0
 
@@ -357,16 +606,28 @@ class Task:
                 log.ODM_INFO("LRE: Upload of %s at [%s%%]" % (self, int(percentage)))
                 nonloc.last_update = time.time()
 
-        # Upload task
-        task = self.node.create_task(images, 
-                get_submodel_args_dict(config.config()),
-                progress_callback=print_progress,
-                skip_post_processing=True,
-                outputs=outputs)
-        self.remote_task = task
+        class seed:
+            file = None
+
+        def build_seed():
+            seed.file = self.create_seed_payload(seed_files, touch_files=seed_touch_files)
+            return seed.file
 
-        # Cleanup seed file
-        os.remove(seed_file)
+        # Upload task (the seed file is built while the images are being uploaded)
+        start_time = time.time()
+        try:
+            task, uploaded_bytes = upload_task(self.node, images,
+                    seed_builder=build_seed,
+                    options=get_submodel_args_dict(config.config()),
+                    outputs=outputs,
+                    progress_callback=print_progress)
+        finally:
+            # Cleanup seed file
+            if seed.file is not None and os.path.exists(seed.file):
+                os.remove(seed.file)
+
+        self.remote_task = task
+        log_transfer_rate("Uploaded", self, self.node, uploaded_bytes, time.time() - start_time)
 
         # Keep track of tasks for cleanup
         self.params['tasks'].append(task)
@@ -399,7 +660,13 @@ class Task:
 
                     task.wait_for_completion(status_callback=status_callback)
                     log.ODM_INFO("LRE: Downloading assets for %s" % self)
-                    task.download_assets(self.project_path, progress_callback=print_progress)
+                    start_time = time.time()
+                    zip_path = task.download_zip(self.project_path, progress_callback=print_progress)
+                    log_transfer_rate("Downloaded", self, self.node, os.path.getsize(zip_path), time.time() - start_time)
+
+                    with zipfile.ZipFile(zip_path, "r") as zf:
+                        zf.extractall(self.project_path)
+                    os.remove(zip_path)
                     log.ODM_INFO("LRE: Downloaded and extracted assets for %s" % self)
                     done()
                 except exceptions.TaskFailedError as e:
@@ -6,8 +6,11 @@ import sys
 import subprocess
 import string
 import signal
-import io
 import shutil
+import shlex
+import re
+import time
+import threading
 from collections import deque
 
 from opendm import context
@@ -57,21 +60,231 @@ def exit_gracefully():
             os.kill(sp.pid, signal.CTRL_C_EVENT)
         else:
             os.killpg(os.getpgid(sp.pid), signal.SIGTERM)
-    
+
+    # os._exit skips atexit handlers, write pending output first
+    log.logger.flush(timeout=5)
     os._exit(1)
 
+def terminate_running_subprocesses():
+    global running_subprocesses
+
+    for sp in list(running_subprocesses):
+        try:
+            log.ODM_WARNING("Sending TERM signal to PID %s..." % sp.pid)
+            if sys.platform == 'win32':
+                sp.terminate()
+            else:
+                os.killpg(os.getpgid(sp.pid), signal.SIGTERM)
+        except Exception as e:
+            log.ODM_WARNING("Cannot terminate PID %s: %s" % (sp.pid, str(e)))
+
 def sighandler(signum, frame):
     exit_gracefully()
 
 signal.signal(signal.SIGINT, sighandler)
 signal.signal(signal.SIGTERM, sighandler)
 
-def run(cmd, env_paths=[context.superbuild_bin_path], env_vars={}, packages_paths=context.python_packages_paths, quiet=False):
-    """Run a system command"""
-    global running_subprocesses
+class ProcessResult:
+    """
+    Outcome of a finished process
+    """
+    def __init__(self, cmd, retcode, output, elapsed, rusage=None):
+        self.cmd = cmd
+        self.retcode = retcode
+        self.output = output # Last lines of output
+        self.elapsed = elapsed # Seconds
+        self.user_time = rusage.ru_utime if rusage is not None else None
+        self.system_time = rusage.ru_stime if rusage is not None else None
+
+        # ru_maxrss is in kilobytes on Linux, bytes on macOS
+        if rusage is not None:
+            self.max_rss_mb = rusage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+        else:
+            self.max_rss_mb = None
+
+    @property
+    def error_code(self):
+        """
+        Exit code of the process. Processes terminated by a signal
+        report 128 + signal, like a shell does
+        """
+        return 128 - self.retcode if self.retcode < 0 else self.retcode
+
+    def check(self):
+        """
+        Raise SubprocessException if the process failed
+        """
+        if self.retcode < 0:
+            raise SubprocessException("Child was terminated by signal {}".format(-self.retcode), self.error_code)
+        elif self.retcode > 0:
+            raise SubprocessException("Child returned {}".format(self.retcode), self.error_code)
+
+    def stats(self):
+        d = {'elapsed': round(self.elapsed, 2)}
+        if self.user_time is not None:
+            d['userTime'] = round(self.user_time, 2)
+            d['systemTime'] = round(self.system_time, 2)
+            d['maxRssMb'] = round(self.max_rss_mb, 1)
+        return d
+
+# Characters that require a shell to interpret a command
+SHELL_CHARS = set("|&;<>()$`*?~")
+
+def split_command(cmd):
+    """
+    :param cmd command string
+    :return list of arguments, or None if the command needs a shell
+        (redirections, pipes, variables, globs, ...)
+    """
+    if sys.platform == 'win32':
+        return None
+
+    try:
+        lex = shlex.shlex(cmd, posix=True, punctuation_chars=True)
+        lex.whitespace_split = True
+        args = list(lex)
+    except ValueError:
+        return None
+
+    for a in args:
+        if a and all([c in SHELL_CHARS for c in a]):
+            return None
 
+    # Unquoted shell expansions
+    unquoted = re.sub(r'"[^"]*"|\'[^\']*\'', '', cmd)
+    if any([c in SHELL_CHARS for c in unquoted]):
+        return None
+
+    return args
+
+class Process:
+    """
+    A running process. Its output is echoed and tracked by a background
+    thread, so that multiple processes can run at the same time.
+    """
+    def __init__(self, cmd, env, quiet=False, progress_callback=None, progress_interval=1.0):
+        self.cmd = cmd
+        self.quiet = quiet
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.lines = deque(maxlen=10)
+        self.start_time = time.time()
+
+        args = split_command(cmd) if isinstance(cmd, str) else list(map(str, cmd))
+        if args is not None:
+            # Popen looks up executables in the PATH of the current process
+            exe = shutil.which(args[0], path=env.get("PATH"))
+            if exe is not None:
+                args[0] = exe
+            try:
+                self.p = subprocess.Popen(args, env=env, start_new_session=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            except FileNotFoundError:
+                # Same exit codes as a shell
+                raise SubprocessException("{}: command not found".format(args[0]), 127)
+            except PermissionError:
+                raise SubprocessException("{}: permission denied".format(args[0]), 126)
+        else:
+            if sys.platform == 'darwin':
+                # Propagate DYLD_LIBRARY_PATH
+                cmd = "export DYLD_LIBRARY_PATH=\"%s\" && %s" % (env.get("DYLD_LIBRARY_PATH", ""), cmd)
+            self.p = subprocess.Popen(cmd, shell=True, env=env, start_new_session=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+        self.pid = self.p.pid
+        running_subprocesses.append(self.p)
+
+        self.reader = threading.Thread(target=self._read_output, daemon=True)
+        self.reader.start()
+
+    def _read_output(self):
+        fd = self.p.stdout.fileno()
+        pending = b""
+        last_progress = 0
+
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+
+            # Only echo complete lines, so that output from
+            # concurrent processes doesn't get mixed mid-line
+            pending += chunk
+            nl = pending.rfind(b"\n")
+            if nl == -1:
+                continue
+
+            complete, pending = pending[:nl + 1], pending[nl + 1:]
+            self._write(complete)
+
+            new_lines = complete.decode('utf-8', errors='replace').splitlines()
+            self.lines.extend([l.strip() for l in new_lines])
+
+            if self.progress_callback is not None and time.time() - last_progress >= self.progress_interval:
+                last_progress = time.time()
+                try:
+                    self.progress_callback(new_lines[-1] if new_lines else "")
+                except Exception as e:
+                    log.ODM_WARNING("Progress callback failed: %s" % str(e))
+
+        if pending:
+            self._write(pending + b"\n")
+            self.lines.extend([l.strip() for l in pending.decode('utf-8', errors='replace').splitlines()])
+
+        self.p.stdout.close()
+
+    def _write(self, data):
+        log.logger.write_output(data.decode('utf-8', errors='replace'))
+
+    def poll(self):
+        """
+        :return True if the process has finished
+        """
+        return not self.reader.is_alive() and self.p.poll() is not None
+
+    def wait(self, raise_on_error=True):
+        """
+        Wait for the process to finish
+        :param raise_on_error raise SubprocessException if the process failed
+        :return ProcessResult
+        """
+        rusage = None
+        if hasattr(os, 'wait4') and self.p.returncode is None:
+            try:
+                _, status, rusage = os.wait4(self.p.pid, 0)
+                self.p.returncode = os.waitstatus_to_exitcode(status)
+            except ChildProcessError:
+                pass
+        retcode = self.p.wait()
+        self.reader.join()
+
+        try:
+            running_subprocesses.remove(self.p)
+        except ValueError:
+            pass
+
+        result = ProcessResult(self.cmd, retcode, list(self.lines), time.time() - self.start_time, rusage)
+        if not self.quiet:
+            log.logger.log_json_process(self.cmd, retcode, result.output, result.stats())
+
+        if raise_on_error:
+            result.check()
+
+        return result
+
+    def terminate(self):
+        if sys.platform == 'win32':
+            self.p.terminate()
+        else:
+            os.killpg(os.getpgid(self.p.pid), signal.SIGTERM)
+
+def start(cmd, env_paths=[context.superbuild_bin_path], env_vars={}, packages_paths=context.python_packages_paths, quiet=False, progress_callback=None, progress_interval=1.0):
+    """
+    Start a system command without waiting for it to finish
+    :param cmd command string (a shell is used only if the command needs one) or list of arguments
+    :param progress_callback optional function called with the latest line of output, at most every progress_interval seconds
+    :return Process
+    """
     if not quiet:
-        log.ODM_INFO('running %s' % cmd)
+        log.ODM_INFO('running %s' % (cmd if isinstance(cmd, str) else " ".join(map(str, cmd))))
     env = os.environ.copy()
 
     sep = ":"
@@ -83,33 +296,15 @@ def run(cmd, env_paths=[context.superbuild_bin_path], env_vars={}, packages_path
     
     if len(packages_paths) > 0:
         env["PYTHONPATH"] = env.get("PYTHONPATH", "") + sep + sep.join(packages_paths) 
-    if sys.platform == 'darwin':
-        # Propagate DYLD_LIBRARY_PATH
-        cmd = "export DYLD_LIBRARY_PATH=\"%s\" && %s" % (env.get("DYLD_LIBRARY_PATH", ""), cmd)
 
     for k in env_vars:
         env[k] = str(env_vars[k])
 
-    p = subprocess.Popen(cmd, shell=True, env=env, start_new_session=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    running_subprocesses.append(p)
-    lines = deque()
-    for line in io.TextIOWrapper(p.stdout):
-        print(line, end="")
-
-        lines.append(line.strip())
-        if len(lines) == 11:
-            lines.popleft()
-
-    retcode = p.wait()
+    return Process(cmd, env, quiet=quiet, progress_callback=progress_callback, progress_interval=progress_interval)
 
-    if not quiet:
-        log.logger.log_json_process(cmd, retcode, list(lines))
-
-    running_subprocesses.remove(p)
-    if retcode < 0:
-        raise SubprocessException("Child was terminated by signal {}".format(-retcode), -retcode)
-    elif retcode > 0:
-        raise SubprocessException("Child returned {}".format(retcode), retcode)
+def run(cmd, env_paths=[context.superbuild_bin_path], env_vars={}, packages_paths=context.python_packages_paths, quiet=False):
+    """Run a system command"""
+    return start(cmd, env_paths=env_paths, env_vars=env_vars, packages_paths=packages_paths, quiet=quiet).wait()
 
 
 def now():
@@ -56,8 +56,10 @@ def dn_to_temperature(photo, image, images_path):
             return image
         else:
             try:
-                params, image = extract_raw_thermal_image_data(os.path.join(images_path, photo.filename))
-                image = sensor_vals_to_temp(image, **params)
+                params, raw = extract_raw_thermal_image_data(os.path.join(images_path, photo.filename))
+                if raw is None:
+                    raise Exception("No raw thermal data")
+                image = sensor_vals_to_temp(raw, **params)
             except Exception as e:
                 log.ODM_WARNING("Cannot radiometrically calibrate %s: %s" % (photo.filename, str(e)))
 
@@ -67,4 +69,3 @@ def dn_to_temperature(photo, image, images_path):
         image = image.astype("float32")
         log.ODM_WARNING("Tried to radiometrically calibrate a non-thermal image with temperature values (%s)" % photo.filename)
         return image
-
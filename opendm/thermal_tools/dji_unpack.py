@@ -1,3 +1,4 @@
+import struct
 from PIL import Image
 import numpy as np
 from opendm import system
@@ -30,16 +31,15 @@ def extract_temperatures_dji(photo, image, dataset_tree):
 
         if photo.camera_model == "MAVIC2-ENTERPRISE-ADVANCED":
             # Adding support for MAVIC2-ENTERPRISE-ADVANCED Camera images
-            im = Image.open(f"{dataset_tree}/{photo.filename}")
+            applist = read_app_segments(f"{dataset_tree}/{photo.filename}")
             # concatenate APP3 chunks of data
-            a = im.applist[3][1]
-            for i in range(4, 14):
-                a += im.applist[i][1]
+            a = b"".join([data for marker, data in applist[3:14]])
             # create image from bytes
             try:
                 img = Image.frombytes("I;16L", (640, 512), a)
             except ValueError as e:
-                log.ODM_ERROR("Error during extracting temperature values for file %s : %s" % photo.filename, e)
+                log.ODM_ERROR("Error during extracting temperature values for file %s : %s" % (photo.filename, str(e)))
+                return image
         else:
             log.ODM_WARNING("Only DJI M2EA currently supported, please wait for new updates")
             return image
@@ -47,4 +47,31 @@ def extract_temperatures_dji(photo, image, dataset_tree):
         raw_sensor_np = np.array(img)
         ## extracting the temperatures from thermal images
         thermal_np = sensor_vals_to_temp(raw_sensor_np, **meta)
-        return thermal_np
\ No newline at end of file
+        return thermal_np
+
+def read_app_segments(image_path):
+    """Reads the APPn segments of a JPEG file without decoding the image.
+    Returns a list of (marker, data) tuples in file order, like PIL's applist."""
+    segments = []
+
+    with open(image_path, 'rb') as f:
+        if f.read(2) != b"\xff\xd8":
+            raise ValueError("Not a JPEG file: %s" % image_path)
+
+        while True:
+            header = f.read(4)
+            if len(header) < 4 or header[0] != 0xFF:
+                break
+
+            marker, length = header[1], struct.unpack(">H", header[2:4])[0]
+
+            # Start of scan, the rest is image data
+            if marker == 0xDA:
+                break
+
+            if 0xE0 <= marker <= 0xEF:
+                segments.append(("APP%s" % (marker - 0xE0), f.read(length - 2)))
+            else:
+                f.seek(length - 2, 1)
+
+    return segments
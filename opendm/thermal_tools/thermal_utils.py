@@ -17,7 +17,8 @@ def sensor_vals_to_temp(
     PlanckO=-7340,
     PlanckR2=0.012545258,
     **kwargs,):
-    """Convert raw values from the thermographic sensor sensor to temperatures in °C. Tested for Flir and DJI cams."""
+    """Convert raw values from the thermographic sensor sensor to temperatures in °C. Tested for Flir and DJI cams.
+    Parameters can either be scalars or arrays that broadcast against raw (see sensor_vals_to_temp_batch)."""
     # this calculation has been ported to python from https://github.com/gtatters/Thermimage/blob/master/R/raw2temp.R
     # a detailed explanation of what is going on here can be found there
 
@@ -84,16 +85,14 @@ def sensor_vals_to_temp(
         (1 - tau2) / Emissivity / tau1 / IRWindowTransmission / tau2 * raw_atm2
     )
 
-    raw_obj = (
-        raw / Emissivity / tau1 / IRWindowTransmission / tau2
-        - raw_atm1_attn
-        - raw_atm2_attn
-        - raw_wind_attn
-        - raw_refl1_attn
-        - raw_refl2_attn
-    )
+    # The terms above only depend on the parameters, so fold them
+    # into a single gain / offset before touching the pixels
+    raw_gain = 1.0 / (Emissivity * tau1 * IRWindowTransmission * tau2)
+    raw_offset = raw_atm1_attn + raw_atm2_attn + raw_wind_attn + raw_refl1_attn + raw_refl2_attn
+
+    raw_obj = raw * raw_gain - raw_offset
     val_to_log = PlanckR1 / (PlanckR2 * (raw_obj + PlanckO)) + PlanckF
-    if any(val_to_log.ravel() < 0):
+    if np.any(val_to_log < 0):
         raise Exception("Image seems to be corrupted")
     # temperature from radiance
     return PlanckB / np.log(val_to_log) - 273.15
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+
+COLOR_RELIEF = os.path.join(os.path.dirname(__file__), "color_relief.txt")
+
+def read_color_relief(path=COLOR_RELIEF):
+    """
+    Read a gdaldem color relief file with percentage entries
+    :return (percentages, colors, nodata_color): percentages in [0, 1], RGBA colors (Nx4), RGBA color of nodata
+    """
+    percentages = []
+    colors = []
+    nodata_color = [0, 0, 0, 0]
+
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 4:
+                continue
+            color = [int(c) for c in parts[1:4]] + [int(parts[4]) if len(parts) > 4 else 255]
+            if parts[0] == 'nv':
+                nodata_color = color
+            else:
+                percentages.append(float(parts[0].rstrip('%')) / 100.0)
+                colors.append(color)
+
+    order = np.argsort(percentages)
+    return np.array(percentages)[order], np.array(colors, dtype=np.float64)[order], np.array(nodata_color, dtype=np.uint8)
+
+def color_relief(arr, valid, minimum, maximum, relief=None):
+    """
+    Color an elevation array (as gdaldem color-relief -alpha, with linear interpolation)
+    :param arr elevation array
+    :param valid boolean array, False where arr is nodata
+    :param minimum,maximum elevation of the 0% and 100% entries of the color relief
+    :param relief color relief, as returned by read_color_relief
+    :return RGBA uint8 array of shape arr.shape + (4,)
+    """
+    percentages, colors, nodata_color = relief if relief is not None else read_color_relief()
+
+    # Colors are interpolated once in a lookup table, fine enough to be off by one level at most
+    lut_size = 4096
+    steps = np.linspace(0, 1, lut_size)
+    lut = np.stack([np.interp(steps, percentages, colors[:, c]) for c in range(4)], axis=-1).round().astype(np.uint8)
+
+    scale = (lut_size - 1) / (maximum - minimum) if maximum > minimum else 0
+    index = np.clip((np.where(valid, arr, minimum) - minimum) * scale + 0.5, 0, lut_size - 1).astype(np.int32)
+    rgba = lut[index]
+    rgba[~valid] = nodata_color
+    return rgba
+
+def hillshade(arr, valid, ewres, nsres, z=1.0, azimuth=315.0, altitude=45.0):
+    """
+    Hillshade of an elevation array (as gdaldem hillshade, Horn's algorithm)
+    :param arr elevation array with a halo of 1 cell on each side
+    :param valid boolean array, False where arr is nodata. Nodata neighbors are replaced with the center cell
+    :param ewres,nsres east-west and north-south resolution (nsres is negative for north-up rasters)
+    :return uint8 array of the shape of arr without the halo (1-255)
+    """
+    h, w = arr.shape[0] - 2, arr.shape[1] - 2
+    center = arr[1:h + 1, 1:w + 1]
+    all_valid = valid.all()
+
+    def cell(r, c):
+        if all_valid:
+            return arr[r:r + h, c:c + w]
+        return np.where(valid[r:r + h, c:c + w], arr[r:r + h, c:c + w], center)
+
+    a, b, c = cell(0, 0), cell(0, 1), cell(0, 2)
+    d, f = cell(1, 0), cell(1, 2)
+    g, hh, i = cell(2, 0), cell(2, 1), cell(2, 2)
+
+    x = ((a + 2 * d + g) - (c + 2 * f + i)) / (8.0 * ewres)
+    y = ((g + 2 * hh + i) - (a + 2 * b + c)) / (8.0 * nsres)
+
+    # With aspect = atan2(y, x), sqrt(x² + y²) * sin(aspect - az) = y * cos(az) - x * sin(az)
+    alt = np.radians(altitude)
+    az = np.radians(azimuth)
+    cang = (np.sin(alt) - np.cos(alt) * z * (y * np.cos(az) - x * np.sin(az))) / np.sqrt(1 + z * z * (x * x + y * y))
+
+    return (np.maximum(cang, 0) * 254 + 1).round().astype(np.uint8)
+
+def hsv_merge(rgba, intensity):
+    """
+    Use a greyscale image (e.g. a hillshade) as the HSV value of a color image, keeping its hue and saturation.
+    For a given hue and saturation RGB is proportional to the value, so colors are scaled
+    by intensity / max(R, G, B) (black is replaced by the intensity).
+    :return RGBA uint8 array (the alpha channel is kept)
+    """
+    maxc = np.maximum(np.maximum(rgba[..., 0], rgba[..., 1]), rgba[..., 2])
+    scale = intensity.astype(np.float32) / np.maximum(maxc, 1)
+
+    result = np.empty(rgba.shape, dtype=np.uint8)
+    for c in range(3):
+        result[..., c] = np.where(maxc > 0, rgba[..., c] * scale, intensity)
+    result[..., 3] = rgba[..., 3]
+    return result
+
+def colored_hillshade(arr, valid, minimum, maximum, ewres, nsres, relief=None):
+    """
+    :param arr elevation array with a halo of 1 cell on each side
+    :return RGBA uint8 array of the colored hillshade (without the halo)
+    """
+    inner = (slice(1, arr.shape[0] - 1), slice(1, arr.shape[1] - 1))
+    colors = color_relief(arr[inner], valid[inner], minimum, maximum, relief)
+    return hsv_merge(colors, hillshade(arr, valid, ewres, nsres))
@@ -0,0 +1,281 @@
+import os
+import math
+import time
+import threading
+import numpy as np
+import rasterio
+from rasterio.enums import ColorInterp, Resampling
+from rasterio.transform import Affine
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window
+from PIL import Image
+from opendm import log
+from opendm.concurrency import parallel_map
+from opendm.tiles.hillshade import colored_hillshade, read_color_relief
+
+# Web Mercator tile pyramids (TMS layout: <zoom>/<x>/<y>.png, y counted from the south,
+# same as gdal2tiles' mercator profile). Tiles of the deepest zoom level are rendered from tile-aligned
+# windows of a warped reader (one per thread), tiles of the other levels are downsampled from
+# their children in memory, so nothing is read twice and no intermediate rasters are written.
+
+TILE_SIZE = 256
+EARTH_RADIUS = 6378137
+ORIGIN_SHIFT = math.pi * EARTH_RADIUS
+
+def get_zoom_range(resolution):
+    """
+    :param resolution ground resolution (cm/pixel)
+    :return (min_zoom, max_zoom) of the tiles
+    """
+    circumference_earth_cm = 2*math.pi*637_813_700
+    resolution_equator_cm = circumference_earth_cm/TILE_SIZE
+    zoom = math.ceil(math.log(resolution_equator_cm/resolution, 2))
+
+    min_zoom = 5  # 4.89 km/px
+    max_zoom = min(zoom, 22)  # No deeper zoom than 22 (3.72 cm/px at equator)
+    return min_zoom, max(min_zoom, max_zoom)
+
+def get_resolution(zoom):
+    """
+    :return resolution (meters/pixel, in EPSG:3857) of the given zoom level
+    """
+    return 2 * ORIGIN_SHIFT / (TILE_SIZE * 2 ** zoom)
+
+def get_tile_bounds(tx, ty, zoom):
+    """
+    :return (minx, miny, maxx, maxy) in EPSG:3857 of a TMS tile
+    """
+    size = TILE_SIZE * get_resolution(zoom)
+    return (tx * size - ORIGIN_SHIFT, ty * size - ORIGIN_SHIFT,
+            (tx + 1) * size - ORIGIN_SHIFT, (ty + 1) * size - ORIGIN_SHIFT)
+
+def get_tile_range(bounds, zoom):
+    """
+    :param bounds (minx, miny, maxx, maxy) in EPSG:3857
+    :return (tminx, tminy, tmaxx, tmaxy) TMS tiles covering bounds at the given zoom level
+    """
+    size = TILE_SIZE * get_resolution(zoom)
+    last = 2 ** zoom - 1
+
+    def tile(coord, round_fn):
+        return int(min(last, max(0, round_fn((coord + ORIGIN_SHIFT) / size))))
+
+    return (tile(bounds[0], math.floor), tile(bounds[1], math.floor),
+            tile(bounds[2], lambda v: math.ceil(v) - 1), tile(bounds[3], lambda v: math.ceil(v) - 1))
+
+def downsample_tile(children):
+    """
+    Build a tile from its 4 children, averaging 2x2 blocks weighted by alpha
+    :param children RGBA arrays (or None for empty tiles), in order top-left, top-right, bottom-left, bottom-right
+    :return RGBA uint8 array, None if all children are empty. As with gdal2tiles, tiles with children
+        are kept even if downsampling makes them transparent
+    """
+    if all([c is None for c in children]):
+        return None
+
+    mosaic = np.zeros((TILE_SIZE * 2, TILE_SIZE * 2, 4), dtype=np.uint8)
+    for i, child in enumerate(children):
+        if child is not None:
+            row, col = (i // 2) * TILE_SIZE, (i % 2) * TILE_SIZE
+            mosaic[row:row + TILE_SIZE, col:col + TILE_SIZE] = child
+
+    # Pixels of each 2x2 block
+    quads = [mosaic[r::2, c::2] for r in (0, 1) for c in (0, 1)]
+    alphas = [q[..., 3].astype(np.uint32) for q in quads]
+    alpha_sum = sum(alphas)
+    divisor = np.maximum(alpha_sum, 1)
+
+    tile = np.empty((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    for b in range(3):
+        tile[..., b] = (sum([q[..., b] * a for q, a in zip(quads, alphas)]) + divisor // 2) // divisor
+    tile[..., 3] = (alpha_sum + 2) // 4
+    return tile
+
+def write_tile(path, tile):
+    Image.fromarray(tile).save(path, 'PNG')
+
+def write_tilemapresource(output_dir, title, latlon_bounds, min_zoom, max_zoom):
+    west, south, east, north = latlon_bounds
+    s = """<?xml version="1.0" encoding="utf-8"?>
+    <TileMap version="1.0.0" tilemapservice="http://tms.osgeo.org/1.0.0">
+      <Title>%s</Title>
+      <Abstract></Abstract>
+      <SRS>EPSG:3857</SRS>
+      <BoundingBox minx="%.14f" miny="%.14f" maxx="%.14f" maxy="%.14f"/>
+      <Origin x="%.14f" y="%.14f"/>
+      <TileFormat width="%d" height="%d" mime-type="image/png" extension="png"/>
+      <TileSets profile="mercator">
+""" % (title, west, south, east, north, west, south, TILE_SIZE, TILE_SIZE)
+    for z in range(min_zoom, max_zoom + 1):
+        s += """        <TileSet href="%d" units-per-pixel="%.14f" order="%d"/>\n""" % (z, 156543.0339/2**z, z)
+    s += """      </TileSets>
+    </TileMap>
+    """
+
+    with open(os.path.join(output_dir, "tilemapresource.xml"), "w") as f:
+        f.write(s)
+
+def dem_renderer(src):
+    """
+    :param src rasterio dataset of a DEM
+    :return render function for generate_pyramid, coloring the DEM with a hillshaded color relief
+    """
+    # Color relief percentages refer to the elevation range of the whole DEM
+    scale = min(1.0, 2048.0 / max(src.width, src.height))
+    sample = src.read(1, out_shape=(max(1, int(src.height * scale)), max(1, int(src.width * scale))), masked=True)
+    if sample.count() == 0:
+        raise Exception("%s has no valid elevation values" % src.name)
+    minimum, maximum = float(sample.min()), float(sample.max())
+    relief = read_color_relief()
+
+    def render(vrt, window, bounds):
+        arr = vrt.read(1, window=window).astype(np.float32, copy=False)
+        valid = vrt.dataset_mask(window=window) > 0
+        if not valid[1:-1, 1:-1].any():
+            return None
+
+        # Mercator pixels are cos(latitude) meters wide on the ground
+        lat = 2 * math.atan(math.exp((bounds[1] + bounds[3]) / 2 / EARTH_RADIUS)) - math.pi / 2
+        res = vrt.transform.a * math.cos(lat)
+        return colored_hillshade(arr, valid, minimum, maximum, res, -res, relief)
+
+    return render
+
+def orthophoto_renderer(src):
+    """
+    :param src rasterio dataset of an 8-bit orthophoto
+    :return render function for generate_pyramid
+    """
+    color_bands = [i for i, ci in zip(src.indexes, src.colorinterp) if ci != ColorInterp.alpha]
+    indexes = color_bands[:3] if len(color_bands) >= 3 else [color_bands[0]] * 3
+
+    def render(vrt, window, bounds):
+        alpha = vrt.dataset_mask(window=window)
+        if not alpha.any():
+            return None
+
+        tile = np.empty((window.height, window.width, 4), dtype=np.uint8)
+        tile[..., :3] = np.moveaxis(vrt.read(indexes, window=window), 0, -1)
+        tile[..., 3] = alpha
+        tile[alpha == 0, :3] = 0
+        return tile
+
+    return render
+
+def generate_pyramid(geotiff, output_dir, min_zoom, max_zoom, renderer, halo=0, max_workers=1):
+    """
+    Generate a TMS tile pyramid (PNG tiles) of a raster
+    :param renderer function taking the source dataset and returning a render function.
+        render(vrt, window, bounds) returns a RGBA tile (None if empty) from a window of a warped
+        (EPSG:3857) reader, with halo pixels on each side
+    :param halo number of pixels read around each tile of the deepest zoom level
+    :return dictionary with zoom level => (number of tiles, seconds of processing)
+    """
+    start = time.time()
+    res = get_resolution(max_zoom)
+
+    with rasterio.open(geotiff) as src:
+        bounds = transform_bounds(src.crs, 'EPSG:3857', *src.bounds, densify_pts=21)
+        latlon_bounds = transform_bounds(src.crs, 'EPSG:4326', *src.bounds, densify_pts=21)
+        add_alpha = src.nodata is None and ColorInterp.alpha not in src.colorinterp
+        render = renderer(src)
+
+    ranges = {z: get_tile_range(bounds, z) for z in range(min_zoom, max_zoom + 1)}
+    tminx, tminy, tmaxx, tmaxy = ranges[max_zoom]
+    vrt_options = {
+        'crs': 'EPSG:3857',
+        'transform': Affine(res, 0, tminx * TILE_SIZE * res - ORIGIN_SHIFT - halo * res,
+                            0, -res, (tmaxy + 1) * TILE_SIZE * res - ORIGIN_SHIFT + halo * res),
+        'width': (tmaxx - tminx + 1) * TILE_SIZE + 2 * halo,
+        'height': (tmaxy - tminy + 1) * TILE_SIZE + 2 * halo,
+        'resampling': Resampling.bilinear,
+        'add_alpha': add_alpha
+    }
+
+    stats = {z: [0, 0.0] for z in ranges}
+    stats_lock = threading.Lock()
+    local = threading.local()
+    sources = []
+    sources_lock = threading.Lock()
+
+    def get_vrt():
+        if not hasattr(local, 'vrt'):
+            s = rasterio.open(geotiff)
+            local.vrt = WarpedVRT(s, **vrt_options)
+            with sources_lock:
+                sources.extend([local.vrt, s])
+        return local.vrt
+
+    def in_range(z, tx, ty):
+        rminx, rminy, rmaxx, rmaxy = ranges[z]
+        return rminx <= tx <= rmaxx and rminy <= ty <= rmaxy
+
+    def save(z, tx, ty, tile, tile_start):
+        if tile is not None:
+            tile_dir = os.path.join(output_dir, str(z), str(tx))
+            os.makedirs(tile_dir, exist_ok=True)
+            write_tile(os.path.join(tile_dir, "%s.png" % ty), tile)
+
+        with stats_lock:
+            stats[z][0] += 1 if tile is not None else 0
+            stats[z][1] += time.time() - tile_start
+        return tile
+
+    def build(z, tx, ty):
+        # Depth-first, so that only the tiles on the path to the deepest level are held in memory
+        if not in_range(z, tx, ty):
+            return None
+
+        if z == max_zoom:
+            tile_start = time.time()
+            window = Window((tx - tminx) * TILE_SIZE, (tmaxy - ty) * TILE_SIZE, TILE_SIZE + 2 * halo, TILE_SIZE + 2 * halo)
+            tile = render(get_vrt(), window, get_tile_bounds(tx, ty, z))
+        else:
+            children = [build(z + 1, 2 * tx + dx, 2 * ty + dy) for dy, dx in [(1, 0), (1, 1), (0, 0), (0, 1)]]
+            tile_start = time.time()
+            tile = downsample_tile(children)
+
+        return save(z, tx, ty, tile, tile_start)
+
+    # Split the work at the first zoom level with enough tiles to keep all workers busy
+    job_zoom = max_zoom
+    for z in range(min_zoom, max_zoom + 1):
+        rminx, rminy, rmaxx, rmaxy = ranges[z]
+        if (rmaxx - rminx + 1) * (rmaxy - rminy + 1) >= max_workers * 4:
+            job_zoom = z
+            break
+
+    rminx, rminy, rmaxx, rmaxy = ranges[job_zoom]
+    jobs = [(tx, ty) for tx in range(rminx, rmaxx + 1) for ty in range(rminy, rmaxy + 1)]
+    tiles = {}
+
+    def process_job(job):
+        tile = build(job_zoom, job[0], job[1])
+        with stats_lock:
+            tiles[job] = tile
+
+    try:
+        parallel_map(process_job, jobs, max_workers)
+    finally:
+        for s in sources:
+            s.close()
+
+    for z in range(job_zoom - 1, min_zoom - 1, -1):
+        rminx, rminy, rmaxx, rmaxy = ranges[z]
+        parents = {}
+        for tx in range(rminx, rmaxx + 1):
+            for ty in range(rminy, rmaxy + 1):
+                tile_start = time.time()
+                children = [tiles.get((2 * tx + dx, 2 * ty + dy)) for dy, dx in [(1, 0), (1, 1), (0, 0), (0, 1)]]
+                parents[(tx, ty)] = save(z, tx, ty, downsample_tile(children), tile_start)
+        tiles = parents
+
+    write_tilemapresource(output_dir, os.path.basename(geotiff), latlon_bounds, min_zoom, max_zoom)
+
+    for z in range(max_zoom, min_zoom - 1, -1):
+        count, seconds = stats[z]
+        log.ODM_INFO("Zoom %s: %s tiles, %.1f tiles/s per thread" % (z, count, count / seconds if seconds > 0 else 0))
+    log.ODM_INFO("Generated %s tiles in %.2fs" % (sum([s[0] for s in stats.values()]), time.time() - start))
+
+    return {z: tuple(s) for z, s in stats.items()}
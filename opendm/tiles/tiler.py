@@ -1,31 +1,39 @@
 import os
 import sys
-import math
+import numpy as np
+import rasterio
 from opendm import log
 from opendm import system
 from opendm import io
+from opendm.tiles.hillshade import colored_hillshade
+from opendm.tiles.pyramid import get_zoom_range, generate_pyramid, dem_renderer, orthophoto_renderer
 
 def generate_tiles(geotiff, output_dir, max_concurrency, resolution):
-    circumference_earth_cm = 2*math.pi*637_813_700
-    px_per_tile = 256
-    resolution_equator_cm = circumference_earth_cm/px_per_tile
-    zoom = math.ceil(math.log(resolution_equator_cm/resolution, 2))
-
-    min_zoom = 5  # 4.89 km/px
-    max_zoom = min(zoom, 22)  # No deeper zoom than 22 (3.72 cm/px at equator)
+    min_zoom, max_zoom = get_zoom_range(resolution)
 
     gdal2tiles = os.path.join(os.path.dirname(__file__), "gdal2tiles.py")
     system.run('%s "%s" --processes %s -z %s-%s -n -w none "%s" "%s"' % (sys.executable, gdal2tiles, max_concurrency, min_zoom, max_zoom, geotiff, output_dir))
 
 def generate_orthophoto_tiles(geotiff, output_dir, max_concurrency, resolution):
     try:
-        generate_tiles(geotiff, output_dir, max_concurrency, resolution)
+        with rasterio.open(geotiff) as src:
+            byte_bands = all([dt == 'uint8' for dt in src.dtypes])
+
+        if byte_bands:
+            min_zoom, max_zoom = get_zoom_range(resolution)
+            generate_pyramid(geotiff, output_dir, min_zoom, max_zoom, orthophoto_renderer, max_workers=max_concurrency)
+        else:
+            # gdal2tiles rescales non 8-bit bands
+            generate_tiles(geotiff, output_dir, max_concurrency, resolution)
     except Exception as e:
         log.ODM_WARNING("Cannot generate orthophoto tiles: %s" % str(e))
 
 def generate_colored_hillshade(geotiff):
-    relief_file = os.path.join(os.path.dirname(__file__), "color_relief.txt")
-    hsv_merge_script = os.path.join(os.path.dirname(__file__), "hsv_merge.py")
+    """
+    Write a colored hillshade (RGBA) of a DEM
+    :return (colored_dem, hillshade_dem, colored_hillshade_dem) paths. Only colored_hillshade_dem is written,
+        the color relief and the hillshade are computed in memory
+    """
     colored_dem = io.related_file_path(geotiff, postfix="color")
     hillshade_dem = io.related_file_path(geotiff, postfix="hillshade")
     colored_hillshade_dem = io.related_file_path(geotiff, postfix="colored_hillshade")
@@ -37,10 +45,33 @@ def generate_colored_hillshade(geotiff):
             if os.path.isfile(f):
                 os.remove(f)
 
-        system.run('gdaldem color-relief "%s" "%s" "%s" -alpha -co ALPHA=YES' % (geotiff, relief_file, colored_dem))
-        system.run('gdaldem hillshade "%s" "%s" -z 1.0 -s 1.0 -az 315.0 -alt 45.0' % (geotiff, hillshade_dem))
-        system.run('"%s" "%s" "%s" "%s" "%s"' % (sys.executable, hsv_merge_script, colored_dem, hillshade_dem, colored_hillshade_dem))
-        
+        with rasterio.open(geotiff) as src:
+            dem = src.read(1, masked=True)
+            if dem.count() == 0:
+                raise Exception("%s has no valid elevation values" % geotiff)
+
+            # Edge cells are shaded as if the DEM extended flat beyond its borders
+            arr = np.pad(dem.data.astype(np.float64), 1, mode='edge')
+            valid = np.pad(~np.ma.getmaskarray(dem), 1, mode='edge')
+            rgba = colored_hillshade(arr, valid, float(dem.min()), float(dem.max()), src.transform.a, src.transform.e)
+
+            profile = {
+                'driver': 'GTiff',
+                'width': src.width,
+                'height': src.height,
+                'count': 4,
+                'dtype': 'uint8',
+                'crs': src.crs,
+                'transform': src.transform,
+                'photometric': 'RGB',
+                'alpha': 'YES',
+                'tiled': True,
+                'compress': 'DEFLATE',
+                'bigtiff': 'IF_SAFER'
+            }
+            with rasterio.open(colored_hillshade_dem, 'w', **profile) as dst:
+                dst.write(np.moveaxis(rgba, -1, 0))
+
         return outputs
     except Exception as e:
         log.ODM_WARNING("Cannot generate colored hillshade: %s" % str(e))
@@ -48,12 +79,8 @@ def generate_colored_hillshade(geotiff):
 
 def generate_dem_tiles(geotiff, output_dir, max_concurrency, resolution):
     try:
-        colored_dem, hillshade_dem, colored_hillshade_dem = generate_colored_hillshade(geotiff)
-        generate_tiles(colored_hillshade_dem, output_dir, max_concurrency, resolution)
-
-        # Cleanup
-        for f in [colored_dem, hillshade_dem, colored_hillshade_dem]:
-            if os.path.isfile(f):
-                os.remove(f)
+        # Color relief, hillshade and HSV merge are computed for each tile (with a 1 pixel halo for the slopes)
+        min_zoom, max_zoom = get_zoom_range(resolution)
+        generate_pyramid(geotiff, output_dir, min_zoom, max_zoom, dem_renderer, halo=1, max_workers=max_concurrency)
     except Exception as e:
         log.ODM_WARNING("Cannot generate DEM tiles: %s" % str(e))
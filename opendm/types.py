@@ -1,22 +1,16 @@
 import os
 import shutil
 import warnings
-import numpy as np
-from opendm import get_image_size
-from opendm import location
-from opendm.gcp import GCPFile
-from pyproj import CRS
-import xmltodict as x2d
-from six import string_types
+import threading
+import importlib
 
 from opendm import log
 from opendm import io
 from opendm import system
 from opendm import context
-from opendm import multispectral
+from opendm import concurrency
 
 from opendm.progress import progressbc
-from opendm.photo import ODM_Photo
 
 # Ignore warnings about proj information being lost
 warnings.filterwarnings("ignore")
@@ -72,6 +66,7 @@ class ODM_Reconstruction(object):
             
             if filter_missing:
                 # Calculate files to ignore
+                from opendm import multispectral
                 _, p2s = multispectral.compute_band_maps(mc, max_band_name)
 
                 max_files_per_band = 0
@@ -196,6 +191,9 @@ class ODM_Reconstruction(object):
         return geo / len(self.photos)
 
     def georeference_with_gcp(self, gcp_file, output_coords_file, output_gcp_file, output_model_txt_geo, rerun=False):
+        import numpy as np
+        from opendm.gcp import GCPFile
+
         if not io.file_exists(output_coords_file) or not io.file_exists(output_gcp_file) or rerun:
             gcp = GCPFile(gcp_file)
             if gcp.exists():
@@ -223,9 +221,8 @@ class ODM_Reconstruction(object):
                 self.gcp = utm_gcp
 
                 # Compute RTC offsets from GCP points
-                x_pos = [p.x for p in utm_gcp.iter_entries()]
-                y_pos = [p.y for p in utm_gcp.iter_entries()]
-                x_off, y_off = int(np.round(np.mean(x_pos))), int(np.round(np.mean(y_pos)))
+                index = utm_gcp.index()
+                x_off, y_off = int(np.round(np.mean(index.x))), int(np.round(np.mean(index.y)))
 
                 # Create coords file, we'll be using this later
                 # during georeferencing
@@ -251,6 +248,9 @@ class ODM_Reconstruction(object):
         return self.georef
 
     def georeference_with_gps(self, images_path, output_coords_file, output_model_txt_geo, rerun=False):
+        from opendm import location
+        from opendm.gcp import GCPFile
+
         try:
             if not io.file_exists(output_coords_file) or rerun:
                 location.extract_utm_coords(self.photos, images_path, output_coords_file)
@@ -307,6 +307,8 @@ class ODM_Reconstruction(object):
 class ODM_GeoRef(object):
     @staticmethod
     def FromCoordsFile(coords_file):
+        from opendm import location
+
         # check for coordinate file existence
         if not io.file_exists(coords_file):
             log.ODM_WARNING('Could not find file %s' % coords_file)
@@ -445,27 +447,69 @@ class ODM_Stage:
             self.params = {}
         self.next_stage = None
         self.prev_stage = None
+        self.dependencies = None
+        self.stale = False
 
     def connect(self, stage):
         self.next_stage = stage
         stage.prev_stage = self
         return stage
 
+    def depends_on(self, *stages):
+        """
+        Declare the stages whose outputs this stage consumes.
+        By default a stage depends on the stage connected before it.
+        """
+        self.dependencies = list(stages)
+        return self
+
+    def get_dependencies(self):
+        if self.dependencies is None:
+            return [self.prev_stage] if self.prev_stage is not None else []
+        else:
+            return self.dependencies
+
     def rerun(self):
         """
         Does this stage need to be rerun?
         """
         return (self.args.rerun is not None and self.args.rerun == self.name) or \
                      (self.args.rerun_all) or \
-                     (self.args.rerun_from is not None and self.name in self.args.rerun_from)
+                     (self.args.rerun_from is not None and self.name in self.args.rerun_from) or \
+                     self.stale
     
     def run(self, outputs = {}):
+        """
+        Run this stage and all of the stages connected after it
+        """
+        ODM_StageExecutor(self, max_concurrent_stages=getattr(self.args, 'max_concurrent_stages', 1)).run(outputs)
+
+    def execute(self, outputs):
+        """
+        Run this stage only
+        """
         start_time = system.now_raw()
         log.logger.log_json_stage_run(self.name, start_time)
 
         log.ODM_INFO('Running %s stage' % self.name)
-        
-        self.process(self.args, outputs)
+
+        manifest = outputs.get('manifest')
+        if manifest is not None:
+            reason = manifest.is_stale(self)
+            if reason is not None:
+                log.ODM_INFO("%s needs to be rerun (%s)" % (self.name, reason))
+                self.stale = True
+
+        # Record the options that the stage reads (including through self.args)
+        if manifest is not None:
+            stage_args = self.args
+            self.args = manifest.track_options(self)
+            try:
+                self.process(self.args, outputs)
+            finally:
+                self.args = stage_args
+        else:
+            self.process(self.args, outputs)
 
         # The tree variable should always be populated at this point
         if outputs.get('tree') is None:
@@ -476,18 +520,13 @@ class ODM_Stage:
         except Exception as e:
             log.ODM_WARNING("Cannot write benchmark file: %s" % str(e))
 
+        if manifest is not None:
+            manifest.record(self)
+
+        log.logger.log_json_stage_end(self.name, system.now_raw())
         log.ODM_INFO('Finished %s stage' % self.name)
         self.update_progress_end()
 
-        # Last stage?
-        if self.args.end_with == self.name or self.args.rerun == self.name:
-            log.ODM_INFO("No more stages to run")
-            return
-
-        # Run next stage?
-        elif self.next_stage is not None:
-            self.next_stage.run(outputs)
-
     def delta_progress(self):
         if self.prev_stage:
             return max(0.0, self.progress - self.prev_stage.progress)
@@ -518,3 +557,175 @@ class ODM_Stage:
     def process(self, args, outputs):
         raise NotImplementedError
 
+
+class ODM_LazyStage(ODM_Stage):
+    """
+    A stage whose implementation (and the heavy modules it depends on)
+    is imported only when the stage runs.
+    """
+    def __init__(self, stage_class, name, args, progress=0.0, **params):
+        """
+        :param stage_class full name of an ODM_Stage subclass (e.g. "stages.dataset.ODMLoadDatasetStage")
+        """
+        super().__init__(name, args, progress, **params)
+        self.stage_class = stage_class
+
+    def process(self, args, outputs):
+        module_name, class_name = self.stage_class.rsplit(".", 1)
+        self.__class__ = getattr(importlib.import_module(module_name), class_name)
+        return self.process(args, outputs)
+
+
+class ODM_StageExecutor:
+    """
+    Runs a chain of connected stages as a dependency graph: a stage
+    starts as soon as all of the stages it depends on have finished,
+    so that independent stages can run concurrently (up to max_concurrent_stages).
+    The order of the chain is still used to decide which stages to run
+    (--end-with, --rerun) and which stages to skip when a stage changes its
+    next_stage while processing (e.g. to stop early or jump to the last stage).
+    """
+    def __init__(self, first_stage, max_concurrent_stages=1, min_free_memory=0.5):
+        self.stages = []
+        s = first_stage
+        while s is not None:
+            self.stages.append(s)
+            s = s.next_stage
+
+        self.max_concurrent_stages = max(1, max_concurrent_stages)
+        self.min_free_memory = min_free_memory
+        self.timeline = {}
+
+    def stages_to_run(self):
+        args = self.stages[0].args
+        for i, s in enumerate(self.stages):
+            if args.end_with == s.name or args.rerun == s.name:
+                return self.stages[:i + 1]
+        return list(self.stages)
+
+    def can_start_more(self, running_count):
+        if running_count == 0:
+            return True
+        if running_count >= self.max_concurrent_stages:
+            return False
+
+        # Only start additional stages if there's plenty of memory left
+        total = concurrency.get_total_memory()
+        return total > 0 and concurrency.get_max_memory_mb(minimum=0, use_at_most=1.0) * 1024 * 1024 / total >= self.min_free_memory
+
+    def run(self, outputs):
+        pending = self.stages_to_run()
+        stop_early = len(pending) < len(self.stages)
+        original_next = {s: s.next_stage for s in pending}
+        finished = set()
+        running = {}
+        errors = []
+        cv = threading.Condition(threading.RLock())
+
+        def skip_after(stage, target):
+            # Remove the stages between stage and target (exclusive) from pending
+            idx = self.stages.index(stage)
+            end = self.stages.index(target) if target is not None else len(self.stages)
+            for s in self.stages[idx + 1:end]:
+                if s in pending:
+                    pending.remove(s)
+                    finished.add(s)
+                    self.timeline[s.name] = {'skipped': True}
+
+        def worker(stage):
+            try:
+                self.timeline[stage.name] = {'start': system.now_raw()}
+                stage.execute(outputs)
+                self.timeline[stage.name]['end'] = system.now_raw()
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                with cv:
+                    del running[stage]
+                    if not errors:
+                        finished.add(stage)
+                        if stage.next_stage is not original_next[stage]:
+                            skip_after(stage, stage.next_stage)
+                    cv.notify_all()
+
+        try:
+            with cv:
+                while pending and not errors:
+                    ready = [s for s in pending if all([d in finished for d in s.get_dependencies()])]
+
+                    if ready and self.can_start_more(len(running)):
+                        stage = ready[0]
+                        pending.remove(stage)
+
+                        if self.max_concurrent_stages == 1:
+                            # Run in the main thread
+                            running[stage] = threading.current_thread()
+                            worker(stage)
+                        else:
+                            t = threading.Thread(target=worker, args=(stage, ))
+                            running[stage] = t
+                            t.start()
+                    elif running:
+                        # Dependencies and free memory are checked
+                        # again every time a running stage finishes
+                        cv.wait()
+                    else:
+                        raise Exception("Cannot run stages %s, dependencies cannot be satisfied" % ", ".join([s.name for s in pending]))
+
+                terminated = False
+                while running:
+                    if errors and not terminated:
+                        # Don't wait for the other stages to finish on their own
+                        system.terminate_running_subprocesses()
+                        terminated = True
+                    cv.wait()
+        finally:
+            self.log_timeline()
+
+        if errors:
+            raise errors[0]
+
+        if stop_early:
+            log.ODM_INFO("No more stages to run")
+
+    def critical_path(self):
+        """
+        :return list of stage names that determined the total running time
+        """
+        done = [s for s in self.stages if 'end' in self.timeline.get(s.name, {})]
+        if not done:
+            return []
+
+        path = []
+        stage = max(done, key=lambda s: self.timeline[s.name]['end'])
+        while stage is not None:
+            path.insert(0, stage.name)
+            deps = [d for d in stage.get_dependencies() if 'end' in self.timeline.get(d.name, {})]
+            stage = max(deps, key=lambda s: self.timeline[s.name]['end']) if deps else None
+        return path
+
+    def log_timeline(self):
+        stages = []
+        for s in self.stages:
+            t = self.timeline.get(s.name)
+            if t is None:
+                continue
+            entry = {
+                'name': s.name,
+                'dependencies': [d.name for d in s.get_dependencies()]
+            }
+            if t.get('skipped'):
+                entry['skipped'] = True
+            if 'start' in t:
+                entry['startTime'] = t['start'].isoformat()
+            if 'end' in t:
+                entry['endTime'] = t['end'].isoformat()
+                entry['totalTime'] = round((t['end'] - t['start']).total_seconds(), 2)
+            stages.append(entry)
+
+        path = self.critical_path()
+        log.logger.log_json_timeline({
+            'stages': stages,
+            'criticalPath': path,
+            'criticalPathTime': round(sum([self.timeline[n]['end'].timestamp() - self.timeline[n]['start'].timestamp() for n in path]), 2)
+        })
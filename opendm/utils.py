@@ -1,23 +1,20 @@
 import os, shutil
-import numpy as np
 import json
-import rasterio
-from osgeo import gdal
 from datetime import datetime
 
 from opendm import log
-from opendm.photo import find_largest_photo_dims, find_mean_utc_time
-from osgeo import gdal
 from opendm.arghelpers import double_quote
 
 class NumpyEncoder(json.JSONEncoder):
     def default(self, obj):
+        import numpy as np
         if isinstance(obj, np.ndarray):
             return obj.tolist()
         return json.JSONEncoder.default(self, obj)
 
 
 def get_depthmap_resolution(args, photos):
+    from opendm.photo import find_largest_photo_dims
     max_dims = find_largest_photo_dims(photos)
     min_dim = 320 # Never go lower than this
 
@@ -47,6 +44,7 @@ def get_depthmap_resolution(args, photos):
         return 640 # Sensible default
 
 def get_raster_stats(geotiff):
+    from osgeo import gdal
     stats = []
     gtif = gdal.Open(geotiff)
     for b in range(gtif.RasterCount):
@@ -117,42 +115,30 @@ def np_to_json(arr):
     return json.dumps(arr, cls=NumpyEncoder)
 
 def np_from_json(json_dump):
+    import numpy as np
     return np.asarray(json.loads(json_dump))
 
-def add_raster_meta_tags(raster, reconstruction, tree, embed_gcp_meta=True):
-    try:
-        if os.path.isfile(raster):
-            mean_capture_time = find_mean_utc_time(reconstruction.photos)
-            mean_capture_dt = None
-            if mean_capture_time is not None:
-                mean_capture_dt = datetime.fromtimestamp(mean_capture_time).strftime('%Y:%m:%d %H:%M:%S') + '+00:00'
-
-            log.ODM_INFO("Adding TIFFTAGs to {}".format(raster))
-            with rasterio.open(raster, 'r+') as rst:
-                if mean_capture_dt is not None:
-                    rst.update_tags(TIFFTAG_DATETIME=mean_capture_dt)
-                rst.update_tags(TIFFTAG_SOFTWARE='ODM {}'.format(log.odm_version()))
-
-            if embed_gcp_meta:
-                # Embed GCP info in 2D results via
-                # XML metadata fields
-                gcp_gml_export_file = tree.path("odm_georeferencing", "ground_control_points.gml")
-
-                if reconstruction.has_gcp() and os.path.isfile(gcp_gml_export_file):
-                    gcp_xml = ""
-
-                    with open(gcp_gml_export_file) as f:
-                        gcp_xml = f.read()
-
-                    ds = gdal.Open(raster)
-                    if ds is not None:
-                        if ds.GetMetadata('xml:GROUND_CONTROL_POINTS') is None or self.rerun():
-                            ds.SetMetadata(gcp_xml, 'xml:GROUND_CONTROL_POINTS')
-                            ds = None
-                            log.ODM_INFO("Wrote xml:GROUND_CONTROL_POINTS metadata to %s" % raster)
-                        else:
-                            log.ODM_WARNING("Already embedded ground control point information")
-                    else:
-                        log.ODM_WARNING("Cannot open %s for writing, skipping GCP embedding" % raster)
-    except Exception as e:
-        log.ODM_WARNING("Cannot write raster meta tags to %s: %s" % (raster, str(e)))
+def get_raster_meta_tags(reconstruction, tree, embed_gcp_meta=True):
+    """
+    :return (tags, metadata) to add to the rasters of a reconstruction: a dictionary of TIFFTAGs and
+        a dictionary of metadata domains (e.g. GCP info as XML)
+    """
+    from opendm.photo import find_mean_utc_time
+
+    tags = {'TIFFTAG_SOFTWARE': 'ODM {}'.format(log.odm_version())}
+    metadata = {}
+
+    mean_capture_time = find_mean_utc_time(reconstruction.photos)
+    if mean_capture_time is not None:
+        tags['TIFFTAG_DATETIME'] = datetime.fromtimestamp(mean_capture_time).strftime('%Y:%m:%d %H:%M:%S') + '+00:00'
+
+    if embed_gcp_meta:
+        # Embed GCP info in 2D results via
+        # XML metadata fields
+        gcp_gml_export_file = tree.path("odm_georeferencing", "ground_control_points.gml")
+
+        if reconstruction.has_gcp() and os.path.isfile(gcp_gml_export_file):
+            with open(gcp_gml_export_file) as f:
+                metadata['xml:GROUND_CONTROL_POINTS'] = f.read()
+
+    return tags, metadata
@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+from math import ceil
 
 class ThresholdBlurChecker:
     def __init__(self, threshold):
@@ -76,39 +77,59 @@ class BlackFrameChecker:
     def NeedPreProcess(self):
         return True
 
-    def PreProcess(self, video_path, start_frame, end_frame):
+    def PreProcess(self, video_path, start_frame, end_frame, max_samples=240, seek_stride=120):
         # Open video file
         cap = cv2.VideoCapture(video_path)
 
         # Set frame start and end indices
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        frame_start = start_frame if start_frame is not None else 0
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         frame_end = end_frame
-        if end_frame == -1:
-            frame_end = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if end_frame is None or end_frame == -1:
+            frame_end = total_frames - 1
+        elif total_frames > 0:
+            frame_end = min(end_frame, total_frames - 1)
 
         # Initialize luminance range size and minimum value
         self.luminance_range_size = 0
         self.luminance_minimum_value = 255
 
-        frame_index = start_frame if start_frame is not None else 0
-
-        # Read and process frames from video file
-        while (cap.isOpened() and (end_frame is None or frame_index <= end_frame)):
-
-            ret, frame = cap.read()
-            if not ret:
-                break
-
+        def update(frame):
             # Convert frame to grayscale
             gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            gray_frame_min = gray_frame.min()
-            gray_frame_max = gray_frame.max()
+            gray_frame_min, gray_frame_max, _, _ = cv2.minMaxLoc(gray_frame)
+            gray_frame_min, gray_frame_max = int(gray_frame_min), int(gray_frame_max)
 
             # Update luminance range size and minimum value
             self.luminance_range_size = max(self.luminance_range_size, gray_frame_max - gray_frame_min)
             self.luminance_minimum_value = min(self.luminance_minimum_value, gray_frame_min)
 
-            frame_index += 1
+        frames_count = frame_end - frame_start + 1
+        stride = max(1, int(ceil(frames_count / max_samples))) if total_frames > 0 else 1
+
+        if stride >= seek_stride:
+            # Long video: seek to evenly spaced samples instead
+            # of decoding the whole stream
+            for frame_index in np.unique(np.linspace(frame_start, frame_end, max_samples, dtype=int)):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(frame_index))
+                ret, frame = cap.read()
+                if ret:
+                    update(frame)
+        else:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_start)
+            frame_index = frame_start
+
+            # Grab all frames, but only retrieve (convert) the sampled ones
+            while (cap.isOpened() and (frames_count <= 0 or frame_index <= frame_end)):
+                if not cap.grab():
+                    break
+
+                if (frame_index - frame_start) % stride == 0:
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        update(frame)
+
+                frame_index += 1
 
         # Calculate absolute threshold for considering a pixel "black"
         self.absolute_threshold = self.luminance_minimum_value + self.pixel_black_th * self.luminance_range_size
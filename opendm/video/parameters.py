@@ -20,6 +20,8 @@ class Parameters:
         # "limit" -> Maximum number of output frames
         # "frame-format" -> frame format (jpg, png, tiff, etc.)")
         # "stats-file" -> Save statistics to csv file")
+        # "frame-step" -> Only evaluate one frame every N frames (the others are skipped without being decoded to BGR)
+        # "max-concurrency" -> Number of threads used to check and write frames
 
         if not os.path.exists(args["output"]):
             os.makedirs(args["output"])
@@ -41,5 +43,7 @@ class Parameters:
         self.max_dimension = args.get("max_dimension", None)
 
         self.stats_file = args.get("stats_file", None)
+        self.frame_step = max(1, int(args.get("frame_step", 1)))
+        self.max_concurrency = max(1, int(args.get("max_concurrency", os.cpu_count() or 1)))
 
         self.internal_resolution = 800
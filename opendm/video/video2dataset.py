@@ -6,6 +6,9 @@ import time
 import cv2
 import os
 import collections
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import numpy as np
 import piexif
@@ -25,6 +28,7 @@ class Video2Dataset:
 
         self.frame_index = parameters.start
         self.f = None
+        self.writers = None
 
 
     def ProcessVideo(self):
@@ -105,30 +109,32 @@ class Video2Dataset:
 
             frames_to_process = self.parameters.end - start_frame + 1 if (self.parameters.end is not None) else video_info.total_frames - start_frame
 
-            progress = 0
-            while (cap.isOpened()):
-                ret, frame = cap.read()
+            decoder = FrameDecoder(cap, start_frame, self.parameters.end, self.parameters.frame_step,
+                                   queue_size=self.parameters.max_concurrency * 2)
+            decoder.start()
 
-                if not ret:
-                    break
-
-                if (self.parameters.end is not None and self.frame_index > self.parameters.end):
-                    break
+            try:
+                progress = 0
+                for frame_index, frame, check in self.CheckFrames(decoder.frames()):
+                    self.frame_index = frame_index
 
-                # Calculate progress percentage
-                prev_progress = progress
-                progress = floor((self.frame_index - start_frame + 1) / frames_to_process * 100)
-                if progress != prev_progress:
-                    print("[{}][{:3d}%] Processing frame {}/{}: ".format(file_name, progress, self.frame_index - start_frame + 1, frames_to_process), end="\r")
+                    # Calculate progress percentage
+                    prev_progress = progress
+                    progress = floor((self.frame_index - start_frame + 1) / frames_to_process * 100)
+                    if progress != prev_progress:
+                        print("[{}][{:3d}%] Processing frame {}/{}: ".format(file_name, progress, self.frame_index - start_frame + 1, frames_to_process), end="\r")
 
-                stats = self.ProcessFrame(frame, video_info, srt_parser)
+                    stats = self.ProcessFrame(frame, video_info, srt_parser, check)
 
-                if stats is not None and self.parameters.stats_file is not None:
-                    self.WriteStats(input_file, stats)
+                    if stats is not None and self.parameters.stats_file is not None:
+                        self.WriteStats(input_file, stats)
 
-                # Add element to array
-                if stats is not None and "written" in stats.keys():
-                    output_file_paths.append(stats["path"])
+                    # Add element to array
+                    if stats is not None and "written" in stats.keys():
+                        output_file_paths.append(stats["path"])
+            finally:
+                decoder.stop()
+                self.WaitWriters()
 
             cap.release()
 
@@ -144,9 +150,30 @@ class Video2Dataset:
         return output_file_paths
 
 
-    def ProcessFrame(self, frame, video_info, srt_parser):
+    def CheckFrames(self, frames):
+        """
+        Run the per-frame checks (blur, black) on a pool of workers,
+        yielding (frame_index, frame, check) tuples in decode order.
+        The similarity check depends on the previously kept frame and
+        is therefore left to the caller.
+        """
+        max_pending = self.parameters.max_concurrency * 2
+        pending = collections.deque()
 
-        res = {"frame_index": self.frame_index, "global_idx": self.global_idx}
+        with ThreadPoolExecutor(max_workers=self.parameters.max_concurrency) as pool:
+            for frame_index, frame in frames:
+                pending.append((frame_index, frame, pool.submit(self.CheckFrame, frame, frame_index)))
+
+                if len(pending) >= max_pending:
+                    frame_index, frame, future = pending.popleft()
+                    yield frame_index, frame, future.result()
+
+            while len(pending) > 0:
+                frame_index, frame, future = pending.popleft()
+                yield frame_index, frame, future.result()
+
+    def CheckFrame(self, frame, frame_index):
+        res = {}
 
         frame_bw = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
@@ -157,21 +184,42 @@ class Video2Dataset:
             factor = resolution / m
             frame_bw = cv2.resize(frame_bw, (int(ceil(w * factor)), int(ceil(h * factor))), interpolation=cv2.INTER_AREA)
 
+        res["frame_bw"] = frame_bw
+
         if (self.blur_checker is not None):
-            blur_score, is_blurry = self.blur_checker.IsBlur(frame_bw, self.frame_index)
+            blur_score, is_blurry = self.blur_checker.IsBlur(frame_bw, frame_index)
             res["blur_score"] = blur_score
             res["is_blurry"] = is_blurry
 
             if is_blurry:
+                return res
+
+        if (self.black_checker is not None):
+            res["is_black"] = self.black_checker.IsBlack(frame_bw, frame_index)
+
+        return res
+
+    def ProcessFrame(self, frame, video_info, srt_parser, check=None):
+
+        res = {"frame_index": self.frame_index, "global_idx": self.global_idx}
+
+        if check is None:
+            check = self.CheckFrame(frame, self.frame_index)
+        frame_bw = check["frame_bw"]
+
+        if "blur_score" in check:
+            res["blur_score"] = check["blur_score"]
+            res["is_blurry"] = check["is_blurry"]
+
+            if check["is_blurry"]:
                 # print ("blurry, skipping")
                 self.frame_index += 1
                 return res
 
-        if (self.black_checker is not None):
-            is_black = self.black_checker.IsBlack(frame_bw, self.frame_index)
-            res["is_black"] = is_black
+        if "is_black" in check:
+            res["is_black"] = check["is_black"]
 
-            if is_black:
+            if check["is_black"]:
                 # print ("black, skipping")
                 self.frame_index += 1
                 return res
@@ -187,7 +235,7 @@ class Video2Dataset:
                 self.frame_index += 1
                 return res
 
-        path = self.SaveFrame(frame, video_info, srt_parser)
+        path = self.QueueSaveFrame(frame, video_info, srt_parser)
         res["written"] = True
         res["path"] = path
         self.frame_index += 1
@@ -195,7 +243,49 @@ class Video2Dataset:
 
         return res
 
-    def SaveFrame(self, frame, video_info, srt_parser: SrtFileParser):
+    def QueueSaveFrame(self, frame, video_info, srt_parser):
+        """
+        Hand the frame off to the writer pool. The output path is returned
+        immediately, encoding and writing happen in the background.
+        """
+        if self.writers is None:
+            self.writers = ThreadPoolExecutor(max_workers=self.parameters.max_concurrency)
+            self.writers_slots = threading.BoundedSemaphore(self.parameters.max_concurrency * 2)
+            self.writers_futures = []
+
+        path = self.GetFramePath(video_info, self.global_idx, self.frame_index)
+
+        # Bound the number of frames held in memory
+        self.writers_slots.acquire()
+        future = self.writers.submit(self.SaveFrame, frame, video_info, srt_parser,
+                                     frame_index=self.frame_index, global_idx=self.global_idx)
+        future.add_done_callback(lambda _: self.writers_slots.release())
+        self.writers_futures.append(future)
+
+        return path
+
+    def WaitWriters(self):
+        if self.writers is None:
+            return
+
+        self.writers.shutdown(wait=True)
+        futures = self.writers_futures
+        self.writers = self.writers_slots = self.writers_futures = None
+
+        # Raise the first write error, if any
+        for f in futures:
+            f.result()
+
+    def GetFramePath(self, video_info, global_idx, frame_index):
+        return os.path.join(self.parameters.output,
+            "{}_{}_{}.{}".format(video_info.basename, global_idx, frame_index, self.parameters.frame_format))
+
+    def SaveFrame(self, frame, video_info, srt_parser: SrtFileParser, frame_index=None, global_idx=None):
+        if frame_index is None:
+            frame_index = self.frame_index
+        if global_idx is None:
+            global_idx = self.global_idx
+
         max_dim = self.parameters.max_dimension
         if max_dim is not None:
             h, w, _ = frame.shape
@@ -204,16 +294,11 @@ class Video2Dataset:
                 factor = max_dim / m
                 frame = cv2.resize(frame, (int(ceil(w * factor)), int(ceil(h * factor))), interpolation=cv2.INTER_AREA)
 
-        path = os.path.join(self.parameters.output,
-            "{}_{}_{}.{}".format(video_info.basename, self.global_idx, self.frame_index, self.parameters.frame_format))
-
-        _, buf = cv2.imencode('.' + self.parameters.frame_format, frame)
+        path = self.GetFramePath(video_info, global_idx, frame_index)
 
-        delta = datetime.timedelta(seconds=(self.frame_index / video_info.frame_rate))
+        delta = datetime.timedelta(seconds=(frame_index / video_info.frame_rate))
         elapsed_time = datetime.datetime(1900, 1, 1) + delta
 
-        img = Image.open(io.BytesIO(buf))
-        
         entry = gps_coords = None
         if srt_parser is not None:
             entry = srt_parser.get_entry(elapsed_time)
@@ -256,7 +341,15 @@ class Video2Dataset:
             exif_dict["GPS"] = get_gps_location(elapsed_time, gps_coords[1], gps_coords[0], gps_coords[2])
 
         exif_bytes = piexif.dump(exif_dict)
-        img.save(path, exif=exif_bytes, quality=95)
+
+        if self.parameters.frame_format.lower() in ["jpg", "jpeg"]:
+            # Encode once and splice the EXIF segment into the JPEG stream
+            _, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            piexif.insert(exif_bytes, buf.tobytes(), path)
+        else:
+            _, buf = cv2.imencode('.' + self.parameters.frame_format, frame)
+            img = Image.open(io.BytesIO(buf))
+            img.save(path, exif=exif_bytes, quality=95)
 
         return path
 
@@ -275,6 +368,68 @@ class Video2Dataset:
             stats["written"] if "written" in stats else "").replace(".", ","))
 
 
+class FrameDecoder(threading.Thread):
+    """
+    Decodes frames ahead of the consumer into a bounded queue.
+    Frames that will not be evaluated (see frame_step) are
+    skipped with grab(), which avoids the BGR conversion and copy.
+    """
+    def __init__(self, cap, start_frame, end_frame, frame_step=1, queue_size=8):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.frame_step = frame_step
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.stopped = threading.Event()
+        self.error = None
+
+    def run(self):
+        frame_index = self.start_frame
+
+        try:
+            while not self.stopped.is_set():
+                if self.end_frame is not None and frame_index > self.end_frame:
+                    break
+
+                if (frame_index - self.start_frame) % self.frame_step != 0:
+                    if not self.cap.grab():
+                        break
+                else:
+                    ret, frame = self.cap.read()
+                    if not ret:
+                        break
+                    self.put((frame_index, frame))
+
+                frame_index += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.put(None)
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def frames(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            yield item
+
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
 def get_video_info(input_file):
 
     video = cv2.VideoCapture(input_file)
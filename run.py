@@ -39,6 +39,8 @@ if __name__ == '__main__':
     opts_json = os.path.join(args.project_path, "options.json")
     auto_rerun_stage, opts_diff = find_rerun_stage(opts_json, args, config.rerun_stages, config.processopts)
     if auto_rerun_stage is not None and len(auto_rerun_stage) > 0:
+        # The stage manifest does not cover all the stages yet,
+        # so it can only add to the stages rerun because of changed options
         log.ODM_INFO("Rerunning from: %s" % auto_rerun_stage[0])
         args.rerun_from = auto_rerun_stage
 
@@ -4,7 +4,7 @@ import json
 from opendm import context
 from opendm import io
 from opendm import types
-from opendm.photo import PhotoCorruptedException
+from opendm.photo import ODM_Photo, PhotoCorruptedException
 from opendm import log
 from opendm import system
 from opendm.geo import GeoFile
@@ -12,8 +12,6 @@ from shutil import copyfile
 from opendm import progress
 from opendm import boundary
 from opendm import ai
-from opendm.skyremoval.skyfilter import SkyFilter
-from opendm.bgfilter import BgFilter
 from opendm.concurrency import parallel_map
 from opendm.video.video2dataset import Parameters, Video2Dataset
 
@@ -24,7 +22,7 @@ def save_images_database(photos, database_file):
     log.ODM_INFO("Wrote images database: %s" % database_file)
 
 def load_images_database(database_file):
-    # Empty is used to create types.ODM_Photo class
+    # Empty is used to create ODM_Photo class
     # instances without calling __init__
     class Empty:
         pass
@@ -39,7 +37,7 @@ def load_images_database(database_file):
             p = Empty()
             for k in photo_json:
                 setattr(p, k, photo_json[k])
-            p.__class__ = types.ODM_Photo
+            p.__class__ = ODM_Photo
             result.append(p)
 
     return result
@@ -142,6 +140,8 @@ class ODMLoadDatasetStage(types.ODM_Stage):
                             "use_srt": True,
                             "max_dimension": args.video_resolution,
                             "limit": args.video_limit,
+                            "frame_step": args.video_frame_step,
+                            "max_concurrency": args.max_concurrency,
                         })
                         v2d = Video2Dataset(params)
                         frames = v2d.ProcessVideo()
@@ -168,7 +168,7 @@ class ODMLoadDatasetStage(types.ODM_Stage):
                     log.ODM_INFO("Loading %s images" % len(path_files))
                     for f in path_files:
                         try:
-                            p = types.ODM_Photo(f)
+                            p = ODM_Photo(f)
                             p.set_mask(find_mask(f, masks))
                             photos.append(p)
                             dataset_list.write(photos[-1].filename + '\n')
@@ -223,6 +223,7 @@ class ODMLoadDatasetStage(types.ODM_Stage):
                         log.ODM_INFO("Automatically generating sky masks for %s images" % len(sky_images))
                         model = ai.get_model("skyremoval", "https://github.com/OpenDroneMap/SkyRemoval/releases/download/v1.0.5/model.zip", "v1.0.5")
                         if model is not None:
+                            from opendm.skyremoval.skyfilter import SkyFilter
                             sf = SkyFilter(model=model)
 
                             def parallel_sky_filter(item):
@@ -264,6 +265,7 @@ class ODMLoadDatasetStage(types.ODM_Stage):
                         log.ODM_INFO("Automatically generating background masks for %s images" % len(bg_images))
                         model = ai.get_model("bgremoval", "https://github.com/OpenDroneMap/ODM/releases/download/v2.9.0/u2net.zip", "v2.9.0")
                         if model is not None:
+                            from opendm.bgfilter import BgFilter
                             bg = BgFilter(model=model)
 
                             def parallel_bg_filter(item):
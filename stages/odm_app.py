@@ -5,20 +5,29 @@ from opendm import types
 from opendm import io
 from opendm import system
 from opendm import log
+from opendm import config
+from opendm.manifest import StageManifest, manifest_path
 
-from stages.dataset import ODMLoadDatasetStage
-from stages.run_opensfm import ODMOpenSfMStage
-from stages.openmvs import ODMOpenMVSStage
-from stages.odm_meshing import ODMeshingStage
-from stages.mvstex import ODMMvsTexStage
-from stages.odm_georeferencing import ODMGeoreferencingStage
-from stages.odm_orthophoto import ODMOrthoPhotoStage
-from stages.odm_dem import ODMDEMStage
-from stages.odm_filterpoints import ODMFilterPoints
-from stages.splitmerge import ODMSplitStage, ODMMergeStage
+# Stage implementations are imported only when a stage runs,
+# so that startup doesn't pay for their (heavy) dependencies
+stage_classes = {
+    'dataset': 'stages.dataset.ODMLoadDatasetStage',
+    'split': 'stages.splitmerge.ODMSplitStage',
+    'merge': 'stages.splitmerge.ODMMergeStage',
+    'opensfm': 'stages.run_opensfm.ODMOpenSfMStage',
+    'openmvs': 'stages.openmvs.ODMOpenMVSStage',
+    'odm_filterpoints': 'stages.odm_filterpoints.ODMFilterPoints',
+    'odm_meshing': 'stages.odm_meshing.ODMeshingStage',
+    'mvs_texturing': 'stages.mvstex.ODMMvsTexStage',
+    'odm_georeferencing': 'stages.odm_georeferencing.ODMGeoreferencingStage',
+    'odm_dem': 'stages.odm_dem.ODMDEMStage',
+    'odm_orthophoto': 'stages.odm_orthophoto.ODMOrthoPhotoStage',
+    'odm_report': 'stages.odm_report.ODMReport',
+    'odm_postprocess': 'stages.odm_postprocess.ODMPostProcess',
+}
 
-from stages.odm_report import ODMReport
-from stages.odm_postprocess import ODMPostProcess
+def create_stage(name, args, **params):
+    return types.ODM_LazyStage(stage_classes[name], name, args, **params)
 
 
 class ODMApp:
@@ -32,26 +41,29 @@ class ODMApp:
             json_log_paths.append(args.copy_to)
 
         log.logger.init_json_output(json_log_paths, args)
+
+        tree = types.ODM_Tree(args.project_path, args.gcp, args.geo, args.align)
+        self.manifest = StageManifest(manifest_path(args.project_path), tree, args, config.rerun_stages)
         
-        dataset = ODMLoadDatasetStage('dataset', args, progress=5.0)
-        split = ODMSplitStage('split', args, progress=75.0)
-        merge = ODMMergeStage('merge', args, progress=100.0)
-        opensfm = ODMOpenSfMStage('opensfm', args, progress=25.0)
-        openmvs = ODMOpenMVSStage('openmvs', args, progress=50.0)
-        filterpoints = ODMFilterPoints('odm_filterpoints', args, progress=52.0)
-        meshing = ODMeshingStage('odm_meshing', args, progress=60.0,
+        dataset = create_stage('dataset', args, progress=5.0)
+        split = create_stage('split', args, progress=75.0)
+        merge = create_stage('merge', args, progress=100.0)
+        opensfm = create_stage('opensfm', args, progress=25.0)
+        openmvs = create_stage('openmvs', args, progress=50.0)
+        filterpoints = create_stage('odm_filterpoints', args, progress=52.0)
+        meshing = create_stage('odm_meshing', args, progress=60.0,
                                     max_vertex=args.mesh_size,
                                     oct_tree=max(1, min(14, args.mesh_octree_depth)),
                                     point_weight=1.0,
                                     max_concurrency=args.max_concurrency)
-        texturing = ODMMvsTexStage('mvs_texturing', args, progress=70.0)
-        georeferencing = ODMGeoreferencingStage('odm_georeferencing', args, progress=80.0,
+        texturing = create_stage('mvs_texturing', args, progress=70.0)
+        georeferencing = create_stage('odm_georeferencing', args, progress=80.0,
                                                     gcp_file=args.gcp)
-        dem = ODMDEMStage('odm_dem', args, progress=90.0,
+        dem = create_stage('odm_dem', args, progress=90.0,
                             max_concurrency=args.max_concurrency)
-        orthophoto = ODMOrthoPhotoStage('odm_orthophoto', args, progress=98.0)
-        report = ODMReport('odm_report', args, progress=99.0)
-        postprocess = ODMPostProcess('odm_postprocess', args, progress=100.0)
+        orthophoto = create_stage('odm_orthophoto', args, progress=98.0)
+        report = create_stage('odm_report', args, progress=99.0)
+        postprocess = create_stage('odm_postprocess', args, progress=100.0)
         
 
         # Normal pipeline
@@ -75,13 +87,30 @@ class ODMApp:
             .connect(orthophoto) \
             .connect(report) \
             .connect(postprocess)
+
+        # Stages that don't consume each other's outputs
+        # can run concurrently (--max-concurrent-stages)
+        georeferencing_deps = [filterpoints]
+        if tree.odm_align_file is not None:
+            # Alignment transforms the textured models
+            georeferencing_deps.append(texturing)
+        if args.optimize_disk_space:
+            # Georeferencing removes the filtered point cloud used for meshing
+            georeferencing_deps.append(meshing)
+
+        georeferencing.depends_on(*georeferencing_deps)
+        dem.depends_on(georeferencing)
+        orthophoto.depends_on(texturing, georeferencing)
+        report.depends_on(dem, orthophoto)
+        postprocess.depends_on(report)
                 
     def execute(self):
         try:
-            self.first_stage.run()
+            self.first_stage.run({'manifest': self.manifest})
             log.logger.log_json_success()
             return 0
         except system.SubprocessException as e:
+            log.logger.flush()
             print("")
             print("===== Stack Trace (useful for devs to troubleshoot problems) =====")
             print(str(e))
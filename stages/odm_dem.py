@@ -8,11 +8,9 @@ from opendm import context
 from opendm import types
 from opendm import gsd
 from opendm.dem import commands, utils
-from opendm.cropper import Cropper
-from opendm import pseudogeo
 from opendm.tiles.tiler import generate_dem_tiles
-from opendm.cogeo import convert_to_cogeo
-from opendm.utils import add_raster_meta_tags
+from opendm.cogeo import finalize_raster
+from opendm.utils import get_raster_meta_tags
 
 
 class ODMDEMStage(types.ODM_Stage):
@@ -76,26 +74,25 @@ class ODMDEMStage(types.ODM_Stage):
                             decimation=args.dem_decimation,
                             max_workers=args.max_concurrency,
                             with_euclidean_map=args.dem_euclidean_map,
+                            max_blend_distance=args.dem_blend_distance,
                             max_tiles=None if reconstruction.has_geotagged_photos() else math.ceil(len(reconstruction.photos) * 1.2)
                         )
 
                     dem_geotiff_path = os.path.join(odm_dem_root, "{}.tif".format(product))
                     bounds_file_path = os.path.join(tree.odm_georeferencing, 'odm_georeferenced_model.bounds.gpkg')
 
-                    if args.crop > 0 or args.boundary:
-                        # Crop DEM
-                        Cropper.crop(bounds_file_path, dem_geotiff_path, utils.get_dem_vars(args), keep_original=not args.optimize_disk_space)
-
-                    if pseudo_georeference:
-                        pseudogeo.add_pseudo_georeferencing(dem_geotiff_path)
-                    
-                    add_raster_meta_tags(dem_geotiff_path, reconstruction, tree, embed_gcp_meta=not outputs['large'])
+                    # Crop DEM, add pseudo georeferencing and meta tags, convert to COG in a single write
+                    tags, metadata = get_raster_meta_tags(reconstruction, tree, embed_gcp_meta=not outputs['large'])
+                    finalize_raster(dem_geotiff_path,
+                                    cutline=bounds_file_path if args.crop > 0 or args.boundary else None,
+                                    tags=tags, metadata=metadata,
+                                    pseudo_georeference=pseudo_georeference,
+                                    cog=args.cog, creation_options=utils.get_dem_vars(args),
+                                    max_workers=args.max_concurrency,
+                                    keep_original=not args.optimize_disk_space)
 
                     if args.tiles:
                         generate_dem_tiles(dem_geotiff_path, tree.path("%s_tiles" % product), args.max_concurrency, resolution)
-                    
-                    if args.cog:
-                        convert_to_cogeo(dem_geotiff_path, max_workers=args.max_concurrency)
 
                     progress += 40
                     self.update_progress(progress)
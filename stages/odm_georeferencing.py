@@ -21,8 +21,8 @@ from opendm import point_cloud
 from opendm.multispectral import get_primary_band_name
 from opendm.osfm import OSFMContext
 from opendm.boundary import as_polygon, export_to_bounds_files
-from opendm.align import compute_alignment_matrix, transform_point_cloud, transform_obj
-from opendm.utils import np_to_json
+from opendm.align import compute_alignment_matrix, transform_obj
+from opendm.utils import np_to_json, np_from_json
 
 class ODMGeoreferencingStage(types.ODM_Stage):
     def process(self, args, outputs):
@@ -115,12 +115,6 @@ class ODMGeoreferencingStage(types.ODM_Stage):
                 log.ODM_WARNING("GCPs could not be loaded for writing to %s" % gcp_export_file)
 
         if not io.file_exists(tree.odm_georeferencing_model_laz) or self.rerun():
-            cmd = f'pdal translate -i "{tree.filtered_point_cloud}" -o \"{tree.odm_georeferencing_model_laz}\"'
-            stages = ["ferry"]
-            params = [
-                '--filters.ferry.dimensions="views => UserData"'
-            ]
-
             # Establish appropriate las scale for export
             las_scale = 0.001
             filtered_point_cloud_stats = tree.path("odm_filterpoints", "point_cloud_stats.json")
@@ -147,76 +141,39 @@ class ODMGeoreferencingStage(types.ODM_Stage):
             else:
                 log.ODM_INFO("No point_cloud_stats.json found. Using default las scale: %s" % las_scale)
             
-            params += [
-                f'--writers.las.scale_x={las_scale}',
-                f'--writers.las.scale_y={las_scale}',
-                f'--writers.las.scale_z={las_scale}',
-            ]
+            offset = None
+            srs = None
+            vlrs = []
 
             if reconstruction.is_georeferenced():
-                log.ODM_INFO("Georeferencing point cloud")
-
-                stages.append("transformation")
-                utmoffset = reconstruction.georef.utm_offset()
-
-                params += [
-                    f'--filters.transformation.matrix="1 0 0 {utmoffset[0]} 0 1 0 {utmoffset[1]} 0 0 1 0 0 0 0 1"',
-                    f'--writers.las.offset_x={reconstruction.georef.utm_east_offset}' ,
-                    f'--writers.las.offset_y={reconstruction.georef.utm_north_offset}',
-                    '--writers.las.offset_z=0',
-                    f'--writers.las.a_srs="{reconstruction.georef.proj4()}"' # HOBU this should maybe be WKT
-                ]
+                offset = reconstruction.georef.utm_offset()
+                srs = reconstruction.georef.proj4() # HOBU this should maybe be WKT
 
                 if reconstruction.has_gcp() and io.file_exists(gcp_geojson_zip_export_file):
                     if os.path.getsize(gcp_geojson_zip_export_file) <= 65535:
                         log.ODM_INFO("Embedding GCP info in point cloud")
-                        params += [
-                            '--writers.las.vlrs="{\\\"filename\\\": \\\"%s\\\", \\\"user_id\\\": \\\"ODM\\\", \\\"record_id\\\": 2, \\\"description\\\": \\\"Ground Control Points (zip)\\\"}"' % gcp_geojson_zip_export_file.replace(os.sep, "/")
-                        ]
+                        vlrs.append({
+                            'filename': gcp_geojson_zip_export_file.replace(os.sep, "/"),
+                            'user_id': 'ODM',
+                            'record_id': 2,
+                            'description': 'Ground Control Points (zip)'
+                        })
                     else:
                         log.ODM_WARNING("Cannot embed GCP info in point cloud, %s is too large" % gcp_geojson_zip_export_file)
 
-                system.run(cmd + ' ' + ' '.join(stages) + ' ' + ' '.join(params))
-
-                self.update_progress(50)
-
-                if args.crop > 0:
-                    log.ODM_INFO("Calculating cropping area and generating bounds shapefile from point cloud")
-                    cropper = Cropper(tree.odm_georeferencing, 'odm_georeferenced_model')
-
-                    if args.fast_orthophoto:
-                        decimation_step = 4
-                    else:
-                        decimation_step = 40
-
-                    # More aggressive decimation for large datasets
-                    if not args.fast_orthophoto:
-                        decimation_step *= int(len(reconstruction.photos) / 1000) + 1
-                        decimation_step = min(decimation_step, 95)
-
-                    try:
-                        cropper.create_bounds_gpkg(tree.odm_georeferencing_model_laz, args.crop,
-                                                    decimation_step=decimation_step)
-                    except:
-                        log.ODM_WARNING("Cannot calculate crop bounds! We will skip cropping")
-                        args.crop = 0
-
-                if 'boundary' in outputs and args.crop == 0:
-                    log.ODM_INFO("Using boundary JSON as cropping area")
-
-                    bounds_base, _ = os.path.splitext(tree.odm_georeferencing_model_laz)
-                    bounds_json = bounds_base + ".bounds.geojson"
-                    bounds_gpkg = bounds_base + ".bounds.gpkg"
-                    export_to_bounds_files(outputs['boundary'], reconstruction.get_proj_srs(), bounds_json, bounds_gpkg)
+            # The filtered point cloud is read once: views, offset and alignment
+            # are applied in the same pass. If it's going to be classified, it's
+            # handed off to the classification, which writes the final LAZ.
+            if args.pc_classify:
+                georeferenced_model = io.related_file_path(tree.odm_georeferencing_model_laz, postfix="_unclassified")
             else:
-                log.ODM_INFO("Converting point cloud (non-georeferenced)")
-                system.run(cmd + ' ' + ' '.join(stages) + ' ' + ' '.join(params))
-
+                georeferenced_model = tree.odm_georeferencing_model_laz
 
             stats_dir = tree.path("opensfm", "stats", "codem")
             if os.path.exists(stats_dir) and self.rerun():
                 shutil.rmtree(stats_dir)
 
+            a_matrix = None
             if tree.odm_align_file is not None:
                 alignment_file_exists = io.file_exists(tree.odm_georeferencing_alignment_matrix)
 
@@ -224,27 +181,18 @@ class ODMGeoreferencingStage(types.ODM_Stage):
                     if alignment_file_exists:
                         os.unlink(tree.odm_georeferencing_alignment_matrix)
 
-                    a_matrix = None
+                    # The alignment is computed on the unaligned point cloud
+                    log.ODM_INFO("Georeferencing point cloud (unaligned)")
+                    point_cloud.georeference(tree.filtered_point_cloud, unaligned_model, las_scale, offset, srs, vlrs=vlrs)
+
                     try:
-                        a_matrix = compute_alignment_matrix(tree.odm_georeferencing_model_laz, tree.odm_align_file, stats_dir)
+                        a_matrix = compute_alignment_matrix(unaligned_model, tree.odm_align_file, stats_dir)
                     except Exception as e:
                         log.ODM_WARNING("Cannot compute alignment matrix: %s" % str(e))
 
                     if a_matrix is not None:
                         log.ODM_INFO("Alignment matrix: %s" % a_matrix)
 
-                        # Align point cloud
-                        if os.path.isfile(unaligned_model):
-                            os.rename(unaligned_model, tree.odm_georeferencing_model_laz)
-                        os.rename(tree.odm_georeferencing_model_laz, unaligned_model)
-
-                        try:
-                            transform_point_cloud(unaligned_model, a_matrix, tree.odm_georeferencing_model_laz)
-                            log.ODM_INFO("Transformed %s" % tree.odm_georeferencing_model_laz)
-                        except Exception as e:
-                            log.ODM_WARNING("Cannot transform point cloud: %s" % str(e))
-                            os.rename(unaligned_model, tree.odm_georeferencing_model_laz)
-
                         # Align textured models
                         def transform_textured_model(obj):
                             if os.path.isfile(obj):
@@ -274,12 +222,59 @@ class ODMGeoreferencingStage(types.ODM_Stage):
                             f.write(np_to_json(a_matrix))
                     else:
                         log.ODM_WARNING("Alignment to %s will be skipped." % tree.odm_align_file)
+
+                    if args.optimize_disk_space and os.path.isfile(unaligned_model):
+                        os.remove(unaligned_model)
                 else:
                     log.ODM_WARNING("Already computed alignment")
+                    with open(tree.odm_georeferencing_alignment_matrix, 'r') as f:
+                        a_matrix = np_from_json(f.read())
             elif io.file_exists(tree.odm_georeferencing_alignment_matrix):
                 os.unlink(tree.odm_georeferencing_alignment_matrix)
 
-            point_cloud.post_point_cloud_steps(args, tree, self.rerun())
+            if reconstruction.is_georeferenced():
+                log.ODM_INFO("Georeferencing point cloud")
+            else:
+                log.ODM_INFO("Converting point cloud (non-georeferenced)")
+
+            point_cloud.georeference(tree.filtered_point_cloud, georeferenced_model, las_scale, offset, srs, a_matrix, vlrs)
+            if a_matrix is not None:
+                log.ODM_INFO("Transformed %s" % georeferenced_model)
+
+            if reconstruction.is_georeferenced():
+                self.update_progress(50)
+
+                if args.crop > 0:
+                    log.ODM_INFO("Calculating cropping area and generating bounds shapefile from point cloud")
+                    cropper = Cropper(tree.odm_georeferencing, 'odm_georeferenced_model')
+
+                    if args.fast_orthophoto:
+                        decimation_step = 4
+                    else:
+                        decimation_step = 40
+
+                    # More aggressive decimation for large datasets
+                    if not args.fast_orthophoto:
+                        decimation_step *= int(len(reconstruction.photos) / 1000) + 1
+                        decimation_step = min(decimation_step, 95)
+
+                    try:
+                        cropper.create_bounds_gpkg(georeferenced_model, args.crop,
+                                                    decimation_step=decimation_step)
+                    except:
+                        log.ODM_WARNING("Cannot calculate crop bounds! We will skip cropping")
+                        args.crop = 0
+
+                if 'boundary' in outputs and args.crop == 0:
+                    log.ODM_INFO("Using boundary JSON as cropping area")
+
+                    bounds_base, _ = os.path.splitext(tree.odm_georeferencing_model_laz)
+                    bounds_json = bounds_base + ".bounds.geojson"
+                    bounds_gpkg = bounds_base + ".bounds.gpkg"
+                    export_to_bounds_files(outputs['boundary'], reconstruction.get_proj_srs(), bounds_json, bounds_gpkg)
+
+            point_cloud.post_point_cloud_steps(args, tree, self.rerun(),
+                                               input_point_cloud=georeferenced_model if georeferenced_model != tree.odm_georeferencing_model_laz else None)
         else:
             log.ODM_WARNING('Found a valid georeferenced model in: %s'
                             % tree.odm_georeferencing_model_laz)
@@ -7,6 +7,7 @@ from opendm import context
 from opendm import point_cloud
 from opendm import types
 from opendm.gpu import has_gpu
+from opendm.governor import get_governor, is_oom_error
 from opendm.utils import get_depthmap_resolution
 from opendm.osfm import OSFMContext
 from opendm.multispectral import get_primary_band_name
@@ -66,12 +67,29 @@ class ODMOpenMVSStage(types.ODM_Stage):
             min_resolution = 320 if args.pc_quality in ["low", "lowest"] else 640
             scene_dense_ply = os.path.join(tree.openmvs, 'scene_dense.ply')
 
+            # Plan threads and tiling based on the expected memory usage,
+            # rather than waiting for the process to run out of memory
+            governor = get_governor()
+            depthmap_mp = (outputs['undist_image_max_size'] / 2 ** resolution_level) ** 2 / 1000000
+            densify_units = len(photos) * depthmap_mp
+            densify_plan = governor.plan('DensifyPointCloud', densify_units, args.max_concurrency, thread_units=depthmap_mp)
+
+            def plan_tiled():
+                # Tiling removes the fusion of all depthmaps (the units term),
+                # plan threads from the per-thread term only
+                return 0, governor.plan('DensifyPointCloud', 0, args.max_concurrency, thread_units=depthmap_mp)
+
+            if not densify_plan.fits:
+                log.ODM_WARNING("OpenMVS is not expected to fit in memory, we're going to turn on tiling")
+                pc_tile = True
+                densify_units, densify_plan = plan_tiled()
+
             config = [
                 "--resolution-level %s" % int(resolution_level),
                 '--dense-config-file "%s"' % densify_ini_file,
                 "--max-resolution %s" % int(outputs['undist_image_max_size']),
                 "--min-resolution %s" % min_resolution,
-                "--max-threads %s" % args.max_concurrency,
+                "--max-threads %s" % densify_plan.threads,
                 "--number-views-fuse %s" % number_views_fuse,
                 "--postprocess-dmaps 3", # nOptimize
                 "--fusion-filter 1",
@@ -101,14 +119,17 @@ class ODMOpenMVSStage(types.ODM_Stage):
             with open(densify_ini_file, 'w+') as f:
                 f.write("Min Views Filter = 1\nInterpolate Gap Size = 29\nEstimation Geometric Weight = 0.4\nNCC Threshold Keep = 0.95\nRandom Smooth Bonus = 0.96\n")
 
+            if pc_tile:
+                config.append("--fusion-mode 1")
+
             def run_densify():
-                system.run('"%s" "%s" %s' % (context.omvs_densify_path, 
+                governor.run('DensifyPointCloud', '"%s" "%s" %s' % (context.omvs_densify_path, 
                                         openmvs_scene_file,
-                                        ' '.join(config + gpu_config + extra_config)))
+                                        ' '.join(config + gpu_config + extra_config)), densify_units, densify_plan.threads, thread_units=depthmap_mp)
             
             try:
                 run_densify()
-                if not os.path.exists(scene_dense_ply):
+                if not pc_tile and not os.path.exists(scene_dense_ply):
                     raise system.ExitException("Dense reconstruction failed. This could be due to poor georeferencing or insufficient image overlap.")
             except system.SubprocessException as e:
                 # If the GPU was enabled and the program failed,
@@ -117,10 +138,12 @@ class ODMOpenMVSStage(types.ODM_Stage):
                     log.ODM_WARNING("OpenMVS failed with GPU, is your graphics card driver up to date? Falling back to CPU.")
                     gpu_config = ["--cuda-device -2"]
                     run_densify()
-                elif (e.errorCode == 137 or e.errorCode == 143 or e.errorCode == 3221226505) and not pc_tile:
+                elif is_oom_error(e.errorCode) and not pc_tile:
                     log.ODM_WARNING("OpenMVS ran out of memory, we're going to turn on tiling to see if we can process this.")
                     pc_tile = True
-                    config.append("--fusion-mode 1")
+                    densify_units, densify_plan = plan_tiled()
+                    config = [c for c in config if not c.startswith("--max-threads")]
+                    config += ["--max-threads %s" % densify_plan.threads, "--fusion-mode 1"]
                     run_densify()
                 elif e.errorCode == 139:
                     log.ODM_WARNING("OpenMVS segfaulted, let's try one more time")
@@ -233,7 +256,7 @@ class ODMOpenMVSStage(types.ODM_Stage):
                         try:
                             system.run('"%s" %s' % (context.omvs_densify_path, ' '.join(config + gpu_config + extra_config)))
                         except system.SubprocessException as e:
-                            if e.errorCode == 139 or e.errorCode == 137 or e.errorCode == 143 or e.errorCode == 3221226505:
+                            if e.errorCode == 139 or is_oom_error(e.errorCode):
                                 log.ODM_WARNING("Unexpected process termination, visibility checks will be skipped.")
                                 skip_filtering()
                             else:
@@ -13,10 +13,11 @@ from opendm.cropper import Cropper
 from opendm.remote import LocalRemoteExecutor
 from opendm.shots import merge_geojson_shots, merge_cameras
 from opendm import point_cloud
-from opendm.utils import double_quote, add_raster_meta_tags
+from opendm.utils import double_quote, get_raster_meta_tags
 from opendm.tiles.tiler import generate_dem_tiles
-from opendm.cogeo import convert_to_cogeo
+from opendm.cogeo import finalize_raster
 from opendm import multispectral
+from opendm.geo import GeoFile
 
 class ODMSplitStage(types.ODM_Stage):
     def process(self, args, outputs):
@@ -86,6 +87,11 @@ class ODMSplitStage(types.ODM_Stage):
                 mds = metadataset.MetaDataSet(tree.opensfm)
                 submodel_paths = [os.path.abspath(p) for p in mds.get_submodel_paths()]
 
+                # Parse the geo file once for all submodels
+                geo_file = None
+                if tree.odm_geo_file is not None and os.path.isfile(tree.odm_geo_file):
+                    geo_file = GeoFile(tree.odm_geo_file)
+
                 for sp in submodel_paths:
                     sp_octx = OSFMContext(sp)
                     submodel_images_dir = os.path.abspath(sp_octx.path("..", "images"))
@@ -101,12 +107,6 @@ class ODMSplitStage(types.ODM_Stage):
                         else:
                             log.ODM_INFO("No GCP will be copied for %s, not enough images in the submodel are referenced by the GCP" % sp_octx.name())
                     
-                    # Copy GEO file if needed (one for each submodel project directory)
-                    if tree.odm_geo_file is not None and os.path.isfile(tree.odm_geo_file):
-                        geo_dst_path = os.path.abspath(sp_octx.path("..", "geo.txt"))
-                        io.copy(tree.odm_geo_file, geo_dst_path)
-                        log.ODM_INFO("Copied GEO file to %s" % geo_dst_path)
-
                     # If this is a multispectral dataset,
                     # we need to link the multispectral images
                     if reconstruction.multi_camera:
@@ -120,6 +120,12 @@ class ODMSplitStage(types.ODM_Stage):
                                 for p in secondary_band_photos:
                                     system.link_file(os.path.join(tree.dataset_raw, p.filename), submodel_images_dir)
 
+                    # Copy the entries of the GEO file for the submodel's images (one for each submodel project directory)
+                    if geo_file is not None:
+                        geo_dst_path = os.path.abspath(sp_octx.path("..", "geo.txt"))
+                        if geo_file.make_filtered_copy(geo_dst_path, set(os.listdir(submodel_images_dir))):
+                            log.ODM_INFO("Copied filtered GEO file to %s" % geo_dst_path)
+
                 # Reconstruct each submodel
                 log.ODM_INFO("Dataset has been split into %s submodels. Reconstructing each submodel..." % len(submodel_paths))
                 self.update_progress(25)
@@ -131,7 +137,9 @@ class ODMSplitStage(types.ODM_Stage):
                         local_sp_octx.create_tracks(self.rerun())
                         local_sp_octx.reconstruct(args.rolling_shutter, not args.sfm_no_partial, self.rerun())
                 else:
-                    lre = LocalRemoteExecutor(args.sm_cluster, args.rolling_shutter, self.rerun())
+                    # Upload a few submodels at a time, so that packaging and
+                    # transfers of one submodel overlap with the others
+                    lre = LocalRemoteExecutor(args.sm_cluster, args.rolling_shutter, self.rerun(), parallel_uploads=3)
                     lre.set_projects([os.path.abspath(os.path.join(p, "..")) for p in submodel_paths])
                     lre.run_reconstruction()
 
@@ -295,21 +303,22 @@ class ODMMergeStage(types.ODM_Stage):
                     if human_name == "DTM":
                         eu_map_source = "dsm"
 
-                    euclidean_merge_dems(all_dems, dem_file, dem_vars, euclidean_map_source=eu_map_source)
+                    euclidean_merge_dems(all_dems, dem_file, dem_vars, euclidean_map_source=eu_map_source,
+                                         max_blend_distance=args.dem_blend_distance)
 
                     if io.file_exists(dem_file):
-                        # Crop
-                        if args.crop > 0 or args.boundary:
-                            Cropper.crop(merged_bounds_file, dem_file, dem_vars, keep_original=not args.optimize_disk_space)
+                        # Crop, add meta tags and convert to COG in a single write
+                        tags, metadata = get_raster_meta_tags(reconstruction, tree, embed_gcp_meta=False)
+                        finalize_raster(dem_file,
+                                        cutline=merged_bounds_file if args.crop > 0 or args.boundary else None,
+                                        tags=tags, metadata=metadata,
+                                        cog=args.cog, creation_options=dem_vars,
+                                        max_workers=args.max_concurrency,
+                                        keep_original=not args.optimize_disk_space)
                         log.ODM_INFO("Created %s" % dem_file)
                         
                         if args.tiles:
                             generate_dem_tiles(dem_file, tree.path("%s_tiles" % human_name.lower()), args.max_concurrency, args.dem_resolution)
-                        
-                        add_raster_meta_tags(dem_file, reconstruction, tree, embed_gcp_meta=False)
-
-                        if args.cog:
-                            convert_to_cogeo(dem_file, max_workers=args.max_concurrency)
                     else:
                         log.ODM_WARNING("Cannot merge %s, %s was not created" % (human_name, dem_file))
                 
@@ -0,0 +1,127 @@
+import os
+import json
+import struct
+import shutil
+import unittest
+from unittest import mock
+import numpy as np
+
+from opendm.dem import pdal
+
+def synthetic_terrain(count, size=400.0, seed=0):
+    """Rolling ground with buildings and trees on top of it"""
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, size, count)
+    y = rng.uniform(0, size, count)
+    z = 100 + 0.05 * x + 5 * np.sin(y / 40.0) + rng.normal(0, 0.05, count)
+
+    for cx, cy in rng.uniform(0, size, (int(size / 20), 2)):
+        building = (np.abs(x - cx) < 6) & (np.abs(y - cy) < 6)
+        z[building] += 8
+    trees = rng.random(count) < 0.05
+    z[trees] += rng.uniform(2, 15, np.count_nonzero(trees))
+    return x, y, z
+
+def write_cloud(path, x, y, z):
+    import pdal as pdal_module
+
+    arr = np.zeros(len(x), dtype=[('X', np.float64), ('Y', np.float64), ('Z', np.float64), ('Classification', np.uint8), ('Confidence', np.float32)])
+    arr['X'], arr['Y'], arr['Z'] = x, y, z
+    arr['Confidence'] = np.arange(len(x)) % 100
+    pdal_module.Pipeline(json.dumps([{"type": "writers.las", "filename": path, "scale_x": 0.001, "scale_y": 0.001, "scale_z": 0.001,
+                                      "offset_x": 1000, "offset_y": 2000, "offset_z": 100, "extra_dims": "all"}]),
+                         arrays=[arr]).execute()
+
+def read_scale_offset(path):
+    with open(path, 'rb') as f:
+        f.seek(131)
+        return struct.unpack('<6d', f.read(48))
+
+def read_cloud(path):
+    import pdal as pdal_module
+
+    p = pdal_module.Reader.las(path).pipeline()
+    p.execute()
+    arr = p.arrays[0]
+    arr = arr[np.lexsort((arr['Z'], arr['Y'], arr['X']))]
+    return arr
+
+def has_pdal():
+    try:
+        import pdal as pdal_module
+    except ImportError:
+        return False
+    return shutil.which('pdal') is not None
+
+class TestClassify(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+    def test_tile_plan(self):
+        bounds = {'minx': 1000.0, 'maxx': 1400.0, 'miny': 2000.0, 'maxy': 2300.0}
+
+        # Too small or single worker
+        self.assertIsNone(pdal.smrf_tile_plan(bounds, 18.0, 1))
+        self.assertIsNone(pdal.smrf_tile_plan(bounds, 100.0, 8))
+
+        length, buffer = pdal.smrf_tile_plan(bounds, 18.0, 4)
+        self.assertEqual(buffer, 36.0)
+        self.assertTrue(length >= buffer * 8)
+
+        # Cores partition the point cloud: every point falls in exactly one core
+        rng = np.random.default_rng(0)
+        points = np.column_stack((rng.uniform(1000, 1400, 10000), rng.uniform(2000, 2300, 10000)))
+        points[0] = [1400, 2300]
+        points[1] = [1000, 2000]
+
+        tx = np.floor((points[:,0] - bounds['minx']) / length).astype(int)
+        ty = np.floor((points[:,1] - bounds['miny']) / length).astype(int)
+        count = np.zeros(len(points), dtype=int)
+        for x in range(tx.min(), tx.max() + 1):
+            for y in range(ty.min(), ty.max() + 1):
+                minx, maxx, miny, maxy = pdal.smrf_tile_core(bounds, length, x, y)
+                count += (points[:,0] >= minx) & (points[:,0] < maxx) & (points[:,1] >= miny) & (points[:,1] < maxy)
+        self.assertTrue((count == 1).all())
+
+    def test_classify(self):
+        from opendm.dem import commands
+
+        with mock.patch.object(commands.pdal, 'run_pdaltranslate_smrf') as single, \
+             mock.patch.object(commands.pdal, 'run_tiled_smrf') as tiled, \
+             mock.patch.object(commands.point_cloud, 'get_extent', return_value={}):
+            # Tiled SMRF is opt-in
+            commands.classify("cloud.laz", 1.25, 0.15, 0.5, 18.0, max_workers=4)
+            self.assertEqual((single.call_count, tiled.call_count), (1, 0))
+
+            commands.classify("cloud.laz", 1.25, 0.15, 0.5, 18.0, max_workers=4, tiled=True)
+            self.assertEqual((single.call_count, tiled.call_count), (1, 1))
+
+    @unittest.skipUnless(has_pdal(), "PDAL not available")
+    def test_tiled_smrf(self):
+        # Ground classification of tiled runs agrees with a single run on more than 99% of the points
+        x, y, z = synthetic_terrain(400000)
+        write_cloud("tests/assets/output/cloud.las", x, y, z)
+        bounds = {'minx': x.min(), 'maxx': x.max(), 'miny': y.min(), 'maxy': y.max()}
+
+        pdal.run_pdaltranslate_smrf("tests/assets/output/cloud.las", "tests/assets/output/single.laz", 1.25, 0.15, 0.5, 18.0)
+        pdal.run_tiled_smrf("tests/assets/output/cloud.las", "tests/assets/output/tiled.laz", bounds, 1.25, 0.15, 0.5, 18.0, max_workers=4)
+
+        single = read_cloud("tests/assets/output/single.laz")
+        tiled = read_cloud("tests/assets/output/tiled.laz")
+
+        # No points lost or duplicated
+        self.assertEqual(len(single), len(tiled))
+        np.testing.assert_array_equal(single['X'], tiled['X'])
+        np.testing.assert_array_equal(single['Y'], tiled['Y'])
+
+        # Scale, offset and extra dimensions are kept
+        self.assertEqual(read_scale_offset("tests/assets/output/tiled.laz"), read_scale_offset("tests/assets/output/cloud.las"))
+        np.testing.assert_array_equal(tiled['Confidence'], read_cloud("tests/assets/output/cloud.las")['Confidence'])
+
+        agreement = np.mean((single['Classification'] == 2) == (tiled['Classification'] == 2))
+        self.assertTrue(agreement > 0.99, "%.3f%% agreement" % (agreement * 100))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import os
+import time
+import shutil
+import subprocess
+import unittest
+import numpy as np
+
+from opendm import cogeo
+
+def has_gdal():
+    try:
+        from osgeo import gdal
+    except ImportError:
+        return False
+    return True
+
+def write_orthophoto(path, size, blocksize=512):
+    """Tiled RGBA raster with a smooth gradient and some noise, written block by block"""
+    from osgeo import gdal, osr
+
+    ds = gdal.GetDriverByName('GTiff').Create(path, size, size, 4, gdal.GDT_Byte,
+                                               ['TILED=YES', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER',
+                                                'BLOCKXSIZE=%s' % blocksize, 'BLOCKYSIZE=%s' % blocksize])
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32615)
+    ds.SetProjection(srs.ExportToWkt())
+    ds.SetGeoTransform([500000, 0.05, 0, 4000000, 0, -0.05])
+
+    rng = np.random.default_rng(0)
+    for row in range(0, size, blocksize):
+        h = min(blocksize, size - row)
+        y, x = np.mgrid[row:row + h, 0:size]
+        for b in range(3):
+            band = ((x + y * (b + 1)) // 16 % 256 + rng.integers(0, 8, (h, size))).astype(np.uint8)
+            ds.GetRasterBand(b + 1).WriteArray(band, 0, row)
+        ds.GetRasterBand(4).WriteArray(np.full((h, size), 255, dtype=np.uint8), 0, row)
+    ds.GetRasterBand(4).SetColorInterpretation(gdal.GCI_AlphaBand)
+    ds = None
+
+def write_cutline(path, size):
+    """Diamond inside the raster written by write_orthophoto"""
+    from osgeo import ogr, osr
+
+    extent = size * 0.05
+    cx, cy, r = 500000 + extent / 2, 4000000 - extent / 2, extent * 0.4
+    ring = ogr.Geometry(ogr.wkbLinearRing)
+    for x, y in [(cx - r, cy), (cx, cy + r), (cx + r, cy), (cx, cy - r), (cx - r, cy)]:
+        ring.AddPoint_2D(x, y)
+    polygon = ogr.Geometry(ogr.wkbPolygon)
+    polygon.AddGeometry(ring)
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32615)
+    ds = ogr.GetDriverByName('GPKG').CreateDataSource(path)
+    layer = ds.CreateLayer('bounds', srs=srs, geom_type=ogr.wkbPolygon)
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetGeometry(polygon)
+    layer.CreateFeature(feature)
+    ds = None
+
+@unittest.skipUnless(has_gdal(), "GDAL not available")
+class TestCogeo(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+    def assertValidCog(self, path):
+        from osgeo import gdal
+
+        # gdalinfo reports LAYOUT=COG for files written by the COG driver
+        ds = gdal.Open(path)
+        self.assertEqual(ds.GetMetadata('IMAGE_STRUCTURE').get('LAYOUT'), 'COG')
+        ds = None
+
+        # The layout is still valid after the file has been written (e.g. no metadata added in place)
+        try:
+            from osgeo_utils.samples.validate_cloud_optimized_geotiff import validate
+        except ImportError:
+            validate = None
+        if validate is not None:
+            errors, warnings, details = validate(path, full_check=True)
+            self.assertEqual(errors, [], "%s is not a valid COG" % path)
+
+    def test_finalize_raster(self):
+        from osgeo import gdal
+
+        raster = "tests/assets/output/ortho.tif"
+        cutline = "tests/assets/output/bounds.gpkg"
+        write_orthophoto(raster, 2000)
+        write_cutline(cutline, 2000)
+
+        tags = {'TIFFTAG_SOFTWARE': 'ODM test', 'TIFFTAG_DATETIME': '2024:01:01 00:00:00+00:00'}
+        metadata = {'xml:GROUND_CONTROL_POINTS': '<gcp>test</gcp>'}
+        self.assertTrue(cogeo.finalize_raster(raster, cutline=cutline, tags=tags, metadata=metadata,
+                                              cog=True, warp_options=['-dstalpha'], max_workers=2))
+
+        # Uncropped raster is kept
+        self.assertTrue(os.path.isfile("tests/assets/output/ortho.original.tif"))
+
+        self.assertValidCog(raster)
+        ds = gdal.Open(raster)
+        self.assertEqual(ds.GetMetadataItem('TIFFTAG_SOFTWARE'), 'ODM test')
+        self.assertEqual(ds.GetMetadataItem('TIFFTAG_DATETIME'), '2024:01:01 00:00:00+00:00')
+        self.assertEqual(ds.GetMetadata('xml:GROUND_CONTROL_POINTS')[0], '<gcp>test</gcp>')
+        self.assertTrue(ds.GetRasterBand(1).GetOverviewCount() > 0)
+
+        # Cropped to the cutline, outside of it is transparent
+        self.assertTrue(abs(ds.RasterXSize - 1600) <= 2)
+        alpha = ds.GetRasterBand(4).ReadAsArray()
+        self.assertEqual(alpha[0, 0], 0)
+        self.assertEqual(alpha[alpha.shape[0] // 2, alpha.shape[1] // 2], 255)
+        ds = None
+
+        # COG without cropping
+        write_orthophoto(raster, 1000)
+        self.assertTrue(cogeo.finalize_raster(raster, tags=tags, metadata=metadata, cog=True))
+        self.assertValidCog(raster)
+        ds = gdal.Open(raster)
+        self.assertEqual(ds.GetMetadataItem('TIFFTAG_SOFTWARE'), 'ODM test')
+        self.assertEqual(ds.RasterXSize, 1000)
+        ds = None
+
+        # Tags only: written in place
+        write_orthophoto(raster, 500)
+        self.assertTrue(cogeo.finalize_raster(raster, tags=tags, overviews=True))
+        ds = gdal.Open(raster)
+        self.assertEqual(ds.GetMetadataItem('TIFFTAG_SOFTWARE'), 'ODM test')
+        self.assertEqual(ds.GetRasterBand(1).GetOverviewCount(), 4)
+        ds = None
+
+        # Missing files
+        self.assertFalse(cogeo.finalize_raster("tests/assets/output/missing.tif", tags=tags))
+
+    @unittest.skipUnless(os.environ.get('ODM_BENCHMARK'), "Set ODM_BENCHMARK=1 to run benchmarks")
+    def test_benchmark(self):
+        size = 16384
+        raster = "tests/assets/output/ortho.tif"
+        cutline = "tests/assets/output/bounds.gpkg"
+        write_orthophoto(raster, size)
+        write_cutline(cutline, size)
+        shutil.copyfile(raster, "tests/assets/output/ortho_old.tif")
+        tags = {'TIFFTAG_SOFTWARE': 'ODM test'}
+
+        start = time.time()
+        cogeo.finalize_raster(raster, cutline=cutline, tags=tags, cog=True, warp_options=['-dstalpha'],
+                              max_workers=4, keep_original=False)
+        new_time = time.time() - start
+
+        # Previous chain: gdalwarp crop, tags in place, gdal_translate to COG
+        if shutil.which('gdalwarp') is None or shutil.which('gdal_translate') is None:
+            self.skipTest("GDAL tools not found, cannot compare with the previous chain")
+
+        from opendm.cropper import Cropper
+        old = "tests/assets/output/ortho_old.tif"
+        start = time.time()
+        Cropper.crop(cutline, old, {'TILED': 'YES', 'COMPRESS': 'DEFLATE', 'BIGTIFF': 'IF_SAFER', 'NUM_THREADS': 4},
+                     keep_original=False, warp_options=['-dstalpha'])
+        from osgeo import gdal
+        ds = gdal.Open(old, gdal.GA_Update)
+        ds.SetMetadataItem('TIFFTAG_SOFTWARE', 'ODM test')
+        ds = None
+        subprocess.run(['gdal_translate', '-of', 'COG', '-co', 'NUM_THREADS=4', '-co', 'BLOCKSIZE=256', '-co', 'COMPRESS=DEFLATE',
+                        '-co', 'PREDICTOR=2', '-co', 'BIGTIFF=IF_SAFER', '-co', 'RESAMPLING=NEAREST', old, old + ".cog.tif"],
+                       check=True, stdout=subprocess.DEVNULL)
+        old_time = time.time() - start
+
+        self.assertTrue(new_time < old_time, "Raster finalization (%sx%s RGBA, crop + tags + COG): %.2fs (previous chain: %.2fs)" % (size, size, new_time, old_time))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import shutil
+import unittest
+from unittest import mock
+import numpy as np
+import scipy.spatial # imported lazily by cropper, not while sys.modules is patched
+
+from osgeo import ogr
+from opendm import cropper
+from opendm.cropper import Cropper
+
+class PipelineMock:
+    """Stands in for pdal.Pipeline: streams the (decimated) points in chunks"""
+    points = None
+    srs = {'proj4': '+proj=utm +zone=15 +datum=WGS84 +units=m +no_defs'}
+
+    def __init__(self, spec):
+        self.spec = json.loads(spec)
+        self.quickinfo = {'readers.las': {'srs': self.srs}}
+
+    def iterator(self, chunk_size):
+        step = self.spec[1]['step']
+        points = self.points[::step]
+        for i in range(0, len(points), chunk_size):
+            yield points[i:i + chunk_size]
+
+def synthetic_points(count, seed=0):
+    rng = np.random.default_rng(seed)
+    arr = np.zeros(count, dtype=[('X', np.float64), ('Y', np.float64), ('Z', np.float64)])
+    arr['X'] = rng.uniform(0, 100, count)
+    arr['Y'] = rng.uniform(0, 50, count)
+
+    # Corners of the extent
+    arr['X'][:4] = [0, 100, 100, 0]
+    arr['Y'][:4] = [0, 0, 50, 50]
+    return arr
+
+class TestCropper(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+    def test_convex_hull(self):
+        points = np.array([[0, 0], [1, 0], [1, 1], [0, 1], [0.5, 0.5], [0.2, 0.7]])
+        hull = cropper.convex_hull(points)
+        self.assertEqual(sorted(map(tuple, hull)), [(0, 0), (0, 1), (1, 0), (1, 1)])
+
+        # Degenerate inputs
+        self.assertEqual(len(cropper.convex_hull(np.array([[0, 0], [0, 0]]))), 1)
+        self.assertEqual(sorted(map(tuple, cropper.convex_hull(np.array([[0, 0], [1, 1], [2, 2]])))), [(0, 0), (2, 2)])
+
+    def test_compute_bounds(self):
+        PipelineMock.points = synthetic_points(10000)
+        pdal = mock.MagicMock(Pipeline=PipelineMock)
+
+        with mock.patch.dict(sys.modules, {'pdal': pdal}):
+            hull, srs = Cropper.compute_bounds("cloud.laz", decimation_step=1, chunk_size=10000)
+            self.assertEqual(sorted(map(tuple, hull)), [(0, 0), (0, 50), (100, 0), (100, 50)])
+            self.assertEqual(srs, PipelineMock.srs['proj4'])
+
+            # Same hull when streaming in chunks
+            chunked, _ = Cropper.compute_bounds("cloud.laz", decimation_step=1, chunk_size=777)
+            self.assertEqual(sorted(map(tuple, chunked)), sorted(map(tuple, hull)))
+
+            # Hull of the decimated points
+            decimated, _ = Cropper.compute_bounds("cloud.laz", decimation_step=3, chunk_size=1000)
+            expected = cropper.convex_hull(np.column_stack((PipelineMock.points['X'][::3], PipelineMock.points['Y'][::3])))
+            self.assertEqual(sorted(map(tuple, decimated)), sorted(map(tuple, expected)))
+
+            PipelineMock.points = synthetic_points(4)[:0]
+            with self.assertRaises(RuntimeError):
+                Cropper.compute_bounds("cloud.laz")
+
+    @unittest.skipUnless(hasattr(ogr, 'Geometry'), "GDAL not available")
+    def test_create_bounds_gpkg(self):
+        PipelineMock.points = synthetic_points(10000)
+        pdal = mock.MagicMock(Pipeline=PipelineMock)
+        pointcloud = "tests/assets/output/cloud.laz"
+        with open(pointcloud, 'w') as f:
+            f.write("")
+
+        with mock.patch.dict(sys.modules, {'pdal': pdal}):
+            gpkg = Cropper("tests/assets/output", "cloud").create_bounds_gpkg(pointcloud, buffer_distance=2, decimation_step=1)
+
+        ds = ogr.Open(gpkg)
+        geom = ds.GetLayer().GetNextFeature().GetGeometryRef()
+        minx, maxx, miny, maxy = geom.GetEnvelope()
+        self.assertAlmostEqual(minx, 2, places=1)
+        self.assertAlmostEqual(maxx, 98, places=1)
+        self.assertAlmostEqual(miny, 2, places=1)
+        self.assertAlmostEqual(maxy, 48, places=1)
+
+if __name__ == '__main__':
+    unittest.main()
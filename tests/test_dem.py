@@ -0,0 +1,214 @@
+import os
+import time
+import shutil
+import subprocess
+import unittest
+import numpy as np
+import rasterio
+from rasterio.transform import Affine, from_origin
+
+from scipy import ndimage
+from opendm.dem import gapfill, euclidean
+
+NODATA = -9999
+
+def write_dem(path, arr):
+    profile = {
+        'driver': 'GTiff', 'dtype': 'float32', 'count': 1, 'nodata': NODATA,
+        'width': arr.shape[1], 'height': arr.shape[0],
+        'transform': from_origin(500000, 4000000, 0.1, 0.1), 'crs': 'EPSG:32615',
+        'tiled': True, 'blockxsize': 256, 'blockysize': 256
+    }
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(arr.astype(np.float32), 1)
+
+def synthetic_dem(size, seed=0):
+    """Smooth surface with gaps and some spikes"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size]
+    arr = (100 + 0.01 * x + 0.02 * y + 2 * np.sin(x / 50.0)).astype(np.float32)
+    arr[rng.random(arr.shape) < 0.01] += 50
+
+    for cx, cy in rng.integers(0, size, (10, 2)):
+        arr[(x - cx) ** 2 + (y - cy) ** 2 < (size / 30) ** 2] = NODATA
+    return arr
+
+def read_dem(path):
+    with rasterio.open(path) as src:
+        return src.read(1)
+
+class TestDem(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+    def test_fill_pyramid(self):
+        arr = np.full((64, 64), 10, dtype=np.float32)
+        arr[20:40, 20:40] = np.nan
+        filled = gapfill.fill_pyramid(arr.copy())
+        self.assertFalse(np.isnan(filled).any())
+        np.testing.assert_allclose(filled, 10, rtol=1e-6)
+
+        # Gaps farther than max_distance stay unfilled
+        arr = np.full((256, 256), np.nan, dtype=np.float32)
+        arr[0, 0] = 1
+        filled = gapfill.fill_pyramid(arr, max_distance=8)
+        self.assertTrue(np.isnan(filled[-1, -1]))
+        self.assertEqual(filled[1, 1], 1)
+
+    def test_median_filter(self):
+        arr = np.full((32, 32), 5, dtype=np.float32)
+        arr[10, 10] = 100
+        arr[0:5, 0:5] = np.nan
+        result = gapfill.median_filter(arr, 4)
+        self.assertEqual(result[10, 10], 5)
+        self.assertTrue(np.isnan(result[0:5, 0:5]).all())
+        self.assertTrue((result[~np.isnan(result)] == 5).all())
+
+    def test_fill_and_smooth(self):
+        arr = synthetic_dem(1000)
+        write_dem("tests/assets/output/dem.tif", arr)
+
+        # Gap fill only: valid pixels are unchanged, gaps are filled
+        gapfill.fill_and_smooth("tests/assets/output/dem.tif", "tests/assets/output/filled.tif", smoothing_radius=None, max_workers=2, block_size=256)
+        filled = read_dem("tests/assets/output/filled.tif")
+        valid = arr != NODATA
+        np.testing.assert_array_equal(filled[valid], arr[valid])
+        self.assertTrue((filled != NODATA).all())
+
+        # Smoothing only: spikes are removed, gaps stay
+        gapfill.fill_and_smooth("tests/assets/output/dem.tif", "tests/assets/output/smooth.tif", gapfill=False, max_workers=2, block_size=256)
+        smooth = read_dem("tests/assets/output/smooth.tif")
+        np.testing.assert_array_equal(smooth == NODATA, ~valid)
+        self.assertTrue(smooth[valid].max() < arr[valid].max() - 40)
+
+        # No seams at block edges next to gaps
+        noise = np.random.default_rng(1).random((128, 128)).astype(np.float32)
+        noise[:, 64:68] = NODATA
+        write_dem("tests/assets/output/noise.tif", noise)
+        gapfill.fill_and_smooth("tests/assets/output/noise.tif", "tests/assets/output/noise_smooth.tif", gapfill=False, block_size=64)
+        expected = gapfill.median_filter(np.where(noise != NODATA, noise, np.nan), 4)
+        expected[np.isnan(expected)] = NODATA
+        np.testing.assert_array_equal(read_dem("tests/assets/output/noise_smooth.tif"), expected)
+
+        # Block size and workers do not change the result
+        gapfill.fill_and_smooth("tests/assets/output/dem.tif", "tests/assets/output/both_a.tif", max_workers=1, block_size=512)
+        gapfill.fill_and_smooth("tests/assets/output/dem.tif", "tests/assets/output/both_b.tif", max_workers=4, block_size=128)
+        np.testing.assert_array_equal(read_dem("tests/assets/output/both_a.tif"), read_dem("tests/assets/output/both_b.tif"))
+
+    def test_distance_map(self):
+        arr = synthetic_dem(1500)
+        write_dem("tests/assets/output/dem.tif", arr)
+
+        # Same as the capped distance transform of the whole raster, regardless of blocks
+        expected = np.minimum(ndimage.distance_transform_edt(arr != NODATA), 50)
+        for block_size, workers in [(1500, 1), (256, 4), (100, 2)]:
+            euclidean.compute_distance_map("tests/assets/output/dem.tif", "tests/assets/output/emap.tif", max_distance=50,
+                                            max_workers=workers, block_size=block_size)
+            np.testing.assert_allclose(read_dem("tests/assets/output/emap.tif"), expected, rtol=1e-6)
+
+        # Without a cap
+        euclidean.compute_distance_map("tests/assets/output/dem.tif", "tests/assets/output/emap.tif", max_distance=0, block_size=256)
+        np.testing.assert_allclose(read_dem("tests/assets/output/emap.tif"), ndimage.distance_transform_edt(arr != NODATA), rtol=1e-6)
+
+        # No nodata
+        write_dem("tests/assets/output/dem.tif", np.ones((100, 100)))
+        euclidean.compute_distance_map("tests/assets/output/dem.tif", "tests/assets/output/emap.tif", max_distance=50)
+        self.assertTrue((read_dem("tests/assets/output/emap.tif") == 50).all())
+
+    def test_merge(self):
+        from opendm.dem.merge import euclidean_merge_dems
+
+        # Two DEMs overlapping by 50 pixels
+        a, b = np.full((100, 100), 10), np.full((100, 100), 20)
+        for arr in [a, b]:
+            arr[[0, -1], :] = NODATA
+            arr[:, [0, -1]] = NODATA
+        write_dem("tests/assets/output/a.tif", a)
+        with rasterio.open("tests/assets/output/a.tif") as src:
+            profile = src.profile
+        with rasterio.open("tests/assets/output/b.tif", 'w', **dict(profile, transform=profile['transform'] * Affine.translation(50, 0))) as dst:
+            dst.write(b.astype(np.float32), 1)
+
+        def merge(max_blend_distance):
+            for f in os.listdir("tests/assets/output"):
+                if "euclideand" in f:
+                    os.remove(os.path.join("tests/assets/output", f))
+            output = "tests/assets/output/merged_%s.tif" % max_blend_distance
+            euclidean_merge_dems(["tests/assets/output/a.tif", "tests/assets/output/b.tif"], output, max_blend_distance=max_blend_distance)
+            return read_dem(output)[50, 50:100]
+
+        # Blended over the whole overlap
+        row = merge(0)
+        self.assertTrue((np.diff(row[1:-1]) > 0).all())
+
+        # Blended only near the edges of the overlap
+        row = merge(5)
+        np.testing.assert_allclose(row[10:40], 15)
+
+    @unittest.skipUnless(os.environ.get('ODM_BENCHMARK'), "Set ODM_BENCHMARK=1 to run benchmarks")
+    def test_distance_map_benchmark(self):
+        dem = "tests/assets/output/dem.tif"
+        write_dem(dem, synthetic_dem(8192))
+
+        start = time.time()
+        euclidean.compute_distance_map(dem, "tests/assets/output/emap.tif", max_workers=4)
+        elapsed = time.time() - start
+        self.assertTrue(elapsed < 120, "Euclidean distance map (8192x8192, max distance %s): %.2fs" % (euclidean.MAX_BLEND_DISTANCE, elapsed))
+
+    @unittest.skipUnless(os.environ.get('ODM_BENCHMARK'), "Set ODM_BENCHMARK=1 to run benchmarks")
+    def test_benchmark(self):
+        dem = "tests/assets/output/dem.tif"
+        write_dem(dem, synthetic_dem(4096))
+        outdir = "tests/assets/output"
+
+        start = time.time()
+        gapfill.fill_and_smooth(dem, os.path.join(outdir, "new.tif"), max_workers=4)
+        new_time = time.time() - start
+        new_bytes = os.path.getsize(os.path.join(outdir, "new.tif"))
+
+        # Previous gdal_translate / gdal_fillnodata / gdalbuildvrt / fastrasterfilter chain
+        if not all([shutil.which(p) for p in ['gdal_translate', 'gdal_fillnodata.py', 'gdalbuildvrt', 'fastrasterfilter']]):
+            self.skipTest("GDAL tools or fastrasterfilter not found, cannot compare with the previous chain")
+
+        small, small_filled, merged, old = [os.path.join(outdir, f) for f in ["small.tif", "small_filled.tif", "merged.vrt", "old.tif"]]
+        start = time.time()
+        subprocess.run(['gdal_translate', '-co', 'COMPRESS=DEFLATE', '-outsize', '10%', '0', dem, small], check=True, stdout=subprocess.DEVNULL)
+        subprocess.run(['gdal_fillnodata.py', '-co', 'COMPRESS=DEFLATE', '-b', '1', '-of', 'GTiff', small, small_filled], check=True, stdout=subprocess.DEVNULL)
+        subprocess.run(['gdalbuildvrt', '-resolution', 'highest', '-r', 'bilinear', merged, small_filled, dem], check=True, stdout=subprocess.DEVNULL)
+        subprocess.run(['fastrasterfilter', merged, '--output', old, '--window-size', '512', '--radius', '4',
+                        '--co', 'TILED=YES', '--co', 'COMPRESS=DEFLATE'], check=True, stdout=subprocess.DEVNULL, env=dict(os.environ, OMP_NUM_THREADS='4'))
+        old_time = time.time() - start
+        old_bytes = sum([os.path.getsize(p) for p in [small, small_filled, old]])
+
+        summary = "DEM gap fill + smoothing (4096x4096): %.2fs, %.1f MB written (previous chain: %.2fs, %.1f MB written)" % \
+                    (new_time, new_bytes / 1024 / 1024, old_time, old_bytes / 1024 / 1024)
+        self.assertTrue(new_time < old_time, summary)
+        self.assertTrue(new_bytes < old_bytes, summary)
+
+    @unittest.skipUnless(os.environ.get('ODM_BENCHMARK'), "Set ODM_BENCHMARK=1 to run benchmarks")
+    def test_median_filter_benchmark(self):
+        # Smoothing only, on a realistic DEM size (e.g. ~1 km² at 12 cm/px)
+        dem = "tests/assets/output/dem.tif"
+        write_dem(dem, synthetic_dem(8192))
+        outdir = "tests/assets/output"
+
+        start = time.time()
+        gapfill.fill_and_smooth(dem, os.path.join(outdir, "new.tif"), gapfill=False, max_workers=4)
+        new_time = time.time() - start
+
+        # Previous median smoothing
+        if not shutil.which('fastrasterfilter'):
+            self.skipTest("fastrasterfilter not found, cannot compare with the previous median smoothing (median_filter: %.2fs)" % new_time)
+
+        start = time.time()
+        subprocess.run(['fastrasterfilter', dem, '--output', os.path.join(outdir, "old.tif"), '--window-size', '512', '--radius', '4',
+                        '--co', 'TILED=YES', '--co', 'COMPRESS=DEFLATE'], check=True, stdout=subprocess.DEVNULL, env=dict(os.environ, OMP_NUM_THREADS='4'))
+        old_time = time.time() - start
+
+        summary = "DEM median smoothing (8192x8192, radius 4): %.2fs (fastrasterfilter: %.2fs)" % (new_time, old_time)
+        self.assertTrue(new_time < old_time, summary)
+
+if __name__ == '__main__':
+    unittest.main()
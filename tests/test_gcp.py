@@ -65,5 +65,18 @@ class TestGcp(unittest.TestCase):
         self.assertTrue(copy.exists())
         self.assertEqual(copy.get_entry(0).extras, '')
 
+    def test_utm_filtered_copy(self):
+        gcp = GCPFile("tests/assets/gcp_latlon_valid.txt")
+        self.assertTrue("DJI_0002.JPG" in gcp.index())
+        self.assertFalse("DJI_0001.JPG" in gcp.index())
+
+        rejected = []
+        copy = GCPFile(gcp.create_utm_copy("tests/assets/output/gcp_utm_filtered.txt", filenames=["DJI_0002.JPG"], rejected_entries=rejected))
+        self.assertEqual(copy.entries_count(), 1)
+        self.assertEqual(copy.get_entry(0).filename, "DJI_0002.JPG")
+        self.assertEqual(copy.get_entry(0).x, 609865.7077054137)
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(rejected[0].filename, "DJI_0003.JPG")
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,102 @@
+import os
+import time
+import shutil
+import unittest
+import numpy as np
+
+def has_pdal():
+    try:
+        import pdal
+    except ImportError:
+        return False
+    return shutil.which('pdal') is not None
+
+def write_ply(path, xyz, views):
+    vertices = np.zeros(len(xyz), dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'),
+                                         ('red', 'u1'), ('green', 'u1'), ('blue', 'u1'), ('views', 'u1')])
+    vertices['x'], vertices['y'], vertices['z'] = xyz.T
+    vertices['views'] = views
+
+    with open(path, 'wb') as f:
+        f.write(("ply\nformat binary_little_endian 1.0\nelement vertex %s\n"
+                 "property float x\nproperty float y\nproperty float z\n"
+                 "property uchar red\nproperty uchar green\nproperty uchar blue\n"
+                 "property uchar views\nend_header\n" % len(xyz)).encode())
+        f.write(vertices.tobytes())
+
+def read_las(path):
+    import pdal
+
+    p = pdal.Reader.las(path).pipeline()
+    p.execute()
+    return p.arrays[0]
+
+@unittest.skipUnless(has_pdal(), "PDAL not available")
+class TestGeoreference(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+    def test_georeference(self):
+        from opendm import point_cloud, pcinfo
+
+        rng = np.random.default_rng(0)
+        xyz = np.column_stack((rng.uniform(-500, 500, 10000), rng.uniform(-500, 500, 10000), rng.uniform(0, 50, 10000))).astype(np.float32)
+        views = rng.integers(2, 20, 10000)
+        write_ply("tests/assets/output/cloud.ply", xyz, views)
+
+        offset = (500000, 4000000)
+        angle = np.radians(1)
+        a_matrix = np.array([[np.cos(angle), -np.sin(angle), 0, 2.5],
+                             [np.sin(angle), np.cos(angle), 0, -1.5],
+                             [0, 0, 1, 0.75],
+                             [0, 0, 0, 1]])
+
+        point_cloud.georeference("tests/assets/output/cloud.ply", "tests/assets/output/cloud.laz", 0.001, offset,
+                                 "+proj=utm +zone=15 +datum=WGS84 +units=m +no_defs", a_matrix)
+        arr = read_las("tests/assets/output/cloud.laz")
+
+        # Offset, then alignment
+        expected = np.column_stack((xyz.astype(np.float64) + [offset[0], offset[1], 0], np.ones(len(xyz))))
+        expected = np.dot(a_matrix, expected.T).T
+        np.testing.assert_allclose(arr['X'], expected[:,0], atol=0.001)
+        np.testing.assert_allclose(arr['Y'], expected[:,1], atol=0.001)
+        np.testing.assert_allclose(arr['Z'], expected[:,2], atol=0.001)
+        np.testing.assert_array_equal(arr['UserData'], views)
+        self.assertIsNotNone(pcinfo.get_srs("tests/assets/output/cloud.laz"))
+
+        # Not georeferenced
+        point_cloud.georeference("tests/assets/output/cloud.ply", "tests/assets/output/local.las")
+        arr = read_las("tests/assets/output/local.las")
+        np.testing.assert_allclose(arr['X'], xyz[:,0], atol=0.001)
+
+    @unittest.skipUnless(os.environ.get('ODM_BENCHMARK'), "Set ODM_BENCHMARK=1 to run benchmarks")
+    def test_benchmark(self):
+        from opendm import point_cloud
+        from opendm.dem.pdal import run_pipeline
+
+        rng = np.random.default_rng(0)
+        count = 5000000
+        xyz = np.column_stack((rng.uniform(-500, 500, count), rng.uniform(-500, 500, count), rng.uniform(0, 50, count))).astype(np.float32)
+        write_ply("tests/assets/output/cloud.ply", xyz, rng.integers(2, 20, count))
+        offset = (500000, 4000000)
+        a_matrix = np.identity(4)
+        a_matrix[0][3] = 1.0
+
+        start = time.time()
+        point_cloud.georeference("tests/assets/output/cloud.ply", "tests/assets/output/single.laz", 0.001, offset, a_matrix=a_matrix)
+        single_time = time.time() - start
+
+        # Previous chain: translate with offset, then transform the LAZ with the alignment matrix
+        start = time.time()
+        point_cloud.georeference("tests/assets/output/cloud.ply", "tests/assets/output/unaligned.laz", 0.001, offset)
+        run_pipeline({'pipeline': ["tests/assets/output/unaligned.laz", {
+            'type': 'filters.transformation',
+            'matrix': " ".join(map(str, a_matrix.flatten()))
+        }, "tests/assets/output/aligned.laz"]})
+        old_time = time.time() - start
+        self.assertTrue(single_time < old_time, "Georeferencing + alignment (5M points): single pass %.2fs, previous chain %.2fs" % (single_time, old_time))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from opendm import system
+from opendm.governor import MemoryGovernor, ToolModel, is_oom_error
+
+# Allocates (and touches) the given number of megabytes, then waits a bit
+HUNGRY_CHILD = '"%s" -c "import time; b = b\'x\' * (%s * 1024 * 1024); time.sleep(1.5)"'
+
+class TestGovernor(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.history_file = os.path.join(self.tmpdir, "history", "memory_history.json")
+        self.models = {'hungry': ToolModel(10, 1, 10)}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def governor(self, budget_mb=1000):
+        g = MemoryGovernor(self.history_file, models=self.models, safety_factor=1.0)
+        g.budget_mb = lambda: budget_mb
+        return g
+
+    def test_plan(self):
+        g = self.governor()
+
+        # 10 + 100 + 10 * 16 fits
+        plan = g.plan('hungry', 100, 16)
+        self.assertEqual(plan.threads, 16)
+        self.assertTrue(plan.fits)
+
+        # 10 + 900 + 10 * t <= 1000 --> t = 9
+        plan = g.plan('hungry', 900, 16)
+        self.assertEqual(plan.threads, 9)
+        self.assertTrue(plan.fits)
+
+        # Nothing fits, tile
+        plan = g.plan('hungry', 2000, 16)
+        self.assertEqual(plan.threads, 1)
+        self.assertFalse(plan.fits)
+
+        # Tiling removes the units term, threads are planned from the per-thread term
+        # 10 + 10 * 10 * t <= 1000 --> t = 9
+        plan = g.plan('hungry', 0, 16, thread_units=10)
+        self.assertEqual(plan.threads, 9)
+        self.assertTrue(plan.fits)
+
+    def test_history(self):
+        g = self.governor()
+
+        # Tool used twice the memory we estimated
+        g.record('hungry', 100, 2, 260)
+        self.assertAlmostEqual(g.correction('hungry'), 2.0)
+        self.assertEqual(g.plan('hungry', 450, 16).threads, 4)
+
+        # History is per machine (persisted)
+        g = self.governor()
+        self.assertAlmostEqual(g.correction('hungry'), 2.0)
+
+    def test_run(self):
+        if not sys.platform.startswith('linux'):
+            self.skipTest("Linux only")
+
+        g = self.governor()
+        g.run('hungry', HUNGRY_CHILD % (sys.executable, 200), 1, 1, quiet=True)
+
+        peak = g.history['hungry'][-1]['peakMb']
+        self.assertTrue(peak >= 200)
+        self.assertFalse(g.history['hungry'][-1]['oom'])
+
+        # The next estimate accounts for the observed peak
+        self.assertTrue(g.estimate('hungry', 1, 1) >= 200)
+
+        # Processes killed by a signal report shell-like error codes
+        with self.assertRaises(system.SubprocessException) as cm:
+            g.run('hungry', '"%s" -c "import os, signal; os.kill(os.getpid(), signal.SIGKILL)"' % sys.executable, 1, 1, quiet=True)
+        self.assertEqual(cm.exception.errorCode, 137)
+        self.assertTrue(is_oom_error(cm.exception.errorCode))
+        self.assertTrue(g.history['hungry'][-1]['oom'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import time
+import shutil
+import unittest
+import numpy as np
+
+from opendm import location
+
+class PhotoMock:
+    def __init__(self, filename, longitude, latitude, altitude):
+        self.filename = filename
+        self.longitude = longitude
+        self.latitude = latitude
+        self.altitude = altitude
+
+def synthetic_photos(count, lon=-91.99, lat=46.84, seed=0):
+    rng = np.random.default_rng(seed)
+    lons = lon + rng.uniform(-0.01, 0.01, count)
+    lats = lat + rng.uniform(-0.01, 0.01, count)
+    alts = rng.uniform(100, 200, count)
+    return [PhotoMock("IMG_%06d.JPG" % i, float(lons[i]), float(lats[i]), float(alts[i])) for i in range(count)]
+
+def read_coords(coords_file):
+    with open(coords_file) as f:
+        header = f.readline().strip()
+        dx, dy = map(int, f.readline().split())
+    return header, (dx, dy), np.loadtxt(coords_file, skiprows=2, ndmin=2)
+
+class TestLocation(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+    def test_convert_to_utm(self):
+        # Reference values computed with Proj(proj='utm', zone=15, ellps='WGS84')
+        np.testing.assert_allclose(location.convert_to_utm(-91.99, 46.84, 150.0, 15, 'N'),
+                                   [577014.505088, 5187879.312553, 150.0], atol=1e-5)
+        np.testing.assert_allclose(location.convert_to_utm(106.8, -6.2, 0, 48, 'S'),
+                                   [699163.390565, 9314348.961580, 0], atol=1e-5)
+
+    def test_extract_utm_coords(self):
+        photos = [PhotoMock("IMG_0001.JPG", -91.99, 46.84, 150.0),
+                  PhotoMock("IMG_0002.JPG", -91.995, 46.845, None),
+                  PhotoMock("IMG_0003.JPG", -91.981, 46.832, 120.5),
+                  PhotoMock("IMG_0004.JPG", -91.98, None, 100.0)]
+        coords_file = "tests/assets/output/coords.txt"
+        location.extract_utm_coords(photos, None, coords_file)
+
+        header, (dx, dy), coords = read_coords(coords_file)
+        self.assertEqual(header, "WGS84 UTM 15N")
+        self.assertEqual((dx, dy), (577117, 5187769))
+
+        # Reference values computed with Proj(proj='utm', zone=15, ellps='WGS84')
+        expected = np.array([[577014.505088, 5187879.312553, 150.0],
+                             [576626.137613, 5188430.032896, 0.0],
+                             [577712.301709, 5186999.200562, 120.5]])
+        np.testing.assert_allclose(coords[:,0] + dx, expected[:,0], atol=1e-5)
+        np.testing.assert_allclose(coords[:,1] + dy, expected[:,1], atol=1e-5)
+        np.testing.assert_allclose(coords[:,2], expected[:,2])
+
+        self.assertRaises(Exception, location.extract_utm_coords, [], None, coords_file)
+        self.assertRaises(Exception, location.extract_utm_coords, [PhotoMock("a.JPG", None, None, None)], None, coords_file)
+
+    def test_southern_hemisphere(self):
+        coords_file = "tests/assets/output/coords_south.txt"
+        location.extract_utm_coords([PhotoMock("IMG_0001.JPG", 106.8, -6.2, 10.0)], None, coords_file)
+        header, (dx, dy), coords = read_coords(coords_file)
+        self.assertEqual(header, "WGS84 UTM 48S")
+        np.testing.assert_allclose(coords[0] + [dx, dy, 0], [699163.390565, 9314348.961580, 10.0], atol=1e-5)
+
+    @unittest.skipUnless(os.environ.get('ODM_BENCHMARK'), "Set ODM_BENCHMARK=1 to run benchmarks")
+    def test_benchmark(self):
+        photos = synthetic_photos(100000)
+        coords_file = "tests/assets/output/coords_100k.txt"
+        location.extract_utm_coords(photos, None, coords_file)
+        _, _, coords = read_coords(coords_file)
+        self.assertEqual(len(coords), len(photos))
+
+        # Conversion of all photos at once
+        start = time.time()
+        lon, lat, alt, valid = location.photo_coords(photos)
+        location.utm_transformer(15, 'N').transform(lon, lat)
+        vectorized = time.time() - start
+
+        # Per-photo conversion, sampled and extrapolated
+        sample = photos[:1000]
+        start = time.time()
+        for p in sample:
+            location.convert_to_utm(p.longitude, p.latitude, p.altitude, 15, 'N')
+        per_photo = (time.time() - start) * len(photos) / len(sample)
+
+        self.assertTrue(vectorized < per_photo, "Vectorized conversion: %.2fs, per-photo conversion: %.2fs" % (vectorized, per_photo))
+
+if __name__ == '__main__':
+    unittest.main()
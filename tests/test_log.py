@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import threading
+import subprocess
+import unittest
+from opendm import log
+
+class BlockingStream:
+    """A stream whose writes wait until it's released"""
+    def __init__(self):
+        self.data = []
+        self.released = threading.Event()
+
+    def write(self, data):
+        self.released.wait()
+        self.data.append(data)
+
+    def flush(self):
+        pass
+
+class TestLog(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+    def test_async_writer(self):
+        stream = BlockingStream()
+        writer = log.AsyncWriter(lambda: stream, max_pending=10)
+
+        # The writer thread holds one batch while the stream blocks,
+        # then writes wait once max_pending writes are queued
+        t = threading.Thread(target=lambda: [writer.write("%s\n" % i) for i in range(30)], daemon=True)
+        t.start()
+        t.join(timeout=0.2)
+        self.assertTrue(t.is_alive())
+        self.assertEqual(writer.queue.qsize(), 10)
+
+        self.assertFalse(writer.flush(timeout=0.1))
+
+        stream.released.set()
+        t.join(timeout=5)
+        self.assertFalse(t.is_alive())
+        self.assertTrue(writer.flush(timeout=5))
+        writer.close()
+
+        # All writes, in order
+        self.assertEqual("".join(stream.data), "".join(["%s\n" % i for i in range(30)]))
+
+        # Closed writers write synchronously
+        writer.write("sync\n")
+        self.assertEqual(stream.data[-1], "sync\n")
+        self.assertTrue(writer.flush(timeout=0))
+
+    def test_json_output(self):
+        json_file = "tests/assets/output/log.json"
+        logger = log.ODMLogger()
+        logger.init_json_output([json_file, "tests/assets/output/log_copy.json"], argparse.Namespace(name="test", max_concurrency=4))
+
+        logger.log_json_stage_run("dataset", logger.start_time)
+        logger.info("Hello")
+        logger.log_json_process("echo hello", 0, ["hello"], {'elapsed': 0.1})
+        logger.log_json_success()
+
+        # Events are written to log.jsonl before close()
+        logger.flush(timeout=5)
+        with open("tests/assets/output/log.jsonl") as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual([e['event'] for e in events], ['start', 'stageStart', 'message', 'process', 'success'])
+        self.assertEqual(events[2]['message'], "Hello")
+
+        logger.close()
+        with open(json_file) as f:
+            j = json.loads(f.read())
+        self.assertTrue(j['success'])
+        self.assertEqual(j['stages'][0]['messages'], [{'message': 'Hello', 'type': 'info'}])
+        self.assertEqual(j['processes'][0]['command'], "echo hello")
+        self.assertTrue(os.path.isfile("tests/assets/output/log_copy.json"))
+
+    def test_json_processes(self):
+        max_processes = log.MAX_PROCESSES
+        try:
+            log.MAX_PROCESSES = 5
+            logger = log.ODMLogger()
+            logger.init_json_output(["tests/assets/output/log.json"], argparse.Namespace())
+            for i in range(20):
+                logger.log_json_process("echo %s" % i, 0)
+            logger.close()
+        finally:
+            log.MAX_PROCESSES = max_processes
+
+        # Only the most recent processes are kept in log.json, all of them are in log.jsonl
+        with open("tests/assets/output/log.json") as f:
+            j = json.loads(f.read())
+        self.assertEqual([p['command'] for p in j['processes']], ["echo %s" % i for i in range(15, 20)])
+        with open("tests/assets/output/log.jsonl") as f:
+            self.assertEqual(len([line for line in f if '"process"' in line]), 20)
+
+    @unittest.skipIf(sys.platform == 'win32', "POSIX only")
+    def test_exit_gracefully(self):
+        # Pending output is written before exiting
+        script = "; ".join([
+            "import argparse",
+            "from opendm import log, system",
+            "log.logger.init_json_output(['tests/assets/output/log.json'], argparse.Namespace())",
+            "log.logger.log_json_stage_run('dataset', log.logger.start_time)",
+            "[log.ODM_INFO('line %s' % i) for i in range(5000)]",
+            "system.exit_gracefully()",
+        ])
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        p = subprocess.run([sys.executable, '-c', script], cwd=root, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                           universal_newlines=True, timeout=60)
+        self.assertEqual(p.returncode, 1)
+        self.assertTrue("line 4999" in p.stdout)
+        self.assertTrue("Caught TERM/INT signal" in p.stdout)
+
+        with open("tests/assets/output/log.jsonl") as f:
+            events = [json.loads(line) for line in f]
+        self.assertEqual(events[-1]['message'], "Caught TERM/INT signal, attempting to exit gracefully...")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import shutil
+import argparse
+import unittest
+from opendm import manifest
+from opendm.manifest import StageManifest
+
+OUTPUT = "tests/assets/output"
+
+class TreeMock:
+    def __init__(self, root_path):
+        self.root_path = os.path.abspath(root_path)
+        self.odm_georeferencing_gcp = os.path.join(root_path, "gcp_list.txt")
+        self.odm_align_file = None
+        self.odm_georeferencing_model_laz = os.path.join(root_path, "odm_georeferenced_model.laz")
+        self.input_images = os.path.join(root_path, "images")
+        self.odm_geo_file = None
+        self.dataset_list = os.path.join(root_path, "img_list.txt")
+        self.odm_georeferencing = root_path
+        self.odm_georeferencing_coords = os.path.join(root_path, "coords.txt")
+        self.odm_georeferencing_model_txt_geo = os.path.join(root_path, "odm_georeferencing_model_geo.txt")
+        self.odm_georeferencing_gcp_utm = os.path.join(root_path, "gcp_list_utm.txt")
+        self.odm_georeferencing_proj = "proj.txt"
+        self.opensfm = os.path.join(root_path, "opensfm")
+        self.opensfm_reconstruction = os.path.join(self.opensfm, "reconstruction.json")
+
+    def path(self, *args):
+        return os.path.join(self.root_path, *args)
+
+class StageMock:
+    def __init__(self, name, args, dependencies=[]):
+        self.name = name
+        self.args = args
+        self.dependencies = dependencies
+
+    def get_dependencies(self):
+        return self.dependencies
+
+rerun_stages = {
+    'camera_lens': 'dataset',
+    'crop': 'odm_georeferencing',
+    'dem_resolution': 'odm_dem',
+    'boundary': 'odm_filterpoints',
+    'max_concurrency': None,
+}
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists(OUTPUT):
+            shutil.rmtree(OUTPUT)
+        os.makedirs(OUTPUT)
+        self.args = argparse.Namespace(camera_lens='auto', crop=3, dem_resolution=5, boundary=None, max_concurrency=4)
+        self.tree = TreeMock(OUTPUT)
+
+    def create_manifest(self):
+        return StageManifest(os.path.join(OUTPUT, "manifest.json"), self.tree, self.args, rerun_stages)
+
+    def run_stage(self, m, stage, read=[]):
+        args = m.track_options(stage)
+        for opt in read:
+            getattr(args, opt)
+        m.record(stage)
+
+    def test_options(self):
+        m = self.create_manifest()
+        stage = StageMock('odm_georeferencing', self.args)
+
+        # Never recorded
+        self.assertIsNone(m.is_stale(stage))
+
+        # Options read while running are tracked along with the mapped ones,
+        # options that don't affect outputs are not
+        self.run_stage(m, stage, read=['boundary', 'max_concurrency'])
+        self.assertEqual(m.data['stages']['odm_georeferencing']['options'], {'boundary': None, 'crop': 3})
+        self.assertIsNone(m.is_stale(stage))
+
+        self.args.max_concurrency = 8
+        self.args.dem_resolution = 10
+        self.assertIsNone(m.is_stale(stage))
+
+        self.args.boundary = {"type": "Polygon"}
+        self.assertEqual(m.is_stale(stage), "changed options: boundary")
+
+        # Manifest is saved
+        self.assertEqual(self.create_manifest().is_stale(stage), "changed options: boundary")
+
+        # Options read on previous runs are kept
+        self.run_stage(m, stage)
+        self.assertEqual(list(m.data['stages']['odm_georeferencing']['options'].keys()), ['boundary', 'crop'])
+
+    def test_recorder(self):
+        recorder = manifest.OptionRecorder(self.args)
+        self.assertEqual(recorder.crop, 3)
+        recorder.crop = 4
+        self.assertEqual(self.args.crop, 4)
+        self.assertEqual(recorder.read_options, {'crop'})
+
+        # vars() can read any option
+        self.assertEqual(vars(recorder), vars(self.args))
+        self.assertEqual(recorder.read_options, set(vars(self.args).keys()))
+
+    def test_inputs(self):
+        m = self.create_manifest()
+        stage = StageMock('odm_georeferencing', self.args)
+
+        gcp = self.tree.odm_georeferencing_gcp
+        with open(gcp, 'w') as f:
+            f.write("EPSG:4326\n")
+        self.run_stage(m, stage)
+        self.assertIsNone(m.is_stale(stage))
+
+        # Same size and modification time, hash is cached
+        m.data['files']['gcp_list.txt']['hash'] = 'cached'
+        self.assertEqual(m.hash_file(gcp), 'cached')
+
+        m = self.create_manifest()
+        self.run_stage(m, stage)
+        with open(gcp, 'w') as f:
+            f.write("EPSG:4327\n")
+        self.assertEqual(m.is_stale(stage), "changed inputs: gcp_list.txt")
+
+        # Removed inputs are not changes
+        os.remove(gcp)
+        self.assertIsNone(m.is_stale(stage))
+
+    def test_pass_through(self):
+        m = self.create_manifest()
+        dataset = StageMock('dataset', self.args)
+        split = StageMock('split', self.args, [dataset])
+        merge = StageMock('merge', self.args, [split])
+        opensfm = StageMock('opensfm', self.args, [merge])
+
+        images_json = self.tree.path('images.json')
+        with open(images_json, 'w') as f:
+            f.write('[{"camera_projection": "perspective"}]')
+        for s in [dataset, split, merge, opensfm]:
+            self.run_stage(m, s)
+        self.assertEqual(list(m.data['stages']['opensfm']['inputs'].keys())[0], 'images.json')
+        self.assertIsNone(m.is_stale(opensfm))
+
+        # A dataset option changes the images database,
+        # which is consumed by opensfm through split and merge
+        self.args.camera_lens = 'fisheye'
+        self.assertEqual(m.is_stale(dataset), "changed options: camera_lens")
+        with open(images_json, 'w') as f:
+            f.write('[{"camera_projection": "fisheye"}]')
+        self.run_stage(m, dataset)
+        self.assertEqual(m.is_stale(opensfm), "changed inputs: images.json")
+
+    def test_large_files(self):
+        m = self.create_manifest()
+        path = os.path.join(OUTPUT, "large.bin")
+        with open(path, 'wb') as f:
+            f.write(b"\0" * 1024)
+
+        max_size = manifest.MAX_CONTENT_HASH_SIZE
+        try:
+            manifest.MAX_CONTENT_HASH_SIZE = 1000
+            st = os.stat(path)
+            self.assertEqual(m.hash_file(path), "%s:%s" % (st.st_size, st.st_mtime_ns))
+            self.assertEqual(m.data['files'], {})
+        finally:
+            manifest.MAX_CONTENT_HASH_SIZE = max_size
+
+        self.assertEqual(m.hash_file(path), manifest.file_hash(path))
+        self.assertIsNone(m.hash_file(os.path.join(OUTPUT, "missing.bin")))
+
+if __name__ == '__main__':
+    unittest.main()
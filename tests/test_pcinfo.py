@@ -0,0 +1,173 @@
+import os
+import time
+import shutil
+import struct
+import unittest
+from unittest import mock
+import numpy as np
+
+from opendm import pcinfo
+
+WKT = 'PROJCS["WGS 84 / UTM zone 15N",GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],' \
+      'PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]],PROJECTION["Transverse_Mercator"],' \
+      'PARAMETER["latitude_of_origin",0],PARAMETER["central_meridian",-93],PARAMETER["scale_factor",0.9996],' \
+      'PARAMETER["false_easting",500000],PARAMETER["false_northing",0],UNIT["metre",1],AUTHORITY["EPSG","32615"]]'
+
+def vlr(user_id, record_id, payload):
+    return struct.pack('<H16sHH32s', 0, user_id.encode(), record_id, len(payload), b'') + payload
+
+def write_las(path, xyz, point_format=2, minor=2, vlrs=[], extra_bytes=0):
+    """Minimal uncompressed LAS file (points are left zeroed, except X, Y, Z)"""
+    header_size = 375 if minor >= 4 else 227
+    vlr_data = b''.join(vlrs)
+    record_length = pcinfo.LAS_RECORD_LENGTHS[point_format] + extra_bytes
+    scale = 0.001
+    offset = xyz.min(axis=0)
+
+    header = bytearray(header_size)
+    header[0:4] = b'LASF'
+    header[24] = 1
+    header[25] = minor
+    struct.pack_into('<HII', header, 94, header_size, header_size + len(vlr_data), len(vlrs))
+    struct.pack_into('<BHI', header, 104, point_format, record_length, len(xyz) if minor < 4 else 0)
+    struct.pack_into('<3d3d', header, 131, scale, scale, scale, *offset)
+    mins, maxs = xyz.min(axis=0), xyz.max(axis=0)
+    struct.pack_into('<6d', header, 179, maxs[0], mins[0], maxs[1], mins[1], maxs[2], mins[2])
+    if minor >= 4:
+        struct.pack_into('<Q', header, 247, len(xyz))
+
+    points = np.zeros((len(xyz), record_length), dtype=np.uint8)
+    points[:, 0:12] = np.round((xyz - offset) / scale).astype('<i4').view(np.uint8).reshape(len(xyz), 12)
+
+    with open(path, 'wb') as f:
+        f.write(bytes(header))
+        f.write(vlr_data)
+        f.write(points.tobytes())
+
+def write_ply(path, xyz, rgb, views):
+    vertices = np.zeros(len(xyz), dtype=[('x', '<f4'), ('y', '<f4'), ('z', '<f4'),
+                                         ('red', 'u1'), ('green', 'u1'), ('blue', 'u1'), ('views', 'u1')])
+    vertices['x'], vertices['y'], vertices['z'] = xyz.T
+    vertices['red'], vertices['green'], vertices['blue'] = rgb.T
+    vertices['views'] = views
+
+    with open(path, 'wb') as f:
+        f.write(("ply\nformat binary_little_endian 1.0\nelement vertex %s\n"
+                 "property float x\nproperty float y\nproperty float z\n"
+                 "property uchar red\nproperty uchar green\nproperty uchar blue\n"
+                 "property uchar views\nend_header\n" % len(xyz)).encode())
+        f.write(vertices.tobytes())
+
+def synthetic_points(count, seed=0):
+    rng = np.random.default_rng(seed)
+    xyz = np.column_stack((rng.uniform(500000, 501000, count), rng.uniform(4000000, 4001000, count), rng.normal(100, 10, count)))
+    return xyz.astype(np.float32).astype(np.float64), rng.integers(0, 256, (count, 3)), rng.integers(2, 10, count)
+
+class TestPcinfo(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+        pcinfo._cache.clear()
+
+    def test_las_header(self):
+        xyz, _, _ = synthetic_points(1000)
+        path = "tests/assets/output/cloud.las"
+        write_las(path, xyz, vlrs=[vlr('LASF_Projection', 2112, WKT.encode() + b'\0')])
+
+        header = pcinfo.get_header(path)
+        self.assertEqual(header['count'], 1000)
+        self.assertEqual(pcinfo.get_srs(path), WKT)
+        self.assertTrue(all([d in header['dimensions'] for d in ['X', 'Y', 'Z', 'Red', 'Green', 'Blue']]))
+        self.assertFalse('GpsTime' in header['dimensions'])
+
+        extent = pcinfo.get_extent(path)
+        self.assertEqual(extent['minx'], xyz[:,0].min())
+        self.assertEqual(extent['maxz'], xyz[:,2].max())
+
+        # LAS 1.4, GeoTIFF keys and extra bytes
+        path = "tests/assets/output/cloud14.las"
+        geokeys = struct.pack('<8H', 1, 1, 0, 1, 3072, 0, 1, 32615)
+        extra = bytearray(192)
+        extra[2] = 1
+        extra[4:4 + len(b'views')] = b'views'
+        write_las(path, xyz, point_format=7, minor=4, extra_bytes=1,
+                  vlrs=[vlr('LASF_Projection', 34735, geokeys), vlr('LASF_Spec', 4, bytes(extra))])
+
+        header = pcinfo.get_header(path)
+        self.assertEqual(header['count'], 1000)
+        self.assertEqual(header['srs'], 'EPSG:32615')
+        self.assertTrue(all([d in header['dimensions'] for d in ['GpsTime', 'Red', 'views']]))
+
+    def test_ply_stats(self):
+        xyz, rgb, views = synthetic_points(250000)
+        path = "tests/assets/output/cloud.ply"
+        write_ply(path, xyz, rgb, views)
+
+        header = pcinfo.get_header(path)
+        self.assertEqual(header['count'], 250000)
+        self.assertEqual(header['dimensions'], ['X', 'Y', 'Z', 'Red', 'Green', 'Blue', 'views'])
+        self.assertIsNone(header['srs'])
+
+        with mock.patch.object(pcinfo, 'CHUNK_SIZE', 100000):
+            stats = pcinfo.get_stats(path)
+        self.assertEqual(stats['count'], 250000)
+        z = pcinfo.get_dimension_stats(path, 'Z')
+        self.assertAlmostEqual(z['average'], xyz[:,2].mean(), places=6)
+        self.assertAlmostEqual(z['stddev'], xyz[:,2].std(ddof=1), places=6)
+        self.assertEqual(z['minimum'], xyz[:,2].min())
+        self.assertEqual(pcinfo.get_dimension_stats(path, 'Red')['maximum'], rgb[:,0].max())
+        self.assertIsNone(pcinfo.get_dimension_stats(path, 'Intensity'))
+
+        # PLY extents come from the statistics
+        self.assertEqual(pcinfo.get_extent(path), {'minx': xyz[:,0].min(), 'maxx': xyz[:,0].max(),
+                                                   'miny': xyz[:,1].min(), 'maxy': xyz[:,1].max(),
+                                                   'minz': xyz[:,2].min(), 'maxz': xyz[:,2].max()})
+
+    def test_cache(self):
+        xyz, rgb, views = synthetic_points(10000)
+        path = "tests/assets/output/cloud.ply"
+        write_ply(path, xyz, rgb, views)
+
+        with mock.patch.object(pcinfo, 'compute_stats', wraps=pcinfo.compute_stats) as compute:
+            pcinfo.get_stats(path)
+            pcinfo.get_extent(path)
+            self.assertEqual(compute.call_count, 1)
+
+            # Nothing is written next to the point cloud
+            self.assertEqual(os.listdir("tests/assets/output"), ["cloud.ply"])
+
+            # A new version of the file is scanned again
+            write_ply(path, xyz[:5000], rgb[:5000], views[:5000])
+            self.assertEqual(pcinfo.get_stats(path)['count'], 5000)
+            self.assertEqual(compute.call_count, 2)
+
+            # Including same-size rewrites with the same modification time
+            st = os.stat(path)
+            write_ply(path, xyz[:5000] + 1, rgb[:5000], views[:5000])
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            self.assertEqual(os.stat(path).st_size, st.st_size)
+            self.assertAlmostEqual(pcinfo.get_dimension_stats(path, 'Z')['average'], xyz[:5000,2].mean() + 1, places=6)
+            self.assertEqual(compute.call_count, 3)
+
+    @unittest.skipUnless(os.environ.get('ODM_BENCHMARK'), "Set ODM_BENCHMARK=1 to run benchmarks")
+    def test_benchmark(self):
+        xyz, rgb, views = synthetic_points(5000000)
+        path = "tests/assets/output/cloud.ply"
+        write_ply(path, xyz, rgb, views)
+
+        start = time.time()
+        pcinfo.get_stats(path)
+        scan_time = time.time() - start
+
+        start = time.time()
+        for i in range(1000):
+            pcinfo.get_extent(path)
+            pcinfo.get_count(path)
+        query_time = (time.time() - start) / 2000
+
+        # Cached queries don't read the point cloud
+        self.assertTrue(query_time * 1000 < scan_time, "Point cloud statistics (5M points): %.2fs scan, %.3f ms per cached query" % (scan_time, query_time * 1000))
+
+if __name__ == '__main__':
+    unittest.main()
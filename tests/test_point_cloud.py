@@ -0,0 +1,37 @@
+import argparse
+import unittest
+from unittest import mock
+
+from opendm import point_cloud
+
+class TreeMock:
+    odm_georeferencing_model_laz = "odm_georeferenced_model.laz"
+    odm_georeferencing_xyz_file = "odm_georeferenced_model.csv"
+    odm_georeferencing_model_las = "odm_georeferenced_model.las"
+    entwine_pointcloud = "entwine_pointcloud"
+
+class TestPointCloud(unittest.TestCase):
+    def export(self, max_concurrency, max_memory_mb, source_count=1000000):
+        args = argparse.Namespace(pc_csv=False, pc_las=False, pc_ept=True, pc_copc=True, max_concurrency=max_concurrency)
+        with mock.patch.object(point_cloud.pcinfo, 'get_count', return_value=source_count), \
+             mock.patch.object(point_cloud.pcinfo, 'get_dimensions', return_value=['X', 'Y', 'Z', 'Red', 'Green', 'Blue']), \
+             mock.patch.object(point_cloud, 'get_max_memory_mb', return_value=max_memory_mb), \
+             mock.patch.object(point_cloud.entwine, 'build') as build, \
+             mock.patch.object(point_cloud.entwine, 'build_copc') as build_copc:
+            point_cloud.export_point_cloud(args, TreeMock())
+
+        self.assertEqual(build_copc.call_count, 1)
+        return build.call_args[1]['max_concurrency']
+
+    def test_ept_threads(self):
+        # ~46 MB per builder
+
+        # EPT and COPC run at the same time
+        self.assertEqual(self.export(8, 1000), 4)
+
+        # One at a time: not enough memory for both, or a single thread
+        self.assertEqual(self.export(8, 60), 8)
+        self.assertEqual(self.export(1, 1000), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import os
+import time
+import tracemalloc
+import unittest
+import numpy as np
+
+from opendm.dem.ground_rectification.point_cloud import PointCloud
+from opendm.dem.ground_rectification.rectify import reclassify_cloud, extend_cloud, fit_partitions
+from opendm.dem.ground_rectification.grid.builder import build_grid, label_grid_points
+from opendm.dem.ground_rectification.bounds.types import BoxBounds
+from opendm.dem.ground_rectification.bounds.utils import calculate_convex_hull_bounds
+
+def synthetic_cloud(count, size=500.0, seed=0):
+    """Sloped ground with some objects on top of it and a hole in the middle"""
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, size, count)
+    y = rng.uniform(0, size, count)
+
+    # Remove a hole, so that there's something to extend
+    hole = (np.abs(x - size / 2) < size / 10) & (np.abs(y - size / 2) < size / 10)
+    x, y = x[~hole], y[~hole]
+    count = len(x)
+
+    z = 0.05 * x + 0.02 * y + rng.normal(0, 0.2, count)
+    classification = np.full(count, 2, dtype=np.uint8)
+
+    # Some points wrongly classified as ground
+    objects = rng.random(count) < 0.05
+    z[objects] += rng.uniform(6, 20, np.count_nonzero(objects))
+
+    rgb = rng.integers(0, 255, (3, count)).astype(np.uint16)
+    return PointCloud.with_dimensions(x, y, z, classification, rgb[0], rgb[1], rgb[2])
+
+def rectify(point_cloud, max_workers):
+    point_cloud = reclassify_cloud(point_cloud, 'median', 5, 500, 750, max_workers)
+    return extend_cloud(point_cloud, 'surrounding', 5, 500, 750, max_workers)
+
+class TestRectify(unittest.TestCase):
+    def assertCloudsEqual(self, a, b):
+        np.testing.assert_array_equal(a.xy, b.xy)
+        np.testing.assert_array_equal(a.z, b.z)
+        np.testing.assert_array_equal(a.classification, b.classification)
+        np.testing.assert_array_equal(a.rgb, b.rgb)
+        self.assertEqual(sorted(a.extra_dimensions.keys()), sorted(b.extra_dimensions.keys()))
+        for name in a.extra_dimensions:
+            np.testing.assert_array_equal(a.extra_dimensions[name], b.extra_dimensions[name])
+
+    def test_rectify(self):
+        original = synthetic_cloud(50000)
+        point_cloud = rectify(synthetic_cloud(50000), 1)
+
+        # Objects were reclassified
+        objects = original.z - (0.05 * original.xy[:,0] + 0.02 * original.xy[:,1]) > 6
+        self.assertTrue(np.all(point_cloud.classification[:original.len()][objects] == 1))
+
+        # The hole was filled
+        extended = point_cloud.get_extra_dimension_values('extended') == 1
+        self.assertTrue(np.count_nonzero(extended) > 0)
+        self.assertTrue(np.all(point_cloud.classification[extended] == 2))
+
+    def test_parallel(self):
+        serial = rectify(synthetic_cloud(50000), 1)
+        parallel = rectify(synthetic_cloud(50000), 4)
+        self.assertCloudsEqual(serial, parallel)
+
+    def test_sparse_cloud(self):
+        # Sparse ground: clusters of the surrounding plan that are not surrounded by ground
+        # points get a zone partition, whose bounds are calculated on a view of the cloud
+        original = synthetic_cloud(3000)
+        point_cloud = extend_cloud(synthetic_cloud(3000), 'surrounding', 5, 10, 10, 1)
+        self.assertTrue(point_cloud.len() > original.len())
+        np.testing.assert_array_equal(point_cloud.xy[:original.len()], original.xy)
+        self.assertFalse(np.isnan(point_cloud.z).any())
+
+    def test_fit_partitions(self):
+        xy = np.random.default_rng(0).random((10000, 2))
+        z = np.arange(10000, dtype=np.float64)
+        tasks = [(np.arange(0, 10000, 7), (1,)), (slice(100, 200), (2,)), (np.array([5, 3, 1]), (3,))]
+        fit = lambda xy, z, factor: (xy.sum() + z.sum()) * factor
+
+        # Workers read the columns from memory mapped files
+        expected = [(xy[rows].sum() + z[rows].sum()) * args[0] for rows, args in tasks]
+        self.assertEqual(fit_partitions(fit, [xy, z], tasks, 1), expected)
+        self.assertEqual(fit_partitions(fit, [xy, z], tasks, 2), expected)
+
+    def test_grid(self):
+        from sklearn.neighbors import BallTree
+
+        ground = synthetic_cloud(20000, size=300.0)
+        bounds = calculate_convex_hull_bounds(ground.get_xy())
+        grid = build_grid(bounds, ground, 5)
+
+        # Reference: all grid points inside the bounds without a (manhattan) neighbor closer than 5
+        x_min, x_max, y_min, y_max = bounds.corners()
+        expected = np.array([[x, y] for x in np.arange(x_min, x_max + 5, 5) for y in np.arange(y_min, y_max + 5, 5)])
+        expected = bounds.keep_points_inside(expected)
+        count = BallTree(ground.get_xy(), metric='manhattan').query_radius(expected, 5 - 0.00001, count_only=True)
+        expected = expected[count == 0]
+
+        self.assertTrue(len(grid) > 0)
+        np.testing.assert_array_equal(grid, expected)
+
+        # Overlapping partitions: the last one wins
+        partitions = [BoxBounds(x_min, x_max, y_min, y_max), BoxBounds(100, 200, 100, 200), bounds]
+        labels = label_grid_points(grid, bounds, 5, partitions)
+        for i, point in enumerate(grid):
+            expected = -1
+            for n, b in enumerate(partitions):
+                if b.calculate_mask(point.reshape(1, 2))[0]:
+                    expected = n
+            self.assertEqual(labels[i], expected)
+
+    @unittest.skipUnless(os.environ.get('ODM_BENCHMARK'), "Set ODM_BENCHMARK=1 to run benchmarks")
+    def test_grid_benchmark(self):
+        # 100 km² site, with a few large holes
+        rng = np.random.default_rng(0)
+        xy = rng.uniform(0, 10000, (2000000, 2))
+        for cx, cy in rng.uniform(1000, 9000, (20, 2)):
+            xy = xy[np.abs(xy[:,0] - cx) + np.abs(xy[:,1] - cy) > 300]
+        ground = PointCloud.with_xy(xy)
+        bounds = calculate_convex_hull_bounds(xy)
+
+        start = time.time()
+        grid = build_grid(bounds, ground, 5)
+        build_time = time.time() - start
+
+        partitions = [BoxBounds(x, x + 1000, y, y + 1000) for x in range(0, 10000, 500) for y in range(0, 10000, 500)]
+        start = time.time()
+        label_grid_points(grid, bounds, 5, partitions)
+        label_time = time.time() - start
+
+        self.assertTrue(len(grid) > 0)
+        self.assertTrue(build_time + label_time < 60, "Extension grid (100 km², %s points): build %.2fs, %s partitions labeled in %.2fs" % (len(xy), build_time, len(partitions), label_time))
+
+    @unittest.skipUnless(os.environ.get('ODM_BENCHMARK'), "Set ODM_BENCHMARK=1 to run benchmarks")
+    def test_benchmark(self):
+        times = []
+        for workers in [1, 2, 4]:
+            point_cloud = synthetic_cloud(500000)
+            if workers == 1:
+                tracemalloc.start()
+            start = time.time()
+            rectify(point_cloud, workers)
+            times.append((workers, time.time() - start))
+            if workers == 1:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+        summary = "Ground rectification (500k points): %s, peak memory %.1f MB" % (", ".join(["%s workers: %.2fs" % t for t in times]), peak / 1024 / 1024)
+        self.assertTrue(peak < 2 * 1024 * 1024 * 1024, summary)
+        if (os.cpu_count() or 1) >= 4:
+            self.assertTrue(times[-1][1] < times[0][1], summary)
+
+if __name__ == '__main__':
+    unittest.main()
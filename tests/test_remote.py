@@ -1,8 +1,14 @@
 import time
+import os
+import json
+import shutil
+import tempfile
+import zipfile
 import unittest
 import threading
 import random
-from opendm.remote import LocalRemoteExecutor, Task, NodeTaskLimitReachedException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from opendm.remote import LocalRemoteExecutor, Task, NodeTaskLimitReachedException, upload_task, zip_compress_type
 from pyodm import Node, exceptions
 from pyodm.types import TaskStatus
 
@@ -20,7 +26,7 @@ class TestRemote(unittest.TestCase):
 
     def test_processing_logic(self):
         # Fake online status
-        self.lre.node_online = True
+        self.lre.nodes[0].online = True
 
         MAX_QUEUE = 2
         class nonloc:
@@ -102,5 +108,190 @@ class TestRemote(unittest.TestCase):
         with self.assertRaises(exceptions.TaskFailedError):
             self.lre.run(TaskMock)
 
+    def test_node_pool(self):
+        lre = LocalRemoteExecutor('http://localhost:9001,http://localhost:9002#4,http://localhost:9003#2', parallel_uploads=2)
+        self.assertEqual([pn.weight for pn in lre.nodes], [1.0, 4.0, 2.0])
+
+        # Fake nodes, the first one goes offline as soon as we send a task to it
+        for pn in lre.nodes:
+            pn.online = True
+
+        projects = ['/submodels/submodel_%s' % str(i).rjust(4, '0') for i in range(12)]
+        lre.set_projects(projects)
+
+        class nonloc:
+            completed = {}
+            lock = threading.Lock()
+
+        class TaskMock(Task):
+            def estimated_cost(self):
+                return float(int(self.project_path[-4:]) + 1)
+
+            def process_local(self):
+                time.sleep(0.2)
+                with nonloc.lock:
+                    nonloc.completed[self.project_path] = 'local'
+
+            def process_remote(self, done):
+                port = self.node.port
+                if port == 9001:
+                    raise exceptions.NodeConnectionError("Node offline")
+
+                time.sleep(0.05) # file upload
+                done(error=None, partial=True)
+
+                def monitor():
+                    time.sleep(0.1)
+                    with nonloc.lock:
+                        nonloc.completed[self.project_path] = port
+                    done()
+
+                t = threading.Thread(target=monitor)
+                self.params['threads'].append(t)
+                t.start()
+
+        lre.run(TaskMock)
+
+        self.assertEqual(sorted(nonloc.completed.keys()), projects)
+        self.assertFalse(9001 in nonloc.completed.values())
+        self.assertFalse(lre.nodes[0].online)
+        self.assertTrue(9002 in nonloc.completed.values())
+
+    def test_upload_task(self):
+        uploads = {}
+
+        class MockNodeODM(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, data):
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith('/info'):
+                    self.reply({'version': '2.2.0', 'taskQueueCount': 0, 'engine': 'odm', 'engineVersion': '3.0.0'})
+                else:
+                    self.reply({'error': 'not found'})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path == '/task/new/init':
+                    self.reply({'uuid': 'mock-uuid'})
+                elif self.path == '/task/new/upload/mock-uuid':
+                    for name in [b'a.jpg', b'b.jpg', b'seed.zip']:
+                        if b'filename="' + name + b'"' in body:
+                            uploads[name.decode('utf-8')] = len(body)
+                    self.reply({'success': True})
+                elif self.path == '/task/new/commit/mock-uuid':
+                    self.reply({'uuid': 'mock-uuid'})
+                else:
+                    self.reply({'error': 'not found'})
+
+        server = ThreadingHTTPServer(('localhost', 0), MockNodeODM)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        tmpdir = tempfile.mkdtemp()
+
+        try:
+            files = []
+            for name in ['a.jpg', 'b.jpg']:
+                files.append(os.path.join(tmpdir, name))
+                with open(files[-1], 'wb') as f:
+                    f.write(os.urandom(1024))
+
+            def seed_builder():
+                seed_file = os.path.join(tmpdir, 'seed.zip')
+                with zipfile.ZipFile(seed_file, 'w') as zf:
+                    zf.writestr('opensfm/reconstruction.json', '{}')
+                return seed_file
+
+            progress = []
+            node = Node('localhost', server.server_address[1])
+            task, uploaded_bytes = upload_task(node, files, seed_builder=seed_builder, progress_callback=progress.append, parallel_uploads=2)
+
+            self.assertEqual(task.uuid, 'mock-uuid')
+            self.assertEqual(sorted(uploads.keys()), ['a.jpg', 'b.jpg', 'seed.zip'])
+            self.assertEqual(uploaded_bytes, 2048 + os.path.getsize(os.path.join(tmpdir, 'seed.zip')))
+            self.assertEqual(progress[-1], 100.0)
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(tmpdir)
+
+    def test_upload_task_failure(self):
+        attempts = []
+
+        class MockNodeODM(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, data):
+                body = json.dumps(data).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self.reply({'version': '2.2.0', 'taskQueueCount': 0, 'engine': 'odm', 'engineVersion': '3.0.0'})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path == '/task/new/init':
+                    self.reply({'uuid': 'mock-uuid'})
+                elif self.path == '/task/remove':
+                    attempts.append(body.decode('utf-8'))
+                    self.reply({'success': True})
+                elif b'filename="bad.jpg"' in body:
+                    attempts.append('bad.jpg')
+                    self.reply({'error': 'Cannot save file'})
+                else:
+                    time.sleep(0.05)
+                    self.reply({'success': True})
+
+        server = ThreadingHTTPServer(('localhost', 0), MockNodeODM)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        tmpdir = tempfile.mkdtemp()
+
+        try:
+            # The failing file is queued first, the other files are still queued when it fails
+            files = []
+            for name in ['bad.jpg'] + ['%s.jpg' % i for i in range(50)]:
+                files.append(os.path.join(tmpdir, name))
+                with open(files[-1], 'wb') as f:
+                    f.write(os.urandom(128))
+
+            class nonloc:
+                error = None
+
+            def upload():
+                try:
+                    upload_task(Node('localhost', server.server_address[1]), files, parallel_uploads=2, max_retries=0)
+                except Exception as e:
+                    nonloc.error = e
+
+            t = threading.Thread(target=upload, daemon=True)
+            t.start()
+            t.join(timeout=20)
+
+            self.assertFalse(t.is_alive())
+            self.assertTrue(isinstance(nonloc.error, exceptions.NodeResponseError))
+            # The task is removed from the node
+            self.assertEqual(attempts, ['bad.jpg', 'uuid=mock-uuid'])
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(tmpdir)
+
+    def test_zip_compress_type(self):
+        self.assertEqual(zip_compress_type('images/DJI_0001.JPG'), zipfile.ZIP_STORED)
+        self.assertEqual(zip_compress_type('opensfm/features/a.jpg.features.npz'), zipfile.ZIP_STORED)
+        self.assertEqual(zip_compress_type('opensfm/reconstruction.json'), zipfile.ZIP_DEFLATED)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
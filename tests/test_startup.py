@@ -0,0 +1,45 @@
+import os
+import sys
+import subprocess
+import unittest
+
+# Modules that should only be imported by the stages that use them
+HEAVY_MODULES = ['opensfm', 'cv2', 'rasterio', 'osgeo', 'fiona', 'sklearn', 'scipy',
+                 'skimage', 'onnxruntime', 'pdal', 'numpy', 'pyproj', 'PIL', 'trimesh']
+
+# Generous upper bound (it takes ~150 ms without the heavy modules)
+MAX_IMPORT_TIME_MS = 1000
+
+def import_times(module):
+    """
+    :return dictionary of module name --> cumulative import time (microseconds)
+        as reported by python -X importtime
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % module],
+                       cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if p.returncode != 0:
+        raise RuntimeError(p.stderr)
+
+    times = {}
+    for line in p.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        times[parts[2].strip()] = int(parts[1])
+    return times
+
+class TestStartup(unittest.TestCase):
+    def test_import_time(self):
+        times = import_times('stages.odm_app')
+
+        heavy = sorted([m for m in times if m.split('.')[0] in HEAVY_MODULES])
+        self.assertEqual(heavy, [], "Heavy modules imported at startup: %s" % ", ".join(heavy))
+
+        ms = times['stages.odm_app'] / 1000.0
+        self.assertTrue(ms < MAX_IMPORT_TIME_MS, "stages.odm_app takes %.1f ms to import" % ms)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import sys
+import time
+import unittest
+from opendm import system
+from opendm.system import SubprocessException
+
+@unittest.skipIf(sys.platform == 'win32', "POSIX commands")
+class TestSystem(unittest.TestCase):
+    def test_split_command(self):
+        self.assertEqual(system.split_command('echo "a b" c'), ['echo', 'a b', 'c'])
+        self.assertEqual(system.split_command("pdal info 'file (1).laz'"), ['pdal', 'info', 'file (1).laz'])
+
+        # Commands that need a shell
+        self.assertIsNone(system.split_command('echo a | wc -l'))
+        self.assertIsNone(system.split_command('echo a > out.txt'))
+        self.assertIsNone(system.split_command('echo $HOME'))
+        self.assertIsNone(system.split_command('ls *.laz'))
+        self.assertIsNone(system.split_command('a && b'))
+
+    def test_run(self):
+        result = system.run('echo "hello world"', quiet=True)
+        self.assertEqual(result.retcode, 0)
+        self.assertEqual(result.output, ['hello world'])
+
+        # Through a shell
+        result = system.run('echo a; echo b | tr b c', quiet=True)
+        self.assertEqual(result.output, ['a', 'c'])
+
+        # Lists of arguments
+        result = system.run(['echo', 'a b'], quiet=True)
+        self.assertEqual(result.output, ['a b'])
+
+        # Only the last lines are kept
+        result = system.run(['seq', '1', '100'], quiet=True)
+        self.assertEqual(result.output, [str(i) for i in range(91, 101)])
+
+    def test_errors(self):
+        with self.assertRaises(SubprocessException) as cm:
+            system.run(['sh', '-c', 'exit 3'], quiet=True)
+        self.assertEqual(cm.exception.errorCode, 3)
+
+        # Signals are reported as 128 + signal
+        with self.assertRaises(SubprocessException) as cm:
+            system.run(['sh', '-c', 'kill -9 $$'], quiet=True)
+        self.assertEqual(cm.exception.errorCode, 137)
+
+        result = system.start(['sh', '-c', 'kill -15 $$'], quiet=True).wait(raise_on_error=False)
+        self.assertEqual(result.retcode, -15)
+        self.assertEqual(result.error_code, 143)
+
+        # Missing binaries, with and without a shell
+        with self.assertRaises(SubprocessException) as cm:
+            system.run('odm_missing_binary --help', quiet=True)
+        self.assertEqual(cm.exception.errorCode, 127)
+
+        with self.assertRaises(SubprocessException) as cm:
+            system.run('odm_missing_binary --help > /dev/null', quiet=True)
+        self.assertEqual(cm.exception.errorCode, 127)
+
+    def test_concurrent(self):
+        start = time.time()
+        processes = [system.start(['sh', '-c', 'sleep 0.5; echo %s' % i], quiet=True) for i in range(4)]
+        results = [p.wait() for p in processes]
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual([r.output for r in results], [[str(i)] for i in range(4)])
+
+        p = system.start(['sleep', '30'], quiet=True)
+        self.assertFalse(p.poll())
+        p.terminate()
+        with self.assertRaises(SubprocessException) as cm:
+            p.wait()
+        self.assertEqual(cm.exception.errorCode, 143)
+        self.assertTrue(p.poll())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import shutil
+import struct
+import unittest
+import numpy as np
+import cv2
+from PIL import Image
+
+from opendm import exiftool
+from opendm.thermal_tools import dji_unpack
+from opendm.thermal_tools.thermal_utils import sensor_vals_to_temp
+
+PARAMS = {
+    "Emissivity": 0.95,
+    "ObjectDistance": 25.0,
+    "AtmosphericTemperature": 20.0,
+    "ReflectedApparentTemperature": 22.0,
+    "IRWindowTemperature": 20.0,
+    "IRWindowTransmission": 1.0,
+    "RelativeHumidity": 50.0,
+    "PlanckR1": 17096.453,
+    "PlanckB": 1428.0,
+    "PlanckF": 1.0,
+    "PlanckO": -51.0,
+    "PlanckR2": 0.0113,
+}
+
+def insert_app_segments(jpeg_bytes, segments):
+    """Insert (marker, data) APPn segments right after the SOI marker"""
+    data = b"".join([struct.pack(">BBH", 0xFF, 0xE0 + n, len(d) + 2) + d for n, d in segments])
+    return jpeg_bytes[:2] + data + jpeg_bytes[2:]
+
+class TestThermal(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+    def test_sensor_vals_to_temp(self):
+        raw = np.array([[12000, 14000], [16000, 18000]], dtype=np.uint16)
+
+        # Reference values computed with the per-pixel formula (before the gain/offset folding)
+        np.testing.assert_allclose(sensor_vals_to_temp(raw, **PARAMS),
+                                   [[21.36894544, 31.90312022], [41.51512366, 50.40903375]], rtol=1e-7)
+
+        with self.assertRaises(Exception):
+            sensor_vals_to_temp(np.array([[0]], dtype=np.uint16), **dict(PARAMS, PlanckO=-20000.0))
+
+    def test_temperature_params(self):
+        tags = {k: str(v) for k, v in PARAMS.items()}
+        tags["ObjectDistance"] = "25.0m"
+        tags["AtmosphericTemperature"] = "20.0C"
+        tags["RelativeHumidity"] = "50.0%"
+
+        params = exiftool.extract_temperature_params_from(tags)
+        self.assertEqual(params["ObjectDistance"], 25.0)
+        self.assertEqual(params["AtmosphericTemperature"], 20.0)
+        self.assertEqual(params["RelativeHumidity"], 50.0)
+        self.assertEqual(params["PlanckB"], 1428.0)
+
+        del tags["PlanckB"]
+        with self.assertRaises(Exception):
+            exiftool.extract_temperature_params_from(tags)
+
+    def test_decode_raw_thermal_image(self):
+        raw = (np.arange(64 * 80, dtype=np.uint16) * 7).reshape(64, 80)
+
+        for ext in [".png", ".tif"]:
+            _, buf = cv2.imencode(ext, raw)
+            img = exiftool.decode_raw_thermal_image(buf.tobytes())
+            self.assertEqual(img.shape, (64, 80, 1))
+            np.testing.assert_array_equal(img[:, :, 0], raw)
+
+        _, buf = cv2.imencode(".png", np.zeros((4, 4, 3), dtype=np.uint8))
+        with self.assertRaises(Exception):
+            exiftool.decode_raw_thermal_image(buf.tobytes())
+
+    def test_read_app_segments(self):
+        path = "tests/assets/output/thermal.jpg"
+        Image.new("RGB", (16, 16)).save(path, "JPEG")
+        with open(path, "rb") as f:
+            jpeg = f.read()
+
+        segments = [(3, bytes([i]) * 1000) for i in range(12)] + [(5, b"DJI")]
+        with open(path, "wb") as f:
+            f.write(insert_app_segments(jpeg, segments))
+
+        # Same segments (and order) as PIL's applist
+        with Image.open(path) as im:
+            self.assertEqual([(m, d) for m, d in dji_unpack.read_app_segments(path)], [(m, d) for m, d in im.applist])
+
+        apps = dji_unpack.read_app_segments(path)
+        self.assertEqual([m for m, d in apps if m != "APP0"], ["APP3"] * 12 + ["APP5"])
+
+        with open("tests/assets/output/not_a.jpg", "wb") as f:
+            f.write(b"GIF89a")
+        with self.assertRaises(ValueError):
+            dji_unpack.read_app_segments("tests/assets/output/not_a.jpg")
+
+    @unittest.skipUnless(shutil.which("exiftool") is not None, "exiftool not available")
+    def test_exiftool_process(self):
+        paths = []
+        for i in range(3):
+            path = "tests/assets/output/image_%s.jpg" % i
+            Image.new("RGB", (8 + i, 8)).save(path, "JPEG")
+            paths.append(path)
+
+        et = exiftool.ExifToolProcess()
+        try:
+            entries = et.get_json(paths, ["ImageWidth"])
+            self.assertEqual([e["ImageWidth"] for e in entries], [8, 9, 10])
+
+            # The same process answers later commands
+            pid = et.process.pid
+            self.assertEqual(et.get_json([paths[2]], ["ImageWidth"])[0]["ImageWidth"], 10)
+            self.assertEqual(et.process.pid, pid)
+
+            # Images without the raw thermal data
+            self.assertEqual(exiftool.extract_raw_thermal_image_data(paths[0]), ({}, None))
+        finally:
+            et.close()
+        self.assertFalse(et.is_running())
+
+if __name__ == '__main__':
+    unittest.main()
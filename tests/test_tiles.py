@@ -0,0 +1,179 @@
+import os
+import time
+import shutil
+import unittest
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from opendm.tiles import hillshade, pyramid, tiler
+
+def write_dem(path, size, resolution=0.1, nodata=-9999.0):
+    """Smooth hills with a nodata corner"""
+    y, x = np.mgrid[0:size, 0:size] * resolution
+    dem = (100 + 5 * np.sin(x / 7.0) * np.cos(y / 11.0) + 0.05 * x).astype(np.float32)
+    dem[:size // 8, :size // 8] = nodata
+
+    with rasterio.open(path, 'w', driver='GTiff', width=size, height=size, count=1, dtype='float32',
+                       crs='EPSG:32615', transform=from_origin(500000, 4000000, resolution, resolution),
+                       nodata=nodata, tiled=True, compress='DEFLATE') as dst:
+        dst.write(dem, 1)
+
+def count_tiles(output_dir):
+    counts = {}
+    for z in os.listdir(output_dir):
+        if z.isdigit():
+            counts[int(z)] = sum([len(files) for _, _, files in os.walk(os.path.join(output_dir, z))])
+    return counts
+
+class TestTiles(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+    def test_hillshade(self):
+        # Flat: cos of the zenith angle
+        flat = np.full((6, 6), 10.0)
+        valid = np.ones(flat.shape, dtype=bool)
+        self.assertTrue((hillshade.hillshade(flat, valid, 1.0, -1.0) == 181).all())
+
+        # Slope facing west (towards the light) is brighter than one facing east
+        x = np.tile(np.arange(6, dtype=np.float64), (6, 1))
+        west = hillshade.hillshade(x, valid, 1.0, -1.0)
+        east = hillshade.hillshade(-x, valid, 1.0, -1.0)
+        self.assertEqual(west.shape, (4, 4))
+        self.assertTrue((west > east).all())
+
+        # gdaldem: slope of 1 facing west (aspect = atan2(0, -1))
+        alt, az = np.radians(45), np.radians(315)
+        expected = 1 + 254 * (np.sin(alt) - np.cos(alt) * np.sin(np.pi - az)) / np.sqrt(2)
+        self.assertEqual(west[0, 0], int(round(expected)))
+
+        # Nodata neighbors do not create cliffs
+        hole = flat.copy()
+        hole[0, 0] = -9999
+        hole_valid = hole != -9999
+        self.assertTrue((hillshade.hillshade(hole, hole_valid, 1.0, -1.0) == 181).all())
+
+    def test_color_relief(self):
+        relief = hillshade.read_color_relief()
+        percentages, colors, nodata_color = relief
+        self.assertEqual(len(percentages), 11)
+        self.assertEqual(list(nodata_color), [0, 0, 0, 0])
+
+        arr = np.array([[0.0, 50.0, 100.0, -9999]])
+        valid = arr != -9999
+        rgba = hillshade.color_relief(arr, valid, 0, 100, relief)
+        self.assertEqual(list(rgba[0, 0]), [68, 1, 84, 255])
+        self.assertEqual(list(rgba[0, 1]), [32, 144, 141, 255])
+        self.assertEqual(list(rgba[0, 2]), [253, 231, 37, 255])
+        self.assertEqual(rgba[0, 3, 3], 0)
+
+        # Hue is kept, value comes from the hillshade
+        merged = hillshade.hsv_merge(rgba, np.array([[127, 127, 127, 127]], dtype=np.uint8))
+        self.assertEqual(list(merged[0, 2]), [127, 115, 18, 255])
+        self.assertEqual(merged[0, 3, 3], 0)
+
+    def test_tile_grid(self):
+        self.assertEqual(pyramid.get_zoom_range(10), (5, 21))
+        self.assertEqual(pyramid.get_zoom_range(1e9), (5, 5))
+
+        # Tile 0/0/0 is the whole world
+        b = pyramid.get_tile_bounds(0, 0, 0)
+        self.assertAlmostEqual(b[0], -pyramid.ORIGIN_SHIFT)
+        self.assertAlmostEqual(b[3], pyramid.ORIGIN_SHIFT)
+
+        # TMS y grows northward
+        self.assertEqual(pyramid.get_tile_range((1, 1, 2, 2), 1), (1, 1, 1, 1))
+        self.assertEqual(pyramid.get_tile_range((-1, -1, 1, 1), 1), (0, 0, 1, 1))
+
+        # Alpha weighted average
+        red = np.zeros((256, 256, 4), dtype=np.uint8)
+        red[..., 0] = 200
+        red[::2, ::2, 3] = 255
+        tile = pyramid.downsample_tile([red, None, None, None])
+        self.assertEqual(list(tile[0, 0]), [200, 0, 0, 64])
+        self.assertEqual(tile[-1, -1, 3], 0)
+        self.assertIsNone(pyramid.downsample_tile([None] * 4))
+
+    def test_dem_tiles(self):
+        dem = "tests/assets/output/dsm.tif"
+        output_dir = "tests/assets/output/dsm_tiles"
+        write_dem(dem, 1000)
+
+        tiler.generate_dem_tiles(dem, output_dir, 2, 10)
+        counts = count_tiles(output_dir)
+        self.assertEqual(sorted(counts.keys()), list(range(5, 22)))
+        self.assertEqual(counts[5], 1)
+        self.assertTrue(counts[21] > counts[20] > 1)
+        self.assertTrue(os.path.isfile(os.path.join(output_dir, "tilemapresource.xml")))
+
+        # Same tiles with a single thread
+        single_dir = "tests/assets/output/dsm_tiles_single"
+        tiler.generate_dem_tiles(dem, single_dir, 1, 10)
+        self.assertEqual(count_tiles(single_dir), counts)
+
+        # TMS paths of the tiles containing the DEM
+        with rasterio.open(dem) as src:
+            bounds = rasterio.warp.transform_bounds(src.crs, 'EPSG:3857', *src.bounds)
+        tminx, tminy, tmaxx, tmaxy = pyramid.get_tile_range(bounds, 15)
+        alpha = 0
+        for tx in range(tminx, tmaxx + 1):
+            for ty in range(tminy, tmaxy + 1):
+                with rasterio.open(os.path.join(output_dir, "15", str(tx), "%s.png" % ty)) as t:
+                    self.assertEqual((t.count, t.width, t.height), (4, 256, 256))
+                    alpha += int((t.read(4) > 0).sum())
+        self.assertTrue(alpha > 0)
+
+        # Report preview
+        colored_dem, hillshade_dem, colored_hillshade_dem = tiler.generate_colored_hillshade(dem)
+        with rasterio.open(colored_hillshade_dem) as t:
+            self.assertEqual(t.count, 4)
+            alpha = t.read(4)
+            self.assertEqual(alpha[0, 0], 0)
+            self.assertEqual(alpha[-1, -1], 255)
+
+    def test_orthophoto_tiles(self):
+        ortho = "tests/assets/output/odm_orthophoto.tif"
+        size = 1000
+        rgba = np.zeros((4, size, size), dtype=np.uint8)
+        rgba[:3] = 120
+        rgba[3, size // 4:, :] = 255
+        with rasterio.open(ortho, 'w', driver='GTiff', width=size, height=size, count=4, dtype='uint8',
+                           crs='EPSG:32615', transform=from_origin(500000, 4000000, 0.1, 0.1),
+                           photometric='RGB', alpha='YES') as dst:
+            dst.write(rgba)
+
+        output_dir = "tests/assets/output/orthophoto_tiles"
+        tiler.generate_orthophoto_tiles(ortho, output_dir, 2, 10)
+        counts = count_tiles(output_dir)
+        self.assertEqual(max(counts.keys()), 21)
+
+        with rasterio.open(ortho) as src:
+            bounds = rasterio.warp.transform_bounds(src.crs, 'EPSG:3857', *src.bounds)
+        tminx, tminy, tmaxx, tmaxy = pyramid.get_tile_range(bounds, 21)
+        with rasterio.open(os.path.join(output_dir, "21", str(tminx), "%s.png" % tminy)) as t:
+            tile = t.read()
+        self.assertTrue((tile[:3][:, tile[3] == 255] == 120).all())
+
+        # Top quarter of the orthophoto is transparent
+        self.assertFalse(os.path.isfile(os.path.join(output_dir, "21", str(tmaxx), "%s.png" % tmaxy)))
+
+    @unittest.skipUnless(os.environ.get('ODM_BENCHMARK'), "Set ODM_BENCHMARK=1 to run benchmarks")
+    def test_benchmark(self):
+        dem = "tests/assets/output/dsm.tif"
+        write_dem(dem, 8000, resolution=0.05)
+        output_dir = "tests/assets/output/dsm_tiles"
+
+        start = time.time()
+        min_zoom, max_zoom = pyramid.get_zoom_range(5)
+        stats = pyramid.generate_pyramid(dem, output_dir, min_zoom, max_zoom, pyramid.dem_renderer, halo=1, max_workers=4)
+        elapsed = time.time() - start
+
+        summary = "DEM tiles (8000x8000): %.2fs (%s)" % (elapsed, ", ".join(["zoom %s: %s tiles in %.2fs" % (z, stats[z][0], stats[z][1]) for z in sorted(stats.keys(), reverse=True)]))
+        self.assertTrue(stats[max_zoom][0] > 0, summary)
+        self.assertTrue(elapsed < 300, summary)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,34 @@
+import os
+import shutil
+import threading
+import time
 import unittest
 from opendm import types
+from opendm import system
+
+class Args:
+    def __init__(self, **kwargs):
+        self.end_with = None
+        self.rerun = None
+        self.rerun_all = False
+        self.rerun_from = None
+        self.__dict__.update(kwargs)
+
+class TreeMock:
+    benchmarking = "tests/assets/output/benchmark.txt"
+
+class StageMock(types.ODM_Stage):
+    def __init__(self, name, args, events, func=None):
+        super().__init__(name, args)
+        self.events = events
+        self.func = func
+
+    def process(self, args, outputs):
+        self.events.append(("start", self.name))
+        outputs['tree'] = TreeMock()
+        if self.func is not None:
+            self.func()
+        self.events.append(("end", self.name))
 
 class ODMPhotoMock:
     def __init__(self, filename, band_name, band_index):
@@ -46,5 +75,64 @@ class TestTypes(unittest.TestCase):
         recon = types.ODM_Reconstruction(photos)
         self.assertTrue(recon.multi_camera is None)
 
+    def test_stage_executor(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+        def chain(names, args, events, funcs={}):
+            stages = [StageMock(n, args, events, funcs.get(n)) for n in names]
+            for i in range(len(stages) - 1):
+                stages[i].connect(stages[i + 1])
+            return stages
+
+        # Dependencies are respected, independent stages run concurrently
+        events = []
+        c_started = threading.Event()
+        a, b, c, d = chain("abcd", Args(), events, {
+            'b': lambda: self.assertTrue(c_started.wait(5)),
+            'c': c_started.set
+        })
+        b.depends_on(a)
+        c.depends_on(a)
+        d.depends_on(b, c)
+        types.ODM_StageExecutor(a, max_concurrent_stages=2, min_free_memory=0).run({})
+
+        self.assertEqual(events[0], ("start", "a"))
+        self.assertEqual(events[-2:], [("start", "d"), ("end", "d")])
+        self.assertTrue(events.index(("start", "c")) < events.index(("end", "b")))
+
+        # Sequential execution follows the chain, --end-with stops early
+        events = []
+        a, b, c, d = chain("abcd", Args(end_with="c"), events)
+        types.ODM_StageExecutor(a).run({})
+        self.assertEqual(events, [(e, n) for n in "abc" for e in ["start", "end"]])
+
+        # A failure stops the stages that have not started yet
+        events = []
+        def fail():
+            raise RuntimeError("b failed")
+        a, b, c, d = chain("abcd", Args(), events, {'b': fail})
+        with self.assertRaises(RuntimeError):
+            types.ODM_StageExecutor(a, max_concurrent_stages=2, min_free_memory=0).run({})
+        self.assertFalse(("start", "c") in events)
+
+        # A failure cancels the processes of stages running concurrently
+        events = []
+        def fail_later():
+            time.sleep(0.5)
+            raise RuntimeError("c failed")
+        a, b, c = chain("abc", Args(), events, {
+            'b': lambda: system.run("sleep 30"),
+            'c': fail_later
+        })
+        c.depends_on(a)
+        start = time.time()
+        with self.assertRaises(RuntimeError):
+            types.ODM_StageExecutor(a, max_concurrent_stages=2, min_free_memory=0).run({})
+        self.assertTrue(time.time() - start < 10)
+        self.assertTrue(("start", "b") in events)
+        self.assertFalse(("end", "b") in events)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,154 @@
+import os
+import shutil
+import threading
+import time
+import unittest
+import numpy as np
+
+def has_cv2():
+    try:
+        import cv2
+    except ImportError:
+        return False
+    return True
+
+class FakeCapture:
+    """Stands in for cv2.VideoCapture, frames are filled with their index"""
+    def __init__(self, count, fail_at=None):
+        self.count = count
+        self.fail_at = fail_at
+        self.position = 0
+        self.reads = []
+        self.grabs = []
+
+    def grab(self):
+        if self.position >= self.count:
+            return False
+        self.grabs.append(self.position)
+        self.position += 1
+        return True
+
+    def read(self):
+        if self.position >= self.count:
+            return False, None
+        if self.position == self.fail_at:
+            raise IOError("Decode error")
+        self.reads.append(self.position)
+        frame = np.full((4, 4, 3), self.position % 256, dtype=np.uint8)
+        self.position += 1
+        return True, frame
+
+def write_video(path, count, size=(320, 240)):
+    import cv2
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, size)
+    rng = np.random.default_rng(0)
+    for i in range(count):
+        # Sharp, distinct frames (random noise) so that checks keep them
+        writer.write(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8))
+    writer.release()
+
+@unittest.skipUnless(has_cv2(), "OpenCV not available")
+class TestVideo(unittest.TestCase):
+    def setUp(self):
+        if os.path.exists("tests/assets/output"):
+            shutil.rmtree("tests/assets/output")
+        os.makedirs("tests/assets/output")
+
+    def test_frame_decoder(self):
+        from opendm.video.video2dataset import FrameDecoder
+
+        cap = FakeCapture(10)
+        decoder = FrameDecoder(cap, 0, None, frame_step=3, queue_size=2)
+        decoder.start()
+        frames = list(decoder.frames())
+        decoder.stop()
+
+        # Skipped frames are grabbed, not decoded
+        self.assertEqual([i for i, _ in frames], [0, 3, 6, 9])
+        self.assertTrue(all([f[0, 0, 0] == i for i, f in frames]))
+        self.assertEqual(cap.reads, [0, 3, 6, 9])
+        self.assertEqual(cap.grabs, [1, 2, 4, 5, 7, 8])
+
+        # End frame (inclusive) and start offset
+        cap = FakeCapture(10)
+        cap.position = 2
+        decoder = FrameDecoder(cap, 2, 6, frame_step=2)
+        decoder.start()
+        self.assertEqual([i for i, _ in decoder.frames()], [2, 4, 6])
+        decoder.stop()
+
+        # Decode errors are raised to the consumer
+        decoder = FrameDecoder(FakeCapture(10, fail_at=4), 0, None)
+        decoder.start()
+        with self.assertRaises(IOError):
+            list(decoder.frames())
+        decoder.stop()
+
+        # Stopping with a full queue does not block
+        decoder = FrameDecoder(FakeCapture(1000), 0, None, queue_size=1)
+        decoder.start()
+        time.sleep(0.1)
+        decoder.stop()
+        self.assertFalse(decoder.is_alive())
+
+    def test_writers(self):
+        from opendm.video.parameters import Parameters
+        from opendm.video.video2dataset import Video2Dataset
+
+        params = Parameters({"input": [], "output": "tests/assets/output/frames", "max_concurrency": 2})
+        v2d = Video2Dataset(params)
+        video_info = type("VideoInfo", (), {"basename": "video"})()
+
+        in_flight = [0]
+        max_in_flight = [0]
+        lock = threading.Lock()
+
+        def save_frame(frame, video_info, srt_parser, frame_index=None, global_idx=None):
+            with lock:
+                in_flight[0] += 1
+                max_in_flight[0] = max(max_in_flight[0], in_flight[0])
+            time.sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+            if frame_index == 7:
+                raise IOError("Disk full")
+
+        v2d.SaveFrame = save_frame
+        paths = []
+        for i in range(10):
+            v2d.frame_index = i
+            v2d.global_idx = i
+            paths.append(v2d.QueueSaveFrame(None, video_info, None))
+
+        self.assertEqual(paths[3], os.path.join("tests/assets/output/frames", "video_3_3.jpg"))
+
+        # Write errors are raised once all writers are done
+        with self.assertRaises(IOError):
+            v2d.WaitWriters()
+        self.assertTrue(max_in_flight[0] <= 2)
+        self.assertIsNone(v2d.writers)
+
+    def test_process_video(self):
+        from opendm.video.parameters import Parameters
+        from opendm.video.video2dataset import Video2Dataset
+        import piexif
+
+        video = "tests/assets/output/video.avi"
+        write_video(video, 20)
+
+        params = Parameters({"input": [video], "output": "tests/assets/output/frames",
+                             "blur_threshold": 300, "distance_threshold": 10,
+                             "black_ratio_threshold": 0.98, "pixel_black_threshold": 0.30,
+                             "frame_step": 4, "max_concurrency": 2})
+        frames = Video2Dataset(params).ProcessVideo()
+
+        self.assertEqual([os.path.basename(f) for f in frames],
+                         ["video_%s_%s.jpg" % (i, i * 4) for i in range(5)])
+        for f in frames:
+            exif = piexif.load(f)
+            self.assertEqual(exif["0th"][piexif.ImageIFD.Software], b"ODM")
+            self.assertEqual(exif["Exif"][piexif.ExifIFD.PixelXDimension], 320)
+
+if __name__ == '__main__':
+    unittest.main()